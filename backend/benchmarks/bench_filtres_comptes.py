@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark des filtres de comptes : LIKE 'prefixe%' contre plage [borne_inf, borne_sup)
+
+Construit un grand livre synthétique SQLite (1 000 000 de lignes par défaut),
+affiche le plan d'exécution (EXPLAIN QUERY PLAN) et la durée de chaque variante.
+
+    python benchmarks/bench_filtres_comptes.py --lignes 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from flask import Flask
+from sqlalchemy import func, text
+
+from models import db, PlanComptable, EcritureComptable, LigneEcriture
+from services.account_ranges import filtre_prefixe
+
+PREFIXES = ['6', '60', '512', '7561']
+LIGNES_PAR_ECRITURE = 4
+
+
+def creer_app(chemin):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{chemin}',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False
+    )
+    db.init_app(app)
+    return app
+
+
+def generer_grand_livre(nb_lignes, graine=42):
+    """Plan de ~2 000 comptes et nb_lignes lignes réparties sur une année"""
+    aleatoire = random.Random(graine)
+    comptes = sorted({
+        f"{classe}{aleatoire.randint(0, 9)}{aleatoire.randint(0, 9)}{aleatoire.randint(0, 99):02d}"
+        for classe in range(1, 9) for _ in range(300)
+    } | {'512', '5121', '7561'})
+    db.session.execute(PlanComptable.__table__.insert(), [
+        {'numero_compte': n, 'libelle_compte': f'Compte {n}', 'classe': int(n[0]), 'niveau': 3}
+        for n in comptes
+    ])
+
+    nb_ecritures = nb_lignes // LIGNES_PAR_ECRITURE
+    debut = date(2024, 1, 1)
+    for lot in range(0, nb_ecritures, 50000):
+        taille = min(50000, nb_ecritures - lot)
+        db.session.execute(EcritureComptable.__table__.insert(), [
+            {
+                'id': lot + i + 1,
+                'numero_ecriture': f'OD-{lot + i + 1:09d}',
+                'date_ecriture': debut + timedelta(days=aleatoire.randint(0, 364)),
+                'libelle': 'Écriture synthétique',
+                'journal': 'OD',
+                'montant_total': 100,
+                'statut': 'valide'
+            }
+            for i in range(taille)
+        ])
+        db.session.execute(LigneEcriture.__table__.insert(), [
+            {
+                'ecriture_id': lot + i + 1,
+                'numero_compte': aleatoire.choice(comptes),
+                'libelle': 'Ligne',
+                'debit': 100 if j % 2 == 0 else 0,
+                'credit': 0 if j % 2 == 0 else 100
+            }
+            for i in range(taille) for j in range(LIGNES_PAR_ECRITURE)
+        ])
+    db.session.commit()
+
+
+def plan(requete):
+    sql = str(requete.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return ' | '.join(str(ligne[-1]) for ligne in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+
+
+def mesurer(requete, repetitions=5):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        resultat = requete.scalar()
+    return resultat, (time.perf_counter() - debut) / repetitions * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LIKE contre plage de préfixe")
+    parser.add_argument('--lignes', type=int, default=1000000, help="Nombre de lignes d'écriture")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        app = creer_app(os.path.join(dossier, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            debut = time.perf_counter()
+            generer_grand_livre(args.lignes)
+            db.session.execute(text('ANALYZE'))
+            print(f"📒 {args.lignes} lignes générées en {time.perf_counter() - debut:.1f} s\n")
+
+            for prefixe in PREFIXES:
+                colonne = LigneEcriture.numero_compte
+                like = db.session.query(func.count(LigneEcriture.id)).filter(colonne.like(f'{prefixe}%'))
+                plage = db.session.query(func.count(LigneEcriture.id)).filter(filtre_prefixe(colonne, prefixe))
+
+                n_like, ms_like = mesurer(like)
+                n_plage, ms_plage = mesurer(plage)
+                assert n_like == n_plage, (prefixe, n_like, n_plage)
+
+                print(f"Préfixe {prefixe} ({n_plage} lignes)")
+                print(f"   LIKE  {ms_like:8.1f} ms  {plan(like)}")
+                print(f"   plage {ms_plage:8.1f} ms  {plan(plage)}")
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
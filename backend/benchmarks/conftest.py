@@ -0,0 +1,93 @@
+"""
+Configuration du banc de performance ComptaEBNL-IA
+
+    pytest benchmarks --lignes 10000,100000,1000000 --benchmark-json=resultats.json
+
+Chaque taille de grand livre est générée une fois (base SQLite temporaire) et
+partagée par les mesures de cette taille. Les résultats JSON de deux commits se
+comparent avec --benchmark-compare.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Ajouter le chemin src au PYTHONPATH pour les imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+TAILLES_DEFAUT = '10000'
+
+
+def pytest_addoption(parser):
+    parser.addoption('--lignes', default=TAILLES_DEFAUT,
+                     help="Tailles de grand livre (lignes d'écriture), séparées par des virgules")
+    parser.addoption('--entites', type=int, default=1, help="Nombre d'entités générées")
+    parser.addoption('--exercices', type=int, default=2, help="Nombre d'exercices générés")
+
+
+def pytest_generate_tests(metafunc):
+    if 'taille' in metafunc.fixturenames:
+        tailles = [int(t) for t in metafunc.config.getoption('lignes').split(',') if t.strip()]
+        metafunc.parametrize('taille', tailles, ids=[f'{t}_lignes' for t in tailles], scope='session')
+
+
+@pytest.fixture(scope='session')
+def grand_livre(request, taille):
+    """Application Flask sur un grand livre synthétique de `taille` lignes"""
+    from flask import Flask
+    from models import db, init_default_data
+    from api import create_api_blueprints
+    from generateur import generer_grand_livre
+
+    dossier = tempfile.TemporaryDirectory()
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(dossier.name, 'bench.db')}",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        REPORT_CACHE_DISABLED=True  # mesurer le calcul, pas le cache
+    )
+    db.init_app(app)
+    create_api_blueprints(app)
+
+    contexte = app.app_context()
+    contexte.push()
+    db.create_all()
+    init_default_data()
+    statistiques = generer_grand_livre(
+        taille,
+        nb_entites=request.config.getoption('entites'),
+        nb_exercices=request.config.getoption('exercices')
+    )
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+    yield app, statistiques
+
+    db.session.remove()
+    contexte.pop()
+    dossier.cleanup()
+
+
+@pytest.fixture
+def client_bench(grand_livre):
+    app, _ = grand_livre
+    return app.test_client()
+
+
+@pytest.fixture
+def mesurer(benchmark, grand_livre, taille):
+    """Mesure une fonction et annote le résultat avec la taille du grand livre"""
+    _, statistiques = grand_livre
+
+    def _mesurer(fonction, *args, rounds=3, **kwargs):
+        benchmark.extra_info.update(taille=taille, **{
+            cle: statistiques[cle] for cle in ('ecritures', 'lignes', 'mouvements_bancaires')
+        })
+        benchmark.group = benchmark.name.split('[')[0]
+        return benchmark.pedantic(fonction, args=args, kwargs=kwargs, rounds=rounds, iterations=1, warmup_rounds=0)
+
+    return _mesurer
@@ -0,0 +1,218 @@
+"""
+Générateur déterministe de grands livres synthétiques pour ComptaEBNL-IA
+N entités × M exercices × K écritures, répartition réaliste des comptes SYCEBNL
+(dons 756, subventions 74, banque 512...) ; même graine, même grand livre
+"""
+
+import csv
+import io
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterator, List, Tuple
+
+from models import (
+    db, PlanComptable, JournalComptable, EcritureComptable, LigneEcriture,
+    ExerciceComptable, EntiteEBNL, MouvementBancaire
+)
+from services.monthly_balances import reconstruire_soldes_mensuels
+
+TAILLE_LOT = 20000
+TAUX_BROUILLARD = 0.05      # part des écritures laissées en brouillard
+TAUX_RELEVE = 0.5           # part des lignes bancaires présentes sur le relevé
+LIGNES_PAR_ECRITURE = 2.15  # moyenne observée avec MODELES (ventilations à 3 lignes)
+
+COMPTES = {
+    '1011': 'Fonds associatifs sans droit de reprise',
+    '2183': 'Matériel de bureau et informatique',
+    '401': 'Fournisseurs',
+    '421': 'Personnel, rémunérations dues',
+    '431': 'Sécurité sociale',
+    '5121': 'Banque compte courant',
+    '5122': 'Banque compte projets',
+    '571': 'Caisse',
+    '6011': 'Achats de marchandises',
+    '6061': 'Fournitures non stockables',
+    '6063': 'Fournitures d\'entretien et petit équipement',
+    '6132': 'Locations immobilières',
+    '6226': 'Honoraires',
+    '6251': 'Voyages et déplacements',
+    '6411': 'Salaires',
+    '6451': 'Cotisations URSSAF',
+    '7061': 'Prestations de services',
+    '7411': 'Subventions d\'exploitation État',
+    '7418': 'Subventions d\'exploitation collectivités',
+    '7561': 'Cotisations des membres',
+    '7562': 'Dons manuels',
+    '7563': 'Mécénat',
+}
+
+# (poids, journal, libellé, [(compte débité...)], [(compte crédité...)], montant médian)
+MODELES: List[Tuple[int, str, str, List[str], List[str], int]] = [
+    (22, 'DON', 'Don manuel', ['5121', '571'], ['7562', '7563'], 80),
+    (12, 'BQ', 'Cotisation annuelle', ['5121'], ['7561'], 40),
+    (6, 'SUB', 'Subvention de fonctionnement', ['5122'], ['7411', '7418'], 8000),
+    (20, 'ACH', 'Facture fournisseur', ['6061', '6063', '6132', '6226', '6251', '6011'], ['401'], 350),
+    (16, 'BQ', 'Règlement fournisseur', ['401'], ['5121'], 350),
+    (8, 'OD', 'Salaires du mois', ['6411', '6451'], ['421', '431'], 2500),
+    (8, 'BQ', 'Virement des salaires', ['421'], ['5121'], 2000),
+    (4, 'VTE', 'Prestation de service', ['5121'], ['7061'], 600),
+    (2, 'ACH', 'Acquisition de matériel', ['2183'], ['5121'], 1500),
+    (2, 'CAI', 'Dépense de caisse', ['6061', '6251'], ['571'], 30),
+]
+LIBELLES_TIERS = ['Dupont', 'Martin', 'Traoré', 'Ouédraogo', 'Kaboré', 'Mairie', 'Fondation Avenir', 'Imprimerie Centrale']
+
+
+def _montant(aleatoire: random.Random, median: int) -> Decimal:
+    return Decimal(str(round(aleatoire.lognormvariate(0, 0.8) * median, 2))).quantize(Decimal('0.01')) or Decimal('1.00')
+
+
+def _ecritures(nb_ecritures: int, exercices: List[ExerciceComptable], graine: int) -> Iterator[Dict]:
+    """Écritures équilibrées (2 ou 3 lignes) réparties uniformément sur les exercices"""
+    aleatoire = random.Random(graine)
+    poids = [modele[0] for modele in MODELES]
+    for numero in range(1, nb_ecritures + 1):
+        exercice = exercices[(numero - 1) % len(exercices)]
+        duree = (exercice.date_fin - exercice.date_debut).days
+        jour = exercice.date_debut + timedelta(days=aleatoire.randint(0, duree))
+        _, journal, libelle, debits, credits, median = aleatoire.choices(MODELES, weights=poids)[0]
+        tiers = aleatoire.choice(LIBELLES_TIERS)
+
+        # Ventilation éventuelle du débit sur deux comptes
+        total = _montant(aleatoire, median)
+        if len(debits) > 1 and aleatoire.random() < 0.3:
+            part = (total * Decimal(str(round(aleatoire.uniform(0.2, 0.8), 2)))).quantize(Decimal('0.01'))
+            lignes_debit = [(debits[0], part), (debits[1], total - part)]
+        else:
+            lignes_debit = [(aleatoire.choice(debits), total)]
+
+        yield {
+            'numero': numero,
+            'date': jour,
+            'journal': journal,
+            'libelle': f'{libelle} {tiers}',
+            'montant': total,
+            'statut': 'brouillard' if aleatoire.random() < TAUX_BROUILLARD else 'valide',
+            'lignes': [(compte, montant, Decimal('0')) for compte, montant in lignes_debit]
+                      + [(aleatoire.choice(credits), Decimal('0'), total)]
+        }
+
+
+def _preparer_referentiels(nb_entites: int, nb_exercices: int, annee_debut: int) -> List[ExerciceComptable]:
+    existants = {numero for (numero,) in db.session.query(PlanComptable.numero_compte)}
+    nouveaux = [
+        {'numero_compte': numero, 'libelle_compte': libelle, 'classe': int(numero[0]), 'niveau': min(len(numero) - 1, 3)}
+        for numero, libelle in COMPTES.items() if numero not in existants
+    ]
+    if nouveaux:
+        db.session.execute(PlanComptable.__table__.insert(), nouveaux)
+
+    if not JournalComptable.query.first():
+        from models import init_default_data
+        init_default_data()
+
+    for rang in range(EntiteEBNL.query.count(), nb_entites):
+        db.session.add(EntiteEBNL(nom_entite=f'Association synthétique {rang + 1}', type_entite='association'))
+
+    exercices = []
+    for annee in range(annee_debut, annee_debut + nb_exercices):
+        exercice = ExerciceComptable.query.filter_by(nom_exercice=str(annee)).first()
+        if not exercice:
+            exercice = ExerciceComptable(nom_exercice=str(annee), date_debut=date(annee, 1, 1), date_fin=date(annee, 12, 31))
+            db.session.add(exercice)
+        exercices.append(exercice)
+    db.session.commit()
+    return exercices
+
+
+def generer_grand_livre(nb_lignes: int, nb_entites: int = 1, nb_exercices: int = 1,
+                        annee_debut: int = 2024, graine: int = 42) -> Dict:
+    """
+    Remplit la base courante avec un grand livre synthétique (insertions Core par lots)
+
+    Le schéma ne rattache pas les écritures à une entité : les N entités sont
+    créées et les écritures des N × M combinaisons partagent le même grand livre.
+
+    Args:
+        nb_lignes: Nombre approximatif de lignes d'écriture (≈ LIGNES_PAR_ECRITURE par écriture)
+        nb_entites: Nombre d'entités EBNL créées
+        nb_exercices: Nombre d'exercices consécutifs couverts
+        annee_debut: Année du premier exercice
+        graine: Graine du générateur pseudo-aléatoire
+
+    Returns:
+        Dict: {'ecritures', 'lignes', 'mouvements_bancaires', 'exercices', 'entites', 'duree_s'}
+    """
+    debut = datetime.utcnow()
+    exercices = _preparer_referentiels(nb_entites, nb_exercices, annee_debut)
+    premier_id = (db.session.query(db.func.max(EcritureComptable.id)).scalar() or 0)
+    aleatoire = random.Random(graine + 1)
+
+    nb_ecritures = max(1, round(nb_lignes / LIGNES_PAR_ECRITURE))
+    ecritures, lignes, mouvements = [], [], []
+    totaux = {'ecritures': 0, 'lignes': 0, 'mouvements_bancaires': 0}
+
+    def vider():
+        if ecritures:
+            db.session.execute(EcritureComptable.__table__.insert(), ecritures)
+            db.session.execute(LigneEcriture.__table__.insert(), lignes)
+        if mouvements:
+            db.session.execute(MouvementBancaire.__table__.insert(), mouvements)
+        totaux['ecritures'] += len(ecritures)
+        totaux['lignes'] += len(lignes)
+        totaux['mouvements_bancaires'] += len(mouvements)
+        ecritures.clear()
+        lignes.clear()
+        mouvements.clear()
+
+    for ecriture in _ecritures(nb_ecritures, exercices, graine):
+        identifiant = premier_id + ecriture['numero']
+        ecritures.append({
+            'id': identifiant,
+            'numero_ecriture': f"GEN-{identifiant:010d}",
+            'date_ecriture': ecriture['date'],
+            'libelle': ecriture['libelle'],
+            'journal': ecriture['journal'],
+            'montant_total': ecriture['montant'],
+            'statut': ecriture['statut'],
+            'date_creation': debut,
+            'date_modification': debut
+        })
+        for compte, debit, credit in ecriture['lignes']:
+            lignes.append({'ecriture_id': identifiant, 'numero_compte': compte, 'libelle': ecriture['libelle'],
+                           'debit': debit, 'credit': credit})
+            # Une partie des lignes bancaires figure sur le relevé (date décalée de 0 à 3 jours)
+            if compte.startswith('512') and aleatoire.random() < TAUX_RELEVE:
+                mouvements.append({
+                    'empreinte': f'gen-{identifiant}-{compte}',
+                    'compte_bancaire': compte,
+                    'date_operation': ecriture['date'] + timedelta(days=aleatoire.randint(0, 3)),
+                    'libelle': ecriture['libelle'].upper(),
+                    'montant': debit - credit,
+                    'format_source': 'csv',
+                    'date_import': debut,
+                    'statut': 'non_rapproche'
+                })
+        if len(lignes) >= TAILLE_LOT:
+            vider()
+    vider()
+    db.session.commit()
+
+    reconstruire_soldes_mensuels()
+    return dict(totaux, exercices=[e.id for e in exercices], entites=nb_entites,
+                duree_s=round((datetime.utcnow() - debut).total_seconds(), 2))
+
+
+def generer_csv_import(nb_lignes: int, annee: int = 2024, graine: int = 7) -> bytes:
+    """Fichier CSV au format de /import/ecritures (une écriture par date, journal et libellé)"""
+    sortie = io.StringIO()
+    writer = csv.writer(sortie)
+    writer.writerow(['date_ecriture', 'journal', 'libelle_ecriture', 'piece_justificative',
+                     'numero_compte', 'libelle_ligne', 'debit', 'credit'])
+    exercice = ExerciceComptable(nom_exercice=str(annee), date_debut=date(annee, 1, 1), date_fin=date(annee, 12, 31))
+    for ecriture in _ecritures(max(1, round(nb_lignes / LIGNES_PAR_ECRITURE)), [exercice], graine):
+        libelle = f"{ecriture['libelle']} #{ecriture['numero']}"
+        for compte, debit, credit in ecriture['lignes']:
+            writer.writerow([ecriture['date'].isoformat(), ecriture['journal'], libelle, '',
+                             compte, ecriture['libelle'], f'{debit:.2f}', f'{credit:.2f}'])
+    return sortie.getvalue().encode('utf-8')
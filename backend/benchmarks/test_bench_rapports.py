@@ -0,0 +1,81 @@
+"""
+Banc de performance des endpoints de rapports, de rapprochement, d'import et d'export
+"""
+
+import io
+
+PERIODE = 'date_debut=2024-01-01&date_fin=2024-12-31'
+
+
+def _get(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)[:200]
+    # Les exports sont diffusés en flux : la mesure inclut la production du corps
+    return len(response.get_data())
+
+
+def test_balance(client_bench, mesurer):
+    mesurer(_get, client_bench, f'/api/v1/balance?{PERIODE}')
+
+
+def test_balance_partielle(client_bench, mesurer):
+    """Période à cheval sur des mois partiels (lecture ligne à ligne en bordure)"""
+    mesurer(_get, client_bench, '/api/v1/balance?date_debut=2024-02-10&date_fin=2024-11-20')
+
+
+def test_grand_livre(client_bench, mesurer):
+    mesurer(_get, client_bench, f'/api/v1/grand-livre/5121?{PERIODE}')
+
+
+def test_bilan(client_bench, mesurer):
+    mesurer(_get, client_bench, '/api/v1/bilan?date_fin=2024-12-31')
+
+
+def test_compte_resultat(client_bench, mesurer):
+    mesurer(_get, client_bench, f'/api/v1/compte-resultat?{PERIODE}')
+
+
+def test_dashboard_kpi(client_bench, mesurer):
+    mesurer(_get, client_bench, '/api/v1/dashboard/kpi?exercice_id=2')
+
+
+def test_series(client_bench, mesurer):
+    mesurer(_get, client_bench, f'/api/v1/analyses/series?comptes=7&granularite=week&{PERIODE}')
+
+
+def test_rapprochement_correspondances(client_bench, mesurer):
+    def rapprocher():
+        response = client_bench.post('/api/v1/rapprochement/correspondances', json={
+            'date_debut': '2024-03-01', 'date_fin': '2024-03-31', 'affectation_unique': True
+        })
+        assert response.status_code == 200
+        return response.get_json()['data']['statistiques']['total_mouvements']
+
+    mesurer(rapprocher, rounds=1)
+
+
+def test_export_ecritures(client_bench, mesurer):
+    mesurer(_get, client_bench, f'/api/v1/export/ecritures?format=csv&{PERIODE}', rounds=1)
+
+
+def test_export_balance(client_bench, mesurer):
+    mesurer(_get, client_bench, f'/api/v1/export/balance?{PERIODE}')
+
+
+def test_import_ecritures(client_bench, mesurer, taille):
+    """Import d'un fichier de 10 % de la taille du grand livre (exécuté en dernier : il écrit)"""
+    from generateur import generer_csv_import
+    from models import ExerciceComptable
+
+    contenu = generer_csv_import(max(1000, taille // 10), annee=2025)
+    exercice_id = ExerciceComptable.query.filter_by(nom_exercice='2025').one().id
+
+    def importer():
+        response = client_bench.post('/api/v1/import/ecritures', data={
+            'exercice_id': exercice_id,
+            'file': (io.BytesIO(contenu), 'ecritures.csv')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200, response.get_data(as_text=True)[:200]
+        return response.get_json()['data']['ecritures_creees']
+
+    mesurer(importer, rounds=1)
@@ -15,6 +15,7 @@ def create_api_blueprints(app):
     from .multi_entites import multi_entites_bp
     from .notifications import notifications_bp
     from .audit_trail import audit_trail_bp
+    from .taches import taches_bp
 
     # Préfixe API v1
     app.register_blueprint(plan_comptable_bp, url_prefix='/api/v1')
@@ -28,4 +29,5 @@ def create_api_blueprints(app):
     app.register_blueprint(reconciliation_bp, url_prefix='/api/v1')
     app.register_blueprint(multi_entites_bp, url_prefix='/api/v1')
     app.register_blueprint(notifications_bp, url_prefix='/api/v1')
-    app.register_blueprint(audit_trail_bp, url_prefix='/api/v1')
\ No newline at end of file
+    app.register_blueprint(audit_trail_bp, url_prefix='/api/v1')
+    app.register_blueprint(taches_bp, url_prefix='/api/v1')
\ No newline at end of file
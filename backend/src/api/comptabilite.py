@@ -6,22 +6,67 @@ ComptaEBNL-IA - Gestion comptable pour entités à but non lucratif
 """
 
 from flask import Blueprint, jsonify, request
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from decimal import Decimal
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
+import base64
+import time
 from models import (
     db, 
     EcritureComptable, 
     LigneEcriture, 
     PlanComptable,
-    JournalComptable
+    JournalComptable,
+    StatutEcriture
 )
+from services.monthly_balances import PeriodeCloturee, appliquer_ecriture, totaux_periode
+from services.report_cache import cache_rapport
+from services.account_registry import get_registre
+from services.full_text_search import rechercher_ecritures
+from services.trial_balance import construire_balance, en_montant
 
 comptabilite_bp = Blueprint('comptabilite', __name__)
 
+# Totaux de listes mémorisés par jeu de filtres : {clé: (horodatage, total)}
+_TOTAUX_CACHE = {}
+TOTAL_CACHE_TTL = 60  # secondes
+
+class CurseurInvalide(ValueError):
+    """Curseur de pagination illisible ou altéré"""
+
+def encoder_curseur(ecriture):
+    """Curseur opaque (date, id) de la dernière écriture d'une page"""
+    brut = f"{ecriture.date_ecriture.isoformat()}|{ecriture.id}"
+    return base64.urlsafe_b64encode(brut.encode()).decode().rstrip('=')
+
+def decoder_curseur(curseur):
+    """Retourne (date, id) d'un curseur, CurseurInvalide s'il est illisible"""
+    try:
+        brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4)).decode()
+        date_str, ecriture_id = brut.split('|')
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(ecriture_id)
+    except Exception:
+        raise CurseurInvalide(curseur)
+
+def compter_ecritures(query, cle, mode):
+    """Total d'une liste filtrée : 'exact', 'cache' (mémorisé TOTAL_CACHE_TTL s) ou 'none'"""
+    if mode == 'none':
+        return None
+    if mode == 'cache':
+        entree = _TOTAUX_CACHE.get(cle)
+        if entree and time.monotonic() - entree[0] < TOTAL_CACHE_TTL:
+            return entree[1]
+    total = query.order_by(None).count()
+    if len(_TOTAUX_CACHE) > 256:
+        _TOTAUX_CACHE.clear()
+    _TOTAUX_CACHE[cle] = (time.monotonic(), total)
+    return total
+
 @comptabilite_bp.route('/ecritures', methods=['GET'])
 def get_ecritures():
     """
-    Récupère les écritures comptables
+    Récupère les écritures comptables (de la plus récente à la plus ancienne)
     
     Query Parameters:
     - date_debut: Date de début (YYYY-MM-DD)
@@ -29,7 +74,9 @@ def get_ecritures():
     - journal: Code du journal
     - compte: Numéro de compte
     - limit: Nombre max de résultats (défaut: 50)
-    - page: Page (défaut: 1)
+    - cursor: Curseur de la page suivante (retourné dans pagination.next_cursor)
+    - page: Page (défaut: 1), pagination par décalage conservée pour compatibilité
+    - total: exact, cache ou none (défaut: exact sans curseur, none avec)
     """
     try:
         # Paramètres de requête
@@ -39,6 +86,8 @@ def get_ecritures():
         compte = request.args.get('compte')
         limit = request.args.get('limit', 50, type=int)
         page = request.args.get('page', 1, type=int)
+        curseur = request.args.get('cursor')
+        mode_total = request.args.get('total', 'none' if curseur else 'exact')
         
         # Construction de la requête
         query = EcritureComptable.query
@@ -56,28 +105,45 @@ def get_ecritures():
         if journal:
             query = query.filter(EcritureComptable.journal == journal)
             
-        # Filtre par compte (via les lignes d'écriture)
+        # Filtre par compte : semi-jointure, une écriture n'apparaît qu'une fois
         if compte:
-            query = query.join(LigneEcriture).filter(LigneEcriture.numero_compte == compte)
-        
-        # Pagination
-        offset = (page - 1) * limit
-        ecritures = query.order_by(EcritureComptable.date_ecriture.desc())\
-                        .offset(offset)\
-                        .limit(limit)\
-                        .all()
-        
-        total = query.count()
+            query = query.filter(EcritureComptable.id.in_(
+                db.session.query(LigneEcriture.ecriture_id).filter(LigneEcriture.numero_compte == compte)
+            ))
+        
+        total = compter_ecritures(query, (date_debut, date_fin, journal, compte), mode_total)
+        
+        # Pagination par clé (date, id) : coût constant quelle que soit la profondeur
+        page_query = query
+        if curseur:
+            date_curseur, id_curseur = decoder_curseur(curseur)
+            page_query = page_query.filter(or_(
+                EcritureComptable.date_ecriture < date_curseur,
+                and_(EcritureComptable.date_ecriture == date_curseur, EcritureComptable.id < id_curseur)
+            ))
+        elif page > 1:
+            page_query = page_query.offset((page - 1) * limit)
+        
+        ecritures = page_query.options(
+            selectinload(EcritureComptable.lignes).joinedload(LigneEcriture.compte)
+        ).order_by(
+            EcritureComptable.date_ecriture.desc(), EcritureComptable.id.desc()
+        ).limit(limit + 1).all()
+        
+        page_suivante = len(ecritures) > limit
+        ecritures = ecritures[:limit]
         
         # Formatage de la réponse
         result = {
             'success': True,
             'data': [ecriture.to_dict() for ecriture in ecritures],
             'pagination': {
-                'page': page,
+                'page': None if curseur else page,
                 'limit': limit,
                 'total': total,
-                'pages': (total + limit - 1) // limit
+                'pages': (total + limit - 1) // limit if total is not None else None,
+                'next_cursor': encoder_curseur(ecritures[-1]) if page_suivante else None,
+                'has_more': page_suivante
             },
             'filters': {
                 'date_debut': date_debut,
@@ -89,6 +155,13 @@ def get_ecritures():
         
         return jsonify(result)
         
+    except CurseurInvalide:
+        return jsonify({
+            'success': False,
+            'error': 'Curseur invalide',
+            'message': 'Utilisez la valeur pagination.next_cursor de la page précédente'
+        }), 400
+        
     except ValueError as e:
         return jsonify({
             'success': False,
@@ -103,6 +176,74 @@ def get_ecritures():
             'message': 'Erreur lors de la récupération des écritures'
         }), 500
 
+@comptabilite_bp.route('/ecritures/recherche', methods=['GET'])
+def search_ecritures():
+    """
+    Recherche plein texte dans les écritures (libellé, pièce justificative, libellés des lignes)
+    
+    Query Parameters:
+    - q: Mots recherchés, sans accents ni casse, début de mot accepté (requis)
+    - date_debut: Date de début (YYYY-MM-DD)
+    - date_fin: Date de fin (YYYY-MM-DD)
+    - journal: Code du journal
+    - statut: brouillard, valide ou annule
+    - limit: Nombre max de résultats (défaut: 20)
+    - offset: Décalage pour les pages suivantes (défaut: 0)
+    """
+    try:
+        query_param = request.args.get('q', '')
+        date_debut = request.args.get('date_debut')
+        date_fin = request.args.get('date_fin')
+        journal = request.args.get('journal')
+        statut = request.args.get('statut')
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        
+        if not query_param.strip():
+            return jsonify({
+                'success': False,
+                'error': 'Paramètre de recherche manquant',
+                'message': 'Le paramètre "q" est requis'
+            }), 400
+        
+        resultat = rechercher_ecritures(
+            query_param,
+            date_debut=datetime.strptime(date_debut, '%Y-%m-%d').date() if date_debut else None,
+            date_fin=datetime.strptime(date_fin, '%Y-%m-%d').date() if date_fin else None,
+            journal=journal,
+            statut=statut,
+            limite=limit,
+            offset=offset
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': resultat['resultats'],
+            'query': query_param,
+            'pagination': {
+                'limit': limit,
+                'offset': offset,
+                'next_offset': offset + limit if resultat['has_more'] else None,
+                'has_more': resultat['has_more']
+            },
+            'moteur': resultat['moteur']
+        })
+        
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Format de date invalide',
+            'message': 'Utilisez le format YYYY-MM-DD pour les dates'
+        }), 400
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Erreur lors de la recherche des écritures'
+        }), 500
+
 @comptabilite_bp.route('/ecritures', methods=['POST'])
 def create_ecriture():
     """
@@ -170,7 +311,8 @@ def create_ecriture():
                 'message': f'Total débit ({total_debit}) ≠ Total crédit ({total_credit})'
             }), 400
         
-        # Validation des comptes
+        # Validation des comptes (registre en mémoire, sans requête par ligne)
+        registre = get_registre()
         for i, ligne in enumerate(lignes):
             numero_compte = ligne.get('numero_compte')
             if not numero_compte:
@@ -180,8 +322,7 @@ def create_ecriture():
                     'message': 'Chaque ligne doit avoir un numéro de compte'
                 }), 400
                 
-            compte = PlanComptable.query.filter_by(numero_compte=numero_compte).first()
-            if not compte:
+            if numero_compte not in registre:
                 return jsonify({
                     'success': False,
                     'error': f'Compte inexistant: {numero_compte}',
@@ -274,7 +415,7 @@ def valider_ecriture(ecriture_id):
                 'message': f'L\'écriture {ecriture_id} n\'existe pas'
             }), 404
         
-        if ecriture.statut == 'valide':
+        if ecriture.est_validee:
             return jsonify({
                 'success': False,
                 'error': 'Écriture déjà validée',
@@ -293,8 +434,9 @@ def valider_ecriture(ecriture_id):
             }), 400
         
         # Valider
-        ecriture.statut = 'valide'
+        ecriture.statut = StatutEcriture.VALIDE
         ecriture.date_validation = datetime.now()
+        appliquer_ecriture(ecriture)
         
         db.session.commit()
         
@@ -304,6 +446,14 @@ def valider_ecriture(ecriture_id):
             'message': 'Écriture validée avec succès'
         })
         
+    except PeriodeCloturee as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': 'Exercice clôturé',
+            'message': str(e)
+        }), 400
+        
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -313,9 +463,10 @@ def valider_ecriture(ecriture_id):
         }), 500
 
 @comptabilite_bp.route('/balance', methods=['GET'])
+@cache_rapport('balance')
 def get_balance():
     """
-    Génère la balance comptable
+    Génère la balance comptable (ouverture, mouvements, clôture et sous-totaux)
     
     Query Parameters:
     - date_debut: Date de début (YYYY-MM-DD)
@@ -330,88 +481,40 @@ def get_balance():
         classe = request.args.get('classe', type=int)
         niveau = request.args.get('niveau', 3, type=int)  # Niveau 3 par défaut (le plus détaillé)
         
-        # Construction de la requête pour les lignes d'écriture validées
-        query = db.session.query(
-            LigneEcriture.numero_compte,
-            PlanComptable.libelle_compte,
-            PlanComptable.classe,
-            PlanComptable.niveau,
-            db.func.sum(LigneEcriture.debit).label('total_debit'),
-            db.func.sum(LigneEcriture.credit).label('total_credit')
-        ).join(
-            EcritureComptable, LigneEcriture.ecriture_id == EcritureComptable.id
-        ).join(
-            PlanComptable, LigneEcriture.numero_compte == PlanComptable.numero_compte
-        ).filter(
-            EcritureComptable.statut == 'valide'
-        )
-        
-        # Filtres par date
         if date_debut:
-            date_debut_obj = datetime.strptime(date_debut, '%Y-%m-%d').date()
-            query = query.filter(EcritureComptable.date_ecriture >= date_debut_obj)
-            
+            datetime.strptime(date_debut, '%Y-%m-%d')
         if date_fin:
-            date_fin_obj = datetime.strptime(date_fin, '%Y-%m-%d').date()
-            query = query.filter(EcritureComptable.date_ecriture <= date_fin_obj)
+            datetime.strptime(date_fin, '%Y-%m-%d')
         
-        # Filtre par classe
-        if classe:
-            query = query.filter(PlanComptable.classe == classe)
-            
-        # Filtre par niveau
-        if niveau:
-            query = query.filter(PlanComptable.niveau <= niveau)
-        
-        # Grouper par compte
-        query = query.group_by(
-            LigneEcriture.numero_compte,
-            PlanComptable.libelle_compte,
-            PlanComptable.classe,
-            PlanComptable.niveau
-        ).order_by(LigneEcriture.numero_compte)
-        
-        lignes_balance = query.all()
-        
-        # Formatage de la balance
-        balance = []
-        total_debit_general = Decimal('0')
-        total_credit_general = Decimal('0')
-        
-        for ligne in lignes_balance:
-            debit = ligne.total_debit or Decimal('0')
-            credit = ligne.total_credit or Decimal('0')
-            solde = debit - credit
-            
-            balance.append({
-                'numero_compte': ligne.numero_compte,
-                'libelle_compte': ligne.libelle_compte,
-                'classe': ligne.classe,
-                'niveau': ligne.niveau,
-                'debit': float(debit),
-                'credit': float(credit),
-                'solde': float(solde),
-                'sens_solde': 'débiteur' if solde > 0 else 'créditeur' if solde < 0 else 'nul'
-            })
-            
-            total_debit_general += debit
-            total_credit_general += credit
+        # Balance en colonnes (centimes entiers), puis filtres vectorisés
+        balance = construire_balance(date_debut, date_fin).filtrer(classe=classe, niveau=niveau)
+        totaux = balance.totaux()
+        
+        lignes = balance.lignes_dict()
+        for ligne in lignes:
+            # Colonnes historiques : mouvements de la période et solde de clôture
+            ligne['debit'] = ligne['debit_periode']
+            ligne['credit'] = ligne['credit_periode']
+            ligne['solde'] = ligne['solde_cloture']
+            ligne['sens_solde'] = 'débiteur' if ligne['solde'] > 0 else 'créditeur' if ligne['solde'] < 0 else 'nul'
         
         return jsonify({
             'success': True,
             'data': {
-                'lignes': balance,
-                'totaux': {
-                    'total_debit': float(total_debit_general),
-                    'total_credit': float(total_credit_general),
-                    'equilibre': total_debit_general == total_credit_general
-                },
+                'lignes': lignes,
+                'sous_totaux': balance.sous_totaux_dict(),
+                'totaux': dict(
+                    {colonne: float(en_montant(valeur)) for colonne, valeur in totaux.items()},
+                    total_debit=float(en_montant(totaux['debit_periode'])),
+                    total_credit=float(en_montant(totaux['credit_periode'])),
+                    equilibre=totaux['debit_cloture'] == totaux['credit_cloture']
+                ),
                 'parametres': {
                     'date_debut': date_debut,
                     'date_fin': date_fin,
                     'classe': classe,
                     'niveau': niveau,
-                    'nombre_comptes': len(balance)
+                    'nombre_comptes': len(lignes)
                 }
             }
         })
@@ -441,7 +544,7 @@ def get_grand_livre_compte(numero_compte):
     """
     try:
         # Vérifier l'existence du compte
-        compte = PlanComptable.query.filter_by(numero_compte=numero_compte).first()
+        compte = get_registre().get(numero_compte)
         if not compte:
             return jsonify({
                 'success': False,
@@ -505,19 +608,29 @@ def get_grand_livre_compte(numero_compte):
         total_debit = sum(Decimal(str(ligne['debit'])) for ligne in lignes_grand_livre)
         total_credit = sum(Decimal(str(ligne['credit'])) for ligne in lignes_grand_livre)
         
+        # Solde d'ouverture lu dans les soldes mensuels
+        solde_ouverture = Decimal('0')
+        if date_debut:
+            debit_ouv, credit_ouv, _ = totaux_periode(
+                None, date_debut_obj - timedelta(days=1), numeros=[numero_compte]
+            ).get(numero_compte, (Decimal('0'), Decimal('0'), 0))
+            solde_ouverture = debit_ouv - credit_ouv
+        
         return jsonify({
             'success': True,
             'data': {
                 'compte': {
-                    'numero': compte.numero_compte,
-                    'libelle': compte.libelle_compte,
-                    'classe': compte.classe
+                    'numero': compte['numero_compte'],
+                    'libelle': compte['libelle_compte'],
+                    'classe': compte['classe']
                 },
                 'mouvements': lignes_grand_livre,
                 'totaux': {
                     'total_debit': float(total_debit),
                     'total_credit': float(total_credit),
                     'solde_final': float(solde_cumule),
+                    'solde_ouverture': float(solde_ouverture),
+                    'solde_cloture': float(solde_ouverture + solde_cumule),
                     'nombre_mouvements': len(lignes_grand_livre)
                 },
                 'parametres': {
@@ -560,6 +673,7 @@ def get_journaux():
         }), 500
 
 @comptabilite_bp.route('/tableau-bord', methods=['GET'])
+@cache_rapport('tableau_bord')
 def get_tableau_bord():
     """Génère un tableau de bord comptable avec indicateurs clés"""
     try:
@@ -41,6 +41,7 @@ try:
         EvaluationFormation, Certificat, StatutProgression, StatutCertificat,
         NiveauDifficulte, TypeContenu, TypeQuiz
     )
+    from services.elearning_progression import enregistrer_lecon_terminee, progressions_a_jour
 except ImportError:
     # Fallback si les modèles ne sont pas encore intégrés
     from models import db
@@ -82,27 +83,9 @@ def check_formation_access(formation, user_plan="gratuit"):
     return user_level >= required_level
 
 def calculate_progression(inscription):
-    """Calcule la progression d'une inscription"""
-    if not inscription.formation.modules:
-        return 0.0
-    
-    total_lecons = 0
-    lecons_terminees = 0
-    
-    for module in inscription.formation.modules:
-        total_lecons += len(module.lecons)
-        for lecon in module.lecons:
-            progression = ProgressionLecon.query.filter_by(
-                inscription_id=inscription.id,
-                lecon_id=lecon.id
-            ).first()
-            if progression and progression.termine:
-                lecons_terminees += 1
-    
-    if total_lecons == 0:
-        return 0.0
-    
-    return (lecons_terminees / total_lecons) * 100
+    """Progression d'une inscription (gardée sur l'inscription, recalculée seulement si inconnue)"""
+    progressions_a_jour([inscription])
+    return inscription.pourcentage_completion or 0.0
 
 # ============================
 # ENDPOINTS FORMATIONS
@@ -460,6 +443,7 @@ def terminer_lecon(lecon_id):
                 'message': 'Progression non trouvée'
             }), 404
         
+        deja_terminee = progression.termine
         progression.termine = True
         progression.date_fin = datetime.utcnow()
         progression.temps_passe = temps_passe
@@ -467,8 +451,11 @@ def terminer_lecon(lecon_id):
         # Mettre à jour le temps total de l'inscription
         inscription.temps_passe += temps_passe // 60  # conversion en minutes
         
-        # Recalculer la progression globale
-        inscription.pourcentage_completion = calculate_progression(inscription)
+        # Mettre à jour la progression globale (incrément, sans relire les leçons)
+        if not deja_terminee:
+            enregistrer_lecon_terminee(inscription)
+        else:
+            progressions_a_jour([inscription])
         
         # Vérifier si la formation est terminée
         if inscription.pourcentage_completion >= 100:
@@ -717,6 +704,10 @@ def get_mes_formations():
             utilisateur_id=user_id
         ).order_by(InscriptionFormation.date_inscription.desc()).all()
         
+        # Progressions inconnues recalculées en une requête pour toutes les inscriptions
+        if progressions_a_jour(inscriptions):
+            db.session.commit()
+        
         formations_data = []
         for inscription in inscriptions:
             formation_dict = inscription.formation.to_dict()
@@ -724,7 +715,9 @@ def get_mes_formations():
                 'id': inscription.id,
                 'statut': inscription.statut.value,
                 'date_inscription': inscription.date_inscription.isoformat(),
-                'pourcentage_completion': calculate_progression(inscription),
+                'pourcentage_completion': inscription.pourcentage_completion or 0.0,
+                'lecons_terminees': inscription.lecons_terminees or 0,
+                'nb_lecons': inscription.nb_lecons or 0,
                 'temps_passe': inscription.temps_passe
             }
             formations_data.append(formation_dict)
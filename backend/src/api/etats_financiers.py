@@ -22,6 +22,8 @@ from decimal import Decimal
 import json
 
 from models import db, PlanComptable, EcritureComptable, LigneEcriture, ExerciceComptable
+from services.balance_engine import charger_soldes, charger_soldes_ouverture
+from services.report_cache import cache_rapport
 
 # Création du blueprint
 etats_financiers_bp = Blueprint('etats_financiers', __name__)
@@ -168,49 +170,16 @@ STRUCTURE_COMPTE_RESULTAT_SYCEBNL = {
 }
 
 def calculer_solde_compte(numero_compte, date_debut=None, date_fin=None, exercice_id=None):
-    """Calcule le solde d'un compte pour une période donnée"""
+    """Calcule le solde d'un compte (cumulé sur ses sous-comptes) pour une période donnée"""
     try:
-        query = db.session.query(
-            func.sum(LigneEcriture.debit).label('total_debit'),
-            func.sum(LigneEcriture.credit).label('total_credit')
-        ).join(EcritureComptable).join(PlanComptable)
-        
-        # Filtrer par numéro de compte (avec wildcard pour les comptes parents)
-        if len(numero_compte) <= 2:
-            # Compte de classe ou principal
-            query = query.filter(PlanComptable.numero_compte.like(f"{numero_compte}%"))
-        else:
-            # Compte spécifique
-            query = query.filter(PlanComptable.numero_compte == numero_compte)
-        
-        # Filtres temporels
-        if exercice_id:
-            query = query.filter(EcritureComptable.exercice_id == exercice_id)
-        else:
-            if date_debut:
-                query = query.filter(EcritureComptable.date_ecriture >= date_debut)
-            if date_fin:
-                query = query.filter(EcritureComptable.date_ecriture <= date_fin)
-        
-        # Seulement les écritures validées
-        query = query.filter(EcritureComptable.statut == 'valide')
-        
-        result = query.first()
-        
-        debit = result.total_debit or Decimal('0')
-        credit = result.total_credit or Decimal('0')
-        solde = debit - credit
-        
-        return {
-            'debit': float(debit),
-            'credit': float(credit), 
-            'solde': float(solde)
-        }
+        soldes = charger_soldes(date_debut=date_debut, date_fin=date_fin, exercice_id=exercice_id)
+        return soldes.solde(numero_compte)
         
     except Exception as e:
         return {'debit': 0, 'credit': 0, 'solde': 0, 'erreur': str(e)}
 
 @etats_financiers_bp.route('/bilan', methods=['GET'])
+@cache_rapport('bilan')
 def generer_bilan():
     """Génère le bilan comptable SYCEBNL"""
     try:
@@ -237,14 +206,17 @@ def generer_bilan():
         total_actif = Decimal('0')
         total_passif = Decimal('0')
         
+        # Une seule agrégation pour tous les postes du bilan
+        soldes = charger_soldes(date_fin=date_fin, exercice_id=exercice_id)
+        
         # === CALCUL ACTIF ===
         for section_nom, section_data in STRUCTURE_BILAN_SYCEBNL["ACTIF"].items():
             section_total = Decimal('0')
             comptes_section = {}
             
             for compte_num, compte_libelle in section_data["comptes"].items():
-                solde_data = calculer_solde_compte(compte_num, date_fin=date_fin, exercice_id=exercice_id)
-                solde = Decimal(str(solde_data['solde']))
+                solde_data = soldes.solde(compte_num)
+                solde = soldes.solde_decimal(compte_num)
                 
                 # Pour l'actif, on prend les soldes débiteurs
                 if solde > 0:
@@ -271,8 +243,8 @@ def generer_bilan():
             comptes_key = "comptes_passif" if "comptes_passif" in section_data else "comptes"
             
             for compte_num, compte_libelle in section_data[comptes_key].items():
-                solde_data = calculer_solde_compte(compte_num, date_fin=date_fin, exercice_id=exercice_id)
-                solde = Decimal(str(solde_data['solde']))
+                solde_data = soldes.solde(compte_num)
+                solde = soldes.solde_decimal(compte_num)
                 
                 # Pour le passif, on prend les soldes créditeurs (donc négatifs)
                 if solde < 0:
@@ -316,6 +288,7 @@ def generer_bilan():
         }), 500
 
 @etats_financiers_bp.route('/compte-resultat', methods=['GET'])
+@cache_rapport('compte_resultat')
 def generer_compte_resultat():
     """Génère le compte de résultat (compte d'emploi et de ressources) SYCEBNL"""
     try:
@@ -347,19 +320,17 @@ def generer_compte_resultat():
         total_emplois = Decimal('0')
         total_ressources = Decimal('0')
         
+        # Une seule agrégation pour tous les postes du compte de résultat (avant écriture de clôture)
+        soldes = charger_soldes(date_debut=date_debut, date_fin=date_fin, exercice_id=exercice_id, hors_cloture=True)
+        
         # === CALCUL EMPLOIS (CHARGES) ===
         for section_nom, section_data in STRUCTURE_COMPTE_RESULTAT_SYCEBNL["EMPLOIS"].items():
             section_total = Decimal('0')
             comptes_section = {}
             
             for compte_num, compte_libelle in section_data["comptes"].items():
-                solde_data = calculer_solde_compte(
-                    compte_num, 
-                    date_debut=date_debut, 
-                    date_fin=date_fin, 
-                    exercice_id=exercice_id
-                )
-                solde = Decimal(str(solde_data['solde']))
+                solde_data = soldes.solde(compte_num)
+                solde = soldes.solde_decimal(compte_num)
                 
                 # Pour les charges, on prend les soldes débiteurs
                 if solde > 0:
@@ -384,13 +355,8 @@ def generer_compte_resultat():
             comptes_section = {}
             
             for compte_num, compte_libelle in section_data["comptes"].items():
-                solde_data = calculer_solde_compte(
-                    compte_num, 
-                    date_debut=date_debut, 
-                    date_fin=date_fin, 
-                    exercice_id=exercice_id
-                )
-                solde = Decimal(str(solde_data['solde']))
+                solde_data = soldes.solde(compte_num)
+                solde = soldes.solde_decimal(compte_num)
                 
                 # Pour les produits, on prend les soldes créditeurs (donc négatifs)
                 if solde < 0:
@@ -466,21 +432,21 @@ def generer_flux_tresorerie():
             "variation": {}
         }
         
-        # Calcul de la trésorerie de début (date_debut - 1 jour)
-        date_debut_obj = datetime.strptime(date_debut, '%Y-%m-%d')
-        date_avant_debut = (date_debut_obj - timedelta(days=1)).strftime('%Y-%m-%d')
+        # Trésorerie de début (avant date_debut) et de fin en une seule agrégation
+        soldes_debut, mouvements = charger_soldes_ouverture(date_debut, date_fin=date_fin, exercice_id=exercice_id)
+        soldes_fin = soldes_debut.combiner(mouvements)
         
         tresorerie_debut = Decimal('0')
         tresorerie_fin = Decimal('0')
         
         for compte in comptes_tresorerie:
             # Trésorerie de début
-            solde_debut = calculer_solde_compte(compte, date_fin=date_avant_debut, exercice_id=exercice_id)
-            tresorerie_debut += Decimal(str(solde_debut['solde']))
+            solde_debut = soldes_debut.solde(compte)
+            tresorerie_debut += soldes_debut.solde_decimal(compte)
             
             # Trésorerie de fin
-            solde_fin = calculer_solde_compte(compte, date_fin=date_fin, exercice_id=exercice_id)
-            tresorerie_fin += Decimal(str(solde_fin['solde']))
+            solde_fin = soldes_fin.solde(compte)
+            tresorerie_fin += soldes_fin.solde_decimal(compte)
             
             flux_tresorerie["tresorerie_debut"][compte] = {
                 'solde': float(solde_debut['solde']),
@@ -547,13 +513,15 @@ def generer_etats_ebnl():
             "adherents": {}
         }
         
+        # Une seule agrégation pour toutes les rubriques EBNL (comptes de gestion avant clôture)
+        soldes = charger_soldes(date_debut=date_debut, date_fin=date_fin, exercice_id=exercice_id, hors_cloture=True)
+        
         # === FONDS AFFECTÉS (Classe 16) ===
         comptes_fonds = ['16', '160', '161', '162', '163', '164', '165', '166', '167', '168']
-        fonds_total = Decimal('0')
         
         for compte in comptes_fonds:
-            solde_data = calculer_solde_compte(compte, date_debut=date_debut, date_fin=date_fin, exercice_id=exercice_id)
-            solde = Decimal(str(solde_data['solde']))
+            solde_data = soldes.solde(compte)
+            solde = soldes.solde_decimal(compte)
             
             if abs(solde) > 0:
                 etats_ebnl["fonds_affectes"][compte] = {
@@ -561,17 +529,16 @@ def generer_etats_ebnl():
                     'debit': solde_data['debit'],
                     'credit': solde_data['credit']
                 }
-                fonds_total += abs(solde)
         
-        etats_ebnl["fonds_affectes"]["total"] = float(fonds_total)
+        # Le total se lit sur le compte racine, qui cumule déjà ses sous-comptes
+        etats_ebnl["fonds_affectes"]["total"] = float(abs(soldes.solde_decimal('16')))
         
         # === CONTRIBUTIONS VOLONTAIRES (Classe 86) ===
         comptes_contrib = ['86', '860', '861', '862', '863']
-        contrib_total = Decimal('0')
         
         for compte in comptes_contrib:
-            solde_data = calculer_solde_compte(compte, date_debut=date_debut, date_fin=date_fin, exercice_id=exercice_id)
-            solde = Decimal(str(solde_data['solde']))
+            solde_data = soldes.solde(compte)
+            solde = soldes.solde_decimal(compte)
             
             if abs(solde) > 0:
                 etats_ebnl["contributions_volontaires"][compte] = {
@@ -579,17 +546,15 @@ def generer_etats_ebnl():
                     'debit': solde_data['debit'],
                     'credit': solde_data['credit']
                 }
-                contrib_total += abs(solde)
         
-        etats_ebnl["contributions_volontaires"]["total"] = float(contrib_total)
+        etats_ebnl["contributions_volontaires"]["total"] = float(abs(soldes.solde_decimal('86')))
         
         # === SUBVENTIONS (Comptes 74, 14) ===
         comptes_subv = ['74', '740', '741', '742', '743', '744', '14', '140', '141', '142']
-        subv_total = Decimal('0')
         
         for compte in comptes_subv:
-            solde_data = calculer_solde_compte(compte, date_debut=date_debut, date_fin=date_fin, exercice_id=exercice_id)
-            solde = Decimal(str(solde_data['solde']))
+            solde_data = soldes.solde(compte)
+            solde = soldes.solde_decimal(compte)
             
             if abs(solde) > 0:
                 etats_ebnl["subventions"][compte] = {
@@ -597,9 +562,10 @@ def generer_etats_ebnl():
                     'debit': solde_data['debit'],
                     'credit': solde_data['credit']
                 }
-                subv_total += abs(solde)
         
-        etats_ebnl["subventions"]["total"] = float(subv_total)
+        etats_ebnl["subventions"]["total"] = float(
+            abs(soldes.solde_decimal('74')) + abs(soldes.solde_decimal('14'))
+        )
         
         print(f"✅ États EBNL générés")
         
@@ -618,6 +584,7 @@ def generer_etats_ebnl():
         }), 500
 
 @etats_financiers_bp.route('/synthese', methods=['GET'])
+@cache_rapport('synthese')
 def synthese_etats_financiers():
     """Génère une synthèse de tous les états financiers"""
     try:
@@ -650,25 +617,29 @@ def synthese_etats_financiers():
         total_produits = Decimal('0')
         tresorerie = Decimal('0')
         
+        # Soldes d'ouverture et mouvements de la période en une seule agrégation
+        soldes_ouverture, mouvements = charger_soldes_ouverture(date_debut, date_fin=date_fin, exercice_id=exercice_id,
+                                                                hors_cloture=True)
+        soldes_cumules = soldes_ouverture.combiner(mouvements)
+        
         # Actif total (classe 2, 3, 4, 5)
         for classe in [2, 3, 4, 5]:
-            solde_data = calculer_solde_compte(str(classe), date_fin=date_fin, exercice_id=exercice_id)
-            if solde_data['solde'] > 0:
-                total_actif += Decimal(str(solde_data['solde']))
+            solde = soldes_cumules.solde_decimal(str(classe))
+            if solde > 0:
+                total_actif += solde
         
         # Charges (classe 6)
-        solde_charges = calculer_solde_compte('6', date_debut=date_debut, date_fin=date_fin, exercice_id=exercice_id)
-        if solde_charges['solde'] > 0:
-            total_charges = Decimal(str(solde_charges['solde']))
+        solde_charges = mouvements.solde_decimal('6')
+        if solde_charges > 0:
+            total_charges = solde_charges
         
         # Produits (classe 7)
-        solde_produits = calculer_solde_compte('7', date_debut=date_debut, date_fin=date_fin, exercice_id=exercice_id)
-        if solde_produits['solde'] < 0:
-            total_produits = abs(Decimal(str(solde_produits['solde'])))
+        solde_produits = mouvements.solde_decimal('7')
+        if solde_produits < 0:
+            total_produits = abs(solde_produits)
         
         # Trésorerie (comptes 5)
-        solde_tresorerie = calculer_solde_compte('5', date_fin=date_fin, exercice_id=exercice_id)
-        tresorerie = Decimal(str(solde_tresorerie['solde']))
+        tresorerie = soldes_cumules.solde_decimal('5')
         
         resultat_net = total_produits - total_charges
         
@@ -684,7 +655,7 @@ def synthese_etats_financiers():
         synthese["ratios"] = {
             'taux_resultat': float((resultat_net / total_produits * 100) if total_produits > 0 else 0),
             'ratio_tresorerie': float((tresorerie / total_actif * 100) if total_actif > 0 else 0),
-            'autonomie_financiere': float((abs(solde_produits['solde']) / total_charges * 100) if total_charges > 0 else 0)
+            'autonomie_financiere': float((abs(solde_produits) / total_charges * 100) if total_charges > 0 else 0)
         }
         
         print(f"✅ Synthèse générée - Résultat: {resultat_net}€")
@@ -16,13 +16,15 @@ Auteur: ComptaEBNL-IA
 Date: 2025
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from sqlalchemy import func, and_, or_
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import json
 
-from models import db, ExerciceComptable, EcritureComptable, LigneEcriture, PlanComptable
+from models import db, ExerciceComptable, EcritureComptable, LigneEcriture, PlanComptable, SoldeClotureExercice, ClotureExercice
+from services.exercice_closing import preparer_cloture, executer_cloture, lancer_cloture, est_abandonnee
+from services.opening_balances import supprimer_snapshot
 
 # Création du blueprint
 exercices_bp = Blueprint('exercices', __name__)
@@ -282,7 +284,7 @@ def get_exercice_detail(exercice_id):
 
 @exercices_bp.route('/exercices/<int:exercice_id>/cloturer', methods=['POST'])
 def cloturer_exercice(exercice_id):
-    """Clôture un exercice comptable"""
+    """Lance (ou reprend) la clôture d'un exercice comptable par étapes"""
     try:
         exercice = ExerciceComptable.query.get_or_404(exercice_id)
         
@@ -297,90 +299,79 @@ def cloturer_exercice(exercice_id):
         
         print(f"🔒 Clôture exercice: {exercice.libelle} (définitive: {cloture_definitive})")
         
-        # Vérifications avant clôture
-        verifications = []
+        # Une clôture interrompue reprend à son dernier point de reprise
+        cloture, a_lancer = preparer_cloture(exercice, cloture_definitive, data.get('forcer', False))
         
-        # 1. Vérifier l'équilibre général
-        total_debit = db.session.query(func.sum(LigneEcriture.debit)).join(EcritureComptable).filter(
-            EcritureComptable.exercice_id == exercice_id,
-            EcritureComptable.statut == 'valide'
-        ).scalar() or 0
-        
-        total_credit = db.session.query(func.sum(LigneEcriture.credit)).join(EcritureComptable).filter(
-            EcritureComptable.exercice_id == exercice_id,
-            EcritureComptable.statut == 'valide'
-        ).scalar() or 0
-        
-        if abs(float(total_debit - total_credit)) > 0.01:
-            verifications.append({
-                'type': 'erreur',
-                'message': f'Déséquilibre comptable: {float(total_debit - total_credit):.2f}€'
+        # Exécution dans la requête (tests, petites bases) : réponse finale directe
+        if a_lancer and current_app.config.get('CLOTURE_SYNCHRONE'):
+            cloture = executer_cloture(cloture.id)
+            suivi = cloture.to_dict()
+            if cloture.statut == 'erreur':
+                return jsonify({
+                    'success': False,
+                    'error': cloture.erreur,
+                    'data': suivi,
+                    'verifications': suivi['verifications']
+                }), 400
+            return jsonify({
+                'success': True,
+                'data': {
+                    'exercice': exercice.to_dict(),
+                    'cloture': suivi,
+                    'verifications': suivi['verifications'],
+                    'resultat_net': suivi['resultat']['resultat_net'] if cloture.definitif else None,
+                    'comptes_figes': (cloture.etat or {}).get('comptes_figes', 0)
+                },
+                'message': f'Exercice "{exercice.libelle}" clôturé avec succès'
             })
         
-        # 2. Vérifier les écritures non validées
-        nb_brouillard = EcritureComptable.query.filter_by(
-            exercice_id=exercice_id, 
-            statut='brouillard'
-        ).count()
-        
-        if nb_brouillard > 0:
-            verifications.append({
-                'type': 'avertissement',
-                'message': f'{nb_brouillard} écriture(s) encore en brouillard'
-            })
+        tache_cloture = lancer_cloture(cloture.id) if a_lancer else None
         
-        # 3. Vérifier que la date de fin est passée
-        if exercice.date_fin > date.today():
-            verifications.append({
-                'type': 'avertissement',
-                'message': 'La date de fin d\'exercice n\'est pas encore atteinte'
-            })
+        return jsonify({
+            'success': True,
+            'data': {
+                'cloture': cloture.to_dict(),
+                'tache_id': tache_cloture.id if tache_cloture else None,
+                'suivi': f'/api/v1/exercices/{exercice_id}/cloture'
+            },
+            'message': f'Clôture de l\'exercice "{exercice.libelle}" en cours'
+        }), 202
         
-        # Si erreurs bloquantes, arrêter
-        erreurs = [v for v in verifications if v['type'] == 'erreur']
-        if erreurs and not data.get('forcer', False):
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erreur clôture exercice: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Erreur lors de la clôture de l\'exercice'
+        }), 500
+
+@exercices_bp.route('/exercices/<int:exercice_id>/cloture', methods=['GET'])
+def get_statut_cloture(exercice_id):
+    """Avancement de la clôture d'un exercice (étape, progression, vérifications)"""
+    try:
+        cloture = ClotureExercice.query.filter_by(exercice_id=exercice_id).first()
+        if not cloture:
             return jsonify({
                 'success': False,
-                'error': 'Erreurs bloquantes détectées',
-                'verifications': verifications,
-                'message': 'Utilisez "forcer": true pour passer outre les erreurs'
-            }), 400
-        
-        # Effectuer la clôture
-        exercice.statut = 'ferme'
-        exercice.date_cloture = datetime.now()
-        exercice.cloture_definitif = cloture_definitive
-        
-        if cloture_definitive:
-            # Générer les écritures de clôture (à nouveau et résultat)
-            resultat_net = float(total_credit - total_debit)  # Crédit - Débit pour le résultat
-            
-            if abs(resultat_net) > 0.01:
-                # Créer l'écriture de clôture du résultat
-                from api.comptabilite import creer_ecriture_cloture
-                creer_ecriture_cloture(exercice_id, resultat_net)
-        
-        db.session.commit()
+                'error': 'Aucune clôture lancée pour cet exercice'
+            }), 404
         
-        print(f"✅ Exercice clôturé: {exercice.libelle}")
+        statut = cloture.to_dict()
+        statut['interrompue'] = est_abandonnee(cloture)
         
         return jsonify({
             'success': True,
-            'data': {
-                'exercice': exercice.to_dict(),
-                'verifications': verifications,
-                'resultat_net': float(total_credit - total_debit) if cloture_definitive else None
-            },
-            'message': f'Exercice "{exercice.libelle}" clôturé avec succès'
+            'data': statut,
+            'message': f'Clôture {cloture.statut} ({cloture.progression}%)'
         })
         
     except Exception as e:
-        db.session.rollback()
-        print(f"❌ Erreur clôture exercice: {e}")
+        print(f"❌ Erreur suivi clôture: {e}")
         return jsonify({
             'success': False,
             'error': str(e),
-            'message': 'Erreur lors de la clôture de l\'exercice'
+            'message': 'Erreur lors de la lecture de l\'avancement de la clôture'
         }), 500
 
 @exercices_bp.route('/exercices/<int:exercice_id>/rouvrir', methods=['POST'])
@@ -401,11 +392,24 @@ def rouvrir_exercice(exercice_id):
                 'error': 'Impossible de rouvrir un exercice clôturé définitivement'
             }), 400
         
+        # Les soldes figés des exercices suivants incluent celui-ci
+        suivant = ExerciceComptable.query.filter(
+            ExerciceComptable.date_debut > exercice.date_fin,
+            ExerciceComptable.id.in_(db.session.query(SoldeClotureExercice.exercice_id))
+        ).first()
+        if suivant:
+            return jsonify({
+                'success': False,
+                'error': f'L\'exercice suivant "{suivant.nom_exercice}" est clôturé : rouvrez-le d\'abord'
+            }), 400
+        
         print(f"🔓 Réouverture exercice: {exercice.libelle}")
         
         # Réouvrir l'exercice
         exercice.statut = 'ouvert'
         exercice.date_cloture = None
+        supprimer_snapshot(exercice_id)
+        ClotureExercice.query.filter_by(exercice_id=exercice_id).delete(synchronize_session=False)
         
         db.session.commit()
         
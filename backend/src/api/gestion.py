@@ -6,7 +6,7 @@ Gestion multi-projets, multi-bailleurs : dirigeants, budget, activités, patrimo
 from flask import Blueprint, request, jsonify, current_app, send_file
 from datetime import datetime, date
 import os
-import pandas as pd
+from sqlalchemy import insert
 from werkzeug.utils import secure_filename
 import json
 from decimal import Decimal
@@ -19,9 +19,16 @@ from models_gestion import (
     TypeActivite, TypeBien, StatutBudget
 )
 
+from services.balance_upload import (
+    FormatBalanceInvalide, SEUIL_FLUX_DEFAUT, TAILLE_LOT_DEFAUT, lire_fichier, preparer_lignes, iterer_lots_csv
+)
+
 # Middleware d'authentification (à adapter selon votre système)
 from middleware.subscription_middleware import subscription_required
 
+from services.job_runner import tache, get_gestionnaire, ErreurTache
+from api.taches import demande_asynchrone, reponse_tache
+
 gestion_bp = Blueprint('gestion', __name__)
 
 # Configuration upload
@@ -643,10 +650,105 @@ def get_balances():
             'message': f'Erreur lors de la récupération des balances: {str(e)}'
         }), 500
 
+def traiter_balance(file_path, filename, association_id, importe_par, exercice, date_cloture,
+                    type_balance, mode_import, delimiter, progression=None):
+    """
+    Crée la balance et ses lignes depuis le fichier enregistré (commit)
+    
+    Args:
+        progression: Fonction appelée avec le pourcentage traité (tâche en arrière-plan)
+    
+    Returns:
+        tuple: (corps JSON, code HTTP)
+    """
+    balance = Balance(
+        association_id=association_id,
+        exercice=exercice,
+        date_cloture=date_cloture,
+        type_balance=type_balance,
+        fichier_balance=f"uploads/balances/{filename}",
+        importe_par=importe_par
+    )
+    
+    db.session.add(balance)
+    db.session.flush()
+    
+    # Traiter le fichier Excel/CSV
+    try:
+        nb_lignes, erreurs = 0, []
+        seuil_flux = current_app.config.get('BALANCE_SEUIL_FLUX', SEUIL_FLUX_DEFAUT)
+        taille_fichier = os.path.getsize(file_path)
+        
+        if filename.lower().endswith('.csv') and taille_fichier > seuil_flux:
+            # Gros CSV : lecture en flux sans pandas, insertion lot par lot
+            with open(file_path, encoding='utf-8-sig', newline='') as stream:
+                for lot, erreurs_lot in iterer_lots_csv(stream, balance.id, delimiter):
+                    erreurs.extend(erreurs_lot)
+                    if lot and (not erreurs or mode_import == 'force'):
+                        db.session.execute(insert(LigneBalance), lot)
+                        nb_lignes += len(lot)
+                    if progression:
+                        progression(stream.buffer.tell() * 100 // max(taille_fichier, 1))
+        else:
+            # Conversion et validation sur des colonnes entières
+            lignes, erreurs = preparer_lignes(lire_fichier(file_path, delimiter), balance.id)
+            if not erreurs or mode_import == 'force':
+                for debut in range(0, len(lignes), TAILLE_LOT_DEFAUT):
+                    db.session.execute(insert(LigneBalance), lignes[debut:debut + TAILLE_LOT_DEFAUT])
+                    if progression:
+                        progression((debut + TAILLE_LOT_DEFAUT) * 100 // len(lignes))
+                nb_lignes = len(lignes)
+        
+        # Toutes les lignes en erreur sont signalées en une fois
+        if erreurs and mode_import != 'force':
+            db.session.rollback()
+            os.remove(file_path)
+            return {
+                'success': False,
+                'message': f'{len(erreurs)} erreur(s) de validation : utilisez mode=force pour importer les lignes valides',
+                'erreurs': erreurs
+            }, 400
+        
+        db.session.commit()
+        
+        return {
+            'success': True,
+            'message': f'Balance importée avec succès ({nb_lignes} lignes)',
+            'balance': balance.to_dict(),
+            'erreurs': erreurs
+        }, 200
+        
+    except FormatBalanceInvalide as e:
+        db.session.rollback()
+        os.remove(file_path)
+        return {
+            'success': False,
+            'message': str(e)
+        }, 400
+        
+    except Exception as e:
+        # Supprimer le fichier en cas d'erreur de traitement
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise e
+
+@tache('balance_upload')
+def tache_balance_upload(contexte, fichier, nom_fichier, association_id, importe_par, exercice, date_cloture,
+                         type_balance, mode, delimiter):
+    """Import de balance exécuté en arrière-plan depuis le fichier enregistré"""
+    corps, code = traiter_balance(
+        fichier, nom_fichier, association_id, importe_par, exercice,
+        datetime.strptime(date_cloture, '%Y-%m-%d').date(), type_balance, mode, delimiter,
+        progression=lambda pourcentage: contexte.progression(pourcentage, 'Import des lignes')
+    )
+    if code != 200:
+        raise ErreurTache(corps['message'], corps)
+    return corps
+
 @gestion_bp.route('/balances/upload', methods=['POST'])
 @subscription_required
 def upload_balance():
-    """Upload et traitement d'une balance Excel/CSV"""
+    """Upload et traitement d'une balance Excel/CSV (asynchrone=true : tâche en arrière-plan)"""
     try:
         if 'fichier' not in request.files:
             return jsonify({
@@ -671,6 +773,8 @@ def upload_balance():
         exercice = int(request.form.get('exercice'))
         date_cloture = datetime.strptime(request.form.get('date_cloture'), '%Y-%m-%d').date()
         type_balance = request.form.get('type_balance', 'balance_n1')
+        mode_import = request.form.get('mode', 'validation')  # validation, force
+        delimiter = request.form.get('delimiter', ',')
         
         # Sauvegarder le fichier
         filename = secure_filename(file.filename)
@@ -679,64 +783,25 @@ def upload_balance():
         file_path = os.path.join(upload_dir, filename)
         file.save(file_path)
         
-        # Créer l'enregistrement Balance
-        association_id = get_user_association_id()
-        balance = Balance(
-            association_id=association_id,
-            exercice=exercice,
-            date_cloture=date_cloture,
-            type_balance=type_balance,
-            fichier_balance=f"uploads/balances/{filename}",
-            importe_par=get_current_user_id()
+        if demande_asynchrone():
+            tache_balance = get_gestionnaire().soumettre('balance_upload', {
+                'fichier': file_path,
+                'nom_fichier': filename,
+                'association_id': get_user_association_id(),
+                'importe_par': get_current_user_id(),
+                'exercice': exercice,
+                'date_cloture': date_cloture.isoformat(),
+                'type_balance': type_balance,
+                'mode': mode_import,
+                'delimiter': delimiter
+            }, utilisateur_id=get_current_user_id())
+            return reponse_tache(tache_balance, 'Import de balance mis en file')
+        
+        corps, code = traiter_balance(
+            file_path, filename, get_user_association_id(), get_current_user_id(), exercice, date_cloture,
+            type_balance, mode_import, delimiter
         )
-        
-        db.session.add(balance)
-        db.session.flush()
-        
-        # Traiter le fichier Excel/CSV
-        try:
-            if filename.endswith('.xlsx') or filename.endswith('.xls'):
-                df = pd.read_excel(file_path)
-            else:  # CSV
-                df = pd.read_csv(file_path)
-            
-            # Colonnes attendues (à adapter selon le format)
-            colonnes_requises = ['numero_compte', 'libelle_compte', 'solde_debiteur', 'solde_crediteur']
-            
-            # Vérifier les colonnes
-            if not all(col in df.columns for col in colonnes_requises):
-                return jsonify({
-                    'success': False,
-                    'message': f'Colonnes requises manquantes: {colonnes_requises}'
-                }), 400
-            
-            # Traiter chaque ligne
-            for index, row in df.iterrows():
-                ligne = LigneBalance(
-                    balance_id=balance.id,
-                    numero_compte=str(row['numero_compte']).strip(),
-                    libelle_compte=str(row['libelle_compte']).strip(),
-                    solde_debiteur=Decimal(str(row.get('solde_debiteur', 0) or 0)),
-                    solde_crediteur=Decimal(str(row.get('solde_crediteur', 0) or 0)),
-                    mouvement_debit=Decimal(str(row.get('mouvement_debit', 0) or 0)),
-                    mouvement_credit=Decimal(str(row.get('mouvement_credit', 0) or 0)),
-                    ligne_fichier=index + 2  # +2 car index commence à 0 et ligne d'en-tête
-                )
-                db.session.add(ligne)
-            
-            db.session.commit()
-            
-            return jsonify({
-                'success': True,
-                'message': f'Balance importée avec succès ({len(df)} lignes)',
-                'balance': balance.to_dict()
-            })
-            
-        except Exception as e:
-            # Supprimer le fichier en cas d'erreur de traitement
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            raise e
+        return jsonify(corps), code
             
     except Exception as e:
         db.session.rollback()
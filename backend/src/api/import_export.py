@@ -16,7 +16,7 @@ Auteur: ComptaEBNL-IA
 Date: 2025
 """
 
-from flask import Blueprint, request, jsonify, send_file, make_response
+from flask import Blueprint, request, jsonify, send_file, make_response, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import csv
 import json
@@ -27,6 +27,15 @@ from decimal import Decimal
 import tempfile
 
 from models import db, PlanComptable, EcritureComptable, LigneEcriture, ExerciceComptable, JournalComptable
+from services.balance_engine import resoudre_periode
+from services.monthly_balances import PeriodeCloturee, verifier_periode_ouverte
+from services.trial_balance import construire_balance, en_montant
+from services.ledger_import import (
+    REQUIRED_HEADERS, TAILLE_LOT_DEFAUT, charger_referentiels, valider_lignes,
+    controler_equilibre, allouer_numeros, inserer_par_lots
+)
+from services.job_runner import tache, get_gestionnaire, ErreurTache
+from api.taches import demande_asynchrone, reponse_tache
 
 # Création du blueprint
 import_export_bp = Blueprint('import_export', __name__)
@@ -128,9 +137,159 @@ def export_plan_comptable():
             'message': 'Erreur lors de l\'export du plan comptable'
         }), 500
 
+# Colonnes des exports d'écritures (une ligne de fichier par ligne d'écriture)
+EXPORT_CSV_HEADERS = [
+    'numero_ecriture', 'date_ecriture', 'journal', 'libelle_ecriture',
+    'piece_justificative', 'numero_compte', 'libelle_compte', 'libelle_ligne',
+    'debit', 'credit', 'statut', 'exercice_id'
+]
+
+EXPORT_FEC_HEADERS = [
+    'JournalCode', 'JournalLib', 'EcritureNum', 'EcritureDate',
+    'CompteNum', 'CompteLib', 'CompAuxNum', 'CompAuxLib',
+    'PieceRef', 'PieceDate', 'EcritureLib', 'Debit', 'Credit',
+    'EcritureLet', 'DateLet', 'ValidDate', 'Montantdevise', 'Idevise'
+]
+
+# En-tête CSV -> colonne de la balance vectorisée
+EXPORT_BALANCE_COLONNES = [
+    ('debit_precedent', 'debit_ouverture'),
+    ('credit_precedent', 'credit_ouverture'),
+    ('solde_precedent', 'solde_ouverture'),
+    ('debit_periode', 'debit_periode'),
+    ('credit_periode', 'credit_periode'),
+    ('mouvement_periode', 'mouvement_periode'),
+    ('debit_cumule', 'debit_cloture'),
+    ('credit_cumule', 'credit_cloture'),
+    ('solde_final', 'solde_cloture')
+]
+
+EXPORT_BATCH_SIZE = 2000  # lignes lues par aller-retour curseur et par bloc émis
+
+def requete_export_ecritures(date_debut=None, date_fin=None, journal=None, statut=None):
+    """Requête unique lignes + écritures + comptes + journaux, triée pour l'export"""
+    query = db.session.query(
+        EcritureComptable.numero_ecriture,
+        EcritureComptable.date_ecriture,
+        EcritureComptable.journal,
+        EcritureComptable.libelle,
+        EcritureComptable.piece_justificative,
+        EcritureComptable.statut,
+        EcritureComptable.date_validation,
+        LigneEcriture.numero_compte,
+        LigneEcriture.libelle.label('libelle_ligne'),
+        LigneEcriture.debit,
+        LigneEcriture.credit,
+        PlanComptable.libelle_compte,
+        JournalComptable.libelle.label('libelle_journal')
+    ).join(
+        LigneEcriture, LigneEcriture.ecriture_id == EcritureComptable.id
+    ).outerjoin(
+        PlanComptable, PlanComptable.numero_compte == LigneEcriture.numero_compte
+    ).outerjoin(
+        JournalComptable, JournalComptable.code == EcritureComptable.journal
+    )
+    
+    if date_debut:
+        query = query.filter(EcritureComptable.date_ecriture >= date_debut)
+    
+    if date_fin:
+        query = query.filter(EcritureComptable.date_ecriture <= date_fin)
+    
+    if journal:
+        query = query.filter(EcritureComptable.journal == journal)
+    
+    if statut:
+        query = query.filter(EcritureComptable.statut == statut)
+    
+    return query.order_by(
+        EcritureComptable.date_ecriture, EcritureComptable.numero_ecriture, LigneEcriture.id
+    )
+
+def generer_export_ecritures(query, format_export, exercice_id=None):
+    """Génère le fichier par blocs à partir d'un curseur (mémoire constante)"""
+    output = io.StringIO()
+    
+    if format_export == 'fec':
+        writer = csv.writer(output, delimiter='|')
+        writer.writerow(EXPORT_FEC_HEADERS)
+    else:
+        writer = csv.writer(output)
+        writer.writerow(EXPORT_CSV_HEADERS)
+    
+    for index, ligne in enumerate(query.yield_per(EXPORT_BATCH_SIZE), start=1):
+        statut = ligne.statut.value if hasattr(ligne.statut, 'value') else ligne.statut
+        
+        if format_export == 'fec':
+            date_fec = ligne.date_ecriture.strftime('%Y%m%d')
+            writer.writerow([
+                ligne.journal,
+                ligne.libelle_journal or '',
+                ligne.numero_ecriture,
+                date_fec,
+                ligne.numero_compte,
+                ligne.libelle_compte or '',
+                '', # CompAuxNum
+                '', # CompAuxLib
+                ligne.piece_justificative or '',
+                date_fec,
+                ligne.libelle_ligne,
+                f"{ligne.debit:.2f}".replace('.', ','),
+                f"{ligne.credit:.2f}".replace('.', ','),
+                '', # EcritureLet
+                '', # DateLet
+                ligne.date_validation.strftime('%Y%m%d') if ligne.date_validation else '',
+                '', # Montantdevise
+                '' # Idevise
+            ])
+        else:
+            writer.writerow([
+                ligne.numero_ecriture,
+                ligne.date_ecriture.strftime('%Y-%m-%d'),
+                ligne.journal,
+                ligne.libelle,
+                ligne.piece_justificative or '',
+                ligne.numero_compte,
+                ligne.libelle_compte or '',
+                ligne.libelle_ligne,
+                float(ligne.debit),
+                float(ligne.credit),
+                statut,
+                exercice_id or ''
+            ])
+        
+        if index % EXPORT_BATCH_SIZE == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+    
+    yield output.getvalue()
+
+def fichier_export_ecritures(format_export):
+    """Nom et type de contenu du fichier d'export"""
+    if format_export == 'fec':
+        return f'FEC_{datetime.now().strftime("%Y%m%d")}.txt', 'text/plain; charset=utf-8'
+    return f'ecritures_{datetime.now().strftime("%Y%m%d")}.csv', 'text/csv; charset=utf-8'
+
+@tache('export_ecritures')
+def tache_export_ecritures(contexte, format_export, exercice_id, date_debut, date_fin, journal, statut):
+    """Export écrit dans le dossier de la tâche, téléchargeable une fois terminé"""
+    date_debut, date_fin = resoudre_periode(date_debut, date_fin, exercice_id)
+    query = requete_export_ecritures(date_debut, date_fin, journal, statut)
+    total = query.order_by(None).count()
+    
+    filename, content_type = fichier_export_ecritures(format_export)
+    chemin = contexte.fichier_resultat(filename, content_type)
+    with open(chemin, 'w', encoding='utf-8', newline='') as sortie:
+        for rang, bloc in enumerate(generer_export_ecritures(query, format_export, exercice_id)):
+            sortie.write(bloc)
+            contexte.progression(min(99, rang * EXPORT_BATCH_SIZE * 100 // max(total, 1)), f'{filename}')
+    
+    return {'lignes': total, 'fichier': filename}
+
 @import_export_bp.route('/export/ecritures', methods=['GET'])
 def export_ecritures():
-    """Exporte les écritures comptables"""
+    """Exporte les écritures comptables en flux (CSV ou FEC ; asynchrone=true : fichier produit par une tâche)"""
     try:
         format_export = request.args.get('format', 'csv').lower()
         exercice_id = request.args.get('exercice_id', type=int)
@@ -139,120 +298,48 @@ def export_ecritures():
         journal = request.args.get('journal')
         statut = request.args.get('statut', 'valide')
         
-        print(f"📤 Export écritures (format: {format_export})")
-        
-        # Construction de la requête
-        query = EcritureComptable.query
-        
-        if exercice_id:
-            query = query.filter(EcritureComptable.exercice_id == exercice_id)
-        
-        if date_debut:
-            query = query.filter(EcritureComptable.date_ecriture >= date_debut)
-        
-        if date_fin:
-            query = query.filter(EcritureComptable.date_ecriture <= date_fin)
-        
-        if journal:
-            query = query.filter(EcritureComptable.journal == journal)
-        
-        if statut:
-            query = query.filter(EcritureComptable.statut == statut)
-        
-        ecritures = query.order_by(EcritureComptable.date_ecriture, EcritureComptable.numero_ecriture).all()
-        
-        if format_export == 'csv':
-            # Export CSV détaillé (une ligne par ligne d'écriture)
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # En-têtes CSV
-            headers = [
-                'numero_ecriture', 'date_ecriture', 'journal', 'libelle_ecriture',
-                'piece_justificative', 'numero_compte', 'libelle_compte', 'libelle_ligne',
-                'debit', 'credit', 'statut', 'exercice_id'
-            ]
-            writer.writerow(headers)
-            
-            # Données
-            for ecriture in ecritures:
-                for ligne in ecriture.lignes:
-                    writer.writerow([
-                        ecriture.numero_ecriture,
-                        ecriture.date_ecriture.strftime('%Y-%m-%d'),
-                        ecriture.journal,
-                        ecriture.libelle,
-                        ecriture.piece_justificative or '',
-                        ligne.compte.numero_compte,
-                        ligne.compte.libelle_compte,
-                        ligne.libelle,
-                        float(ligne.debit),
-                        float(ligne.credit),
-                        ecriture.statut,
-                        ecriture.exercice_id
-                    ])
-            
-            # Créer la réponse
-            output.seek(0)
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-            response.headers['Content-Disposition'] = f'attachment; filename=ecritures_{datetime.now().strftime("%Y%m%d")}.csv'
-            
-            return response
-            
-        elif format_export == 'fec':
-            # Export au format FEC (Fichier des Écritures Comptables)
-            output = io.StringIO()
-            writer = csv.writer(output, delimiter='|')
-            
-            # En-têtes FEC
-            headers = [
-                'JournalCode', 'JournalLib', 'EcritureNum', 'EcritureDate',
-                'CompteNum', 'CompteLib', 'CompAuxNum', 'CompAuxLib',
-                'PieceRef', 'PieceDate', 'EcritureLib', 'Debit', 'Credit',
-                'EcritureLet', 'DateLet', 'ValidDate', 'Montantdevise', 'Idevise'
-            ]
-            writer.writerow(headers)
-            
-            # Données au format FEC
-            for ecriture in ecritures:
-                for ligne in ecriture.lignes:
-                    writer.writerow([
-                        ecriture.journal,
-                        '', # JournalLib - à remplir depuis JournalComptable
-                        ecriture.numero_ecriture,
-                        ecriture.date_ecriture.strftime('%Y%m%d'),
-                        ligne.compte.numero_compte,
-                        ligne.compte.libelle_compte,
-                        '', # CompAuxNum
-                        '', # CompAuxLib
-                        ecriture.piece_justificative or '',
-                        ecriture.date_ecriture.strftime('%Y%m%d'),
-                        ligne.libelle,
-                        f"{ligne.debit:.2f}".replace('.', ','),
-                        f"{ligne.credit:.2f}".replace('.', ','),
-                        '', # EcritureLet
-                        '', # DateLet
-                        ecriture.date_validation.strftime('%Y%m%d') if ecriture.date_validation else '',
-                        '', # Montantdevise
-                        '' # Idevise
-                    ])
-            
-            # Créer la réponse
-            output.seek(0)
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/plain; charset=utf-8'
-            response.headers['Content-Disposition'] = f'attachment; filename=FEC_{datetime.now().strftime("%Y%m%d")}.txt'
-            
-            return response
-        
-        else:
+        if format_export not in ('csv', 'fec'):
             return jsonify({
                 'success': False,
                 'error': f'Format non supporté: {format_export}',
                 'formats_supportes': ['csv', 'fec']
             }), 400
         
+        print(f"📤 Export écritures (format: {format_export})")
+        
+        if demande_asynchrone():
+            tache_export = get_gestionnaire().soumettre('export_ecritures', {
+                'format_export': format_export,
+                'exercice_id': exercice_id,
+                'date_debut': date_debut,
+                'date_fin': date_fin,
+                'journal': journal,
+                'statut': statut
+            })
+            return reponse_tache(tache_export, 'Export mis en file')
+        
+        # Les écritures ne portent pas l'exercice : il borne la période
+        date_debut, date_fin = resoudre_periode(date_debut, date_fin, exercice_id)
+        query = requete_export_ecritures(date_debut, date_fin, journal, statut)
+        
+        filename, content_type = fichier_export_ecritures(format_export)
+        
+        # Réponse en flux : transfert par blocs, sans construire le fichier en mémoire
+        response = Response(
+            stream_with_context(generer_export_ecritures(query, format_export, exercice_id)),
+            content_type=content_type
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        
+        return response
+        
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Format de date invalide',
+            'message': 'Utilisez le format YYYY-MM-DD pour les dates'
+        }), 400
+        
     except Exception as e:
         print(f"❌ Erreur export écritures: {e}")
         return jsonify({
@@ -261,9 +348,96 @@ def export_ecritures():
             'message': 'Erreur lors de l\'export des écritures'
         }), 500
 
+def traiter_import_ecritures(stream, exercice, mode_import='validation', delimiter=',',
+                             taille_lot=TAILLE_LOT_DEFAUT, progression=None):
+    """
+    Valide puis insère les écritures d'un CSV (lecture en flux, commit final)
+
+    Returns:
+        Tuple[Dict, int]: (corps de réponse JSON, code HTTP)
+    """
+    csv_reader = csv.DictReader(stream, delimiter=delimiter)
+    
+    # Valider les en-têtes requis
+    is_valid, error_msg = validate_csv_headers(csv_reader.fieldnames or [], REQUIRED_HEADERS)
+    if not is_valid:
+        return {
+            'success': False,
+            'error': error_msg
+        }, 400
+    
+    # Les soldes figés d'un exercice clôturé n'incluraient pas ces écritures une fois validées
+    try:
+        verifier_periode_ouverte(exercice.date_debut)
+    except PeriodeCloturee as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }, 400
+    
+    # Validation ensembliste : référentiels préchargés, une seule passe sur le fichier
+    comptes, journaux = charger_referentiels()
+    ecritures_data, erreurs = valider_lignes(
+        csv_reader, comptes, journaux, exercice.date_debut, exercice.date_fin
+    )
+    erreurs.extend(controler_equilibre(ecritures_data))
+    
+    # Vérifier les erreurs
+    if erreurs and mode_import != 'force':
+        return {
+            'success': False,
+            'error': 'Erreurs de validation détectées',
+            'erreurs': erreurs,
+            'message': 'Utilisez mode=force pour ignorer les erreurs'
+        }, 400
+    
+    # En mode force, les écritures déséquilibrées sont créées en brouillard
+    allouer_numeros(ecritures_data)
+    
+    def afficher_progression(rapport):
+        print(f"   📦 Lot {rapport['lot']}/{rapport['nb_lots']}: "
+              f"{rapport['cumul_ecritures']} écritures ({rapport['duree_ms']} ms)")
+        if progression:
+            progression(rapport)
+    
+    ecritures_creees, lots = inserer_par_lots(
+        ecritures_data, taille_lot, progression=afficher_progression
+    )
+    
+    db.session.commit()
+    
+    print(f"✅ Import terminé: {len(ecritures_creees)} écritures créées")
+    
+    return {
+        'success': True,
+        'data': {
+            'ecritures_creees': len(ecritures_creees),
+            'lignes_creees': sum(lot['lignes'] for lot in lots),
+            'ecritures_ids': ecritures_creees,
+            'lots': lots,
+            'erreurs': erreurs if mode_import == 'force' else []
+        },
+        'message': f'{len(ecritures_creees)} écritures importées avec succès'
+    }, 200
+
+@tache('import_ecritures')
+def tache_import_ecritures(contexte, exercice_id, mode, delimiter, taille_lot, fichier):
+    """Import exécuté en arrière-plan depuis la copie du fichier reçu"""
+    exercice = db.session.get(ExerciceComptable, exercice_id)
+    
+    def signaler(rapport):
+        contexte.progression(rapport['lot'] * 100 // rapport['nb_lots'],
+                             f"Lot {rapport['lot']}/{rapport['nb_lots']}")
+    
+    with open(fichier, encoding='utf-8-sig', newline='') as stream:
+        corps, code = traiter_import_ecritures(stream, exercice, mode, delimiter, taille_lot, signaler)
+    if code != 200:
+        raise ErreurTache(corps['error'], corps)
+    return corps['data']
+
 @import_export_bp.route('/import/ecritures', methods=['POST'])
 def import_ecritures():
-    """Importe des écritures comptables depuis un fichier CSV"""
+    """Importe des écritures comptables depuis un fichier CSV (asynchrone=true : tâche en arrière-plan)"""
     try:
         # Vérifier qu'un fichier a été envoyé
         if 'file' not in request.files:
@@ -290,6 +464,7 @@ def import_ecritures():
         exercice_id = request.form.get('exercice_id', type=int)
         mode_import = request.form.get('mode', 'validation')  # validation, force
         delimiter = request.form.get('delimiter', ',')
+        taille_lot = request.form.get('taille_lot', TAILLE_LOT_DEFAUT, type=int)  # écritures par lot
         
         if not exercice_id:
             return jsonify({
@@ -305,148 +480,21 @@ def import_ecritures():
                 'error': f'Exercice {exercice_id} non trouvé'
             }), 404
         
-        print(f"📥 Import écritures - Exercice: {exercice.libelle}")
-        
-        # Lire le fichier CSV
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.DictReader(stream, delimiter=delimiter)
+        print(f"📥 Import écritures - Exercice: {exercice.nom_exercice}")
         
-        # Valider les en-têtes requis
-        required_headers = [
-            'date_ecriture', 'journal', 'libelle_ecriture', 'numero_compte',
-            'libelle_ligne', 'debit', 'credit'
-        ]
-        
-        is_valid, error_msg = validate_csv_headers(csv_reader.fieldnames, required_headers)
-        if not is_valid:
-            return jsonify({
-                'success': False,
-                'error': error_msg
-            }), 400
+        if demande_asynchrone():
+            tache_import = get_gestionnaire().soumettre('import_ecritures', {
+                'exercice_id': exercice_id,
+                'mode': mode_import,
+                'delimiter': delimiter,
+                'taille_lot': taille_lot
+            }, fichiers={'fichier': file})
+            return reponse_tache(tache_import, 'Import mis en file')
         
-        # Traitement des données
-        ecritures_data = {}
-        erreurs = []
-        ligne_num = 1
-        
-        for row in csv_reader:
-            ligne_num += 1
-            
-            try:
-                # Grouper les lignes par écriture
-                key = f"{row['date_ecriture']}_{row['journal']}_{row['libelle_ecriture']}"
-                
-                if key not in ecritures_data:
-                    ecritures_data[key] = {
-                        'date_ecriture': row['date_ecriture'],
-                        'journal': row['journal'],
-                        'libelle': row['libelle_ecriture'],
-                        'piece_justificative': row.get('piece_justificative', ''),
-                        'lignes': []
-                    }
-                
-                # Valider le compte
-                compte = PlanComptable.query.filter_by(numero_compte=row['numero_compte']).first()
-                if not compte:
-                    erreurs.append(f"Ligne {ligne_num}: Compte {row['numero_compte']} non trouvé")
-                    continue
-                
-                # Valider les montants
-                try:
-                    debit = Decimal(row['debit']) if row['debit'] else Decimal('0')
-                    credit = Decimal(row['credit']) if row['credit'] else Decimal('0')
-                except:
-                    erreurs.append(f"Ligne {ligne_num}: Montants invalides")
-                    continue
-                
-                if debit < 0 or credit < 0:
-                    erreurs.append(f"Ligne {ligne_num}: Montants négatifs non autorisés")
-                    continue
-                
-                if debit > 0 and credit > 0:
-                    erreurs.append(f"Ligne {ligne_num}: Une ligne ne peut avoir à la fois débit et crédit")
-                    continue
-                
-                if debit == 0 and credit == 0:
-                    erreurs.append(f"Ligne {ligne_num}: Montant requis (débit ou crédit)")
-                    continue
-                
-                # Ajouter la ligne
-                ecritures_data[key]['lignes'].append({
-                    'compte_id': compte.id,
-                    'libelle': row['libelle_ligne'],
-                    'debit': float(debit),
-                    'credit': float(credit)
-                })
-                
-            except Exception as e:
-                erreurs.append(f"Ligne {ligne_num}: Erreur {str(e)}")
-        
-        # Vérifier les erreurs
-        if erreurs and mode_import != 'force':
-            return jsonify({
-                'success': False,
-                'error': 'Erreurs de validation détectées',
-                'erreurs': erreurs,
-                'message': 'Utilisez mode=force pour ignorer les erreurs'
-            }), 400
-        
-        # Créer les écritures
-        ecritures_creees = []
-        
-        for key, ecriture_data in ecritures_data.items():
-            try:
-                # Vérifier l'équilibre de l'écriture
-                total_debit = sum(ligne['debit'] for ligne in ecriture_data['lignes'])
-                total_credit = sum(ligne['credit'] for ligne in ecriture_data['lignes'])
-                
-                if abs(total_debit - total_credit) > 0.01:
-                    if mode_import != 'force':
-                        erreurs.append(f"Écriture {key}: Déséquilibre {total_debit - total_credit:.2f}")
-                        continue
-                
-                # Créer l'écriture
-                ecriture = EcritureComptable(
-                    date_ecriture=datetime.strptime(ecriture_data['date_ecriture'], '%Y-%m-%d').date(),
-                    journal=ecriture_data['journal'],
-                    libelle=ecriture_data['libelle'],
-                    piece_justificative=ecriture_data['piece_justificative'],
-                    exercice_id=exercice_id,
-                    statut='brouillard'
-                )
-                
-                db.session.add(ecriture)
-                db.session.flush()  # Pour obtenir l'ID
-                
-                # Créer les lignes
-                for ligne_data in ecriture_data['lignes']:
-                    ligne = LigneEcriture(
-                        ecriture_id=ecriture.id,
-                        compte_id=ligne_data['compte_id'],
-                        libelle=ligne_data['libelle'],
-                        debit=Decimal(str(ligne_data['debit'])),
-                        credit=Decimal(str(ligne_data['credit']))
-                    )
-                    db.session.add(ligne)
-                
-                ecritures_creees.append(ecriture.id)
-                
-            except Exception as e:
-                erreurs.append(f"Écriture {key}: Erreur création {str(e)}")
-        
-        db.session.commit()
-        
-        print(f"✅ Import terminé: {len(ecritures_creees)} écritures créées")
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'ecritures_creees': len(ecritures_creees),
-                'ecritures_ids': ecritures_creees,
-                'erreurs': erreurs if mode_import == 'force' else []
-            },
-            'message': f'{len(ecritures_creees)} écritures importées avec succès'
-        })
+        # Lecture du CSV en flux (pas de copie intégrale du fichier en mémoire)
+        stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        corps, code = traiter_import_ecritures(stream, exercice, mode_import, delimiter, taille_lot)
+        return jsonify(corps), code
         
     except Exception as e:
         db.session.rollback()
@@ -463,44 +511,22 @@ def export_balance():
     try:
         format_export = request.args.get('format', 'csv').lower()
         exercice_id = request.args.get('exercice_id', type=int)
+        date_debut = request.args.get('date_debut')
         date_fin = request.args.get('date_fin', datetime.now().strftime('%Y-%m-%d'))
         
         print(f"📤 Export balance (format: {format_export})")
         
-        # Calculer la balance
-        from api.comptabilite import calculer_balance_detaillee
-        balance_data = calculer_balance_detaillee(exercice_id=exercice_id, date_fin=date_fin)
-        
         if format_export == 'csv':
-            # Export CSV
+            # Même construction que /balance (colonnes en centimes)
+            balance = construire_balance(date_debut, date_fin, exercice_id)
+            
             output = io.StringIO()
             writer = csv.writer(output)
+            writer.writerow(['numero_compte', 'libelle_compte', 'classe'] + [entete for entete, _ in EXPORT_BALANCE_COLONNES])
             
-            # En-têtes CSV
-            headers = [
-                'numero_compte', 'libelle_compte', 'classe',
-                'debit_precedent', 'credit_precedent', 'solde_precedent',
-                'debit_periode', 'credit_periode', 'mouvement_periode',
-                'debit_cumule', 'credit_cumule', 'solde_final'
-            ]
-            writer.writerow(headers)
-            
-            # Données
-            for compte in balance_data.get('comptes', []):
-                writer.writerow([
-                    compte['numero_compte'],
-                    compte['libelle_compte'],
-                    compte['classe'],
-                    compte.get('debit_precedent', 0),
-                    compte.get('credit_precedent', 0),
-                    compte.get('solde_precedent', 0),
-                    compte.get('debit_periode', 0),
-                    compte.get('credit_periode', 0),
-                    compte.get('mouvement_periode', 0),
-                    compte.get('debit_cumule', 0),
-                    compte.get('credit_cumule', 0),
-                    compte.get('solde_final', 0)
-                ])
+            colonnes = [colonne for _, colonne in EXPORT_BALANCE_COLONNES]
+            for numero, ligne in zip(balance.lignes.index, balance.lignes[['libelle_compte', 'classe'] + colonnes].itertuples(index=False)):
+                writer.writerow([numero, ligne[0], ligne[1]] + [en_montant(valeur) for valeur in ligne[2:]])
             
             # Créer la réponse
             output.seek(0)
@@ -510,12 +536,11 @@ def export_balance():
             
             return response
         
-        else:
-            return jsonify({
-                'success': False,
-                'error': f'Format non supporté: {format_export}',
-                'formats_supportes': ['csv']
-            }), 400
+        return jsonify({
+            'success': False,
+            'error': f'Format non supporté: {format_export}',
+            'formats_supportes': ['csv']
+        }), 400
         
     except Exception as e:
         print(f"❌ Erreur export balance: {e}")
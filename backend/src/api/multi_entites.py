@@ -11,6 +11,7 @@ from models import (
     db, PlanComptable, EcritureComptable, LigneEcriture, 
     ExerciceComptable, JournalComptable, EntiteEBNL, Utilisateur
 )
+from services.account_ranges import filtre_prefixe
 
 multi_entites_bp = Blueprint('multi_entites', __name__)
 
@@ -362,7 +363,7 @@ def get_dashboard_entite(entite_id):
             ).join(EcritureComptable).filter(
                 EcritureComptable.date_ecriture >= date_debut,
                 EcritureComptable.date_ecriture <= date_fin,
-                LigneEcriture.numero_compte.like(f'{numero}%')
+                filtre_prefixe(LigneEcriture.numero_compte, numero)
             ).first()
             
             if result:
@@ -6,7 +6,8 @@ ComptaEBNL-IA - Gestion comptable pour entités à but non lucratif
 """
 
 from flask import Blueprint, jsonify, request
-from models import PlanComptable
+from services.account_registry import get_registre
+from services.full_text_search import surligner, termes_requete
 from data.sycebnl_plan_comptable import CLASSES_SYCEBNL
 
 plan_comptable_bp = Blueprint('plan_comptable', __name__)
@@ -19,7 +20,7 @@ def get_plan_comptable():
     Query Parameters:
     - classe: Filtrer par classe (1-9)
     - niveau: Filtrer par niveau (0-3) 
-    - search: Recherche par numéro ou libellé
+    - search: Recherche par numéro (préfixe) ou libellé (sans accents, par pertinence)
     - limit: Nombre max de résultats (défaut: 100)
     """
     try:
@@ -29,30 +30,13 @@ def get_plan_comptable():
         search = request.args.get('search', '')
         limit = request.args.get('limit', 100, type=int)
         
-        # Construction de la requête
-        query = PlanComptable.query
-        
-        if classe:
-            query = query.filter_by(classe=classe)
-            
-        if niveau is not None:
-            query = query.filter_by(niveau=niveau)
-            
-        if search:
-            if search.isdigit():
-                # Recherche par numéro
-                query = query.filter(PlanComptable.numero_compte.like(f"{search}%"))
-            else:
-                # Recherche par libellé
-                query = query.filter(PlanComptable.libelle_compte.ilike(f"%{search}%"))
-        
-        # Exécution avec limitation
-        comptes = query.order_by(PlanComptable.numero_compte).limit(limit).all()
+        # Registre en mémoire : préfixe de numéro ou mots du libellé
+        comptes = get_registre().filtrer(classe=classe, niveau=niveau, recherche=search, limite=limit)
         
         # Formatage de la réponse
         result = {
             'success': True,
-            'data': [compte.to_dict() for compte in comptes],
+            'data': comptes,
             'total': len(comptes),
             'filters': {
                 'classe': classe,
@@ -83,9 +67,10 @@ def get_classes():
     """Récupère la liste des classes SYCEBNL avec compteurs"""
     try:
         classes_info = []
+        par_classe = get_registre().par_classe
         
         for classe_num in range(1, 10):
-            count = PlanComptable.query.filter_by(classe=classe_num).count()
+            count = par_classe.get(classe_num, 0)
             
             classes_info.append({
                 'numero': classe_num,
@@ -118,12 +103,11 @@ def get_comptes_by_classe(classe):
                 'message': 'La classe doit être entre 1 et 9'
             }), 400
         
-        comptes = PlanComptable.query.filter_by(classe=classe)\
-                                    .order_by(PlanComptable.numero_compte).all()
+        comptes = get_registre().filtrer(classe=classe)
         
         return jsonify({
             'success': True,
-            'data': [compte.to_dict() for compte in comptes],
+            'data': comptes,
             'classe_info': {
                 'numero': classe,
                 'libelle': CLASSES_SYCEBNL.get(classe, f'Classe {classe}'),
@@ -142,30 +126,22 @@ def get_comptes_by_classe(classe):
 def get_compte_by_numero(numero):
     """Récupère un compte spécifique par son numéro"""
     try:
-        compte = PlanComptable.query.filter_by(numero_compte=numero).first()
+        registre = get_registre()
+        result = registre.get(numero)
         
-        if not compte:
+        if not result:
             return jsonify({
                 'success': False,
                 'error': 'Compte non trouvé',
                 'message': f'Le compte {numero} n\'existe pas dans le plan SYCEBNL'
             }), 404
         
-        # Récupérer les comptes enfants
-        enfants = PlanComptable.query.filter_by(parent_id=compte.id).all()
-        
-        # Récupérer le compte parent
-        parent = None
-        if compte.parent_id:
-            parent = PlanComptable.query.get(compte.parent_id)
-        
-        result = compte.to_dict()
         result.update({
-            'enfants': [enfant.to_dict() for enfant in enfants],
-            'parent': parent.to_dict() if parent else None,
+            'enfants': registre.enfants_de(numero),
+            'parent': registre.parent(numero),
             'classe_info': {
-                'numero': compte.classe,
-                'libelle': CLASSES_SYCEBNL.get(compte.classe, f'Classe {compte.classe}')
+                'numero': result['classe'],
+                'libelle': CLASSES_SYCEBNL.get(result['classe'], f'Classe {result["classe"]}')
             }
         })
         
@@ -183,7 +159,7 @@ def get_compte_by_numero(numero):
 
 @plan_comptable_bp.route('/plan-comptable/search', methods=['GET'])
 def search_comptes():
-    """Recherche avancée dans le plan comptable"""
+    """Recherche avancée dans le plan comptable (libellés classés par pertinence, extraits surlignés)"""
     try:
         query_param = request.args.get('q', '')
         classe = request.args.get('classe', type=int)
@@ -197,30 +173,15 @@ def search_comptes():
                 'message': 'Le paramètre "q" est requis'
             }), 400
         
-        # Construction de la requête
-        query = PlanComptable.query
-        
-        if classe:
-            query = query.filter_by(classe=classe)
-        
-        if query_param.isdigit():
-            # Recherche par numéro
-            if exact:
-                query = query.filter(PlanComptable.numero_compte == query_param)
-            else:
-                query = query.filter(PlanComptable.numero_compte.like(f"{query_param}%"))
-        else:
-            # Recherche par libellé
-            if exact:
-                query = query.filter(PlanComptable.libelle_compte.ilike(query_param))
-            else:
-                query = query.filter(PlanComptable.libelle_compte.ilike(f"%{query_param}%"))
-        
-        comptes = query.order_by(PlanComptable.numero_compte).limit(limit).all()
+        # Numéro : préfixe (ou égalité) ; libellé : débuts de mots sans accents, BM25 (ou libellé identique)
+        comptes = get_registre().filtrer(classe=classe, recherche=query_param, exact=exact, limite=limit)
+        termes = [] if query_param.isdigit() else termes_requete(query_param)
+        for compte in comptes:
+            compte['extrait'] = surligner(compte['libelle_compte'], termes)
         
         return jsonify({
             'success': True,
-            'data': [compte.to_dict() for compte in comptes],
+            'data': comptes,
             'query': query_param,
             'total_found': len(comptes),
             'search_params': {
@@ -241,12 +202,13 @@ def search_comptes():
 def get_stats_plan_comptable():
     """Statistiques du plan comptable SYCEBNL"""
     try:
-        total_comptes = PlanComptable.query.count()
+        registre = get_registre()
+        total_comptes = len(registre)
         
         # Stats par classe
         stats_classes = []
         for classe_num in range(1, 10):
-            count = PlanComptable.query.filter_by(classe=classe_num).count()
+            count = registre.par_classe.get(classe_num, 0)
             if count > 0:
                 stats_classes.append({
                     'classe': classe_num,
@@ -258,7 +220,7 @@ def get_stats_plan_comptable():
         # Stats par niveau
         stats_niveaux = []
         for niveau in range(0, 4):
-            count = PlanComptable.query.filter_by(niveau=niveau).count()
+            count = registre.par_niveau.get(niveau, 0)
             if count > 0:
                 niveau_desc = {
                     0: "Classes principales",
@@ -284,7 +246,7 @@ def get_stats_plan_comptable():
         
         ebnl_status = []
         for numero, description in comptes_ebnl:
-            existe = PlanComptable.query.filter_by(numero_compte=numero).first() is not None
+            existe = numero in registre
             ebnl_status.append({
                 'numero': numero,
                 'description': description,
@@ -316,26 +278,25 @@ def validate_plan_comptable():
     try:
         issues = []
         
+        registre = get_registre()
+        
         # Vérifier les comptes orphelins (parent_id pointant vers un compte inexistant)
-        comptes_avec_parent = PlanComptable.query.filter(PlanComptable.parent_id.isnot(None)).all()
-        for compte in comptes_avec_parent:
-            parent = PlanComptable.query.get(compte.parent_id)
-            if not parent:
+        for numero, compte in registre.comptes.items():
+            if compte['parent_id'] is not None and compte['parent_id'] not in registre.par_id:
                 issues.append({
                     'type': 'parent_manquant',
-                    'compte': compte.numero_compte,
-                    'message': f'Compte {compte.numero_compte} référence un parent inexistant (ID: {compte.parent_id})'
+                    'compte': numero,
+                    'message': f'Compte {numero} référence un parent inexistant (ID: {compte["parent_id"]})'
                 })
         
         # Vérifier la cohérence classe/numéro
-        comptes = PlanComptable.query.all()
-        for compte in comptes:
-            premier_chiffre = int(compte.numero_compte[0]) if compte.numero_compte and compte.numero_compte[0].isdigit() else None
-            if premier_chiffre and premier_chiffre != compte.classe:
+        for numero, compte in registre.comptes.items():
+            premier_chiffre = int(numero[0]) if numero and numero[0].isdigit() else None
+            if premier_chiffre and premier_chiffre != compte['classe']:
                 issues.append({
                     'type': 'incoherence_classe',
-                    'compte': compte.numero_compte,
-                    'message': f'Compte {compte.numero_compte} en classe {compte.classe} mais commence par {premier_chiffre}'
+                    'compte': numero,
+                    'message': f'Compte {numero} en classe {compte["classe"]} mais commence par {premier_chiffre}'
                 })
         
         return jsonify({
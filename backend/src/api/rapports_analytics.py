@@ -4,55 +4,60 @@ Fournit des analyses comptables et financières pour les EBNL
 """
 
 from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_, extract, case, desc
 from decimal import Decimal
 import calendar
 
 from models import (
-    db, PlanComptable, EcritureComptable, LigneEcriture, 
+    db, EcritureComptable, LigneEcriture, 
     ExerciceComptable, JournalComptable, EntiteEBNL
 )
+from services.monthly_balances import totaux_periode, series_mensuelles
+from services.report_cache import cache_rapport, get_cache
+from services.kpi_engine import calculer_kpis
+from services.time_series import GRANULARITES, METRIQUES, calculer_series
+from services.account_registry import get_registre
+
+MAX_POINTS_JOUR = 1096  # trois ans en granularité journalière
 
 rapports_analytics_bp = Blueprint('rapports_analytics', __name__)
 
 def calculer_solde_compte_periode(numero_compte, date_debut, date_fin):
-    """Calcule le solde d'un compte sur une période donnée"""
+    """Calcule le solde d'un compte sur une période donnée (écritures validées)"""
     try:
-        query = db.session.query(
-            func.coalesce(func.sum(LigneEcriture.debit), 0).label('total_debit'),
-            func.coalesce(func.sum(LigneEcriture.credit), 0).label('total_credit')
-        ).join(EcritureComptable).filter(
-            LigneEcriture.numero_compte == numero_compte,
-            EcritureComptable.date_ecriture >= date_debut,
-            EcritureComptable.date_ecriture <= date_fin
-        ).first()
-        
-        if query:
-            return float(query.total_debit - query.total_credit)
-        return 0.0
+        debit, credit, _ = totaux_periode(
+            date_debut, date_fin, numeros=[numero_compte]
+        ).get(numero_compte, (0, 0, 0))
+        return float(debit - credit)
     except Exception:
         return 0.0
 
 def get_evolution_compte(numero_compte, mois=12):
-    """Récupère l'évolution d'un compte sur X mois"""
-    evolution = []
-    today = datetime.now()
+    """Récupère l'évolution mensuelle d'un compte sur X mois calendaires"""
+    today = datetime.now().date()
+    annee, numero_mois = today.year, today.month - (mois - 1)
+    while numero_mois < 1:
+        annee, numero_mois = annee - 1, numero_mois + 12
+    debut = datetime(annee, numero_mois, 1).date()
     
-    for i in range(mois):
-        date_fin = today - timedelta(days=i*30)
-        date_debut = date_fin - timedelta(days=30)
-        
-        solde = calculer_solde_compte_periode(numero_compte, date_debut, date_fin)
-        
+    # Une seule lecture des soldes mensuels pour toute la fenêtre
+    series = series_mensuelles(debut, today, numeros=[numero_compte])
+    
+    evolution = []
+    for _ in range(mois):
+        periode = f"{annee:04d}-{numero_mois:02d}"
+        debit, credit, _ = series.get(periode, {}).get(numero_compte, (0, 0, 0))
         evolution.append({
-            'mois': date_fin.strftime('%Y-%m'),
-            'solde': solde
+            'mois': periode,
+            'solde': float(debit - credit)
         })
+        annee, numero_mois = (annee + 1, 1) if numero_mois == 12 else (annee, numero_mois + 1)
     
-    return list(reversed(evolution))
+    return evolution
 
 @rapports_analytics_bp.route('/dashboard/kpi', methods=['GET'])
+@cache_rapport('dashboard_kpi')
 def get_kpi_dashboard():
     """Tableau de bord avec indicateurs clés pour EBNL"""
     try:
@@ -71,40 +76,14 @@ def get_kpi_dashboard():
             date_debut = datetime(datetime.now().year, 1, 1)
             date_fin = datetime(datetime.now().year, 12, 31)
 
-        # KPI spécifiques aux EBNL
-        kpis = {
-            # Ressources et emplois
-            'total_dons': calculer_solde_compte_periode('756', date_debut, date_fin),
-            'total_subventions': calculer_solde_compte_periode('74', date_debut, date_fin),
-            'total_cotisations': calculer_solde_compte_periode('7561', date_debut, date_fin),
-            'total_charges': calculer_solde_compte_periode('6', date_debut, date_fin),
-            
-            # Trésorerie
-            'tresorerie_banque': calculer_solde_compte_periode('512', date_debut, date_fin),
-            'tresorerie_caisse': calculer_solde_compte_periode('53', date_debut, date_fin),
-            
-            # Patrimoine
-            'total_actif': calculer_solde_compte_periode('2', date_debut, date_fin),
-            'fonds_associatifs': calculer_solde_compte_periode('10', date_debut, date_fin),
-            
-            # Activité
-            'nb_ecritures': EcritureComptable.query.filter(
-                EcritureComptable.date_ecriture >= date_debut,
-                EcritureComptable.date_ecriture <= date_fin
-            ).count(),
-            
-            # Ratios spécifiques EBNL
-            'ratio_autonomie': 0,  # Calculé ci-dessous
-            'ratio_liquidite': 0   # Calculé ci-dessous
-        }
+        # KPI spécifiques aux EBNL : une lecture des totaux, préfixes résolus en mémoire
+        kpis = {nom: float(valeur) for nom, valeur in calculer_kpis(date_debut, date_fin).items()}
         
-        # Calcul des ratios
-        total_ressources = kpis['total_dons'] + kpis['total_subventions'] + kpis['total_cotisations']
-        if total_ressources > 0:
-            kpis['ratio_autonomie'] = round((kpis['total_dons'] / total_ressources) * 100, 2)
-        
-        if kpis['total_charges'] > 0:
-            kpis['ratio_liquidite'] = round((kpis['tresorerie_banque'] + kpis['tresorerie_caisse']) / abs(kpis['total_charges']) * 100, 2)
+        # Activité
+        kpis['nb_ecritures'] = EcritureComptable.query.filter(
+            EcritureComptable.date_ecriture >= date_debut,
+            EcritureComptable.date_ecriture <= date_fin
+        ).count()
 
         return jsonify({
             'success': True,
@@ -130,11 +109,11 @@ def analyser_evolution_tresorerie():
         comptes_tresorerie = ['512', '53', '531']  # Banque, Caisse, CCP
         evolution = {}
         
+        registre = get_registre()
         for compte in comptes_tresorerie:
-            plan_compte = PlanComptable.query.filter_by(numero_compte=compte).first()
-            if plan_compte:
+            if compte in registre:
                 evolution[compte] = {
-                    'libelle': plan_compte.libelle_compte,
+                    'libelle': registre.libelle(compte),
                     'evolution': get_evolution_compte(compte, mois)
                 }
         
@@ -342,34 +321,19 @@ def analyser_activite_mensuelle():
     try:
         annee = request.args.get('annee', datetime.now().year, type=int)
         
-        activite_mensuelle = []
-        
-        for mois in range(1, 13):
-            date_debut = datetime(annee, mois, 1)
-            # Dernier jour du mois
-            dernier_jour = calendar.monthrange(annee, mois)[1]
-            date_fin = datetime(annee, mois, dernier_jour)
-            
-            # Statistiques du mois
-            nb_ecritures = EcritureComptable.query.filter(
-                EcritureComptable.date_ecriture >= date_debut,
-                EcritureComptable.date_ecriture <= date_fin
-            ).count()
-            
-            # Montant total des mouvements
-            total_mouvements = db.session.query(
-                func.coalesce(func.sum(LigneEcriture.debit + LigneEcriture.credit), 0)
-            ).join(EcritureComptable).filter(
-                EcritureComptable.date_ecriture >= date_debut,
-                EcritureComptable.date_ecriture <= date_fin
-            ).scalar() or 0
-
-            activite_mensuelle.append({
-                'mois': f"{annee}-{mois:02d}",
+        # Une requête groupée par mois (toutes écritures, quel que soit le statut)
+        series = calculer_series(
+            date(annee, 1, 1), date(annee, 12, 31), 'month', metrique='movement', statut=None
+        )
+        activite_mensuelle = [
+            {
+                'mois': point['periode'],
                 'nom_mois': calendar.month_name[mois],
-                'nb_ecritures': nb_ecritures,
-                'total_mouvements': float(total_mouvements)
-            })
+                'nb_ecritures': point['nb_ecritures'],
+                'total_mouvements': point['valeur']
+            }
+            for mois, point in enumerate(series, start=1)
+        ]
         
         # Calcul de statistiques annuelles
         total_ecritures_annee = sum([m['nb_ecritures'] for m in activite_mensuelle])
@@ -393,6 +357,75 @@ def analyser_activite_mensuelle():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@rapports_analytics_bp.route('/analyses/series', methods=['GET'])
+@cache_rapport('series')
+def get_series():
+    """
+    Série temporelle générique pour les graphiques du tableau de bord
+    
+    Query Parameters:
+    - comptes: Préfixes de comptes séparés par des virgules (ex: 6,7561)
+    - granularite: day, week, month (défaut) ou quarter
+    - metrique: count, movement, balance (défaut) ou cumulative
+    - date_debut / date_fin: Période (YYYY-MM-DD), défaut : année en cours
+    - exercice_id: Période de l'exercice
+    - statut: valide (défaut) ou tous
+    """
+    try:
+        exercice_id = request.args.get('exercice_id', type=int)
+        date_debut = request.args.get('date_debut')
+        date_fin = request.args.get('date_fin')
+        if exercice_id and not (date_debut and date_fin):
+            exercice = db.session.get(ExerciceComptable, exercice_id)
+            if not exercice:
+                return jsonify({'success': False, 'error': 'Exercice non trouvé'}), 404
+            date_debut = date_debut or exercice.date_debut.isoformat()
+            date_fin = date_fin or exercice.date_fin.isoformat()
+        date_debut = datetime.strptime(date_debut or f'{datetime.now().year}-01-01', '%Y-%m-%d').date()
+        date_fin = datetime.strptime(date_fin or f'{datetime.now().year}-12-31', '%Y-%m-%d').date()
+        
+        granularite = request.args.get('granularite', 'month')
+        metrique = request.args.get('metrique', 'balance')
+        statut = request.args.get('statut', 'valide')
+        comptes = [c.strip() for c in request.args.get('comptes', '').split(',') if c.strip()]
+        
+        if granularite not in GRANULARITES or metrique not in METRIQUES:
+            return jsonify({
+                'success': False,
+                'error': 'Paramètre invalide',
+                'granularites': list(GRANULARITES),
+                'metriques': list(METRIQUES)
+            }), 400
+        if date_debut > date_fin:
+            return jsonify({'success': False, 'error': 'date_debut postérieure à date_fin'}), 400
+        if granularite == 'day' and (date_fin - date_debut).days > MAX_POINTS_JOUR:
+            return jsonify({'success': False, 'error': f'Période limitée à {MAX_POINTS_JOUR} jours en granularité journalière'}), 400
+        
+        points = calculer_series(
+            date_debut, date_fin, granularite, comptes, metrique,
+            statut=None if statut == 'tous' else statut
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'points': points,
+                'parametres': {
+                    'comptes': comptes,
+                    'granularite': granularite,
+                    'metrique': metrique,
+                    'date_debut': date_debut.isoformat(),
+                    'date_fin': date_fin.isoformat(),
+                    'statut': statut
+                }
+            }
+        })
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @rapports_analytics_bp.route('/analyses/comptes-top', methods=['GET'])
 def analyser_comptes_top():
     """Analyse des comptes les plus mouvementés"""
@@ -412,7 +445,7 @@ def analyser_comptes_top():
             date_debut = datetime(datetime.now().year, 1, 1)
             date_fin = datetime(datetime.now().year, 12, 31)
 
-        # Requête pour les comptes les plus mouvementés
+        # Requête pour les comptes les plus mouvementés (libellés lus dans le registre)
         comptes_actifs = db.session.query(
             LigneEcriture.numero_compte,
             func.count(LigneEcriture.id).label('nb_mouvements'),
@@ -428,14 +461,12 @@ def analyser_comptes_top():
             desc(func.count(LigneEcriture.id))
         ).limit(limite).all()
 
-        # Enrichissement avec les libellés des comptes
+        registre = get_registre()
         top_comptes = []
         for compte_stat in comptes_actifs:
-            plan_compte = PlanComptable.query.filter_by(numero_compte=compte_stat.numero_compte).first()
-            
             top_comptes.append({
                 'numero_compte': compte_stat.numero_compte,
-                'libelle_compte': plan_compte.libelle_compte if plan_compte else 'Compte inconnu',
+                'libelle_compte': registre.libelle(compte_stat.numero_compte, 'Compte inconnu'),
                 'nb_mouvements': compte_stat.nb_mouvements,
                 'total_mouvement': float(compte_stat.total_mouvement or 0),
                 'total_debit': float(compte_stat.total_debit or 0),
@@ -472,18 +503,11 @@ def generer_previsions_budget():
         previsions = {}
         
         for classe in classes_analyse:
-            comptes_classe = PlanComptable.query.filter(
-                PlanComptable.numero_compte.like(f'{classe}%')
-            ).all()
+            numeros = get_registre().par_prefixe(classe)
             
-            total_historique = 0
-            for compte in comptes_classe:
-                solde = calculer_solde_compte_periode(
-                    compte.numero_compte, 
-                    date_debut_historique, 
-                    date_fin_historique
-                )
-                total_historique += abs(solde)
+            # Une lecture des totaux pour tous les comptes de la classe
+            totaux = totaux_periode(date_debut_historique, date_fin_historique, numeros=numeros, hors_cloture=True)
+            total_historique = sum(abs(float(debit - credit)) for debit, credit, _ in totaux.values())
             
             # Prévision simple : augmentation de 3% par rapport à l'année précédente
             prevision = total_historique * 1.03
@@ -557,6 +581,23 @@ def exporter_rapport_complet():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@rapports_analytics_bp.route('/rapports/cache/stats', methods=['GET'])
+def get_statistiques_cache():
+    """Statistiques du cache des rapports (succès, échecs, entrées)"""
+    return jsonify({
+        'success': True,
+        'data': get_cache().statistiques()
+    })
+
+@rapports_analytics_bp.route('/rapports/cache', methods=['DELETE'])
+def vider_cache_rapports():
+    """Vide le cache des rapports (les entrées expirent déjà avec la version du grand livre)"""
+    get_cache().vider()
+    return jsonify({
+        'success': True,
+        'message': 'Cache des rapports vidé'
+    })
+
 # Endpoint de synthèse
 @rapports_analytics_bp.route('/synthese', methods=['GET'])
 def get_synthese_rapports():
@@ -592,6 +633,12 @@ def get_synthese_rapports():
             'description': 'Suivi de l\'activité comptable mois par mois',
             'parametres': ['annee']
         },
+        {
+            'endpoint': '/api/v1/analyses/series',
+            'nom': 'Séries temporelles',
+            'description': 'Nombre d\'écritures, mouvements ou soldes par jour, semaine, mois ou trimestre',
+            'parametres': ['comptes', 'granularite', 'metrique', 'date_debut', 'date_fin', 'exercice_id', 'statut']
+        },
         {
             'endpoint': '/api/v1/analyses/comptes-top',
             'nom': 'Comptes les plus actifs',
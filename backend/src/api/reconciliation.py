@@ -6,47 +6,32 @@ Permet la réconciliation entre les écritures comptables et les relevés bancai
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_, or_, desc
+from sqlalchemy.exc import IntegrityError
 from decimal import Decimal
 import csv
-import re
 
 from models import (
     db, PlanComptable, EcritureComptable, LigneEcriture, 
-    ExerciceComptable, JournalComptable
+    ExerciceComptable, JournalComptable, MouvementBancaire
+)
+from services.account_ranges import filtre_prefixe, filtre_prefixes
+from services.bank_statements import (
+    FORMATS_RELEVE, ReleveInvalide, detecter_format, empreinte_mouvement,
+    importer_releve, iterer_mouvements
+)
+from services.reconciliation_matcher import (
+    IndexRapprochement, LigneCandidate, apparier, SEUIL_AUTOMATIQUE
 )
 
 reconciliation_bp = Blueprint('reconciliation', __name__)
 
-# Modèle simplifié pour les mouvements bancaires
-class MouvementBancaire:
-    def __init__(self, date, libelle, montant, reference=None):
-        self.date = date
-        self.libelle = libelle.strip()
-        self.montant = float(montant)
-        self.reference = reference
-        self.id = f"{date}_{montant}_{hash(libelle) % 10000}"
-
-def nettoyer_libelle(libelle):
-    """Nettoie et normalise un libellé pour la comparaison"""
-    libelle_clean = re.sub(r'[^\w\s]', '', libelle.lower())
-    libelle_clean = re.sub(r'\s+', ' ', libelle_clean).strip()
-    return libelle_clean
+COMPTES_TRESORERIE = ['512', '53']
 
-def calculer_score_similarite(libelle1, libelle2):
-    """Calcule un score de similarité entre deux libellés (0-100)"""
-    lib1_clean = nettoyer_libelle(libelle1)
-    lib2_clean = nettoyer_libelle(libelle2)
-    
-    mots1 = set(lib1_clean.split())
-    mots2 = set(lib2_clean.split())
-    
-    if not mots1 or not mots2:
-        return 0
-    
-    mots_communs = mots1.intersection(mots2)
-    score = (len(mots_communs) * 2) / (len(mots1) + len(mots2)) * 100
-    
-    return min(100, score)
+def _lignes_rapprochees():
+    """Sous-requête des lignes d'écriture déjà rapprochées d'un mouvement bancaire"""
+    return db.session.query(MouvementBancaire.ligne_ecriture_id).filter(
+        MouvementBancaire.ligne_ecriture_id.isnot(None)
+    )
 
 @reconciliation_bp.route('/rapprochement/ecritures-non-rapprochees', methods=['GET'])
 def get_ecritures_non_rapprochees():
@@ -72,7 +57,8 @@ def get_ecritures_non_rapprochees():
         ).filter(
             EcritureComptable.date_ecriture >= date_debut,
             EcritureComptable.date_ecriture <= date_fin,
-            LigneEcriture.numero_compte.like(f'{compte_bancaire}%')
+            filtre_prefixe(LigneEcriture.numero_compte, compte_bancaire),
+            LigneEcriture.id.notin_(_lignes_rapprochees())
         ).order_by(desc(EcritureComptable.date_ecriture))
         
         ecritures_non_rapprochees = []
@@ -119,11 +105,18 @@ def get_statistiques_rapprochement():
         ).filter(
             EcritureComptable.date_ecriture >= date_debut,
             EcritureComptable.date_ecriture <= date_fin,
-            LigneEcriture.numero_compte.like('512%')
+            filtre_prefixe(LigneEcriture.numero_compte, '512')
         ).count()
         
-        # Pour l'instant, aucune écriture n'est rapprochée (fonctionnalité future)
-        ecritures_rapprochees = 0
+        # Lignes bancaires de la période rapprochées d'un mouvement importé
+        ecritures_rapprochees = db.session.query(LigneEcriture.id).join(
+            EcritureComptable
+        ).filter(
+            EcritureComptable.date_ecriture >= date_debut,
+            EcritureComptable.date_ecriture <= date_fin,
+            filtre_prefixe(LigneEcriture.numero_compte, '512'),
+            LigneEcriture.id.in_(_lignes_rapprochees())
+        ).count()
         
         # Calcul des ratios
         taux_rapprochement = (ecritures_rapprochees / total_ecritures * 100) if total_ecritures > 0 else 0
@@ -139,7 +132,7 @@ def get_statistiques_rapprochement():
             ).filter(
                 EcritureComptable.date_ecriture >= debut_mois,
                 EcritureComptable.date_ecriture <= fin_mois,
-                LigneEcriture.numero_compte.like('512%')
+                filtre_prefixe(LigneEcriture.numero_compte, '512')
             ).count()
             
             mouvements_mensuels.append({
@@ -201,9 +194,217 @@ def get_modele_csv():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@reconciliation_bp.route('/rapprochement/import-releve', methods=['POST'])
+def importer_releve_bancaire():
+    """
+    Importe un relevé bancaire (CSV, OFX, CAMT.053) dans mouvements_bancaires
+    
+    Form-data:
+    - file: Fichier du relevé
+    - format: csv, ofx ou camt053 (détecté automatiquement par défaut)
+    - compte: Compte comptable de la banque (défaut: 512)
+    - delimiter: Séparateur CSV (défaut: ;)
+    """
+    try:
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'success': False, 'error': 'Aucun fichier fourni'}), 400
+        
+        fichier = request.files['file']
+        compte_bancaire = request.form.get('compte', '512')
+        format_releve = request.form.get('format') or detecter_format(fichier.filename, fichier.stream.read(512))
+        fichier.stream.seek(0)
+        
+        if format_releve not in FORMATS_RELEVE:
+            return jsonify({
+                'success': False,
+                'error': f'Format non supporté: {format_releve}',
+                'formats_supportes': list(FORMATS_RELEVE)
+            }), 400
+        
+        options = {'delimiter': request.form.get('delimiter', ';')} if format_releve == 'csv' else {}
+        resultat = importer_releve(
+            fichier.stream, format_releve, compte_bancaire,
+            fichier_source=fichier.filename,
+            taille_lot=request.form.get('taille_lot', 1000, type=int),
+            **options
+        )
+        db.session.commit()
+        
+        resultat.update({'format': format_releve, 'compte': compte_bancaire})
+        return jsonify({
+            'success': True,
+            'data': resultat,
+            'message': f"{resultat['importes']} mouvements importés ({resultat['doublons']} doublons ignorés)"
+        })
+        
+    except ReleveInvalide as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@reconciliation_bp.route('/rapprochement/mouvements', methods=['GET'])
+def get_mouvements_bancaires():
+    """Liste les mouvements bancaires importés"""
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 50, type=int), 500)
+        statut = request.args.get('statut')
+        compte_bancaire = request.args.get('compte')
+        
+        query = MouvementBancaire.query
+        if statut:
+            query = query.filter(MouvementBancaire.statut == statut)
+        if compte_bancaire:
+            query = query.filter(filtre_prefixe(MouvementBancaire.compte_bancaire, compte_bancaire))
+        if request.args.get('date_debut'):
+            query = query.filter(MouvementBancaire.date_operation >= datetime.strptime(request.args['date_debut'], '%Y-%m-%d').date())
+        if request.args.get('date_fin'):
+            query = query.filter(MouvementBancaire.date_operation <= datetime.strptime(request.args['date_fin'], '%Y-%m-%d').date())
+        
+        mouvements = query.order_by(
+            MouvementBancaire.date_operation, MouvementBancaire.id
+        ).offset((page - 1) * per_page).limit(per_page).all()
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'mouvements': [mouvement.to_dict() for mouvement in mouvements],
+                'page': page,
+                'per_page': per_page
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@reconciliation_bp.route('/rapprochement/mouvements/<int:mouvement_id>/rapprocher', methods=['POST'])
+def rapprocher_mouvement(mouvement_id):
+    """Enregistre la correspondance acceptée entre un mouvement importé et une ligne d'écriture bancaire"""
+    try:
+        data = request.get_json() or {}
+        mouvement = db.session.get(MouvementBancaire, mouvement_id)
+        if not mouvement:
+            return jsonify({'success': False, 'error': f'Mouvement {mouvement_id} non trouvé'}), 404
+        
+        ligne = db.session.get(LigneEcriture, data['ligne_id']) if data.get('ligne_id') else None
+        if not ligne:
+            return jsonify({'success': False, 'error': 'Ligne d\'écriture non trouvée (ligne_id)'}), 404
+        
+        if mouvement.statut == 'rapproche':
+            return jsonify({
+                'success': False,
+                'error': f'Mouvement déjà rapproché de la ligne {mouvement.ligne_ecriture_id}'
+            }), 400
+        
+        if not ligne.numero_compte.startswith(tuple(COMPTES_TRESORERIE)):
+            return jsonify({
+                'success': False,
+                'error': f'Le compte {ligne.numero_compte} n\'est pas un compte de trésorerie'
+            }), 400
+        
+        tolerance = Decimal(str(data.get('tolerance_montant', '0.01')))
+        if abs((ligne.debit - ligne.credit) - mouvement.montant) > tolerance:
+            return jsonify({
+                'success': False,
+                'error': 'Montants différents',
+                'message': f'Mouvement {mouvement.montant}, ligne {ligne.debit - ligne.credit}'
+            }), 400
+        
+        autre = MouvementBancaire.query.filter_by(ligne_ecriture_id=ligne.id).first()
+        if autre:
+            return jsonify({
+                'success': False,
+                'error': f'Ligne déjà rapprochée du mouvement {autre.id}'
+            }), 409
+        
+        mouvement.ligne_ecriture_id = ligne.id
+        mouvement.statut = 'rapproche'
+        mouvement.score_rapprochement = data.get('score')
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'data': mouvement.to_dict(),
+            'message': 'Mouvement rapproché'
+        })
+        
+    except IntegrityError:
+        # Même ligne rapprochée en parallèle par une autre requête (index unique)
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Ligne déjà rapprochée d\'un autre mouvement'}), 409
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@reconciliation_bp.route('/rapprochement/mouvements/<int:mouvement_id>/rapprocher', methods=['DELETE'])
+def annuler_rapprochement(mouvement_id):
+    """Défait le rapprochement d'un mouvement (il redevient candidat)"""
+    try:
+        mouvement = db.session.get(MouvementBancaire, mouvement_id)
+        if not mouvement:
+            return jsonify({'success': False, 'error': f'Mouvement {mouvement_id} non trouvé'}), 404
+        
+        mouvement.ligne_ecriture_id = None
+        mouvement.statut = 'non_rapproche'
+        mouvement.score_rapprochement = None
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'data': mouvement.to_dict(),
+            'message': 'Rapprochement annulé'
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _formater_correspondance(mouvement, trouves):
+    """Résultat d'appariement d'un mouvement au format de l'API"""
+    meilleures_correspondances = [
+        {
+            'ecriture_id': ligne.ecriture_id,
+            'ligne_id': ligne.ligne_id,
+            'ecriture': {
+                'id': ligne.ecriture_id,
+                'date': ligne.date.strftime('%Y-%m-%d'),
+                'libelle': ligne.libelle,
+                'montant': ligne.montant,
+                'piece_justificative': ligne.piece_justificative
+            },
+            'scores': {
+                'libelle': round(score_libelle, 2),
+                'date': round(score_date, 2),
+                'global': round(score_global, 2)
+            }
+        }
+        for score_global, score_libelle, score_date, ligne in trouves
+    ]
+    
+    return {
+        'mouvement_bancaire': {
+            'id': mouvement['id'],
+            'date': mouvement['date'].strftime('%Y-%m-%d'),
+            'libelle': mouvement['libelle'],
+            'montant': mouvement['montant'],
+            'reference': mouvement['reference']
+        },
+        'correspondances_trouvees': meilleures_correspondances,
+        'statut': 'automatique' if meilleures_correspondances and meilleures_correspondances[0]['scores']['global'] >= SEUIL_AUTOMATIQUE else 'manuel'
+    }
+
 @reconciliation_bp.route('/rapprochement/correspondances', methods=['POST'])
 def rechercher_correspondances():
-    """Recherche les correspondances entre mouvements bancaires et écritures"""
+    """
+    Recherche les correspondances entre mouvements bancaires et écritures
+    
+    Sans 'mouvements_bancaires' dans le corps, les mouvements importés non
+    rapprochés de la période sont traités par lots.
+    """
     try:
         data = request.get_json()
         
@@ -211,74 +412,79 @@ def rechercher_correspondances():
         date_fin = datetime.strptime(data['date_fin'], '%Y-%m-%d').date()
         tolerance_montant = data.get('tolerance_montant', 0.01)
         seuil_similarite = data.get('seuil_similarite', 70)
+        affectation_unique = bool(data.get('affectation_unique', False))
+        compte_bancaire = data.get('compte')
         
-        # Reconstruction des mouvements bancaires
-        mouvements_bancaires = []
-        for mvt_data in data['mouvements_bancaires']:
-            mouvements_bancaires.append(MouvementBancaire(
-                date=datetime.strptime(mvt_data['date'], '%Y-%m-%d').date(),
-                libelle=mvt_data['libelle'],
-                montant=mvt_data['montant'],
-                reference=mvt_data.get('reference', '')
-            ))
-        
-        # Récupération des écritures comptables
-        ecritures_comptables = db.session.query(EcritureComptable, LigneEcriture).join(
-            LigneEcriture
+        # Lots de mouvements bancaires : fournis dans la requête ou lus en base
+        if 'mouvements_bancaires' in data:
+            mouvements = []
+            for mvt_data in data['mouvements_bancaires']:
+                mouvement = {
+                    'date': datetime.strptime(mvt_data['date'], '%Y-%m-%d').date(),
+                    'libelle': mvt_data['libelle'].strip(),
+                    'montant': float(mvt_data['montant']),
+                    'reference': mvt_data.get('reference', '')
+                }
+                mouvement['id'] = empreinte_mouvement(compte_bancaire or '512', mouvement)[:16]
+                mouvements.append(mouvement)
+            lots = [mouvements]
+        else:
+            lots = (
+                [
+                    {
+                        'id': mouvement.id,
+                        'date': mouvement.date_operation,
+                        'libelle': mouvement.libelle,
+                        'montant': float(mouvement.montant),
+                        'reference': mouvement.reference
+                    }
+                    for mouvement in lot
+                ]
+                for lot in iterer_mouvements(date_debut, date_fin, compte_bancaire,
+                                             taille_lot=data.get('taille_lot', 1000))
+            )
+        
+        # Récupération des lignes bancaires (colonnes utiles uniquement)
+        lignes_bancaires = db.session.query(
+            LigneEcriture.id,
+            LigneEcriture.ecriture_id,
+            EcritureComptable.date_ecriture,
+            EcritureComptable.libelle,
+            EcritureComptable.piece_justificative,
+            LigneEcriture.debit,
+            LigneEcriture.credit
+        ).join(
+            EcritureComptable, LigneEcriture.ecriture_id == EcritureComptable.id
         ).filter(
             EcritureComptable.date_ecriture >= date_debut,
             EcritureComptable.date_ecriture <= date_fin,
-            or_(
-                LigneEcriture.numero_compte.like('512%'),
-                LigneEcriture.numero_compte.like('53%')
-            )
+            filtre_prefixes(LigneEcriture.numero_compte, COMPTES_TRESORERIE),
+            LigneEcriture.id.notin_(_lignes_rapprochees())
         ).all()
         
+        # Index par tranche de montant et par mot : seuls les candidats plausibles sont notés
+        index = IndexRapprochement(
+            (
+                LigneCandidate(ligne.id, ligne.ecriture_id, ligne.date_ecriture, ligne.libelle,
+                               ligne.debit - ligne.credit, ligne.piece_justificative)
+                for ligne in lignes_bancaires
+            ),
+            tolerance=tolerance_montant
+        )
+        
         correspondances = []
-        for mouvement in mouvements_bancaires:
-            meilleures_correspondances = []
-            
-            for ecriture, ligne in ecritures_comptables:
-                montant_ecriture = float(ligne.debit - ligne.credit)
-                
-                # Vérification montant
-                if abs(abs(mouvement.montant) - abs(montant_ecriture)) <= tolerance_montant:
-                    score_libelle = calculer_score_similarite(mouvement.libelle, ecriture.libelle)
-                    delta_jours = abs((mouvement.date - ecriture.date_ecriture).days)
-                    score_date = max(0, 100 - (delta_jours * 10))
-                    score_global = (score_libelle * 0.7) + (score_date * 0.3)
-                    
-                    if score_global >= seuil_similarite:
-                        meilleures_correspondances.append({
-                            'ecriture_id': ecriture.id,
-                            'ligne_id': ligne.id,
-                            'ecriture': {
-                                'id': ecriture.id,
-                                'date': ecriture.date_ecriture.strftime('%Y-%m-%d'),
-                                'libelle': ecriture.libelle,
-                                'montant': montant_ecriture,
-                                'piece_justificative': ecriture.piece_justificative
-                            },
-                            'scores': {
-                                'libelle': round(score_libelle, 2),
-                                'date': round(score_date, 2),
-                                'global': round(score_global, 2)
-                            }
-                        })
-            
-            meilleures_correspondances.sort(key=lambda x: x['scores']['global'], reverse=True)
-            
-            correspondances.append({
-                'mouvement_bancaire': {
-                    'id': mouvement.id,
-                    'date': mouvement.date.strftime('%Y-%m-%d'),
-                    'libelle': mouvement.libelle,
-                    'montant': mouvement.montant,
-                    'reference': mouvement.reference
-                },
-                'correspondances_trouvees': meilleures_correspondances[:3],
-                'statut': 'automatique' if meilleures_correspondances and meilleures_correspondances[0]['scores']['global'] >= 90 else 'manuel'
-            })
+        lignes_prises = set()
+        for lot in lots:
+            resultats = apparier(
+                lot, index,
+                seuil=seuil_similarite,
+                affectation_unique=affectation_unique,
+                lignes_prises=lignes_prises
+            )
+            correspondances.extend(
+                _formater_correspondance(mouvement, trouves)
+                for mouvement, trouves in zip(lot, resultats)
+            )
         
         # Statistiques
         nb_automatiques = sum(1 for c in correspondances if c['statut'] == 'automatique')
@@ -308,15 +514,29 @@ def get_synthese_rapprochement():
             'endpoint': '/api/v1/rapprochement/import-releve',
             'methode': 'POST',
             'nom': 'Import relevé bancaire',
-            'description': 'Importe un fichier CSV de relevé bancaire',
-            'parametres': ['fichier (CSV)', 'date_debut', 'date_fin']
+            'description': 'Importe un relevé bancaire en flux, sans doublons',
+            'parametres': ['file (CSV, OFX, CAMT.053)', 'format', 'compte', 'delimiter']
+        },
+        {
+            'endpoint': '/api/v1/rapprochement/mouvements',
+            'methode': 'GET',
+            'nom': 'Mouvements bancaires importés',
+            'description': 'Liste les mouvements des relevés importés',
+            'parametres': ['date_debut', 'date_fin', 'statut', 'compte', 'page', 'per_page']
         },
         {
             'endpoint': '/api/v1/rapprochement/correspondances',
             'methode': 'POST',
             'nom': 'Recherche correspondances',
             'description': 'Trouve automatiquement les correspondances entre relevé et écritures',
-            'parametres': ['mouvements_bancaires', 'date_debut', 'date_fin', 'tolerance_montant', 'seuil_similarite']
+            'parametres': ['mouvements_bancaires', 'date_debut', 'date_fin', 'tolerance_montant', 'seuil_similarite', 'affectation_unique']
+        },
+        {
+            'endpoint': '/api/v1/rapprochement/mouvements/<id>/rapprocher',
+            'methode': 'POST',
+            'nom': 'Validation d\'une correspondance',
+            'description': 'Rapproche un mouvement importé d\'une ligne d\'écriture bancaire (DELETE pour annuler)',
+            'parametres': ['ligne_id', 'score', 'tolerance_montant']
         },
         {
             'endpoint': '/api/v1/rapprochement/ecritures-non-rapprochees',
@@ -348,12 +568,14 @@ def get_synthese_rapprochement():
             'version': '1.0',
             'fonctionnalites': fonctionnalites,
             'total_endpoints': len(fonctionnalites),
-            'formats_supportes': ['CSV'],
+            'formats_supportes': ['CSV', 'OFX', 'CAMT.053'],
             'algorithmes': [
                 'Matching par montant avec tolérance',
                 'Similarité textuelle des libellés',
                 'Pondération temporelle (proximité des dates)',
-                'Score global de correspondance'
+                'Score global de correspondance',
+                'Index par tranche de montant et index inversé des libellés',
+                'Affectation un-pour-un optionnelle'
             ]
         }
     })
\ No newline at end of file
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+API Suivi des tâches en arrière-plan
+====================================
+
+Les traitements longs (imports, exports, clôtures) lancés avec
+asynchrone=true répondent 202 avec l'identifiant d'une tâche :
+- Suivi de l'état et de la progression
+- Téléchargement du résultat
+- Annulation et relance
+
+Auteur: ComptaEBNL-IA
+Date: 2025
+"""
+
+import os
+
+from flask import Blueprint, request, jsonify, send_file
+
+from models import db, Tache
+from services.job_runner import get_gestionnaire, STATUTS_FINAUX
+
+taches_bp = Blueprint('taches', __name__)
+
+
+def demande_asynchrone():
+    """Paramètre asynchrone=true (query string ou formulaire) : traitement délégué à une tâche"""
+    valeur = request.values.get('asynchrone', '')
+    return valeur.lower() in ('1', 'true', 'oui')
+
+
+def reponse_tache(tache, message=None):
+    """Réponse 202 d'un endpoint ayant délégué son traitement à une tâche (code final si déjà exécutée)"""
+    etat = get_gestionnaire().etat(tache)
+    code = 202 if tache.statut not in STATUTS_FINAUX else 400 if tache.statut == 'erreur' else 200
+    return jsonify({
+        'success': tache.statut != 'erreur',
+        'data': {
+            'tache': etat,
+            'suivi': f'/api/v1/taches/{tache.id}',
+            'resultat': f'/api/v1/taches/{tache.id}/resultat'
+        },
+        'message': message or f'Tâche {tache.id} {tache.statut}'
+    }), code
+
+
+@taches_bp.route('/taches', methods=['GET'])
+def get_taches():
+    """Liste les tâches récentes"""
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        query = Tache.query
+
+        if request.args.get('type'):
+            query = query.filter(Tache.type_tache == request.args['type'])
+        if request.args.get('statut'):
+            query = query.filter(Tache.statut == request.args['statut'])
+
+        gestionnaire = get_gestionnaire()
+        taches = query.order_by(Tache.id.desc()).limit(limit).all()
+
+        return jsonify({
+            'success': True,
+            'data': [gestionnaire.etat(tache) for tache in taches],
+            'message': f'{len(taches)} tâche(s)'
+        })
+
+    except Exception as e:
+        print(f"❌ Erreur liste tâches: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Erreur lors de la récupération des tâches'
+        }), 500
+
+
+@taches_bp.route('/taches/<int:tache_id>', methods=['GET'])
+def get_tache(tache_id):
+    """État, progression et résultat d'une tâche"""
+    tache = Tache.query.get_or_404(tache_id)
+    return jsonify({
+        'success': True,
+        'data': get_gestionnaire().etat(tache)
+    })
+
+
+@taches_bp.route('/taches/<int:tache_id>/resultat', methods=['GET'])
+def get_resultat_tache(tache_id):
+    """Télécharge le fichier produit par la tâche (ou son résultat JSON)"""
+    tache = Tache.query.get_or_404(tache_id)
+
+    if tache.statut != 'termine':
+        return jsonify({
+            'success': False,
+            'error': f'La tâche est {tache.statut}',
+            'data': get_gestionnaire().etat(tache)
+        }), 409
+
+    if tache.fichier_resultat:
+        if not os.path.exists(tache.fichier_resultat):
+            return jsonify({
+                'success': False,
+                'error': 'Le fichier résultat n\'est plus disponible'
+            }), 410
+        return send_file(
+            tache.fichier_resultat,
+            mimetype=tache.type_contenu,
+            as_attachment=True,
+            download_name=tache.nom_fichier
+        )
+
+    return jsonify({
+        'success': True,
+        'data': tache.resultat
+    })
+
+
+@taches_bp.route('/taches/<int:tache_id>/annuler', methods=['POST'])
+def annuler_tache(tache_id):
+    """Annule une tâche en attente ou demande l'arrêt d'une tâche en cours"""
+    try:
+        tache = Tache.query.get_or_404(tache_id)
+
+        if tache.statut in STATUTS_FINAUX:
+            return jsonify({
+                'success': False,
+                'error': f'La tâche est déjà {tache.statut}'
+            }), 400
+
+        tache = get_gestionnaire().annuler(tache)
+
+        return jsonify({
+            'success': True,
+            'data': get_gestionnaire().etat(tache),
+            'message': 'Tâche annulée' if tache.statut == 'annule' else 'Annulation demandée'
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erreur annulation tâche: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Erreur lors de l\'annulation de la tâche'
+        }), 500
+
+
+@taches_bp.route('/taches/<int:tache_id>/relancer', methods=['POST'])
+def relancer_tache(tache_id):
+    """Relance une tâche en erreur, annulée ou abandonnée"""
+    try:
+        tache = Tache.query.get_or_404(tache_id)
+        tache = get_gestionnaire().relancer(tache)
+        return reponse_tache(tache, f'Tâche {tache.id} relancée')
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erreur relance tâche: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Erreur lors de la relance de la tâche'
+        }), 500
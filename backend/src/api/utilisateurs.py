@@ -16,7 +16,7 @@ Auteur: ComptaEBNL-IA
 Date: 2025
 """
 
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, current_app, request, jsonify, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import jwt
@@ -24,6 +24,7 @@ import datetime
 from sqlalchemy import func
 
 from models import db, Utilisateur
+from services.auth_context import PERMISSIONS_PAR_ROLE, bit_permission, claims_auth, contexte_auth
 
 # Création du blueprint
 utilisateurs_bp = Blueprint('utilisateurs', __name__)
@@ -34,7 +35,12 @@ JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
 
 def token_required(f):
-    """Décorateur pour vérifier l'authentification JWT"""
+    """
+    Décorateur pour vérifier l'authentification JWT
+    
+    L'endpoint reçoit un ContexteAuth (id, role, actif, droits) servi par le
+    cache des contextes : aucune requête tant que l'utilisateur n'a pas changé.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
         token = None
@@ -59,8 +65,7 @@ def token_required(f):
         try:
             # Décoder le token
             data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            current_user_id = data['user_id']
-            current_user = Utilisateur.query.get(current_user_id)
+            current_user = contexte_auth(data)
             
             if not current_user or not current_user.actif:
                 return jsonify({
@@ -73,7 +78,7 @@ def token_required(f):
                 'success': False,
                 'error': 'Token expiré'
             }), 401
-        except jwt.InvalidTokenError:
+        except (jwt.InvalidTokenError, KeyError):
             return jsonify({
                 'success': False,
                 'error': 'Token invalide'
@@ -84,31 +89,13 @@ def token_required(f):
     return decorated
 
 def permission_required(permission):
-    """Décorateur pour vérifier les permissions spécifiques"""
+    """Décorateur pour vérifier les permissions spécifiques (masque du rôle précompilé)"""
+    masque = bit_permission(permission)
+    
     def decorator(f):
         @wraps(f)
         def decorated(current_user, *args, **kwargs):
-            # Vérifier les permissions selon le rôle
-            permissions_par_role = {
-                'administrateur': ['*'],  # Toutes les permissions
-                'comptable': [
-                    'ecriture.create', 'ecriture.read', 'ecriture.update', 'ecriture.validate',
-                    'plan_comptable.read', 'balance.read', 'etats_financiers.read',
-                    'exercice.read', 'exercice.create'
-                ],
-                'assistant': [
-                    'ecriture.create', 'ecriture.read', 'plan_comptable.read',
-                    'balance.read'
-                ],
-                'consultant': [
-                    'ecriture.read', 'plan_comptable.read', 'balance.read',
-                    'etats_financiers.read'
-                ]
-            }
-            
-            user_permissions = permissions_par_role.get(current_user.role, [])
-            
-            if '*' not in user_permissions and permission not in user_permissions:
+            if not current_user.a_permission(masque):
                 return jsonify({
                     'success': False,
                     'error': f'Permission insuffisante: {permission} requise'
@@ -226,12 +213,17 @@ def login():
         db.session.commit()
         
         # Générer le token JWT
+        maintenant = datetime.datetime.utcnow()
         token_payload = {
             'user_id': utilisateur.id,
             'nom_utilisateur': utilisateur.nom_utilisateur,
             'role': utilisateur.role,
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=JWT_EXPIRATION_HOURS)
+            'iat': maintenant,
+            'exp': maintenant + datetime.timedelta(hours=JWT_EXPIRATION_HOURS)
         }
+        # Rôle et droits dans le jeton : contexte construit sans requête (révoqué si l'utilisateur change)
+        if current_app.config.get('AUTH_CLAIMS_JWT'):
+            token_payload['auth'] = claims_auth(utilisateur)
         
         token = jwt.encode(token_payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
         
@@ -468,33 +460,25 @@ def get_roles(current_user):
                 'code': 'administrateur',
                 'nom': 'Administrateur',
                 'description': 'Accès complet à toutes les fonctionnalités',
-                'permissions': ['*']
+                'permissions': PERMISSIONS_PAR_ROLE['administrateur']
             },
             {
                 'code': 'comptable',
                 'nom': 'Comptable',
                 'description': 'Gestion comptable complète',
-                'permissions': [
-                    'ecriture.create', 'ecriture.read', 'ecriture.update', 'ecriture.validate',
-                    'plan_comptable.read', 'balance.read', 'etats_financiers.read',
-                    'exercice.read', 'exercice.create'
-                ]
+                'permissions': PERMISSIONS_PAR_ROLE['comptable']
             },
             {
                 'code': 'assistant',
                 'nom': 'Assistant comptable',
                 'description': 'Saisie d\'écritures et consultation',
-                'permissions': [
-                    'ecriture.create', 'ecriture.read', 'plan_comptable.read', 'balance.read'
-                ]
+                'permissions': PERMISSIONS_PAR_ROLE['assistant']
             },
             {
                 'code': 'consultant',
                 'nom': 'Consultant',
                 'description': 'Consultation uniquement',
-                'permissions': [
-                    'ecriture.read', 'plan_comptable.read', 'balance.read', 'etats_financiers.read'
-                ]
+                'permissions': PERMISSIONS_PAR_ROLE['consultant']
             }
         ]
         
@@ -19,7 +19,8 @@ def create_app():
     
     # Initialisation de la base de données
     db.init_app(app)
-    migrate.init_app(app, db)
+    if migrate is not None:
+        migrate.init_app(app, db)
     
     # Initialisation CORS
     CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:3000"])
@@ -29,11 +29,38 @@ class Config:
     MTN_MOMO_API_KEY = os.environ.get('MTN_MOMO_API_KEY') or 'mtn_api_key'
     ORANGE_MONEY_API_KEY = os.environ.get('ORANGE_MONEY_API_KEY') or 'orange_api_key'
     WAVE_API_KEY = os.environ.get('WAVE_API_KEY') or 'wave_api_key'
+    
+    # Registre du plan comptable : relecture de la version en base au plus toutes les N secondes
+    REGISTRE_COMPTES_TTL = int(os.environ.get('REGISTRE_COMPTES_TTL', 5))
+    
+    # Recherche plein texte : fts5 / postgresql détectés au démarrage, 'python' force l'index en mémoire
+    RECHERCHE_MOTEUR = os.environ.get('RECHERCHE_MOTEUR')
+    
+    # Contextes d'authentification en cache (LRU par processus) et claims de rôle dans le JWT
+    AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 30))
+    AUTH_CACHE_TAILLE = int(os.environ.get('AUTH_CACHE_TAILLE', 1024))
+    AUTH_CLAIMS_JWT = os.environ.get('AUTH_CLAIMS_JWT', 'false').lower() == 'true'
+    
+    # Quotas d'abonnement : compteurs en mémoire écrits par lots de QUOTAS_LOT unités ou toutes les
+    # QUOTAS_INTERVALLE secondes, vérifiés en base à moins de QUOTAS_MARGE unités de la limite (défaut : QUOTAS_LOT)
+    QUOTAS_LOT = int(os.environ.get('QUOTAS_LOT', 50))
+    QUOTAS_INTERVALLE = int(os.environ.get('QUOTAS_INTERVALLE', 10))
+    QUOTAS_MARGE = int(os.environ['QUOTAS_MARGE']) if os.environ.get('QUOTAS_MARGE') else None
+    ABONNEMENT_CACHE_TTL = int(os.environ.get('ABONNEMENT_CACHE_TTL', 60))
+    ABONNEMENTS_VERIFICATION_INTERVALLE = int(os.environ.get('ABONNEMENTS_VERIFICATION_INTERVALLE', 60))
+
+    # Profilage SQL (Server-Timing, /api/metrics réservé aux administrateurs) : désactivé hors développement et test
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+    METRICS_SEUIL_LENT_MS = int(os.environ.get('METRICS_SEUIL_LENT_MS', 500))
+    METRICS_BUDGET_REQUETES = None  # budget par défaut ; METRICS_BUDGETS = {endpoint: n}
+    METRICS_BUDGETS = {}
+    METRICS_BUDGET_STRICT = False  # True : un dépassement lève une erreur (tests)
 
 class DevelopmentConfig(Config):
     """Configuration de développement"""
     DEBUG = True
     TESTING = False
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
 
 class ProductionConfig(Config):
     """Configuration de production"""
@@ -45,6 +72,8 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    METRICS_ENABLED = True
+    METRICS_BUDGET_STRICT = True
 
 # Configuration par défaut
 config = {
@@ -3,8 +3,14 @@ Extensions Flask pour ComptaEBNL-IA
 """
 
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+
+# Import optionnel de Flask-Migrate (absent des environnements de test)
+try:
+    from flask_migrate import Migrate
+    MIGRATE_AVAILABLE = True
+except ImportError:
+    MIGRATE_AVAILABLE = False
 
 # Initialisation des extensions
 db = SQLAlchemy()
-migrate = Migrate()
\ No newline at end of file
+migrate = Migrate() if MIGRATE_AVAILABLE else None
@@ -42,6 +42,10 @@ def create_app(config_class=Config):
     from api import create_api_blueprints
     create_api_blueprints(app)
     
+    # Profilage SQL par requête (Server-Timing, /api/metrics)
+    from middleware.query_profiler import init_profilage
+    init_profilage(app)
+    
     # Routes principales
     @app.route('/')
     def index():
@@ -226,6 +230,10 @@ def create_app(config_class=Config):
             # Créer toutes les tables
             db.create_all()
             
+            # Compléter les tables créées par une version antérieure (colonnes ajoutées depuis)
+            from services.schema_migrations import migrer_schema
+            migrer_schema()
+            
             # Initialiser les données par défaut
             init_default_data()
             
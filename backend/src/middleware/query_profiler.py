@@ -0,0 +1,258 @@
+"""
+Profilage SQL par requête HTTP
+Compte les requêtes SQL et leur durée pour chaque appel d'API (écouteurs
+before/after_cursor_execute), publie le résultat dans l'en-tête Server-Timing,
+agrège par endpoint sur /api/metrics et signale les endpoints lents ou
+dépassant leur budget de requêtes
+"""
+
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from flask import Blueprint, current_app, g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from api.utilisateurs import permission_required, token_required
+
+NB_REQUETES_LENTES = 5  # requêtes SQL les plus lentes conservées par endpoint
+SEUIL_LENT_MS_DEFAUT = 500
+LONGUEUR_SQL_MAX = 300
+
+_local = threading.local()
+
+
+class BudgetRequetesDepasse(AssertionError):
+    """Nombre de requêtes SQL supérieur au budget (échoue les tests en mode strict)"""
+
+
+class CollecteurSQL:
+    """Requêtes SQL exécutées par le fil courant pendant une requête HTTP ou un bloc compter_requetes()"""
+
+    def __init__(self):
+        self.nb_requetes = 0
+        self.duree_sql = 0.0  # secondes
+        self.plus_lentes: List[Tuple[float, str]] = []  # tas (durée, SQL) borné
+
+    def enregistrer(self, statement: str, duree: float) -> None:
+        self.nb_requetes += 1
+        self.duree_sql += duree
+        entree = (duree, ' '.join(statement.split())[:LONGUEUR_SQL_MAX])
+        if len(self.plus_lentes) < NB_REQUETES_LENTES:
+            heapq.heappush(self.plus_lentes, entree)
+        elif duree > self.plus_lentes[0][0]:
+            heapq.heapreplace(self.plus_lentes, entree)
+
+    @property
+    def duree_sql_ms(self) -> float:
+        return round(self.duree_sql * 1000, 2)
+
+    def requetes_lentes(self) -> List[Dict]:
+        return [{'duree_ms': round(duree * 1000, 2), 'sql': sql}
+                for duree, sql in sorted(self.plus_lentes, reverse=True)]
+
+
+def _collecteurs() -> List[CollecteurSQL]:
+    if not hasattr(_local, 'pile'):
+        _local.pile = []
+    return _local.pile
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _avant_execution(conn, cursor, statement, parameters, context, executemany):
+    if _collecteurs():
+        conn.info.setdefault('profilage_debuts', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _apres_execution(conn, cursor, statement, parameters, context, executemany):
+    debuts = conn.info.get('profilage_debuts')
+    if not debuts:
+        return
+    duree = time.perf_counter() - debuts.pop()
+    # Collecteurs imbriqués (bloc de test autour d'un appel HTTP) : chacun compte la requête
+    for collecteur in _collecteurs():
+        collecteur.enregistrer(statement, duree)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _erreur_execution(contexte):
+    # Requête en échec : after_cursor_execute n'est pas appelé
+    debuts = contexte.connection.info.get('profilage_debuts') if contexte.connection is not None else None
+    if debuts:
+        debuts.pop()
+
+
+@contextmanager
+def compter_requetes(budget: Optional[int] = None):
+    """
+    Compte les requêtes SQL exécutées dans le bloc (fil courant)
+
+    Args:
+        budget: Nombre maximal de requêtes ; BudgetRequetesDepasse levée au-delà
+
+    Yields:
+        CollecteurSQL: Compteurs mis à jour pendant le bloc
+    """
+    collecteur = CollecteurSQL()
+    _collecteurs().append(collecteur)
+    try:
+        yield collecteur
+    finally:
+        _collecteurs().remove(collecteur)
+    if budget is not None and collecteur.nb_requetes > budget:
+        raise BudgetRequetesDepasse(
+            f'{collecteur.nb_requetes} requêtes SQL pour un budget de {budget} : '
+            f'{[r["sql"] for r in collecteur.requetes_lentes()]}'
+        )
+
+
+class StatistiquesEndpoints:
+    """Agrégats par endpoint depuis le démarrage (ou la dernière remise à zéro)"""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.endpoints: Dict[str, Dict] = {}
+
+    def enregistrer(self, endpoint: str, collecteur: CollecteurSQL, duree: float, depassement: bool) -> None:
+        duree_ms = duree * 1000
+        with self.verrou:
+            stats = self.endpoints.setdefault(endpoint, {
+                'appels': 0, 'requetes_total': 0, 'requetes_max': 0, 'sql_ms_total': 0.0,
+                'sql_ms_max': 0.0, 'duree_ms_total': 0.0, 'duree_ms_max': 0.0, 'depassements_budget': 0,
+                'plus_lentes': []
+            })
+            stats['appels'] += 1
+            stats['requetes_total'] += collecteur.nb_requetes
+            stats['requetes_max'] = max(stats['requetes_max'], collecteur.nb_requetes)
+            stats['sql_ms_total'] += collecteur.duree_sql * 1000
+            stats['sql_ms_max'] = max(stats['sql_ms_max'], collecteur.duree_sql * 1000)
+            stats['duree_ms_total'] += duree_ms
+            stats['duree_ms_max'] = max(stats['duree_ms_max'], duree_ms)
+            stats['depassements_budget'] += int(depassement)
+            stats['plus_lentes'] = heapq.nlargest(
+                NB_REQUETES_LENTES, stats['plus_lentes'] + collecteur.plus_lentes
+            )
+
+    def rapport(self) -> List[Dict]:
+        """Endpoints triés par temps SQL cumulé décroissant"""
+        with self.verrou:
+            lignes = []
+            for endpoint, stats in self.endpoints.items():
+                appels = stats['appels']
+                lignes.append({
+                    'endpoint': endpoint,
+                    'appels': appels,
+                    'requetes_moyenne': round(stats['requetes_total'] / appels, 1),
+                    'requetes_max': stats['requetes_max'],
+                    'sql_ms_total': round(stats['sql_ms_total'], 2),
+                    'sql_ms_moyenne': round(stats['sql_ms_total'] / appels, 2),
+                    'sql_ms_max': round(stats['sql_ms_max'], 2),
+                    'duree_ms_moyenne': round(stats['duree_ms_total'] / appels, 2),
+                    'duree_ms_max': round(stats['duree_ms_max'], 2),
+                    'depassements_budget': stats['depassements_budget'],
+                    'requetes_lentes': [{'duree_ms': round(duree * 1000, 2), 'sql': sql}
+                                        for duree, sql in stats['plus_lentes']]
+                })
+            return sorted(lignes, key=lambda ligne: ligne['sql_ms_total'], reverse=True)
+
+    def reinitialiser(self) -> None:
+        with self.verrou:
+            self.endpoints.clear()
+
+
+def budget_endpoint(endpoint: str) -> Optional[int]:
+    """Budget de requêtes : METRICS_BUDGETS[endpoint], sinon METRICS_BUDGET_REQUETES"""
+    return current_app.config.get('METRICS_BUDGETS', {}).get(
+        endpoint, current_app.config.get('METRICS_BUDGET_REQUETES')
+    )
+
+
+def _debut_requete():
+    g.profil_sql = CollecteurSQL()
+    g.profil_debut = time.perf_counter()
+    _collecteurs().append(g.profil_sql)
+
+
+def _fin_requete(response):
+    collecteur = g.pop('profil_sql', None)
+    if collecteur is None:
+        return response
+    if collecteur in _collecteurs():
+        _collecteurs().remove(collecteur)
+
+    duree = time.perf_counter() - g.pop('profil_debut')
+    endpoint = request.endpoint or request.path
+    budget = budget_endpoint(endpoint)
+    depassement = budget is not None and collecteur.nb_requetes > budget
+    if request.blueprint != metrics_bp.name:  # la consultation des métriques ne s'y ajoute pas
+        current_app.extensions['profilage_sql'].enregistrer(endpoint, collecteur, duree, depassement)
+
+    response.headers['Server-Timing'] = (
+        f'sql;dur={collecteur.duree_sql_ms};desc="{collecteur.nb_requetes} requetes", '
+        f'app;dur={round(duree * 1000, 2)}'
+    )
+
+    seuil = current_app.config.get('METRICS_SEUIL_LENT_MS', SEUIL_LENT_MS_DEFAUT)
+    if duree * 1000 > seuil or depassement:
+        current_app.logger.warning(
+            f'Endpoint lent {endpoint}: {round(duree * 1000)} ms, {collecteur.nb_requetes} requêtes SQL '
+            f'({collecteur.duree_sql_ms} ms), plus lente: {collecteur.requetes_lentes()[:1]}'
+        )
+    if depassement and current_app.config.get('METRICS_BUDGET_STRICT'):
+        raise BudgetRequetesDepasse(
+            f'{endpoint}: {collecteur.nb_requetes} requêtes SQL pour un budget de {budget}'
+        )
+    return response
+
+
+def _nettoyer_requete(exception=None):
+    # Requête interrompue avant after_request : ne pas laisser le collecteur sur la pile du fil
+    collecteur = g.pop('profil_sql', None)
+    if collecteur is not None and collecteur in _collecteurs():
+        _collecteurs().remove(collecteur)
+
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/api/metrics', methods=['GET'])
+@token_required
+@permission_required('metrics.read')
+def get_metrics(current_user):
+    """Requêtes SQL et durées agrégées par endpoint (administrateurs)"""
+    limit = request.args.get('limit', 50, type=int)
+    endpoints = current_app.extensions['profilage_sql'].rapport()
+    return jsonify({
+        'success': True,
+        'data': {
+            'endpoints': endpoints[:limit],
+            'seuil_lent_ms': current_app.config.get('METRICS_SEUIL_LENT_MS', SEUIL_LENT_MS_DEFAUT)
+        }
+    })
+
+
+@metrics_bp.route('/api/metrics', methods=['DELETE'])
+@token_required
+@permission_required('metrics.reset')
+def reset_metrics(current_user):
+    """Remet les agrégats à zéro (administrateurs)"""
+    current_app.extensions['profilage_sql'].reinitialiser()
+    return jsonify({
+        'success': True,
+        'message': 'Métriques réinitialisées'
+    })
+
+
+def init_profilage(app) -> None:
+    """Branche le profilage SQL sur l'application (METRICS_ENABLED, actif par défaut en développement et en test)"""
+    if not app.config.get('METRICS_ENABLED', app.debug or app.testing):
+        return
+    app.extensions['profilage_sql'] = StatistiquesEndpoints()
+    app.before_request(_debut_requete)
+    app.after_request(_fin_requete)
+    app.teardown_request(_nettoyer_requete)
+    app.register_blueprint(metrics_bp)
@@ -3,15 +3,24 @@ Middleware de Gestion des Quotas d'Abonnement
 Contrôle l'accès aux fonctionnalités selon le plan d'abonnement
 """
 
+import time
 from functools import wraps
-from flask import request, jsonify, g
+from flask import request, jsonify, g, current_app, has_app_context
 from datetime import datetime, timedelta
 from typing import Optional, Callable, Any
 
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
 from models import (
     db, Abonnement, UtilisationQuota, PlanAbonnement,
     StatutAbonnement, TypePlan
 )
+from services.quota_accounting import COLONNES, Utilisation, compteurs_quotas
+
+ABONNEMENT_TTL_DEFAUT = 60  # secondes
+VERIFICATION_EXPIRATION_DEFAUT = 60  # secondes entre deux recherches d'abonnements expirés
 
 class SubscriptionError(Exception):
     """Exception pour les erreurs d'abonnement"""
@@ -22,32 +31,21 @@ class SubscriptionError(Exception):
         super().__init__(self.message)
 
 class QuotaManager:
-    """Gestionnaire des quotas d'utilisation"""
+    """Gestionnaire des quotas d'utilisation (compteurs en mémoire, voir services.quota_accounting)"""
     
     @staticmethod
-    def get_current_usage(abonnement_id: int, annee: int = None, mois: int = None) -> UtilisationQuota:
-        """Récupère ou crée l'utilisation du mois courant"""
-        if not annee or not mois:
-            now = datetime.now()
-            annee = now.year
-            mois = now.month
-        
-        utilisation = UtilisationQuota.query.filter_by(
-            abonnement_id=abonnement_id,
-            annee=annee,
-            mois=mois
-        ).first()
-        
-        if not utilisation:
-            utilisation = UtilisationQuota(
-                abonnement_id=abonnement_id,
-                annee=annee,
-                mois=mois
-            )
-            db.session.add(utilisation)
-            db.session.commit()
-        
-        return utilisation
+    def get_current_usage(abonnement_id: int, annee: int = None, mois: int = None) -> Utilisation:
+        """Utilisation du mois : valeur en base + consommations en attente (aucune écriture)"""
+        return compteurs_quotas().utilisation(abonnement_id, annee, mois)
+    
+    @staticmethod
+    def get_limit(plan: PlanAbonnement, resource_type: str) -> int:
+        """Limite mensuelle d'une ressource comptée (-1 : illimité)"""
+        if resource_type == 'ecritures':
+            return plan.max_ecritures_mois
+        if resource_type == 'documents':
+            return plan.max_documents_mois
+        return -1
     
     @staticmethod
     def check_quota(abonnement: Abonnement, resource_type: str, quantity: int = 1) -> bool:
@@ -64,19 +62,17 @@ class QuotaManager:
                 return True
         
         # Vérifier les quotas spécifiques
-        utilisation = QuotaManager.get_current_usage(abonnement.id)
-        
         if resource_type == 'ecritures':
             limite = plan.max_ecritures_mois
             if limite == -1:
                 return True
-            return (utilisation.ecritures_utilisees + quantity) <= limite
+            return (QuotaManager.get_current_usage(abonnement.id).ecritures_utilisees + quantity) <= limite
         
         elif resource_type == 'documents':
             limite = plan.max_documents_mois
             if limite == -1:
                 return True
-            return (utilisation.documents_traites + quantity) <= limite
+            return (QuotaManager.get_current_usage(abonnement.id).documents_traites + quantity) <= limite
         
         elif resource_type == 'utilisateurs':
             limite = plan.max_utilisateurs
@@ -94,22 +90,106 @@ class QuotaManager:
         
         return False
     
+    @staticmethod
+    def reserve_quota(abonnement: Abonnement, resource_type: str, quantity: int = 1) -> bool:
+        """Vérifie le quota et compte la consommation en une seule opération atomique"""
+        if resource_type not in COLONNES:
+            return QuotaManager.check_quota(abonnement, resource_type, quantity)
+        return compteurs_quotas().consommer(
+            abonnement.id, resource_type, quantity, QuotaManager.get_limit(abonnement.plan, resource_type)
+        )
+    
+    @staticmethod
+    def release_quota(abonnement_id: int, resource_type: str, quantity: int = 1):
+        """Rend une consommation réservée (l'opération a échoué)"""
+        if resource_type in COLONNES:
+            compteurs_quotas().rendre(abonnement_id, resource_type, quantity)
+    
     @staticmethod
     def increment_usage(abonnement_id: int, resource_type: str, quantity: int = 1):
-        """Incrémente l'utilisation d'une ressource"""
-        utilisation = QuotaManager.get_current_usage(abonnement_id)
-        
-        if resource_type == 'ecritures':
-            utilisation.ecritures_utilisees += quantity
-        elif resource_type == 'documents':
-            utilisation.documents_traites += quantity
-        elif resource_type == 'api_calls':
-            utilisation.appels_api += quantity
-        elif resource_type == 'stockage':
-            utilisation.stockage_utilise_mb += quantity
+        """Incrémente l'utilisation d'une ressource (écrite en base par lots)"""
+        if resource_type not in COLONNES:
+            return
+        compteurs = compteurs_quotas()
+        compteurs.consommer(abonnement_id, resource_type, quantity)
+        compteurs.flush_si_necessaire()
+
+def _copie_detachee(instance):
+    """Copie détachée d'une instance chargée (colonnes seulement), rattachable sans requête"""
+    mapper = inspect(instance).mapper
+    copie = mapper.class_manager.new_instance()
+    for attribut in mapper.column_attrs:
+        set_committed_value(copie, attribut.key, getattr(instance, attribut.key))
+    make_transient_to_detached(copie)
+    return copie
+
+def abonnement_actif(user_id) -> Optional[Abonnement]:
+    """
+    Abonnement actif le plus récent d'un utilisateur, gardé ABONNEMENT_CACHE_TTL secondes
+    
+    Le cache garde une copie détachée de l'abonnement et de son plan, rattachée
+    à la session de la requête sans requête (merge load=False) ; il est vidé au
+    commit d'une modification d'abonnement ou de plan.
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    
+    cache = current_app.extensions.setdefault('abonnements_actifs', {})
+    entree = cache.get(user_id)
+    if entree is None or time.monotonic() - entree[1] >= current_app.config.get('ABONNEMENT_CACHE_TTL', ABONNEMENT_TTL_DEFAUT):
+        abonnement = Abonnement.query.options(joinedload(Abonnement.plan)).filter_by(
+            utilisateur_id=user_id,
+            statut=StatutAbonnement.ACTIF
+        ).order_by(Abonnement.date_creation.desc()).first()
         
-        utilisation.date_maj = datetime.utcnow()
-        db.session.commit()
+        copie = None
+        if abonnement is not None:
+            copie = _copie_detachee(abonnement)
+            set_committed_value(copie, 'plan', _copie_detachee(abonnement.plan))
+        entree = cache[user_id] = (copie, time.monotonic())
+    
+    copie = entree[0]
+    if copie is None:
+        return None
+    return db.session.merge(copie, load=False)
+
+def invalider_abonnements(user_ids=None):
+    """Vide le cache des abonnements (de certains utilisateurs ou de tous)"""
+    if not has_app_context():
+        return
+    cache = current_app.extensions.get('abonnements_actifs')
+    if not cache:
+        return
+    if user_ids is None:
+        cache.clear()
+    else:
+        for user_id in user_ids:
+            cache.pop(user_id, None)
+
+@event.listens_for(Session, 'before_flush')
+def _ecouter_abonnements(session, flush_context, instances):
+    """Abonnements créés, modifiés ou supprimés : cache invalidé au commit (tout le cache pour un plan)"""
+    modifies = session.info.setdefault('abonnements_modifies', set())
+    for groupe in (session.new, session.dirty, session.deleted):
+        for obj in groupe:
+            if isinstance(obj, Abonnement) and obj.utilisateur_id is not None:
+                modifies.add(int(obj.utilisateur_id))
+            elif isinstance(obj, PlanAbonnement):
+                modifies.add('*')
+    if not modifies:
+        session.info.pop('abonnements_modifies')
+
+@event.listens_for(Session, 'after_commit')
+def _apres_commit(session):
+    modifies = session.info.pop('abonnements_modifies', None)
+    if modifies:
+        invalider_abonnements(None if '*' in modifies else modifies)
+
+@event.listens_for(Session, 'after_rollback')
+def _apres_rollback(session):
+    session.info.pop('abonnements_modifies', None)
 
 def subscription_required(f: Callable) -> Callable:
     """Décorateur pour vérifier qu'un abonnement actif existe"""
@@ -125,11 +205,8 @@ def subscription_required(f: Callable) -> Callable:
                 'code': 'AUTH_REQUIRED'
             }), 401
         
-        # Vérifier l'abonnement actif
-        abonnement = Abonnement.query.filter_by(
-            utilisateur_id=user_id,
-            statut=StatutAbonnement.ACTIF
-        ).order_by(Abonnement.date_creation.desc()).first()
+        # Vérifier l'abonnement actif (en cache quelques secondes)
+        abonnement = abonnement_actif(user_id)
         
         if not abonnement or not abonnement.est_actif():
             return jsonify({
@@ -201,8 +278,8 @@ def quota_required(resource_type: str, quantity: int = 1):
                     'code': 'SUBSCRIPTION_REQUIRED'
                 }), 402
             
-            # Vérifier le quota
-            if not QuotaManager.check_quota(abonnement, resource_type, quantity):
+            # Vérifier et réserver le quota
+            if not QuotaManager.reserve_quota(abonnement, resource_type, quantity):
                 plan = abonnement.plan
                 utilisation = QuotaManager.get_current_usage(abonnement.id)
                 
@@ -230,16 +307,23 @@ def quota_required(resource_type: str, quantity: int = 1):
                     'upgrade_url': '/pricing'
                 }), 429
             
-            # Exécuter la fonction
-            result = f(*args, **kwargs)
+            # Exécuter la fonction (la réservation est rendue si elle échoue)
+            try:
+                result = f(*args, **kwargs)
+            except Exception:
+                QuotaManager.release_quota(abonnement.id, resource_type, quantity)
+                raise
             
-            # Incrémenter l'utilisation si la fonction a réussi
-            if hasattr(result, 'status_code'):
-                if 200 <= result.status_code < 300:
-                    QuotaManager.increment_usage(abonnement.id, resource_type, quantity)
+            if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+                status_code = result[1]
             else:
                 # Pour les fonctions qui ne retournent pas de Response Flask
-                QuotaManager.increment_usage(abonnement.id, resource_type, quantity)
+                status_code = getattr(result, 'status_code', 200)
+            if not 200 <= status_code < 300:
+                QuotaManager.release_quota(abonnement.id, resource_type, quantity)
+            
+            # Écriture des compteurs par lots
+            compteurs_quotas().flush_si_necessaire()
             
             return result
         
@@ -285,8 +369,14 @@ def plan_required(min_plan_type: TypePlan):
         return decorated_function
     return decorator
 
-def check_subscription_status():
-    """Middleware pour vérifier le statut des abonnements expirés"""
+def check_subscription_status(force: bool = False):
+    """Middleware pour vérifier le statut des abonnements expirés (au plus toutes les ABONNEMENTS_VERIFICATION_INTERVALLE secondes)"""
+    if not force:
+        derniere = current_app.extensions.get('abonnements_verifies_le')
+        intervalle = current_app.config.get('ABONNEMENTS_VERIFICATION_INTERVALLE', VERIFICATION_EXPIRATION_DEFAUT)
+        if derniere is not None and time.monotonic() - derniere < intervalle:
+            return
+    current_app.extensions['abonnements_verifies_le'] = time.monotonic()
     now = datetime.utcnow()
     
     # Marquer les abonnements expirés
@@ -313,12 +403,7 @@ def init_subscription_middleware(app):
         # Ajouter les informations d'abonnement au contexte si l'utilisateur est connecté
         user_id = request.headers.get('X-User-ID')
         if user_id:
-            abonnement = Abonnement.query.filter_by(
-                utilisateur_id=user_id,
-                statut=StatutAbonnement.ACTIF
-            ).order_by(Abonnement.date_creation.desc()).first()
-            
-            g.current_subscription = abonnement
+            g.current_subscription = abonnement_actif(user_id)
     
     @app.errorhandler(SubscriptionError)
     def handle_subscription_error(error):
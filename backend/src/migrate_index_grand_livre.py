@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migration des index composites du grand livre ComptaEBNL-IA
+Crée sur une base existante les tables et colonnes du grand livre qui n'y
+figurent pas encore, puis les index déclarés absents (idempotent)
+"""
+
+import os
+import sys
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect
+
+from models import db, EcritureComptable, LigneEcriture, PlanComptable, SoldeMensuelCompte
+from services.schema_migrations import migrer_schema
+
+TABLES_GRAND_LIVRE = [EcritureComptable, LigneEcriture, PlanComptable, SoldeMensuelCompte]
+
+def tables_manquantes(connexion):
+    """Tables du grand livre absentes de la base"""
+    inspecteur = inspect(connexion)
+    return [modele.__table__ for modele in TABLES_GRAND_LIVRE if not inspecteur.has_table(modele.__tablename__)]
+
+def index_manquants(connexion):
+    """Index déclarés dans les modèles et absents des tables existantes"""
+    inspecteur = inspect(connexion)
+    manquants = []
+    for modele in TABLES_GRAND_LIVRE:
+        table = modele.__table__
+        if not inspecteur.has_table(table.name):
+            continue  # créée avec ses index
+        existants = {index['name'] for index in inspecteur.get_indexes(table.name)}
+        manquants.extend(index for index in table.indexes if index.name not in existants)
+    return manquants
+
+def mettre_a_jour_grand_livre(simulation=False):
+    """
+    Crée les tables, colonnes puis index manquants (une transaction)
+
+    Returns:
+        tuple: (tables, index) manquants avant la mise à jour
+    """
+    with db.engine.begin() as connexion:
+        tables = tables_manquantes(connexion)
+        manquants = index_manquants(connexion)
+        if simulation:
+            return tables, manquants
+
+        for table in tables:
+            print(f"🔨 Création de la table {table.name}...")
+            table.create(bind=connexion, checkfirst=True)
+        # Colonnes ajoutées depuis la création des tables (et leurs index)
+        migrer_schema(connexion)
+        for index in index_manquants(connexion):
+            colonnes = ', '.join(colonne.name for colonne in index.columns)
+            print(f"🔨 Création de {index.name} ({index.table.name}: {colonnes})...")
+            index.create(bind=connexion, checkfirst=True)
+    return tables, manquants
+
+def migrer_index(simulation=False):
+    """Crée les index manquants (ou les liste avec simulation=True)"""
+    from main import create_app
+    app = create_app()
+
+    with app.app_context():
+        tables, manquants = mettre_a_jour_grand_livre(simulation)
+        if not tables and not manquants:
+            print("✅ Tous les index du grand livre sont présents")
+            return True
+
+        if simulation:
+            for table in tables:
+                print(f"   ➕ table {table.name}")
+            for index in manquants:
+                colonnes = ', '.join(colonne.name for colonne in index.columns)
+                print(f"   ➕ {index.name} ({index.table.name}: {colonnes})")
+
+        print(f"✅ {len(tables)} table(s) et {len(manquants)} index {'à créer' if simulation else 'créé(s)'}")
+        return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Création des index composites du grand livre")
+    parser.add_argument('--simulation', action='store_true', help="Lister les index manquants sans les créer")
+    args = parser.parse_args()
+
+    succes = migrer_index(args.simulation)
+    sys.exit(0 if succes else 1)
@@ -5,6 +5,7 @@ Système de gestion comptable pour entités à but non lucratif
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import datetime, date
 from decimal import Decimal
 import enum
@@ -27,6 +28,10 @@ class TypeJournal(enum.Enum):
     SUBVENTIONS = "SUB"
 
 # === PLAN COMPTABLE ===
+def _racine(contexte, longueur):
+    """Racine du numéro de compte pour les insertions hors ORM (bulk, Core)"""
+    return (contexte.get_current_parameters().get('numero_compte') or '')[:longueur]
+
 class PlanComptable(db.Model):
     __tablename__ = 'plan_comptable'
     
@@ -35,6 +40,9 @@ class PlanComptable(db.Model):
     libelle_compte = db.Column(db.String(255), nullable=False)
     classe = db.Column(db.Integer, nullable=False, index=True)  # 1-9 pour SYCEBNL
     niveau = db.Column(db.Integer, nullable=False, default=0)  # 0=classe, 1=principal, 2=divisionnaire, 3=sous-compte
+    # Chemin matérialisé : racines à 2 et 3 chiffres (filtres hiérarchiques par égalité indexée)
+    racine2 = db.Column(db.String(2), index=True, default=lambda ctx: _racine(ctx, 2))
+    racine3 = db.Column(db.String(3), index=True, default=lambda ctx: _racine(ctx, 3))
     parent_id = db.Column(db.Integer, db.ForeignKey('plan_comptable.id'), nullable=True)
     actif = db.Column(db.Boolean, default=True, nullable=False)
     observations = db.Column(db.Text)
@@ -45,6 +53,12 @@ class PlanComptable(db.Model):
     parent = db.relationship('PlanComptable', remote_side=[id], backref='enfants')
     lignes_ecriture = db.relationship('LigneEcriture', backref='compte', lazy='dynamic')
     
+    @validates('numero_compte')
+    def _maj_racines(self, key, numero_compte):
+        self.racine2 = (numero_compte or '')[:2]
+        self.racine3 = (numero_compte or '')[:3]
+        return numero_compte
+    
     def __repr__(self):
         return f'<Compte {self.numero_compte} - {self.libelle_compte}>'
     
@@ -102,7 +116,9 @@ class EcritureComptable(db.Model):
     journal = db.Column(db.String(10), db.ForeignKey('journaux_comptables.code'), nullable=False, index=True)
     piece_justificative = db.Column(db.String(50))
     montant_total = db.Column(db.Numeric(15, 2), nullable=False)
-    statut = db.Column(db.Enum(StatutEcriture), default=StatutEcriture.BROUILLARD, nullable=False, index=True)
+    # Stocke les valeurs ('valide', 'brouillard'...) : les API filtrent et écrivent ces chaînes
+    statut = db.Column(db.Enum(StatutEcriture, values_callable=lambda e: [m.value for m in e]),
+                       default=StatutEcriture.BROUILLARD, nullable=False, index=True)
     
     # Métadonnées de validation et traçabilité
     date_creation = db.Column(db.DateTime, default=datetime.utcnow)
@@ -116,8 +132,16 @@ class EcritureComptable(db.Model):
     ia_confidence = db.Column(db.Float)  # Niveau de confiance IA (0-1)
     document_source = db.Column(db.String(255))  # Chemin du document source
     
+    __table_args__ = (
+        # Filtre des rapports : écritures validées sur une période
+        db.Index('ix_ecritures_statut_date', 'statut', 'date_ecriture'),
+        # Pagination par curseur (date, id)
+        db.Index('ix_ecritures_date_id', 'date_ecriture', 'id'),
+    )
+    
     # Relations
-    lignes = db.relationship('LigneEcriture', backref='ecriture', lazy='dynamic', cascade='all, delete-orphan')
+    # Chargement classique (et non 'dynamic') pour permettre selectinload sur les listes
+    lignes = db.relationship('LigneEcriture', backref='ecriture', lazy='select', cascade='all, delete-orphan')
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -128,13 +152,10 @@ class EcritureComptable(db.Model):
         """Génère un numéro d'écriture unique"""
         # Format: JOURNAL-YYYYMMDD-XXX
         if self.journal and self.date_ecriture:
-            date_str = self.date_ecriture.strftime('%Y%m%d')
-            # Compter les écritures du même journal le même jour
-            count = EcritureComptable.query.filter(
-                EcritureComptable.journal == self.journal,
-                EcritureComptable.date_ecriture == self.date_ecriture
-            ).count()
-            return f"{self.journal}-{date_str}-{count + 1:03d}"
+            # Import ici pour éviter les imports circulaires
+            from services.numerotation import allouer_numeros, formater_numero
+            numero = allouer_numeros(self.journal, self.date_ecriture)
+            return formater_numero(self.journal, self.date_ecriture, numero)
         return None
     
     def is_equilibree(self):
@@ -143,14 +164,25 @@ class EcritureComptable(db.Model):
         total_credit = sum(ligne.credit for ligne in self.lignes)
         return abs(total_debit - total_credit) < Decimal('0.01')  # Tolérance de 1 centime
     
+    @property
+    def est_validee(self):
+        """Statut validé (énuméré chargé ou valeur affectée par une API)"""
+        return self.statut in (StatutEcriture.VALIDE, StatutEcriture.VALIDE.value)
+    
     def valider(self, user=None):
-        """Valide l'écriture"""
+        """Valide l'écriture (sans effet si elle l'est déjà)"""
+        if self.est_validee:
+            return
         if not self.is_equilibree():
             raise ValueError("Impossible de valider une écriture non équilibrée")
         
         self.statut = StatutEcriture.VALIDE
         self.date_validation = datetime.utcnow()
         self.user_validation = user
+        
+        # Import ici pour éviter les imports circulaires
+        from services.monthly_balances import appliquer_ecriture
+        appliquer_ecriture(self)
         db.session.commit()
     
     def __repr__(self):
@@ -195,6 +227,15 @@ class LigneEcriture(db.Model):
     date_echeance = db.Column(db.Date)  # Pour les comptes de tiers
     reference_externe = db.Column(db.String(50))  # Référence externe (facture, etc.)
     
+    __table_args__ = (
+        # Agrégats par compte (GROUP BY numero_compte) et jointure depuis les écritures ;
+        # débit/crédit inclus dans l'index sous PostgreSQL (parcours d'index seul)
+        db.Index('ix_lignes_compte_ecriture', 'numero_compte', 'ecriture_id',
+                 postgresql_include=['debit', 'credit']),
+        db.Index('ix_lignes_ecriture_compte', 'ecriture_id', 'numero_compte',
+                 postgresql_include=['debit', 'credit']),
+    )
+    
     def __repr__(self):
         return f'<LigneEcriture {self.numero_compte} - D:{self.debit} C:{self.credit}>'
     
@@ -269,6 +310,11 @@ class ExerciceComptable(db.Model):
     statut = db.Column(db.String(20), default='ouvert')  # ouvert, cloture, archive
     cloture_par = db.Column(db.String(50))
     date_cloture = db.Column(db.DateTime)
+    cloture_definitif = db.Column(db.Boolean, default=False)
+    
+    @property
+    def libelle(self):
+        return self.nom_exercice
     
     def __repr__(self):
         return f'<Exercice {self.nom_exercice}>'
@@ -281,7 +327,266 @@ class ExerciceComptable(db.Model):
             'date_fin': self.date_fin.isoformat() if self.date_fin else None,
             'statut': self.statut,
             'cloture_par': self.cloture_par,
-            'date_cloture': self.date_cloture.isoformat() if self.date_cloture else None
+            'date_cloture': self.date_cloture.isoformat() if self.date_cloture else None,
+            'cloture_definitif': bool(self.cloture_definitif)
+        }
+
+# === SOLDES MENSUELS MATÉRIALISÉS ===
+class SoldeMensuelCompte(db.Model):
+    """Totaux débit/crédit des écritures validées par compte et par mois"""
+    __tablename__ = 'soldes_mensuels_comptes'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # 0 = instance mono-entité / mois hors exercice (non NULL pour que la contrainte unique serve de cible d'upsert)
+    entite_id = db.Column(db.Integer, default=0, nullable=False)
+    exercice_id = db.Column(db.Integer, default=0, nullable=False, index=True)
+    numero_compte = db.Column(db.String(20), nullable=False)
+    periode = db.Column(db.String(7), nullable=False)  # Format YYYY-MM
+    
+    total_debit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    total_credit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    nb_lignes = db.Column(db.Integer, default=0, nullable=False)
+    
+    date_maj = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('entite_id', 'exercice_id', 'numero_compte', 'periode', name='uq_soldes_mensuels_comptes'),
+        db.Index('ix_soldes_mensuels_compte_periode', 'numero_compte', 'periode'),
+        db.Index('ix_soldes_mensuels_periode', 'periode'),
+    )
+    
+    def __repr__(self):
+        return f'<SoldeMensuel {self.numero_compte} {self.periode} D:{self.total_debit} C:{self.total_credit}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entite_id': self.entite_id,
+            'exercice_id': self.exercice_id,
+            'numero_compte': self.numero_compte,
+            'periode': self.periode,
+            'total_debit': float(self.total_debit) if self.total_debit else 0,
+            'total_credit': float(self.total_credit) if self.total_credit else 0,
+            'nb_lignes': self.nb_lignes,
+            'date_maj': self.date_maj.isoformat() if self.date_maj else None
+        }
+
+# === SOLDES DE CLÔTURE (À-NOUVEAUX) ===
+class SoldeClotureExercice(db.Model):
+    """Totaux cumulés figés par compte à la date de fin d'un exercice clôturé"""
+    __tablename__ = 'soldes_cloture_exercices'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    entite_id = db.Column(db.Integer, db.ForeignKey('entite_ebnl.id'), nullable=True)  # NULL = instance mono-entité
+    exercice_id = db.Column(db.Integer, db.ForeignKey('exercices_comptables.id'), nullable=False, index=True)
+    numero_compte = db.Column(db.String(20), nullable=False)
+    
+    # Cumuls depuis l'origine du grand livre jusqu'à la date de fin de l'exercice
+    total_debit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    total_credit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    nb_lignes = db.Column(db.Integer, default=0, nullable=False)
+    
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('entite_id', 'exercice_id', 'numero_compte'),
+    )
+    
+    def __repr__(self):
+        return f'<SoldeCloture {self.exercice_id} {self.numero_compte} D:{self.total_debit} C:{self.total_credit}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entite_id': self.entite_id,
+            'exercice_id': self.exercice_id,
+            'numero_compte': self.numero_compte,
+            'total_debit': float(self.total_debit) if self.total_debit else 0,
+            'total_credit': float(self.total_credit) if self.total_credit else 0,
+            'nb_lignes': self.nb_lignes,
+            'date_creation': self.date_creation.isoformat() if self.date_creation else None
+        }
+
+# === CLÔTURES D'EXERCICE ===
+class ClotureExercice(db.Model):
+    """Avancement d'une clôture d'exercice par étapes (reprise après interruption)"""
+    __tablename__ = 'clotures_exercices'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    exercice_id = db.Column(db.Integer, db.ForeignKey('exercices_comptables.id'), nullable=False, unique=True)
+    definitif = db.Column(db.Boolean, default=False, nullable=False)
+    forcer = db.Column(db.Boolean, default=False, nullable=False)
+    
+    statut = db.Column(db.String(20), default='en_attente', nullable=False)  # en_attente, en_cours, termine, erreur
+    etape = db.Column(db.String(30))  # Étape en cours ou dernière exécutée
+    etapes_terminees = db.Column(db.JSON, default=list)
+    progression = db.Column(db.Integer, default=0, nullable=False)  # 0-100
+    etat = db.Column(db.JSON, default=dict)  # Points de reprise et résultats par étape
+    erreur = db.Column(db.Text)
+    
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    date_maj = db.Column(db.DateTime, default=datetime.utcnow)  # Battement de cœur du traitement
+    date_fin = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<ClotureExercice {self.exercice_id} {self.statut} {self.etape}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'exercice_id': self.exercice_id,
+            'definitif': self.definitif,
+            'statut': self.statut,
+            'etape': self.etape,
+            'etapes_terminees': list(self.etapes_terminees or []),
+            'progression': self.progression,
+            'verifications': (self.etat or {}).get('verifications', []),
+            'resultat': (self.etat or {}).get('resultat'),
+            'erreur': self.erreur,
+            'date_creation': self.date_creation.isoformat() if self.date_creation else None,
+            'date_maj': self.date_maj.isoformat() if self.date_maj else None,
+            'date_fin': self.date_fin.isoformat() if self.date_fin else None
+        }
+
+# === TÂCHES EN ARRIÈRE-PLAN ===
+class Tache(db.Model):
+    """Traitement long exécuté hors requête (import, export, clôture...)"""
+    __tablename__ = 'taches'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    type_tache = db.Column(db.String(50), nullable=False, index=True)
+    statut = db.Column(db.String(20), default='en_attente', nullable=False, index=True)  # en_attente, en_cours, termine, erreur, annule
+    parametres = db.Column(db.JSON, default=dict)
+    
+    progression = db.Column(db.Integer, default=0, nullable=False)  # 0-100
+    message = db.Column(db.String(255))
+    resultat = db.Column(db.JSON)
+    fichier_resultat = db.Column(db.String(500))  # Chemin du fichier produit
+    nom_fichier = db.Column(db.String(255))
+    type_contenu = db.Column(db.String(100))
+    erreur = db.Column(db.Text)
+    
+    tentatives = db.Column(db.Integer, default=0, nullable=False)
+    annulation_demandee = db.Column(db.Boolean, default=False, nullable=False)
+    processus = db.Column(db.String(100))  # hôte:pid du processus qui exécute la tâche
+    utilisateur_id = db.Column(db.Integer)
+    
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    date_debut = db.Column(db.DateTime)
+    date_maj = db.Column(db.DateTime, default=datetime.utcnow)
+    date_fin = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<Tache {self.id} {self.type_tache} {self.statut}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type_tache,
+            'statut': self.statut,
+            'parametres': {k: v for k, v in (self.parametres or {}).items() if not k.startswith('_')},
+            'progression': self.progression,
+            'message': self.message,
+            'resultat': self.resultat,
+            'fichier': self.nom_fichier,
+            'erreur': self.erreur,
+            'tentatives': self.tentatives,
+            'annulation_demandee': self.annulation_demandee,
+            'date_creation': self.date_creation.isoformat() if self.date_creation else None,
+            'date_debut': self.date_debut.isoformat() if self.date_debut else None,
+            'date_fin': self.date_fin.isoformat() if self.date_fin else None
+        }
+
+# === SÉQUENCES DE NUMÉROTATION ===
+class SequenceNumerotation(db.Model):
+    """Dernier numéro attribué par (entité, journal, jour) pour JOURNAL-YYYYMMDD-XXX"""
+    __tablename__ = 'sequences_numerotation'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # 0 = instance mono-entité (non NULL pour que la contrainte unique serve de cible d'upsert)
+    entite_id = db.Column(db.Integer, default=0, nullable=False)
+    journal = db.Column(db.String(10), nullable=False)
+    periode = db.Column(db.String(8), nullable=False)  # Format YYYYMMDD
+    dernier_numero = db.Column(db.Integer, default=0, nullable=False)
+    date_maj = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('entite_id', 'journal', 'periode', name='uq_sequences_numerotation'),
+    )
+
+    def __repr__(self):
+        return f'<Sequence {self.journal}-{self.periode} #{self.dernier_numero}>'
+
+# === VERSION DU GRAND LIVRE ===
+class VersionGrandLivre(db.Model):
+    """Compteur incrémenté à chaque écriture du grand livre (clé d'invalidation du cache des rapports)"""
+    __tablename__ = 'versions_grand_livre'
+
+    entite_id = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)  # 0 = instance mono-entité
+    version = db.Column(db.Integer, default=0, nullable=False)
+    date_maj = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<VersionGrandLivre {self.entite_id} v{self.version}>'
+
+# === INDEX DE RECHERCHE PLEIN TEXTE ===
+class EcritureAIndexer(db.Model):
+    """Écritures modifiées depuis la dernière mise à jour de l'index plein texte (alimentée par déclencheurs)"""
+    __tablename__ = 'recherche_a_indexer'
+
+    ecriture_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    def __repr__(self):
+        return f'<EcritureAIndexer {self.ecriture_id}>'
+
+# === RELEVÉS BANCAIRES ===
+class MouvementBancaire(db.Model):
+    """Mouvement de relevé bancaire importé (CSV, OFX, CAMT.053) en attente de rapprochement"""
+    __tablename__ = 'mouvements_bancaires'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # Empreinte SHA-256 stable du mouvement : clé de dédoublonnage entre imports
+    empreinte = db.Column(db.String(64), unique=True, nullable=False)
+    compte_bancaire = db.Column(db.String(20), nullable=False, index=True)  # Compte comptable (ex: 5121)
+    date_operation = db.Column(db.Date, nullable=False, index=True)
+    libelle = db.Column(db.String(255), nullable=False)
+    montant = db.Column(db.Numeric(15, 2), nullable=False)  # Positif = entrée, négatif = sortie
+    reference = db.Column(db.String(100))
+    id_banque = db.Column(db.String(100))  # FITID (OFX) ou AcctSvcrRef (CAMT.053)
+
+    format_source = db.Column(db.String(10))  # csv, ofx, camt053
+    fichier_source = db.Column(db.String(255))
+    date_import = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Rapprochement
+    statut = db.Column(db.String(20), default='non_rapproche', nullable=False, index=True)  # non_rapproche, rapproche
+    ligne_ecriture_id = db.Column(db.Integer, db.ForeignKey('lignes_ecriture.id'), nullable=True)
+    score_rapprochement = db.Column(db.Float)
+
+    __table_args__ = (
+        # Une ligne d'écriture n'est rapprochée que d'un seul mouvement
+        db.Index('uq_mouvements_ligne_ecriture', 'ligne_ecriture_id', unique=True),
+    )
+
+    def __repr__(self):
+        return f'<MouvementBancaire {self.date_operation} {self.montant} {self.libelle}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'empreinte': self.empreinte,
+            'compte_bancaire': self.compte_bancaire,
+            'date': self.date_operation.isoformat() if self.date_operation else None,
+            'libelle': self.libelle,
+            'montant': float(self.montant) if self.montant is not None else 0,
+            'reference': self.reference,
+            'id_banque': self.id_banque,
+            'format_source': self.format_source,
+            'fichier_source': self.fichier_source,
+            'date_import': self.date_import.isoformat() if self.date_import else None,
+            'statut': self.statut,
+            'ligne_ecriture_id': self.ligne_ecriture_id,
+            'score_rapprochement': self.score_rapprochement
         }
 
 # === UTILISATEURS ET AUTHENTIFICATION ===
@@ -300,6 +605,8 @@ class Utilisateur(db.Model):
     peut_valider = db.Column(db.Boolean, default=False)
     peut_cloturer = db.Column(db.Boolean, default=False)
     peut_gerer_plan_comptable = db.Column(db.Boolean, default=False)
+    # Incrémentée à chaque changement de rôle, d'activation ou de permission (jetons à claims antérieurs refusés)
+    version_droits = db.Column(db.Integer, default=0)
     
     # Métadonnées
     date_creation = db.Column(db.DateTime, default=datetime.utcnow)
@@ -695,5 +1002,9 @@ if __name__ == '__main__':
     print("- lignes_ecriture")
     print("- documents")
     print("- exercices_comptables")
+    print("- soldes_mensuels_comptes")
+    print("- sequences_numerotation")
+    print("- versions_grand_livre")
+    print("- mouvements_bancaires")
     print("- utilisateurs")
     print("- entite_ebnl")
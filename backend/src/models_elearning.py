@@ -365,8 +365,10 @@ class InscriptionFormation(db.Model):
     date_debut = db.Column(db.DateTime)
     date_fin = db.Column(db.DateTime)
     
-    # Progression
+    # Progression (tenue à jour par services.elearning_progression)
     pourcentage_completion = db.Column(db.Float, default=0.0)
+    lecons_terminees = db.Column(db.Integer, default=0)
+    nb_lecons = db.Column(db.Integer)  # NULL : progression à recalculer
     temps_passe = db.Column(db.Integer, default=0)  # en minutes
     
     # Relations
@@ -381,6 +383,8 @@ class InscriptionFormation(db.Model):
             'date_debut': self.date_debut.isoformat() if self.date_debut else None,
             'date_fin': self.date_fin.isoformat() if self.date_fin else None,
             'pourcentage_completion': self.pourcentage_completion,
+            'lecons_terminees': self.lecons_terminees,
+            'nb_lecons': self.nb_lecons,
             'temps_passe': self.temps_passe
         }
 
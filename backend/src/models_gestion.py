@@ -8,8 +8,8 @@ from datetime import datetime, date
 import enum
 import json
 from decimal import Decimal
-from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Numeric, Boolean, ForeignKey, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Numeric, Boolean, ForeignKey, Enum, func, select
+from sqlalchemy.orm import column_property, relationship
 
 # ============================
 # ENUMS POUR LA GESTION
@@ -577,7 +577,7 @@ class Balance(db.Model):
             'type_balance': self.type_balance,
             'statut': self.statut,
             'date_import': self.date_import.isoformat(),
-            'nombre_lignes': len(self.lignes_balance) if self.lignes_balance else 0
+            'nombre_lignes': self.nombre_lignes or 0
         }
 
 class LigneBalance(db.Model):
@@ -616,6 +616,11 @@ class LigneBalance(db.Model):
             'mouvement_credit': float(self.mouvement_credit) if self.mouvement_credit else 0
         }
 
+# Nombre de lignes chargé avec la balance par une sous-requête corrélée (lignes insérées en masse non chargées)
+Balance.nombre_lignes = column_property(
+    select(func.count(LigneBalance.id)).where(LigneBalance.balance_id == Balance.id).scalar_subquery()
+)
+
 # ============================
 # MODÈLES FINANCEMENT
 # ============================
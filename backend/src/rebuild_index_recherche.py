@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script d'installation et de reconstruction de l'index de recherche plein texte ComptaEBNL-IA
+"""
+
+import os
+import sys
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main import create_app
+from models import db
+from services.full_text_search import MOTEUR_PYTHON, moteur_recherche, reconstruire_index, synchroniser_index
+
+def rebuild_index_recherche(synchroniser=False):
+    """Installe la table d'index et les déclencheurs puis réindexe toutes les écritures"""
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+
+        if synchroniser:
+            print("🔄 Indexation des écritures modifiées...")
+            nb_ecritures = synchroniser_index()
+        else:
+            print("🔨 Reconstruction de l'index de recherche...")
+            nb_ecritures = reconstruire_index()
+
+        moteur = moteur_recherche()
+        if moteur == MOTEUR_PYTHON:
+            print("⚠️  Aucun moteur plein texte SQL disponible : recherche par index en mémoire")
+            return True
+        print(f"✅ {nb_ecritures} écriture(s) indexée(s) ({moteur})")
+        return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Reconstruction de l'index de recherche des écritures")
+    parser.add_argument('--synchroniser', action='store_true',
+                        help="Indexer seulement les écritures modifiées depuis la dernière recherche")
+    args = parser.parse_args()
+
+    succes = rebuild_index_recherche(args.synchroniser)
+    sys.exit(0 if succes else 1)
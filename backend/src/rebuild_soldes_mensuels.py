@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script de reconstruction des soldes mensuels matérialisés ComptaEBNL-IA
+"""
+
+import os
+import sys
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main import create_app
+from models import db
+from services.monthly_balances import reconstruire_soldes_mensuels, verifier_coherence
+
+def rebuild_soldes_mensuels(exercice_id=None, verifier=False):
+    """Recalcule (ou contrôle) la table soldes_mensuels_comptes depuis le grand livre"""
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+
+        if verifier:
+            print("🔍 Contrôle de cohérence des soldes mensuels...")
+            ecarts = verifier_coherence(exercice_id)
+            for ecart in ecarts:
+                print(f"   ❌ {ecart['periode']} compte {ecart['numero_compte']} "
+                      f"(exercice {ecart['exercice_id']}) : attendu {ecart['attendu']}, "
+                      f"matérialisé {ecart['materialise']}")
+            if ecarts:
+                print(f"⚠️  {len(ecarts)} écart(s) détecté(s)")
+                return False
+            print("✅ Soldes mensuels cohérents avec le grand livre")
+            return True
+
+        print("🔨 Reconstruction des soldes mensuels...")
+        nb_lignes = reconstruire_soldes_mensuels(exercice_id)
+        print(f"✅ {nb_lignes} agrégat(s) mensuel(s) écrit(s)")
+        return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Reconstruction des soldes mensuels par compte")
+    parser.add_argument('--exercice', type=int, help="Limiter à un exercice comptable")
+    parser.add_argument('--verifier', action='store_true', help="Contrôler sans réécrire")
+    args = parser.parse_args()
+
+    succes = rebuild_soldes_mensuels(args.exercice, args.verifier)
+    sys.exit(0 if succes else 1)
@@ -0,0 +1,67 @@
+"""
+Filtres hiérarchiques de comptes pour ComptaEBNL-IA
+Un préfixe de compte devient un intervalle [borne_inf, borne_sup) sur la colonne
+numero_compte : parcours d'index par plage quel que soit le moteur ou la
+collation, là où LIKE 'prefixe%' peut forcer un parcours complet
+"""
+
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import and_, or_, true
+
+from models import PlanComptable
+
+
+def borne_superieure(prefixe: str) -> Optional[str]:
+    """
+    Plus petite chaîne strictement supérieure à tous les numéros du préfixe
+
+    Les '9' finaux sont retirés puis le dernier chiffre incrémenté ('519' -> '52'),
+    afin que la borne reste composée de chiffres (ordre identique sous toute
+    collation). None si le préfixe ne contient que des '9' (pas de borne).
+    """
+    racine = prefixe.rstrip('9') if prefixe.isdigit() else prefixe
+    if not racine:
+        return None
+    return racine[:-1] + chr(ord(racine[-1]) + 1)
+
+
+def bornes_prefixe(prefixe: str) -> Tuple[str, Optional[str]]:
+    """Intervalle [borne_inf, borne_sup) des numéros commençant par le préfixe"""
+    return prefixe, borne_superieure(prefixe)
+
+
+def filtre_prefixe(colonne, prefixe: Optional[str]):
+    """Condition « colonne commence par prefixe » exprimée en plage indexable"""
+    if not prefixe:
+        return true()
+    borne_inf, borne_sup = bornes_prefixe(prefixe)
+    if borne_sup is None:
+        return colonne >= borne_inf
+    return and_(colonne >= borne_inf, colonne < borne_sup)
+
+
+def filtre_prefixes(colonne, prefixes: Iterable[str]):
+    """Union de plages pour plusieurs préfixes (ex: trésorerie 512 et 53)"""
+    prefixes = [p for p in prefixes if p]
+    if not prefixes:
+        return true()
+    return or_(*[filtre_prefixe(colonne, prefixe) for prefixe in prefixes])
+
+
+def filtre_plan_comptable(prefixe: Optional[str]):
+    """
+    Filtre du plan comptable par préfixe, via le chemin matérialisé
+
+    Classe, racine2 et racine3 donnent une égalité indexée pour les
+    préfixes de 1 à 3 chiffres ; au-delà, plage sur numero_compte.
+    """
+    if not prefixe:
+        return true()
+    if len(prefixe) == 1 and prefixe.isdigit():
+        return PlanComptable.classe == int(prefixe)
+    if len(prefixe) == 2:
+        return PlanComptable.racine2 == prefixe
+    if len(prefixe) == 3:
+        return PlanComptable.racine3 == prefixe
+    return filtre_prefixe(PlanComptable.numero_compte, prefixe)
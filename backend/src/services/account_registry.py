@@ -0,0 +1,219 @@
+"""
+Registre en mémoire du plan comptable pour ComptaEBNL-IA
+Le plan (un millier de comptes, rarement modifié) est chargé une fois par
+processus puis servi sans requête : arbre des préfixes de numéros, index
+BM25 des libellés sans accents (voir full_text_search), statistiques par
+classe et niveau, navigation parent/enfants. Toute modification ORM d'un
+compte fait avancer une version en base : rechargement immédiat dans le
+processus, au plus tard après REGISTRE_COMPTES_TTL secondes dans les autres
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import PlanComptable
+from services.full_text_search import IndexBM25, normaliser_texte
+from services.report_cache import incrementer_version, version_courante
+
+CLE_VERSION = -1  # ligne réservée de versions_grand_livre (le plan n'appartient à aucune entité)
+TTL_DEFAUT = 5  # secondes entre deux lectures de la version en base
+
+_generation = 0  # incrémentée à chaque commit touchant le plan dans ce processus
+_verrou_generation = threading.Lock()
+_verrou_chargement = threading.Lock()
+
+
+class NoeudPrefixe:
+    """Nœud de l'arbre des numéros : comptes dont le numéro commence par le chemin"""
+    __slots__ = ('enfants', 'numeros')
+
+    def __init__(self):
+        self.enfants: Dict[str, 'NoeudPrefixe'] = {}
+        self.numeros: List[str] = []
+
+
+class RegistreComptes:
+    """Instantané immuable du plan comptable et de ses index"""
+
+    def __init__(self, comptes: Iterable[Dict], version: int = 0, generation: int = 0):
+        self.version = version
+        self.generation = generation
+        self.charge_le = time.monotonic()
+        self.comptes: Dict[str, Dict] = {}
+        self.par_id: Dict[int, str] = {}
+        self.enfants: Dict[int, List[str]] = {}
+        self.racine = NoeudPrefixe()
+        self.libelles_normalises: Dict[str, str] = {}
+        self.par_classe: Dict[int, int] = {}
+        self.par_niveau: Dict[int, int] = {}
+
+        for compte in sorted(comptes, key=lambda c: c['numero_compte']):
+            numero = compte['numero_compte']
+            self.comptes[numero] = compte
+            self.par_id[compte['id']] = numero
+            if compte['parent_id'] is not None:
+                self.enfants.setdefault(compte['parent_id'], []).append(numero)
+
+            noeud = self.racine
+            noeud.numeros.append(numero)
+            for chiffre in numero:
+                noeud = noeud.enfants.setdefault(chiffre, NoeudPrefixe())
+                noeud.numeros.append(numero)
+
+            self.libelles_normalises[numero] = normaliser_texte(compte['libelle_compte'])
+
+            self.par_classe[compte['classe']] = self.par_classe.get(compte['classe'], 0) + 1
+            self.par_niveau[compte['niveau']] = self.par_niveau.get(compte['niveau'], 0) + 1
+
+        self.index_libelles = IndexBM25(
+            (numero, {'libelle_compte': compte['libelle_compte']}) for numero, compte in self.comptes.items()
+        )
+
+    def __len__(self) -> int:
+        return len(self.comptes)
+
+    def __contains__(self, numero: str) -> bool:
+        return numero in self.comptes
+
+    @property
+    def numeros(self) -> Set[str]:
+        return set(self.comptes)
+
+    # === CONSULTATION ===
+
+    def get(self, numero: str) -> Optional[Dict]:
+        """Compte (format PlanComptable.to_dict) ou None"""
+        compte = self.comptes.get(numero)
+        return dict(compte) if compte else None
+
+    def libelle(self, numero: str, defaut: Optional[str] = None) -> Optional[str]:
+        compte = self.comptes.get(numero)
+        return compte['libelle_compte'] if compte else defaut
+
+    def par_prefixe(self, prefixe: str) -> List[str]:
+        """Numéros commençant par le préfixe, triés"""
+        noeud = self.racine
+        for chiffre in prefixe:
+            noeud = noeud.enfants.get(chiffre)
+            if noeud is None:
+                return []
+        return noeud.numeros
+
+    def parent(self, numero: str) -> Optional[Dict]:
+        compte = self.comptes.get(numero)
+        if not compte or compte['parent_id'] not in self.par_id:
+            return None
+        return self.get(self.par_id[compte['parent_id']])
+
+    def enfants_de(self, numero: str) -> List[Dict]:
+        compte = self.comptes.get(numero)
+        if not compte:
+            return []
+        return [self.get(enfant) for enfant in self.enfants.get(compte['id'], [])]
+
+    def rechercher_libelle(self, texte: str, exact: bool = False) -> List[str]:
+        """
+        Comptes dont le libellé contient tous les mots saisis (début de mot, sans accents)
+
+        Args:
+            texte: Saisie utilisateur ('dons leg' trouve « Dons et legs »)
+            exact: Libellé identique à la saisie, casse et accents ignorés
+
+        Returns:
+            List[str]: Numéros du plus pertinent au moins pertinent (BM25), puis par numéro
+        """
+        if exact:
+            cible = normaliser_texte(texte).strip()
+            return [numero for numero, libelle in self.libelles_normalises.items() if libelle.strip() == cible]
+        return [numero for numero, _ in self.index_libelles.rechercher(texte)]
+
+    def filtrer(self, classe: Optional[int] = None, niveau: Optional[int] = None, recherche: str = '',
+                exact: bool = False, actif: Optional[bool] = None, limite: Optional[int] = None) -> List[Dict]:
+        """Filtres de /plan-comptable : classe, niveau, numéro (préfixe, trié) ou libellé (par pertinence)"""
+        if recherche and recherche.isdigit():
+            if exact:
+                numeros = [recherche] if recherche in self.comptes else []
+            else:
+                numeros = self.par_prefixe(recherche)
+        elif recherche:
+            numeros = self.rechercher_libelle(recherche, exact)
+        else:
+            numeros = self.racine.numeros
+
+        comptes = []
+        for numero in numeros:
+            compte = self.comptes[numero]
+            if classe and compte['classe'] != classe:
+                continue
+            if niveau is not None and compte['niveau'] != niveau:
+                continue
+            if actif is not None and compte['actif'] != actif:
+                continue
+            comptes.append(dict(compte))
+            if limite is not None and len(comptes) >= limite:
+                break
+        return comptes
+
+
+# === CHARGEMENT ET VERSION ===
+
+def charger_registre() -> RegistreComptes:
+    """Lit le plan comptable complet (une requête) et construit les index"""
+    generation = _generation
+    version = version_courante(CLE_VERSION)
+    comptes = [compte.to_dict() for compte in PlanComptable.query.all()]
+    return RegistreComptes(comptes, version, generation)
+
+
+@event.listens_for(Session, 'before_flush')
+def _ecouter_plan_comptable(session, flush_context, instances):
+    """Un compte créé, modifié ou supprimé fait avancer la version du plan"""
+    modifies = (session.new, session.dirty, session.deleted)
+    if any(isinstance(obj, PlanComptable) for groupe in modifies for obj in groupe):
+        incrementer_version(session.connection(), CLE_VERSION)
+        session.info['plan_comptable_modifie'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apres_commit(session):
+    global _generation
+    if session.info.pop('plan_comptable_modifie', False):
+        with _verrou_generation:
+            _generation += 1
+
+
+@event.listens_for(Session, 'after_rollback')
+def _apres_rollback(session):
+    session.info.pop('plan_comptable_modifie', None)
+
+
+def get_registre() -> RegistreComptes:
+    """
+    Registre de l'application courante
+
+    Rechargé après un commit touchant le plan dans ce processus, ou quand
+    la version en base a changé (vérifiée au plus toutes les REGISTRE_COMPTES_TTL secondes).
+    """
+    registre = current_app.extensions.get('registre_comptes')
+    if registre is not None and registre.generation == _generation:
+        ttl = current_app.config.get('REGISTRE_COMPTES_TTL', TTL_DEFAUT)
+        if time.monotonic() - registre.charge_le < ttl:
+            return registre
+        if version_courante(CLE_VERSION) == registre.version:
+            registre.charge_le = time.monotonic()
+            return registre
+
+    with _verrou_chargement:
+        registre = charger_registre()
+        current_app.extensions['registre_comptes'] = registre
+    return registre
+
+
+def invalider_registre() -> None:
+    """Force le rechargement (imports SQL directs hors ORM)"""
+    current_app.extensions.pop('registre_comptes', None)
@@ -0,0 +1,252 @@
+"""
+Contexte d'authentification en cache pour ComptaEBNL-IA
+Évite de relire l'utilisateur à chaque requête authentifiée : les contextes
+(actif, rôle, permissions compilées en masque de bits) sont gardés dans un
+cache LRU par processus de courte durée (AUTH_CACHE_TTL), invalidé à chaque
+commit modifiant un utilisateur. Avec AUTH_CLAIMS_JWT, le rôle est aussi
+porté par le jeton avec la version des droits de l'utilisateur : à
+l'expiration du contexte, seule cette version est relue en base (clé
+primaire) et les claims ne valent que si elle n'a pas changé depuis
+l'émission du jeton, quel que soit le processus qui a modifié l'utilisateur.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+from typing import Dict, Iterable, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from models import db, Utilisateur
+
+TTL_DEFAUT = 30  # secondes
+TAILLE_DEFAUT = 1024  # contextes par processus
+
+# Permissions par rôle ('*' = toutes, y compris celles déclarées plus tard)
+PERMISSIONS_PAR_ROLE = {
+    'administrateur': ['*'],
+    'comptable': [
+        'ecriture.create', 'ecriture.read', 'ecriture.update', 'ecriture.validate',
+        'plan_comptable.read', 'balance.read', 'etats_financiers.read',
+        'exercice.read', 'exercice.create'
+    ],
+    'assistant': [
+        'ecriture.create', 'ecriture.read', 'plan_comptable.read',
+        'balance.read'
+    ],
+    'consultant': [
+        'ecriture.read', 'plan_comptable.read', 'balance.read',
+        'etats_financiers.read'
+    ]
+}
+TOUTES_PERMISSIONS = -1  # tous les bits à 1
+
+_bits: Dict[str, int] = {}
+_verrou_bits = threading.Lock()
+
+
+# === PERMISSIONS ===
+
+def bit_permission(permission: str) -> int:
+    """Bit attribué à la permission (une nouvelle permission reçoit le bit suivant)"""
+    bit = _bits.get(permission)
+    if bit is None:
+        with _verrou_bits:
+            bit = _bits.setdefault(permission, 1 << len(_bits))
+    return bit
+
+
+def compiler_permissions(permissions: Iterable[str]) -> int:
+    """['ecriture.read', 'balance.read'] -> masque de bits"""
+    permissions = list(permissions)
+    if '*' in permissions:
+        return TOUTES_PERMISSIONS
+    return reduce(or_, (bit_permission(permission) for permission in permissions), 0)
+
+
+MASQUES_PAR_ROLE = {role: compiler_permissions(permissions) for role, permissions in PERMISSIONS_PAR_ROLE.items()}
+
+
+def masque_role(role: Optional[str]) -> int:
+    return MASQUES_PAR_ROLE.get(role, 0)
+
+
+# === CONTEXTE ===
+
+class ContexteAuth:
+    """
+    Utilisateur authentifié tel que vu par les endpoints (immuable, partagé entre requêtes)
+
+    Expose id, role, actif et les droits ; to_dict() et utilisateur chargent
+    l'utilisateur complet pour les rares endpoints qui en ont besoin.
+    """
+    __slots__ = ('id', 'nom_utilisateur', 'role', 'actif', 'permissions', 'peut_valider',
+                 'peut_cloturer', 'peut_gerer_plan_comptable', 'charge_le')
+
+    def __init__(self, id: int, nom_utilisateur: Optional[str], role: Optional[str], actif: bool,
+                 peut_valider: bool = False, peut_cloturer: bool = False,
+                 peut_gerer_plan_comptable: bool = False):
+        self.id = id
+        self.nom_utilisateur = nom_utilisateur
+        self.role = role
+        self.actif = bool(actif)
+        self.permissions = masque_role(role)
+        self.peut_valider = bool(peut_valider)
+        self.peut_cloturer = bool(peut_cloturer)
+        self.peut_gerer_plan_comptable = bool(peut_gerer_plan_comptable)
+        self.charge_le = time.monotonic()
+
+    @classmethod
+    def depuis_utilisateur(cls, utilisateur: Utilisateur) -> 'ContexteAuth':
+        return cls(utilisateur.id, utilisateur.nom_utilisateur, utilisateur.role, utilisateur.actif,
+                   utilisateur.peut_valider, utilisateur.peut_cloturer, utilisateur.peut_gerer_plan_comptable)
+
+    @classmethod
+    def depuis_claims(cls, claims: Dict) -> 'ContexteAuth':
+        """Contexte porté par le jeton (actif : une désactivation change la version des droits)"""
+        auth = claims['auth']
+        return cls(claims['user_id'], claims.get('nom_utilisateur'), auth.get('role'), True,
+                   auth.get('peut_valider'), auth.get('peut_cloturer'), auth.get('peut_gerer_plan_comptable'))
+
+    def a_permission(self, masque: int) -> bool:
+        return bool(self.permissions & masque)
+
+    @property
+    def utilisateur(self) -> Optional[Utilisateur]:
+        """Utilisateur complet (une requête, puis carte d'identité de la session)"""
+        return db.session.get(Utilisateur, self.id)
+
+    def to_dict(self) -> Dict:
+        return self.utilisateur.to_dict()
+
+    def __repr__(self):
+        return f'<ContexteAuth {self.nom_utilisateur} ({self.role})>'
+
+
+def claims_auth(utilisateur: Utilisateur) -> Dict:
+    """Claims de rôle embarqués dans le jeton (AUTH_CLAIMS_JWT)"""
+    return {
+        'role': utilisateur.role,
+        'peut_valider': bool(utilisateur.peut_valider),
+        'peut_cloturer': bool(utilisateur.peut_cloturer),
+        'peut_gerer_plan_comptable': bool(utilisateur.peut_gerer_plan_comptable),
+        'version': utilisateur.version_droits or 0
+    }
+
+
+def claims_a_jour(claims: Dict) -> bool:
+    """Version des droits du jeton identique à celle en base (une requête ; False si l'utilisateur n'existe plus)"""
+    version = db.session.execute(
+        select(Utilisateur.version_droits).where(Utilisateur.id == claims['user_id'])
+    ).first()
+    return version is not None and (version[0] or 0) == claims['auth'].get('version')
+
+
+class CacheContextesAuth:
+    """Cache LRU borné des contextes par identifiant d'utilisateur, entrées expirées après ttl secondes"""
+
+    def __init__(self, taille: int = TAILLE_DEFAUT):
+        self.taille = taille
+        self.verrou = threading.Lock()
+        self.entrees: 'OrderedDict[int, ContexteAuth]' = OrderedDict()
+
+    def get(self, user_id: int, ttl: float) -> Optional[ContexteAuth]:
+        with self.verrou:
+            contexte = self.entrees.get(user_id)
+            if contexte is None:
+                return None
+            if time.monotonic() - contexte.charge_le >= ttl:
+                del self.entrees[user_id]
+                return None
+            self.entrees.move_to_end(user_id)
+            return contexte
+
+    def put(self, contexte: ContexteAuth) -> None:
+        with self.verrou:
+            self.entrees[contexte.id] = contexte
+            self.entrees.move_to_end(contexte.id)
+            while len(self.entrees) > self.taille:
+                self.entrees.popitem(last=False)
+
+    def invalider(self, user_ids: Iterable[int]) -> None:
+        with self.verrou:
+            for user_id in user_ids:
+                self.entrees.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self.entrees)
+
+
+def _cache() -> CacheContextesAuth:
+    cache = current_app.extensions.get('contextes_auth')
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'contextes_auth', CacheContextesAuth(current_app.config.get('AUTH_CACHE_TAILLE', TAILLE_DEFAUT))
+        )
+    return cache
+
+
+def contexte_auth(claims: Dict) -> Optional[ContexteAuth]:
+    """
+    Contexte de l'utilisateur d'un jeton décodé : cache, sinon claims du jeton
+    (après relecture de la version des droits) ou utilisateur relu en base
+
+    Returns:
+        Optional[ContexteAuth]: None si l'utilisateur n'existe plus
+    """
+    user_id = claims['user_id']
+    cache = _cache()
+    contexte = cache.get(user_id, current_app.config.get('AUTH_CACHE_TTL', TTL_DEFAUT))
+    if contexte is not None:
+        return contexte
+
+    if current_app.config.get('AUTH_CLAIMS_JWT') and 'auth' in claims and claims_a_jour(claims):
+        contexte = ContexteAuth.depuis_claims(claims)
+    else:
+        utilisateur = db.session.get(Utilisateur, user_id)
+        if utilisateur is None:
+            return None
+        contexte = ContexteAuth.depuis_utilisateur(utilisateur)
+    cache.put(contexte)
+    return contexte
+
+
+def invalider_contextes(user_ids: Iterable[int]) -> None:
+    """Oublie les contextes (modification hors ORM : UPDATE direct, autre outil)"""
+    if has_app_context():
+        _cache().invalider(user_ids)
+
+
+ATTRIBUTS_DROITS = ('role', 'actif', 'peut_valider', 'peut_cloturer', 'peut_gerer_plan_comptable')
+
+
+@event.listens_for(Session, 'before_flush')
+def _ecouter_utilisateurs(session, flush_context, instances):
+    """Utilisateurs modifiés ou supprimés : version des droits incrémentée, contextes invalidés au commit"""
+    modifies = {
+        obj.id for groupe in (session.dirty, session.deleted) for obj in groupe
+        if isinstance(obj, Utilisateur) and obj.id is not None
+    }
+    for obj in session.dirty:
+        if isinstance(obj, Utilisateur) and obj.id is not None:
+            etat = inspect(obj)
+            if any(etat.attrs[attribut].history.has_changes() for attribut in ATTRIBUTS_DROITS):
+                obj.version_droits = func.coalesce(Utilisateur.version_droits, 0) + 1
+    if modifies:
+        session.info.setdefault('utilisateurs_modifies', set()).update(modifies)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apres_commit(session):
+    modifies = session.info.pop('utilisateurs_modifies', None)
+    if modifies:
+        invalider_contextes(modifies)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _apres_rollback(session):
+    session.info.pop('utilisateurs_modifies', None)
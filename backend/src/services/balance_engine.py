@@ -0,0 +1,160 @@
+"""
+Moteur de soldes SYCEBNL pour ComptaEBNL-IA
+Agrège les mouvements validés par compte (via les soldes mensuels matérialisés
+et les soldes de clôture figés), puis remonte les totaux dans l'arborescence
+des préfixes de comptes en mémoire
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from models import db, ExerciceComptable
+from services.monthly_balances import ZERO, to_date as _to_date, totaux_periode
+from services.opening_balances import a_nouveaux, totaux_cumules
+
+
+def resoudre_periode(date_debut=None, date_fin=None, exercice_id=None) -> Tuple[Optional[date], Optional[date]]:
+    """
+    Détermine les bornes effectives d'une période de calcul
+
+    Args:
+        date_debut: Date de début (chaîne YYYY-MM-DD ou date), optionnelle
+        date_fin: Date de fin (chaîne YYYY-MM-DD ou date), optionnelle
+        exercice_id: ID de l'exercice, dont les bornes encadrent la période
+
+    Returns:
+        Tuple[Optional[date], Optional[date]]: (date_debut, date_fin)
+    """
+    debut = _to_date(date_debut)
+    fin = _to_date(date_fin)
+
+    if exercice_id:
+        exercice = db.session.get(ExerciceComptable, exercice_id)
+        if exercice:
+            debut = max(debut, exercice.date_debut) if debut else exercice.date_debut
+            fin = min(fin, exercice.date_fin) if fin else exercice.date_fin
+
+    return debut, fin
+
+
+class SoldesComptes:
+    """Totaux débit/crédit par compte avec cumuls sur chaque préfixe"""
+
+    def __init__(self, totaux: Optional[Dict[str, Tuple[Decimal, Decimal]]] = None):
+        self.totaux: Dict[str, Tuple[Decimal, Decimal]] = dict(totaux or {})
+        self._cumuls: Dict[str, Tuple[Decimal, Decimal]] = {}
+
+        cumuls: Dict[str, list] = {}
+        for numero, (debit, credit) in self.totaux.items():
+            for longueur in range(1, len(numero) + 1):
+                cumul = cumuls.setdefault(numero[:longueur], [ZERO, ZERO])
+                cumul[0] += debit
+                cumul[1] += credit
+        self._cumuls = {prefixe: (d, c) for prefixe, (d, c) in cumuls.items()}
+
+    def totaux_prefixe(self, prefixe: str) -> Tuple[Decimal, Decimal]:
+        """Retourne (débit, crédit) cumulés de tous les comptes commençant par le préfixe"""
+        return self._cumuls.get(prefixe, (ZERO, ZERO))
+
+    def solde_decimal(self, prefixe: str) -> Decimal:
+        """Solde (débit - crédit) cumulé d'un préfixe, en Decimal"""
+        debit, credit = self.totaux_prefixe(prefixe)
+        return debit - credit
+
+    def solde(self, prefixe: str) -> Dict[str, float]:
+        """
+        Solde d'un préfixe de compte au format des états financiers
+
+        Args:
+            prefixe: Numéro de compte ou de classe (ex: '5', '52', '5211')
+
+        Returns:
+            Dict[str, float]: {'debit', 'credit', 'solde'}
+        """
+        debit, credit = self.totaux_prefixe(prefixe)
+        return {
+            'debit': float(debit),
+            'credit': float(credit),
+            'solde': float(debit - credit)
+        }
+
+    def combiner(self, autre: 'SoldesComptes') -> 'SoldesComptes':
+        """Additionne deux jeux de soldes (ex: ouverture + mouvements de la période)"""
+        totaux = dict(self.totaux)
+        for numero, (debit, credit) in autre.totaux.items():
+            d, c = totaux.get(numero, (ZERO, ZERO))
+            totaux[numero] = (d + debit, c + credit)
+        return SoldesComptes(totaux)
+
+    def comptes(self, prefixe: str = '') -> Iterable[str]:
+        """Numéros de comptes mouvementés sous un préfixe, triés"""
+        return sorted(numero for numero in self.totaux if numero.startswith(prefixe))
+
+
+def _soldes(debut: Optional[date], fin: Optional[date], hors_cloture: bool = False) -> SoldesComptes:
+    # Sans borne inférieure, l'historique clos est lu dans le dernier snapshot
+    if debut is None:
+        totaux = totaux_cumules(fin, hors_cloture=hors_cloture)
+    else:
+        totaux = totaux_periode(debut, fin, hors_cloture=hors_cloture)
+    return SoldesComptes({
+        numero: (debit, credit)
+        for numero, (debit, credit, _) in totaux.items()
+    })
+
+
+def charger_soldes(date_debut=None, date_fin=None, exercice_id=None, hors_cloture: bool = False) -> SoldesComptes:
+    """
+    Charge les soldes de tous les comptes en une seule passe agrégée
+
+    Avec un exercice et sans date de début, la position inclut les à-nouveaux
+    issus de la clôture de l'exercice précédent.
+
+    Args:
+        date_debut: Date de début de la période (incluse), optionnelle
+        date_fin: Date de fin de la période (incluse), optionnelle
+        exercice_id: ID de l'exercice encadrant la période, optionnel
+        hors_cloture: Exclut les écritures de clôture (compte de résultat)
+
+    Returns:
+        SoldesComptes: Totaux par compte et cumuls par préfixe
+    """
+    debut, fin = resoudre_periode(date_debut, date_fin, exercice_id)
+    soldes = _soldes(debut, fin, hors_cloture)
+    if exercice_id and not date_debut:
+        soldes = SoldesComptes(a_nouveaux(exercice_id)).combiner(soldes)
+    return soldes
+
+
+def charger_soldes_ouverture(date_debut, date_fin=None, exercice_id=None,
+                             hors_cloture: bool = False) -> Tuple[SoldesComptes, SoldesComptes]:
+    """
+    Charge les soldes d'ouverture et les mouvements d'une période
+
+    Les lignes antérieures à date_debut alimentent l'ouverture, celles de
+    [date_debut, date_fin] les mouvements. Si un exercice est fourni, rien
+    n'est lu avant son ouverture : ses à-nouveaux en tiennent lieu.
+
+    Args:
+        date_debut: Date de début de la période (incluse)
+        date_fin: Date de fin de la période (incluse), optionnelle
+        exercice_id: ID de l'exercice encadrant le calcul, optionnel
+        hors_cloture: Exclut les écritures de clôture des mouvements
+
+    Returns:
+        Tuple[SoldesComptes, SoldesComptes]: (ouverture, mouvements de la période)
+    """
+    debut = _to_date(date_debut)
+    borne_inf, fin = resoudre_periode(None, date_fin, exercice_id)
+
+    if borne_inf and borne_inf >= debut:
+        ouverture = SoldesComptes()
+    else:
+        ouverture = _soldes(borne_inf, debut - timedelta(days=1))
+    if exercice_id:
+        ouverture = SoldesComptes(a_nouveaux(exercice_id)).combiner(ouverture)
+    if borne_inf and borne_inf > debut:
+        debut = borne_inf
+
+    return ouverture, _soldes(debut, fin, hors_cloture)
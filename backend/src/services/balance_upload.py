@@ -0,0 +1,204 @@
+"""
+Import des balances comptables (N-1, reports à nouveau) pour ComptaEBNL-IA
+Lecture en colonnes : normalisation des en-têtes, conversion des montants et
+masques de validation sur des colonnes entières ; les gros CSV passent par une
+lecture en flux sans pandas, par lots
+"""
+
+import csv
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+import pandas as pd
+
+COLONNES_REQUISES = ['numero_compte', 'libelle_compte', 'solde_debiteur', 'solde_crediteur']
+COLONNES_MONTANTS = ['solde_debiteur', 'solde_crediteur', 'mouvement_debit', 'mouvement_credit']
+COLONNES_TEXTE = ['numero_compte', 'libelle_compte']
+
+TAILLE_LOT_DEFAUT = 5000
+SEUIL_FLUX_DEFAUT = 10 * 1024 * 1024  # octets : au-delà, les CSV sont lus en flux
+
+ZERO = Decimal('0')
+ESPACES = re.compile(r'\s')  # espaces insécables compris
+NUMERO_COMPTE = re.compile(r'\d+')
+
+COMPTE_MANQUANT = 'Numéro de compte manquant'
+LIBELLE_MANQUANT = 'Libellé du compte manquant'
+COMPTE_EN_DOUBLE = 'Compte déjà présent plus haut dans le fichier'
+MONTANT_NEGATIF = 'Montants négatifs non autorisés'
+DOUBLE_SOLDE = 'Une ligne ne peut avoir à la fois un solde débiteur et un solde créditeur'
+
+
+class FormatBalanceInvalide(ValueError):
+    """Fichier illisible ou colonnes requises absentes"""
+
+
+def normaliser_entete(nom) -> str:
+    """'Numéro Compte ' -> 'numero_compte' (accents, casse, séparateurs)"""
+    texte = unicodedata.normalize('NFKD', str(nom)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '_', texte.strip().lower()).strip('_')
+
+
+def _verifier_colonnes(colonnes) -> None:
+    manquantes = [colonne for colonne in COLONNES_REQUISES if colonne not in colonnes]
+    if manquantes:
+        raise FormatBalanceInvalide(f'Colonnes requises manquantes: {manquantes}')
+
+
+# === LECTURE EN COLONNES (pandas) ===
+
+def lire_fichier(chemin: str, delimiter: str = ',') -> pd.DataFrame:
+    """Charge un fichier Excel ou CSV en texte brut (conversion faite ensuite colonne par colonne)"""
+    try:
+        if chemin.lower().endswith(('.xlsx', '.xls')):
+            return pd.read_excel(chemin, dtype=str)
+        return pd.read_csv(chemin, dtype=str, sep=delimiter, keep_default_na=False, encoding='utf-8-sig')
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise FormatBalanceInvalide(f'Fichier illisible: {e}')
+
+
+def _montants(brut: pd.Series) -> pd.Series:
+    """'1 234,50' -> 1234.5 sur toute la colonne ; NaN si non numérique ou infini, 0 si vide"""
+    valeurs = pd.to_numeric(brut.mask(brut == '', '0'), errors='coerce')
+    # Seules les cellules non reconnues (espaces, virgule décimale) sont retravaillées en texte
+    a_nettoyer = valeurs.isna()
+    if a_nettoyer.any():
+        texte = brut[a_nettoyer].str.replace(ESPACES, '', regex=True).str.replace(',', '.', regex=False)
+        valeurs[a_nettoyer] = pd.to_numeric(texte.mask(texte == '', '0'), errors='coerce')
+    return valeurs.where(np.isfinite(valeurs))
+
+
+def preparer_lignes(df: pd.DataFrame, balance_id: int) -> Tuple[List[Dict], List[str]]:
+    """
+    Convertit et valide une balance chargée par pandas, sans itération ligne à ligne
+
+    Args:
+        df: Contenu brut du fichier (une ligne par compte)
+        balance_id: Balance de rattachement des lignes
+
+    Returns:
+        Tuple[List[Dict], List[str]]: (lignes valides prêtes à insérer, erreurs de toutes les lignes rejetées)
+    """
+    df = df.rename(columns=normaliser_entete)
+    _verifier_colonnes(df.columns)
+
+    texte = df.reindex(columns=COLONNES_TEXTE + COLONNES_MONTANTS).fillna('').astype(str)
+    texte = texte[(texte != '').any(axis=1)]  # lignes vides ignorées
+    lignes_fichier = texte.index.to_numpy() + 2  # index 0 = ligne 2 (après l'en-tête)
+
+    numero = texte['numero_compte'].str.strip().str.replace(r'\.0+$', '', regex=True)
+    libelle = texte['libelle_compte'].str.strip()
+    montants = pd.DataFrame({colonne: _montants(texte[colonne]) for colonne in COLONNES_MONTANTS})
+
+    masques: List[Tuple[pd.Series, Callable[[int], str]]] = [
+        (numero == '', lambda i: COMPTE_MANQUANT),
+        ((numero != '') & ~numero.str.fullmatch(NUMERO_COMPTE.pattern),
+         lambda i: f"Numéro de compte invalide '{numero.iat[i]}'"),
+        (libelle == '', lambda i: LIBELLE_MANQUANT),
+        ((numero != '') & numero.duplicated(), lambda i: COMPTE_EN_DOUBLE),
+        ((montants < 0).any(axis=1), lambda i: MONTANT_NEGATIF),
+        ((montants['solde_debiteur'] > 0) & (montants['solde_crediteur'] > 0), lambda i: DOUBLE_SOLDE),
+    ] + [
+        (montants[colonne].isna(), lambda i, colonne=colonne: f"Montant {colonne} invalide '{texte[colonne].iat[i]}'")
+        for colonne in COLONNES_MONTANTS
+    ]
+
+    rejet = np.zeros(len(texte), dtype=bool)
+    erreurs: List[Tuple[int, str]] = []
+    for masque, message in masques:
+        positions = np.flatnonzero(masque.to_numpy())
+        rejet[positions] = True
+        erreurs.extend((int(lignes_fichier[i]), message(i)) for i in positions)  # lignes en erreur seulement
+
+    valides = ~rejet
+    colonnes = {
+        'numero_compte': numero.to_numpy()[valides].tolist(),
+        'libelle_compte': libelle.to_numpy()[valides].tolist(),
+        **{colonne: montants[colonne].to_numpy()[valides].round(2).tolist() for colonne in COLONNES_MONTANTS},
+        'ligne_fichier': lignes_fichier[valides].tolist()
+    }
+    lignes = [dict(zip(colonnes, valeurs), balance_id=balance_id) for valeurs in zip(*colonnes.values())]
+
+    erreurs.sort(key=lambda erreur: erreur[0])  # tri stable : ordre des règles conservé par ligne
+    return lignes, [f'Ligne {ligne}: {message}' for ligne, message in erreurs]
+
+
+# === LECTURE EN FLUX (CSV volumineux) ===
+
+def _montant(texte: str) -> Optional[Decimal]:
+    texte = ESPACES.sub('', texte).replace(',', '.')
+    try:
+        montant = Decimal(texte) if texte else ZERO
+    except InvalidOperation:
+        return None
+    return montant if montant.is_finite() else None
+
+
+def iterer_lots_csv(stream: TextIO, balance_id: int, delimiter: str = ',',
+                    taille_lot: int = TAILLE_LOT_DEFAUT) -> Iterator[Tuple[List[Dict], List[str]]]:
+    """
+    Lit un CSV de balance en flux, sans pandas : mêmes règles que preparer_lignes
+
+    Args:
+        stream: Fichier texte ouvert
+        balance_id: Balance de rattachement des lignes
+        delimiter: Séparateur de colonnes
+        taille_lot: Lignes par lot émis
+
+    Yields:
+        Tuple[List[Dict], List[str]]: (lignes valides du lot, erreurs du lot)
+    """
+    lecteur = csv.reader(stream, delimiter=delimiter)
+    entetes = [normaliser_entete(nom) for nom in next(lecteur, [])]
+    _verifier_colonnes(entetes)
+    positions = {colonne: entetes.index(colonne) for colonne in COLONNES_TEXTE + COLONNES_MONTANTS if colonne in entetes}
+
+    comptes_vus = set()  # première occurrence conservée, les suivantes rejetées
+    lot, erreurs = [], []
+
+    for ligne_num, valeurs in enumerate(lecteur, start=2):
+        if not any(valeurs):
+            continue
+        champ = {colonne: valeurs[rang].strip() if rang < len(valeurs) else '' for colonne, rang in positions.items()}
+        numero = re.sub(r'\.0+$', '', champ['numero_compte'])
+        messages = []
+
+        if not numero:
+            messages.append(COMPTE_MANQUANT)
+        elif not NUMERO_COMPTE.fullmatch(numero):
+            messages.append(f"Numéro de compte invalide '{numero}'")
+        if not champ['libelle_compte']:
+            messages.append(LIBELLE_MANQUANT)
+        if numero in comptes_vus:
+            messages.append(COMPTE_EN_DOUBLE)
+        elif numero:
+            comptes_vus.add(numero)
+
+        montants = {colonne: _montant(champ.get(colonne, '')) for colonne in COLONNES_MONTANTS}
+        lisibles = [montant for montant in montants.values() if montant is not None]
+        if any(montant < 0 for montant in lisibles):
+            messages.append(MONTANT_NEGATIF)
+        if (montants['solde_debiteur'] or ZERO) > 0 and (montants['solde_crediteur'] or ZERO) > 0:
+            messages.append(DOUBLE_SOLDE)
+        messages += [f"Montant {colonne} invalide '{champ[colonne]}'" for colonne, montant in montants.items()
+                     if montant is None]
+
+        if messages:
+            erreurs.extend(f'Ligne {ligne_num}: {message}' for message in messages)
+        else:
+            lot.append({
+                'balance_id': balance_id,
+                'numero_compte': numero,
+                'libelle_compte': champ['libelle_compte'],
+                **{colonne: montant.quantize(Decimal('0.01')) for colonne, montant in montants.items()},
+                'ligne_fichier': ligne_num
+            })
+
+        if len(lot) >= taille_lot:
+            yield lot, erreurs
+            lot, erreurs = [], []
+
+    yield lot, erreurs
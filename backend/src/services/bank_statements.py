@@ -0,0 +1,293 @@
+"""
+Lecture des relevés bancaires pour ComptaEBNL-IA
+Analyse incrémentale des fichiers CSV, OFX et CAMT.053 (générateurs), empreinte
+stable des mouvements et enregistrement par lots dans mouvements_bancaires
+"""
+
+import csv
+import hashlib
+import io
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from models import db, MouvementBancaire
+from services.account_ranges import filtre_prefixe
+
+FORMATS_RELEVE = ('csv', 'ofx', 'camt053')
+TAILLE_LOT_DEFAUT = 1000
+TAILLE_BLOC_LECTURE = 64 * 1024
+
+
+class ReleveInvalide(ValueError):
+    """Fichier de relevé illisible ou mouvement incomplet"""
+
+
+# === FORMATS ===
+
+def _montant(texte: str) -> Decimal:
+    texte = (texte or '').strip().replace('\xa0', '').replace(' ', '')
+    if ',' in texte and '.' in texte:
+        texte = texte.replace('.', '').replace(',', '.')
+    else:
+        texte = texte.replace(',', '.')
+    try:
+        return Decimal(texte).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ReleveInvalide(f"Montant invalide '{texte}'")
+
+
+def _date(texte: str) -> date:
+    texte = (texte or '').strip()
+    for format_date, longueur in (('%Y-%m-%d', 10), ('%d/%m/%Y', 10), ('%Y%m%d', 8)):
+        try:
+            return datetime.strptime(texte[:longueur], format_date).date()
+        except ValueError:
+            continue
+    raise ReleveInvalide(f"Date invalide '{texte}'")
+
+
+def lire_csv(flux: BinaryIO, delimiter: str = ';') -> Iterator[Dict]:
+    """
+    Mouvements d'un relevé CSV (colonnes Date, Libelle, Montant, Reference)
+
+    Le fichier est décodé et lu ligne à ligne, sans être chargé en mémoire.
+    """
+    texte = io.TextIOWrapper(flux, encoding='utf-8-sig', newline='')
+    lecteur = csv.DictReader(texte, delimiter=delimiter)
+    colonnes = {nom.strip().lower(): nom for nom in (lecteur.fieldnames or [])}
+    manquantes = {'date', 'libelle', 'montant'} - set(colonnes)
+    if manquantes:
+        raise ReleveInvalide(f"Colonnes manquantes: {', '.join(sorted(manquantes))}")
+
+    for row in lecteur:
+        yield {
+            'date': _date(row[colonnes['date']]),
+            'libelle': (row[colonnes['libelle']] or '').strip(),
+            'montant': _montant(row[colonnes['montant']]),
+            'reference': (row.get(colonnes.get('reference', ''), '') or '').strip() or None,
+            'id_banque': None
+        }
+
+
+_BALISE_OFX = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+
+def lire_ofx(flux: BinaryIO) -> Iterator[Dict]:
+    """
+    Mouvements d'un relevé OFX (SGML 1.x ou XML 2.x), bloc <STMTTRN> par bloc
+
+    Le fichier est lu par tranches ; seul le bloc de transaction en cours est
+    conservé en mémoire.
+    """
+    tampon = ''
+    while True:
+        bloc = flux.read(TAILLE_BLOC_LECTURE)
+        if bloc:
+            tampon += bloc.decode('latin-1') if isinstance(bloc, bytes) else bloc
+        while True:
+            debut = tampon.upper().find('<STMTTRN>')
+            if debut < 0:
+                tampon = tampon[-16:] if bloc else ''
+                break
+            fin = tampon.upper().find('</STMTTRN>', debut)
+            if fin < 0:
+                tampon = tampon[debut:]
+                break
+            champs = {nom.upper(): valeur.strip() for nom, valeur in _BALISE_OFX.findall(tampon[debut:fin])}
+            tampon = tampon[fin + len('</STMTTRN>'):]
+            yield {
+                'date': _date(champs.get('DTPOSTED', '')[:8]),
+                'libelle': ' '.join(filter(None, [champs.get('NAME'), champs.get('MEMO')])) or champs.get('TRNTYPE', ''),
+                'montant': _montant(champs.get('TRNAMT', '')),
+                'reference': champs.get('CHECKNUM') or champs.get('REFNUM'),
+                'id_banque': champs.get('FITID')
+            }
+        if not bloc:
+            return
+
+
+def _local(balise: str) -> str:
+    return balise.rsplit('}', 1)[-1]
+
+
+def _texte(element, *chemin) -> Optional[str]:
+    for nom in chemin:
+        if element is None:
+            return None
+        element = next((enfant for enfant in element if _local(enfant.tag) == nom), None)
+    return element.text.strip() if element is not None and element.text else None
+
+
+def lire_camt053(flux: BinaryIO) -> Iterator[Dict]:
+    """
+    Mouvements d'un relevé ISO 20022 CAMT.053, entrée <Ntry> par entrée
+
+    Analyse en flux (iterparse) : chaque entrée est libérée après lecture.
+    """
+    try:
+        for _, element in ET.iterparse(flux, events=('end',)):
+            if _local(element.tag) != 'Ntry':
+                continue
+            montant = _montant(_texte(element, 'Amt') or '')
+            if _texte(element, 'CdtDbtInd') == 'DBIT':
+                montant = -montant
+            details = next((e for e in element.iter() if _local(e.tag) == 'TxDtls'), None)
+            libelle = (
+                _texte(details, 'RmtInf', 'Ustrd') if details is not None else None
+            ) or _texte(element, 'AddtlNtryInf') or ''
+            yield {
+                'date': _date(_texte(element, 'BookgDt', 'Dt') or _texte(element, 'ValDt', 'Dt') or ''),
+                'libelle': libelle,
+                'montant': montant,
+                'reference': _texte(details, 'Refs', 'EndToEndId') if details is not None else None,
+                'id_banque': _texte(element, 'AcctSvcrRef') or _texte(element, 'NtryRef')
+            }
+            element.clear()
+    except ET.ParseError as e:
+        raise ReleveInvalide(f"XML CAMT.053 invalide: {e}")
+
+
+LECTEURS: Dict[str, Callable[..., Iterator[Dict]]] = {
+    'csv': lire_csv,
+    'ofx': lire_ofx,
+    'camt053': lire_camt053
+}
+
+
+def detecter_format(nom_fichier: str, entete: bytes) -> str:
+    """Déduit le format d'un relevé de son extension ou de ses premiers octets"""
+    extension = nom_fichier.rsplit('.', 1)[-1].lower() if '.' in nom_fichier else ''
+    debut = entete.lstrip()[:512].upper()
+    if extension in ('ofx', 'qfx') or b'OFXHEADER' in debut or b'<OFX>' in debut:
+        return 'ofx'
+    if extension == 'xml' or debut.startswith(b'<?XML') or b'CAMT.053' in debut:
+        return 'camt053'
+    return 'csv'
+
+
+# === EMPREINTE ET ENREGISTREMENT ===
+
+def empreinte_mouvement(compte_bancaire: str, mouvement: Dict, occurrence: int = 1) -> str:
+    """
+    Empreinte SHA-256 stable d'un mouvement, identique d'un processus à l'autre
+
+    L'identifiant bancaire (FITID, AcctSvcrRef) est prioritaire ; à défaut,
+    le contenu normalisé et le rang d'occurrence des mouvements identiques
+    du fichier distinguent deux opérations semblables le même jour.
+    """
+    if mouvement.get('id_banque'):
+        contenu = f"{compte_bancaire}|id|{mouvement['id_banque']}"
+    else:
+        libelle = ' '.join((mouvement.get('libelle') or '').lower().split())
+        contenu = '|'.join([
+            compte_bancaire,
+            mouvement['date'].isoformat(),
+            f"{Decimal(str(mouvement['montant'])):.2f}",
+            libelle,
+            mouvement.get('reference') or '',
+            str(occurrence)
+        ])
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def _enregistrer_lot(lot: List[Dict]) -> int:
+    """Insère les mouvements d'un lot absents de la base (une requête de contrôle)"""
+    existantes = {
+        empreinte for (empreinte,) in db.session.query(MouvementBancaire.empreinte).filter(
+            MouvementBancaire.empreinte.in_([m['empreinte'] for m in lot])
+        )
+    }
+    nouveaux = [m for m in lot if m['empreinte'] not in existantes]
+    if nouveaux:
+        db.session.bulk_insert_mappings(MouvementBancaire, nouveaux)
+    return len(nouveaux)
+
+
+def importer_releve(flux: BinaryIO, format_releve: str, compte_bancaire: str = '512',
+                    fichier_source: Optional[str] = None, taille_lot: int = TAILLE_LOT_DEFAUT,
+                    **options) -> Dict:
+    """
+    Importe un relevé en flux et enregistre les nouveaux mouvements par lots (sans commit)
+
+    Args:
+        flux: Fichier binaire du relevé
+        format_releve: 'csv', 'ofx' ou 'camt053'
+        compte_bancaire: Compte comptable de la banque
+        fichier_source: Nom du fichier (traçabilité)
+        taille_lot: Nombre de mouvements par lot d'insertion
+        **options: Options du lecteur (ex: delimiter pour le CSV)
+
+    Returns:
+        Dict: {'lus', 'importes', 'doublons', 'date_min', 'date_max'}
+    """
+    if format_releve not in LECTEURS:
+        raise ReleveInvalide(f"Format non supporté: {format_releve}")
+
+    occurrences: Dict[str, int] = {}
+    vus = set()
+    lot: List[Dict] = []
+    lus = importes = 0
+    date_min = date_max = None
+
+    for mouvement in LECTEURS[format_releve](flux, **options):
+        lus += 1
+        contenu = empreinte_mouvement(compte_bancaire, mouvement, occurrence=0)
+        occurrences[contenu] = occurrences.get(contenu, 0) + 1
+        empreinte = empreinte_mouvement(compte_bancaire, mouvement, occurrences[contenu])
+        if empreinte in vus:
+            continue
+        vus.add(empreinte)
+
+        date_min = min(date_min, mouvement['date']) if date_min else mouvement['date']
+        date_max = max(date_max, mouvement['date']) if date_max else mouvement['date']
+        lot.append({
+            'empreinte': empreinte,
+            'compte_bancaire': compte_bancaire,
+            'date_operation': mouvement['date'],
+            'libelle': (mouvement['libelle'] or '')[:255],
+            'montant': mouvement['montant'],
+            'reference': mouvement.get('reference'),
+            'id_banque': mouvement.get('id_banque'),
+            'format_source': format_releve,
+            'fichier_source': fichier_source,
+            'date_import': datetime.utcnow(),
+            'statut': 'non_rapproche'
+        })
+        if len(lot) >= taille_lot:
+            importes += _enregistrer_lot(lot)
+            lot = []
+
+    if lot:
+        importes += _enregistrer_lot(lot)
+
+    return {
+        'lus': lus,
+        'importes': importes,
+        'doublons': lus - importes,
+        'date_min': date_min.isoformat() if date_min else None,
+        'date_max': date_max.isoformat() if date_max else None
+    }
+
+
+def iterer_mouvements(date_debut: date, date_fin: date, compte_bancaire: Optional[str] = None,
+                      statut: Optional[str] = 'non_rapproche', taille_lot: int = TAILLE_LOT_DEFAUT) -> Iterator[List[MouvementBancaire]]:
+    """Mouvements enregistrés d'une période, par lots (pagination sur l'ID)"""
+    dernier_id = 0
+    while True:
+        query = MouvementBancaire.query.filter(
+            MouvementBancaire.date_operation >= date_debut,
+            MouvementBancaire.date_operation <= date_fin,
+            MouvementBancaire.id > dernier_id
+        )
+        if compte_bancaire:
+            query = query.filter(filtre_prefixe(MouvementBancaire.compte_bancaire, compte_bancaire))
+        if statut:
+            query = query.filter(MouvementBancaire.statut == statut)
+        lot = query.order_by(MouvementBancaire.id).limit(taille_lot).all()
+        if not lot:
+            return
+        yield lot
+        dernier_id = lot[-1].id
@@ -0,0 +1,119 @@
+"""
+Progression des inscriptions e-learning pour ComptaEBNL-IA
+La progression (leçons terminées, nombre de leçons, pourcentage) est gardée
+sur InscriptionFormation : incrémentée à chaque leçon terminée, recalculée
+par une seule requête agrégée pour un lot d'inscriptions quand elle est
+inconnue (nb_lecons à NULL : nouvelle inscription, leçons ajoutées ou
+supprimées dans la formation).
+"""
+
+from typing import Iterable, List
+
+from sqlalchemy import and_, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models_elearning import db, InscriptionFormation, Lecon, ModuleFormation, ProgressionLecon
+
+
+def pourcentage(lecons_terminees: int, nb_lecons: int) -> float:
+    if not nb_lecons:
+        return 0.0
+    return min(lecons_terminees / nb_lecons * 100, 100.0)
+
+
+def recalculer_progressions(inscriptions: Iterable[InscriptionFormation]) -> List[InscriptionFormation]:
+    """
+    Recalcule la progression d'un lot d'inscriptions (une requête, quel que soit le nombre de leçons)
+
+    Returns:
+        List[InscriptionFormation]: Les inscriptions mises à jour (non commitées)
+    """
+    inscriptions = [inscription for inscription in inscriptions if inscription.id is not None]
+    if not inscriptions:
+        return []
+
+    lignes = db.session.execute(
+        select(
+            InscriptionFormation.id,
+            func.count(Lecon.id),
+            func.count(ProgressionLecon.id)
+        )
+        .outerjoin(ModuleFormation, ModuleFormation.formation_id == InscriptionFormation.formation_id)
+        .outerjoin(Lecon, Lecon.module_id == ModuleFormation.id)
+        .outerjoin(ProgressionLecon, and_(
+            ProgressionLecon.inscription_id == InscriptionFormation.id,
+            ProgressionLecon.lecon_id == Lecon.id,
+            ProgressionLecon.termine.is_(True)
+        ))
+        .where(InscriptionFormation.id.in_([inscription.id for inscription in inscriptions]))
+        .group_by(InscriptionFormation.id)
+    ).all()
+    compteurs = {inscription_id: (nb_lecons, terminees) for inscription_id, nb_lecons, terminees in lignes}
+
+    for inscription in inscriptions:
+        nb_lecons, terminees = compteurs.get(inscription.id, (0, 0))
+        inscription.nb_lecons = nb_lecons
+        inscription.lecons_terminees = terminees
+        inscription.pourcentage_completion = pourcentage(terminees, nb_lecons)
+    return inscriptions
+
+
+def progressions_a_jour(inscriptions: Iterable[InscriptionFormation]) -> List[InscriptionFormation]:
+    """Recalcule, en une requête, les inscriptions dont la progression est inconnue"""
+    return recalculer_progressions([inscription for inscription in inscriptions if inscription.nb_lecons is None])
+
+
+def enregistrer_lecon_terminee(inscription: InscriptionFormation) -> None:
+    """
+    Ajoute une leçon terminée à la progression de l'inscription
+
+    À appeler quand une progression passe à terminée. L'incrément est fait en
+    SQL (lecons_terminees = lecons_terminees + 1) pour ne pas perdre de leçon
+    terminée en parallèle ; sans nombre de leçons connu, la progression est
+    recalculée.
+    """
+    if inscription.nb_lecons is None:
+        db.session.flush()
+        recalculer_progressions([inscription])
+        return
+
+    nb_lecons = inscription.nb_lecons
+    inscription.lecons_terminees = InscriptionFormation.lecons_terminees + 1
+    db.session.flush()
+    # Valeur relue après l'incrément (une requête)
+    inscription.pourcentage_completion = pourcentage(inscription.lecons_terminees, nb_lecons)
+
+
+def invalider_progressions(formation_ids: Iterable[int], connexion=None) -> None:
+    """Marque à recalculer les progressions des inscriptions de ces formations"""
+    formation_ids = list(formation_ids)
+    if not formation_ids:
+        return
+    instruction = update(InscriptionFormation).where(
+        InscriptionFormation.formation_id.in_(formation_ids)
+    ).values(nb_lecons=None)
+    if connexion is not None:
+        connexion.execute(instruction)
+    else:
+        db.session.execute(instruction.execution_options(synchronize_session=False))
+
+
+@event.listens_for(Session, 'after_flush')
+def _ecouter_lecons(session, flush_context):
+    """Leçons ajoutées, déplacées ou supprimées : le nombre de leçons des inscriptions change"""
+    modules = set()
+    for groupe in (session.new, session.deleted):
+        modules.update(obj.module_id for obj in groupe if isinstance(obj, Lecon))
+    for obj in session.dirty:
+        if isinstance(obj, Lecon):
+            historique = inspect(obj).attrs.module_id.history
+            modules.update(historique.added or ())
+            modules.update(historique.deleted or ())
+    modules.discard(None)
+    if not modules:
+        return
+    connexion = session.connection()
+    formation_ids = connexion.execute(
+        select(ModuleFormation.formation_id).where(ModuleFormation.id.in_(modules))
+    ).scalars().all()
+    invalider_progressions(set(formation_ids), connexion)
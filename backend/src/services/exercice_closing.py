@@ -0,0 +1,288 @@
+"""
+Clôture d'exercice incrémentale pour ComptaEBNL-IA
+La clôture est découpée en étapes validées chacune par un commit court
+(vérification, résultat par classe, écriture de clôture, soldes figés,
+finalisation) ; l'avancement est persisté et une clôture interrompue reprend
+à son dernier point de reprise
+"""
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Iterator, List, Tuple
+
+from models import (
+    db, ClotureExercice, ExerciceComptable, EcritureComptable, LigneEcriture, PlanComptable, SoldeClotureExercice
+)
+from services.monthly_balances import PREFIXE_ECRITURE_CLOTURE, ZERO, appliquer_ecriture, totaux_periode
+from services.job_runner import tache, get_gestionnaire, ErreurTache
+from services.opening_balances import COMPTES_RESULTAT, compte_resultat, creer_snapshot
+
+CLASSES_GESTION = ('6', '7', '8')
+DELAI_ABANDON = timedelta(minutes=5)  # sans battement de cœur, le traitement est réputé interrompu
+
+
+class ClotureBloquee(ValueError):
+    """Vérifications bloquantes non forcées"""
+
+
+def numero_ecriture_cloture(exercice: ExerciceComptable) -> str:
+    return f"{PREFIXE_ECRITURE_CLOTURE}{exercice.id:06d}"
+
+
+def _mois(debut: date, fin: date) -> Iterator[Tuple[date, date]]:
+    """Fenêtres mensuelles [début, fin] couvrant la période"""
+    courant = debut
+    while courant <= fin:
+        suivant = date(courant.year + courant.month // 12, courant.month % 12 + 1, 1)
+        yield courant, min(fin, suivant - timedelta(days=1))
+        courant = suivant
+
+
+def _maj_etat(cloture: ClotureExercice, cle: str, valeur) -> None:
+    # Réaffecter le dictionnaire pour que la colonne JSON soit marquée modifiée
+    etat = dict(cloture.etat or {})
+    etat[cle] = valeur
+    cloture.etat = etat
+
+
+def _avancer(cloture: ClotureExercice, fraction: float) -> None:
+    """Point de reprise intermédiaire : progression dans l'étape courante, commit"""
+    rang = NOMS_ETAPES.index(cloture.etape)
+    cloture.progression = int((rang + fraction) * 100 / len(NOMS_ETAPES))
+    cloture.date_maj = datetime.utcnow()
+    db.session.commit()
+
+
+# === ÉTAPES ===
+
+def _etape_verification(cloture: ClotureExercice, exercice: ExerciceComptable) -> None:
+    """Équilibre débit/crédit mois par mois (agrégats mensuels), brouillards, date de fin"""
+    point = dict((cloture.etat or {}).get('verification') or {'reprise': None, 'debit': '0', 'credit': '0'})
+    fenetres = list(_mois(exercice.date_debut, exercice.date_fin))
+
+    for rang, (debut, fin) in enumerate(fenetres, start=1):
+        if point['reprise'] and debut.isoformat() <= point['reprise']:
+            continue
+        totaux = totaux_periode(debut, fin).values()
+        point['debit'] = str(Decimal(point['debit']) + sum((d for d, _, _ in totaux), ZERO))
+        point['credit'] = str(Decimal(point['credit']) + sum((c for _, c, _ in totaux), ZERO))
+        point['reprise'] = debut.isoformat()
+        _maj_etat(cloture, 'verification', point)
+        _avancer(cloture, rang / (len(fenetres) + 1))
+
+    verifications = []
+    ecart = Decimal(point['debit']) - Decimal(point['credit'])
+    if abs(ecart) > Decimal('0.01'):
+        verifications.append({
+            'type': 'erreur',
+            'message': f'Déséquilibre comptable: {float(ecart):.2f}€'
+        })
+
+    nb_brouillard = EcritureComptable.query.filter(
+        EcritureComptable.statut == 'brouillard',
+        EcritureComptable.date_ecriture.between(exercice.date_debut, exercice.date_fin)
+    ).count()
+    if nb_brouillard > 0:
+        verifications.append({
+            'type': 'avertissement',
+            'message': f'{nb_brouillard} écriture(s) encore en brouillard'
+        })
+
+    if exercice.date_fin > date.today():
+        verifications.append({
+            'type': 'avertissement',
+            'message': 'La date de fin d\'exercice n\'est pas encore atteinte'
+        })
+
+    _maj_etat(cloture, 'verifications', verifications)
+    if any(v['type'] == 'erreur' for v in verifications) and not cloture.forcer:
+        db.session.commit()
+        raise ClotureBloquee('Erreurs bloquantes détectées : relancez avec "forcer": true pour passer outre')
+
+
+def _etape_resultat(cloture: ClotureExercice, exercice: ExerciceComptable) -> None:
+    """Totaux des comptes de gestion, une classe à la fois"""
+    resultat = dict((cloture.etat or {}).get('resultat') or {'classes': {}})
+    classes = dict(resultat['classes'])
+
+    for rang, classe in enumerate(CLASSES_GESTION, start=1):
+        if classe in classes:
+            continue
+        totaux = totaux_periode(exercice.date_debut, exercice.date_fin, prefixe=classe, hors_cloture=True).values()
+        classes[classe] = {
+            'debit': str(sum((d for d, _, _ in totaux), ZERO)),
+            'credit': str(sum((c for _, c, _ in totaux), ZERO))
+        }
+        resultat['classes'] = classes
+        _maj_etat(cloture, 'resultat', dict(resultat))
+        _avancer(cloture, rang / (len(CLASSES_GESTION) + 1))
+
+    net = sum((Decimal(t['credit']) - Decimal(t['debit']) for t in classes.values()), ZERO)
+    resultat['resultat_net'] = float(net)
+    resultat['type'] = 'excedent' if net > 0 else 'deficit' if net < 0 else 'equilibre'
+    _maj_etat(cloture, 'resultat', resultat)
+
+
+def _etape_ecritures_cloture(cloture: ClotureExercice, exercice: ExerciceComptable) -> None:
+    """Clôture définitive : solde les comptes de gestion sur le compte de résultat (131/139)"""
+    numero = numero_ecriture_cloture(exercice)
+    if not cloture.definitif or EcritureComptable.query.filter_by(numero_ecriture=numero).first():
+        return
+
+    lignes: List[Tuple[str, Decimal, Decimal]] = []
+    for classe in CLASSES_GESTION:
+        for numero_compte, (debit, credit, _) in sorted(
+            totaux_periode(exercice.date_debut, exercice.date_fin, prefixe=classe, hors_cloture=True).items()
+        ):
+            solde = debit - credit
+            if solde:
+                lignes.append((numero_compte, max(-solde, ZERO), max(solde, ZERO)))
+    if not lignes:
+        return
+
+    net = sum((debit - credit for _, debit, credit in lignes), ZERO)
+    compte = compte_resultat(-net)
+    if not PlanComptable.query.filter_by(numero_compte=compte).first():
+        db.session.add(PlanComptable(
+            numero_compte=compte, libelle_compte=COMPTES_RESULTAT[compte], classe=1, niveau=2
+        ))
+    lignes.append((compte, max(-net, ZERO), max(net, ZERO)))
+
+    ecriture = EcritureComptable(
+        numero_ecriture=numero,
+        date_ecriture=exercice.date_fin,
+        libelle=f"Clôture de l'exercice {exercice.nom_exercice}",
+        journal='OD',
+        montant_total=sum((debit for _, debit, _ in lignes), ZERO),
+        statut='valide',
+        date_validation=datetime.utcnow()
+    )
+    for numero_compte, debit, credit in lignes:
+        ecriture.lignes.append(LigneEcriture(
+            numero_compte=numero_compte, libelle=ecriture.libelle, debit=debit, credit=credit
+        ))
+    db.session.add(ecriture)
+    db.session.flush()
+    appliquer_ecriture(ecriture)
+    _maj_etat(cloture, 'ecriture_cloture', {'numero': numero, 'nb_lignes': len(lignes)})
+
+
+def _etape_soldes_cloture(cloture: ClotureExercice, exercice: ExerciceComptable) -> None:
+    """Soldes cumulés figés (à-nouveaux de l'exercice suivant)"""
+    if SoldeClotureExercice.query.filter_by(exercice_id=exercice.id).first():
+        return
+    _maj_etat(cloture, 'comptes_figes', creer_snapshot(exercice))
+
+
+def _etape_finalisation(cloture: ClotureExercice, exercice: ExerciceComptable) -> None:
+    exercice.statut = 'ferme'
+    exercice.date_cloture = datetime.now()
+    exercice.cloture_definitif = cloture.definitif
+
+
+ETAPES: List[Tuple[str, Callable]] = [
+    ('verification', _etape_verification),
+    ('resultat', _etape_resultat),
+    ('ecritures_cloture', _etape_ecritures_cloture),
+    ('soldes_cloture', _etape_soldes_cloture),
+    ('finalisation', _etape_finalisation),
+]
+NOMS_ETAPES = [nom for nom, _ in ETAPES]
+
+
+# === ORCHESTRATION ===
+
+def est_abandonnee(cloture: ClotureExercice) -> bool:
+    """Traitement marqué en cours mais sans battement de cœur récent (processus interrompu)"""
+    return cloture.statut == 'en_cours' and cloture.date_maj < datetime.utcnow() - DELAI_ABANDON
+
+
+def preparer_cloture(exercice: ExerciceComptable, definitif: bool = False, forcer: bool = False) -> Tuple[ClotureExercice, bool]:
+    """
+    Crée ou reprend la clôture d'un exercice (commit)
+
+    Args:
+        exercice: Exercice à clôturer
+        definitif: Générer l'écriture de clôture et interdire la réouverture
+        forcer: Passer outre les vérifications bloquantes
+
+    Returns:
+        Tuple[ClotureExercice, bool]: (clôture, True si un traitement doit être lancé)
+    """
+    cloture = ClotureExercice.query.filter_by(exercice_id=exercice.id).first()
+    if cloture and cloture.statut == 'en_cours' and not est_abandonnee(cloture):
+        return cloture, False
+
+    if not cloture:
+        cloture = ClotureExercice(exercice_id=exercice.id, etapes_terminees=[], etat={})
+        db.session.add(cloture)
+    # Les options ne changent plus une fois l'écriture de clôture passée
+    if 'ecritures_cloture' not in (cloture.etapes_terminees or []):
+        cloture.definitif = bool(definitif)
+    cloture.forcer = bool(forcer)
+    cloture.statut = 'en_attente'
+    cloture.erreur = None
+    cloture.date_maj = datetime.utcnow()
+    db.session.commit()
+    return cloture, True
+
+
+def executer_cloture(cloture_id: int) -> ClotureExercice:
+    """
+    Exécute les étapes restantes d'une clôture, un commit par point de reprise
+
+    Args:
+        cloture_id: ID de la clôture préparée
+
+    Returns:
+        ClotureExercice: Clôture terminée ou en erreur
+    """
+    cloture = db.session.get(ClotureExercice, cloture_id)
+    exercice = db.session.get(ExerciceComptable, cloture.exercice_id)
+    cloture.statut = 'en_cours'
+    cloture.date_maj = datetime.utcnow()
+    db.session.commit()
+
+    try:
+        for rang, (nom, etape) in enumerate(ETAPES, start=1):
+            if nom in (cloture.etapes_terminees or []):
+                continue
+            print(f"🔒 Clôture {exercice.nom_exercice}: étape {nom}")
+            cloture.etape = nom
+            cloture.date_maj = datetime.utcnow()
+            db.session.commit()
+            etape(cloture, exercice)
+            cloture.etapes_terminees = list(cloture.etapes_terminees or []) + [nom]
+            cloture.progression = int(rang * 100 / len(ETAPES))
+            cloture.date_maj = datetime.utcnow()
+            db.session.commit()
+
+        cloture.statut = 'termine'
+        cloture.date_fin = datetime.utcnow()
+        db.session.commit()
+        print(f"✅ Exercice clôturé: {exercice.nom_exercice}")
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erreur clôture exercice {cloture_id}: {e}")
+        cloture = db.session.get(ClotureExercice, cloture_id)
+        cloture.statut = 'erreur'
+        cloture.erreur = str(e)
+        cloture.date_maj = datetime.utcnow()
+        db.session.commit()
+
+    return cloture
+
+
+@tache('cloture_exercice')
+def tache_cloture_exercice(contexte, cloture_id: int):
+    """Clôture exécutée par le pool de tâches ; l'avancement détaillé reste sur la clôture"""
+    cloture = executer_cloture(cloture_id)
+    if cloture.statut == 'erreur':
+        raise ErreurTache(cloture.erreur, cloture.to_dict())
+    return cloture.to_dict()
+
+
+def lancer_cloture(cloture_id: int):
+    """Confie la clôture au pool de tâches en arrière-plan"""
+    return get_gestionnaire().soumettre('cloture_exercice', {'cloture_id': cloture_id})
@@ -0,0 +1,504 @@
+"""
+Recherche plein texte pour ComptaEBNL-IA
+Recherche sans accents ni casse, classée par pertinence (BM25), par début de
+mot et avec extraits surlignés :
+- écritures (libellé, pièce justificative, libellés des lignes) : table FTS5
+  sous SQLite, tsvector + index GIN sous PostgreSQL, index en mémoire sinon ;
+- plan comptable : index en mémoire du registre (voir account_registry).
+
+Les déclencheurs SQL se contentent de noter les écritures modifiées dans
+recherche_a_indexer (coût négligeable pour les imports par lots) ; l'index
+est mis à jour en une passe avant chaque recherche.
+"""
+
+import bisect
+import html
+import math
+import re
+import unicodedata
+from collections import Counter
+from datetime import date
+from itertools import groupby
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import selectinload
+
+from models import db, EcritureComptable, EcritureAIndexer, LigneEcriture
+
+TABLE_INDEX = 'recherche_ecritures'
+MARQUE_DEBUT, MARQUE_FIN = '<mark>', '</mark>'
+ELLIPSE = '…'
+MOTS_EXTRAIT = 12  # mots de contexte autour de la première occurrence
+
+# Champs indexés des écritures et poids (un mot du libellé compte triple d'un mot de ligne)
+CHAMPS_ECRITURE = ('libelle', 'piece_justificative', 'libelles_lignes')
+POIDS_ECRITURE = {'libelle': 3.0, 'piece_justificative': 2.0, 'libelles_lignes': 1.0}
+
+MOTEUR_FTS5 = 'fts5'
+MOTEUR_POSTGRESQL = 'postgresql'
+MOTEUR_PYTHON = 'python'
+
+_MOT = re.compile(r'\w+')
+
+
+# === NORMALISATION ===
+
+def normaliser_texte(texte: str) -> str:
+    """'Dons & Legs reçus' -> 'dons & legs recus'"""
+    return unicodedata.normalize('NFKD', texte or '').encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def mots(texte: str) -> List[str]:
+    """Mots d'un libellé sans accents ni casse"""
+    return re.findall(r'[a-z0-9]+', normaliser_texte(texte))
+
+
+def termes_requete(texte: str) -> List[str]:
+    """Mots distincts d'une saisie, dans l'ordre ('Électricité EDF edf' -> ['electricite', 'edf'])"""
+    return list(dict.fromkeys(mots(texte)))
+
+
+# === SURLIGNAGE ===
+
+def _correspond(mot: str, termes: List[str]) -> bool:
+    normalises = mots(mot)
+    return any(normalise.startswith(terme) for normalise in normalises for terme in termes)
+
+
+def surligner(texte: str, termes: List[str], mots_contexte: Optional[int] = None) -> str:
+    """
+    Texte échappé (HTML) avec les mots commençant par un terme entourés de <mark>
+
+    Args:
+        texte: Texte d'origine (accents conservés)
+        termes: Termes normalisés (termes_requete)
+        mots_contexte: Si précisé, extrait de ce nombre de mots autour de la première occurrence
+    """
+    texte = texte or ''
+    occurrences = list(_MOT.finditer(texte))
+    debut, fin = 0, len(texte)
+    if mots_contexte and len(occurrences) > mots_contexte:
+        premier = next((i for i, m in enumerate(occurrences) if _correspond(m.group(), termes)), 0)
+        i_debut = max(0, min(premier - mots_contexte // 3, len(occurrences) - mots_contexte))
+        i_fin = i_debut + mots_contexte - 1
+        debut = occurrences[i_debut].start() if i_debut > 0 else 0
+        fin = occurrences[i_fin].end() if i_fin < len(occurrences) - 1 else len(texte)
+
+    morceaux, position = [], debut
+    for occurrence in occurrences:
+        if occurrence.start() < debut or occurrence.end() > fin:
+            continue
+        morceaux.append(html.escape(texte[position:occurrence.start()]))
+        mot = html.escape(occurrence.group())
+        morceaux.append(f'{MARQUE_DEBUT}{mot}{MARQUE_FIN}' if _correspond(occurrence.group(), termes) else mot)
+        position = occurrence.end()
+    morceaux.append(html.escape(texte[position:fin]))
+
+    extrait = ''.join(morceaux)
+    return f'{ELLIPSE if debut > 0 else ""}{extrait}{ELLIPSE if fin < len(texte) else ""}'
+
+
+def extrait_ecriture(champs: Dict[str, str], termes: List[str]) -> str:
+    """Extrait surligné du premier champ (par poids) contenant un terme"""
+    for champ in CHAMPS_ECRITURE:
+        valeur = champs.get(champ) or ''
+        if any(_correspond(m.group(), termes) for m in _MOT.finditer(valeur)):
+            return surligner(valeur, termes, MOTS_EXTRAIT)
+    return surligner(champs.get('libelle') or '', termes, MOTS_EXTRAIT)
+
+
+# === INDEX EN MÉMOIRE ===
+
+class IndexBM25:
+    """
+    Index inversé en mémoire classé par BM25 (champs pondérés)
+
+    Chaque terme de la requête est un début de mot : il s'étend à tous les mots
+    du vocabulaire qui commencent par lui, et un document doit contenir tous les termes.
+    """
+
+    def __init__(self, documents: Iterable[Tuple[Hashable, Dict[str, str]]],
+                 poids: Optional[Dict[str, float]] = None, k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.postings: Dict[str, Dict[Hashable, float]] = {}
+        self.longueurs: Dict[Hashable, float] = {}
+
+        for cle, champs in documents:
+            frequences: Counter = Counter()
+            for champ, valeur in champs.items():
+                for mot in mots(valeur):
+                    frequences[mot] += (poids or {}).get(champ, 1.0)
+            self.longueurs[cle] = sum(frequences.values())
+            for mot, frequence in frequences.items():
+                self.postings.setdefault(mot, {})[cle] = frequence
+
+        self.vocabulaire = sorted(self.postings)
+        self.longueur_moyenne = (sum(self.longueurs.values()) / len(self.longueurs)) if self.longueurs else 0.0
+
+    def __len__(self) -> int:
+        return len(self.longueurs)
+
+    def _developper(self, terme: str) -> List[str]:
+        """Mots du vocabulaire commençant par le terme"""
+        debut = bisect.bisect_left(self.vocabulaire, terme)
+        fin = bisect.bisect_left(self.vocabulaire, terme + '\x7f', debut)
+        return self.vocabulaire[debut:fin]
+
+    def correspondances(self, termes: List[str]) -> Dict[str, Dict[Hashable, float]]:
+        """Fréquence (pondérée) de chaque terme par document le contenant"""
+        par_terme: Dict[str, Dict[Hashable, float]] = {}
+        for terme in termes:
+            frequences: Dict[Hashable, float] = {}
+            for mot in self._developper(terme):
+                for cle, frequence in self.postings[mot].items():
+                    frequences[cle] = frequences.get(cle, 0.0) + frequence
+            par_terme[terme] = frequences
+        return par_terme
+
+    def rechercher(self, texte: str, limite: Optional[int] = None) -> List[Tuple[Hashable, float]]:
+        """
+        Documents contenant tous les mots saisis (début de mot), du plus pertinent au moins pertinent
+
+        Returns:
+            List[Tuple[cle, score]]: Score BM25 décroissant, puis clé croissante
+        """
+        termes = termes_requete(texte)
+        if not termes:
+            return []
+        correspondances = self.correspondances(termes)
+        communs = set.intersection(*(set(frequences) for frequences in correspondances.values()))
+        if not communs:
+            return []
+
+        total = len(self.longueurs)
+        scores = dict.fromkeys(communs, 0.0)
+        for frequences in correspondances.values():
+            idf = math.log(1 + (total - len(frequences) + 0.5) / (len(frequences) + 0.5))
+            for cle in communs:
+                frequence = frequences[cle]
+                normalisation = 1 - self.b + self.b * self.longueurs[cle] / (self.longueur_moyenne or 1)
+                scores[cle] += idf * frequence * (self.k1 + 1) / (frequence + self.k1 * normalisation)
+
+        classement = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return classement[:limite] if limite is not None else classement
+
+
+# === STRUCTURES SQL (déclencheurs, tables d'index) ===
+
+DECLENCHEURS_SQLITE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_INDEX} USING fts5(
+        libelle, piece_justificative, libelles_lignes,
+        tokenize="unicode61 remove_diacritics 2", prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS recherche_ecritures_ai AFTER INSERT ON ecritures_comptables BEGIN
+        INSERT OR IGNORE INTO recherche_a_indexer (ecriture_id) VALUES (new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS recherche_ecritures_au
+        AFTER UPDATE OF libelle, piece_justificative ON ecritures_comptables BEGIN
+        INSERT OR IGNORE INTO recherche_a_indexer (ecriture_id) VALUES (new.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS recherche_ecritures_ad AFTER DELETE ON ecritures_comptables BEGIN
+        DELETE FROM {TABLE_INDEX} WHERE rowid = old.id;
+        DELETE FROM recherche_a_indexer WHERE ecriture_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS recherche_lignes_ai AFTER INSERT ON lignes_ecriture BEGIN
+        INSERT OR IGNORE INTO recherche_a_indexer (ecriture_id) VALUES (new.ecriture_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS recherche_lignes_au AFTER UPDATE OF libelle, ecriture_id ON lignes_ecriture BEGIN
+        INSERT OR IGNORE INTO recherche_a_indexer (ecriture_id) VALUES (old.ecriture_id);
+        INSERT OR IGNORE INTO recherche_a_indexer (ecriture_id) VALUES (new.ecriture_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS recherche_lignes_ad AFTER DELETE ON lignes_ecriture BEGIN
+        INSERT OR IGNORE INTO recherche_a_indexer (ecriture_id) VALUES (old.ecriture_id);
+    END""",
+]
+
+DECLENCHEURS_POSTGRESQL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"CREATE TABLE IF NOT EXISTS {TABLE_INDEX} (ecriture_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS ix_{TABLE_INDEX}_document ON {TABLE_INDEX} USING GIN (document)",
+    f"""CREATE OR REPLACE FUNCTION recherche_noter_ecriture() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM {TABLE_INDEX} WHERE ecriture_id = OLD.id;
+            DELETE FROM recherche_a_indexer WHERE ecriture_id = OLD.id;
+            RETURN OLD;
+        END IF;
+        INSERT INTO recherche_a_indexer (ecriture_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION recherche_noter_ligne() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            INSERT INTO recherche_a_indexer (ecriture_id) VALUES (OLD.ecriture_id) ON CONFLICT DO NOTHING;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO recherche_a_indexer (ecriture_id) VALUES (NEW.ecriture_id) ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS recherche_ecritures_maj ON ecritures_comptables",
+    """CREATE TRIGGER recherche_ecritures_maj
+        AFTER INSERT OR UPDATE OF libelle, piece_justificative OR DELETE ON ecritures_comptables
+        FOR EACH ROW EXECUTE FUNCTION recherche_noter_ecriture()""",
+    "DROP TRIGGER IF EXISTS recherche_lignes_maj ON lignes_ecriture",
+    """CREATE TRIGGER recherche_lignes_maj
+        AFTER INSERT OR UPDATE OF libelle, ecriture_id OR DELETE ON lignes_ecriture
+        FOR EACH ROW EXECUTE FUNCTION recherche_noter_ligne()""",
+]
+
+# Libellés des lignes concaténés
+_LIGNES_SQLITE = ("(SELECT group_concat(l.libelle, ' ') FROM lignes_ecriture l "
+                  "WHERE l.ecriture_id = e.id)")
+_LIGNES_POSTGRESQL = ("(SELECT string_agg(l.libelle, ' ' ORDER BY l.id) FROM lignes_ecriture l "
+                      "WHERE l.ecriture_id = e.id)")
+
+# Document pondéré : A = libellé, B = pièce, C = lignes
+_DOCUMENT_POSTGRESQL = (
+    "setweight(to_tsvector('simple', unaccent(coalesce(e.libelle, ''))), 'A') || "
+    "setweight(to_tsvector('simple', unaccent(coalesce(e.piece_justificative, ''))), 'B') || "
+    f"setweight(to_tsvector('simple', unaccent(coalesce({_LIGNES_POSTGRESQL}, ''))), 'C')"
+)
+
+
+def installer_index(connexion) -> str:
+    """
+    Crée (idempotent) la table d'index et les déclencheurs du dialecte de la connexion
+
+    Une table d'index créée sur une base existante part vide : les écritures
+    déjà présentes sont alors notées à indexer (indexées à la recherche suivante).
+
+    Returns:
+        str: Moteur installé (fts5, postgresql) ou python si le dialecte n'en propose pas
+    """
+    dialecte = connexion.dialect.name
+    instructions = {'sqlite': DECLENCHEURS_SQLITE, 'postgresql': DECLENCHEURS_POSTGRESQL}.get(dialecte)
+    if instructions is None:
+        return MOTEUR_PYTHON
+    try:
+        with connexion.begin_nested():
+            nouvelle_table = not inspect(connexion).has_table(TABLE_INDEX)
+            for instruction in instructions:
+                connexion.exec_driver_sql(instruction)
+            if nouvelle_table:
+                connexion.exec_driver_sql(
+                    "INSERT INTO recherche_a_indexer (ecriture_id) SELECT id FROM ecritures_comptables "
+                    "WHERE id NOT IN (SELECT ecriture_id FROM recherche_a_indexer)"
+                )
+    except Exception as e:
+        # SQLite compilé sans FTS5, extension unaccent non autorisée... : repli en mémoire
+        print(f"⚠️  Index plein texte non installé ({dialecte}) : {e}")
+        return MOTEUR_PYTHON
+    return MOTEUR_FTS5 if dialecte == 'sqlite' else MOTEUR_POSTGRESQL
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _installer_apres_create_all(metadata, connexion, **kwargs):
+    installer_index(connexion)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _supprimer_avant_drop_all(metadata, connexion, **kwargs):
+    if connexion.dialect.name in ('sqlite', 'postgresql'):
+        connexion.exec_driver_sql(f'DROP TABLE IF EXISTS {TABLE_INDEX}')
+
+
+def moteur_recherche() -> str:
+    """Moteur de l'application courante (RECHERCHE_MOTEUR force le repli 'python')"""
+    moteur = current_app.extensions.get('moteur_recherche')
+    if moteur is None:
+        moteur = current_app.config.get('RECHERCHE_MOTEUR')
+        if not moteur:
+            dialecte = db.engine.dialect.name
+            moteur = MOTEUR_PYTHON
+            if dialecte in ('sqlite', 'postgresql') and inspect(db.session.connection()).has_table(TABLE_INDEX):
+                moteur = MOTEUR_FTS5 if dialecte == 'sqlite' else MOTEUR_POSTGRESQL
+        current_app.extensions['moteur_recherche'] = moteur
+    return moteur
+
+
+# === MISE À JOUR DE L'INDEX ===
+
+def synchroniser_index(commit: bool = True) -> int:
+    """
+    Réindexe les écritures notées par les déclencheurs depuis la dernière synchronisation
+
+    Une seule requête quand il n'y a rien à faire ; sinon trois instructions
+    ensemblistes quel que soit le nombre d'écritures.
+
+    Returns:
+        int: Nombre d'écritures réindexées
+    """
+    moteur = moteur_recherche()
+    if moteur == MOTEUR_PYTHON:
+        return 0
+    if db.session.execute(select(EcritureAIndexer.ecriture_id).limit(1)).first() is None:
+        return 0
+
+    if moteur == MOTEUR_FTS5:
+        db.session.execute(text(
+            f"DELETE FROM {TABLE_INDEX} WHERE rowid IN (SELECT ecriture_id FROM recherche_a_indexer)"
+        ))
+        resultat = db.session.execute(text(
+            f"INSERT INTO {TABLE_INDEX} (rowid, libelle, piece_justificative, libelles_lignes) "
+            f"SELECT e.id, e.libelle, coalesce(e.piece_justificative, ''), coalesce({_LIGNES_SQLITE}, '') "
+            "FROM ecritures_comptables e WHERE e.id IN (SELECT ecriture_id FROM recherche_a_indexer)"
+        ))
+        db.session.execute(text("DELETE FROM recherche_a_indexer"))
+    else:
+        # DELETE ... RETURNING : les écritures notées par une transaction concurrente restent en file
+        resultat = db.session.execute(text(
+            "WITH a_indexer AS (DELETE FROM recherche_a_indexer RETURNING ecriture_id) "
+            f"INSERT INTO {TABLE_INDEX} (ecriture_id, document) "
+            f"SELECT e.id, {_DOCUMENT_POSTGRESQL} FROM ecritures_comptables e "
+            "WHERE e.id IN (SELECT ecriture_id FROM a_indexer) "
+            "ON CONFLICT (ecriture_id) DO UPDATE SET document = EXCLUDED.document"
+        ))
+
+    if commit:
+        db.session.commit()
+    return max(resultat.rowcount or 0, 0)
+
+
+def reconstruire_index() -> int:
+    """Vide et recalcule l'index complet (installation sur une base existante, contrôle)"""
+    moteur = installer_index(db.session.connection())
+    current_app.extensions['moteur_recherche'] = current_app.config.get('RECHERCHE_MOTEUR') or moteur
+    if moteur == MOTEUR_PYTHON:
+        db.session.commit()
+        return 0
+    db.session.execute(text(f"DELETE FROM {TABLE_INDEX}"))
+    db.session.execute(text("DELETE FROM recherche_a_indexer"))
+    db.session.execute(text("INSERT INTO recherche_a_indexer (ecriture_id) SELECT id FROM ecritures_comptables"))
+    return synchroniser_index()
+
+
+# === RECHERCHE DANS LES ÉCRITURES ===
+
+def _filtres_sql(date_debut: Optional[date], date_fin: Optional[date], journal: Optional[str],
+                 statut: Optional[str]) -> Tuple[str, Dict]:
+    conditions, parametres = [], {}
+    if date_debut:
+        conditions.append('e.date_ecriture >= :date_debut')
+        parametres['date_debut'] = date_debut
+    if date_fin:
+        conditions.append('e.date_ecriture <= :date_fin')
+        parametres['date_fin'] = date_fin
+    if journal:
+        conditions.append('e.journal = :journal')
+        parametres['journal'] = journal
+    if statut:
+        conditions.append('e.statut = :statut')
+        parametres['statut'] = statut
+    return ''.join(f' AND {condition}' for condition in conditions), parametres
+
+
+def _classer_sql(moteur: str, termes: List[str], filtres: str, parametres: Dict,
+                 limite: int, offset: int) -> List[Tuple[int, float]]:
+    parametres = dict(parametres, limite=limite, offset=offset)
+    if moteur == MOTEUR_FTS5:
+        # bm25() : plus petit = plus pertinent ; poids par colonne dans l'ordre de CHAMPS_ECRITURE
+        poids = ', '.join(str(POIDS_ECRITURE[champ]) for champ in CHAMPS_ECRITURE)
+        parametres['requete'] = ' AND '.join(f'"{terme}"*' for terme in termes)
+        lignes = db.session.execute(text(
+            f"SELECT {TABLE_INDEX}.rowid, -bm25({TABLE_INDEX}, {poids}) AS score "
+            f"FROM {TABLE_INDEX} JOIN ecritures_comptables e ON e.id = {TABLE_INDEX}.rowid "
+            f"WHERE {TABLE_INDEX} MATCH :requete{filtres} "
+            f"ORDER BY bm25({TABLE_INDEX}, {poids}), e.id LIMIT :limite OFFSET :offset"
+        ), parametres)
+    else:
+        # PostgreSQL ne fournit pas BM25 : ts_rank_cd (densité de couverture, poids A/B/C)
+        parametres['requete'] = ' & '.join(f'{terme}:*' for terme in termes)
+        lignes = db.session.execute(text(
+            "SELECT r.ecriture_id, ts_rank_cd(r.document, q) AS score "
+            f"FROM {TABLE_INDEX} r JOIN ecritures_comptables e ON e.id = r.ecriture_id, "
+            "to_tsquery('simple', :requete) q "
+            f"WHERE r.document @@ q{filtres} "
+            "ORDER BY score DESC, e.id LIMIT :limite OFFSET :offset"
+        ), parametres)
+    return [(identifiant, float(score)) for identifiant, score in lignes]
+
+
+def _classer_en_memoire(texte: str, date_debut: Optional[date], date_fin: Optional[date],
+                        journal: Optional[str], statut: Optional[str], limite: int,
+                        offset: int) -> List[Tuple[int, float]]:
+    """Repli sans moteur SQL : parcours des écritures filtrées et index BM25 éphémère"""
+    requete = db.session.query(
+        EcritureComptable.id, EcritureComptable.libelle, EcritureComptable.piece_justificative,
+        LigneEcriture.libelle
+    ).outerjoin(LigneEcriture, LigneEcriture.ecriture_id == EcritureComptable.id)
+    if date_debut:
+        requete = requete.filter(EcritureComptable.date_ecriture >= date_debut)
+    if date_fin:
+        requete = requete.filter(EcritureComptable.date_ecriture <= date_fin)
+    if journal:
+        requete = requete.filter(EcritureComptable.journal == journal)
+    if statut:
+        requete = requete.filter(EcritureComptable.statut == statut)
+    lignes = requete.order_by(EcritureComptable.id, LigneEcriture.id).yield_per(5000)
+
+    def documents():
+        for identifiant, groupe in groupby(lignes, key=lambda ligne: ligne[0]):
+            groupe = list(groupe)
+            yield identifiant, {
+                'libelle': groupe[0][1],
+                'piece_justificative': groupe[0][2] or '',
+                'libelles_lignes': ' '.join(ligne[3] for ligne in groupe if ligne[3])
+            }
+
+    return IndexBM25(documents(), POIDS_ECRITURE).rechercher(texte, limite + offset)[offset:]
+
+
+def rechercher_ecritures(texte: str, date_debut: Optional[date] = None, date_fin: Optional[date] = None,
+                         journal: Optional[str] = None, statut: Optional[str] = None,
+                         limite: int = 20, offset: int = 0) -> Dict:
+    """
+    Écritures dont le libellé, la pièce ou les lignes contiennent tous les mots saisis
+
+    Args:
+        texte: Saisie utilisateur ('electricite edf' trouve « Facture Électricité EDF »)
+        date_debut, date_fin, journal, statut: Filtres optionnels
+        limite: Nombre de résultats
+        offset: Décalage (pages suivantes)
+
+    Returns:
+        Dict: {'resultats': [écriture + score + extrait], 'has_more': bool, 'moteur': str}
+    """
+    termes = termes_requete(texte)
+    moteur = moteur_recherche()
+    if not termes:
+        return {'resultats': [], 'has_more': False, 'moteur': moteur}
+
+    if moteur == MOTEUR_PYTHON:
+        classement = _classer_en_memoire(texte, date_debut, date_fin, journal, statut, limite + 1, offset)
+    else:
+        synchroniser_index()
+        filtres, parametres = _filtres_sql(date_debut, date_fin, journal, statut)
+        classement = _classer_sql(moteur, termes, filtres, parametres, limite + 1, offset)
+
+    has_more = len(classement) > limite
+    classement = classement[:limite]
+
+    ecritures = {
+        ecriture.id: ecriture
+        for ecriture in EcritureComptable.query.options(
+            selectinload(EcritureComptable.lignes).joinedload(LigneEcriture.compte)
+        ).filter(EcritureComptable.id.in_([identifiant for identifiant, _ in classement]))
+    } if classement else {}
+
+    resultats = []
+    for identifiant, score in classement:
+        ecriture = ecritures.get(identifiant)
+        if ecriture is None:
+            continue
+        donnees = ecriture.to_dict()
+        donnees['score'] = round(score, 4)
+        donnees['extrait'] = extrait_ecriture({
+            'libelle': ecriture.libelle,
+            'piece_justificative': ecriture.piece_justificative,
+            'libelles_lignes': ' '.join(ligne.libelle for ligne in ecriture.lignes if ligne.libelle)
+        }, termes)
+        resultats.append(donnees)
+
+    return {'resultats': resultats, 'has_more': has_more, 'moteur': moteur}
@@ -0,0 +1,329 @@
+"""
+Exécution des traitements longs en arrière-plan pour ComptaEBNL-IA
+Les tâches sont persistées (table taches) et exécutées par un pool de fils
+borné (JOBS_MAX_WORKERS) ; un endpoint peut répondre 202 avec l'identifiant
+de la tâche, suivie ensuite par /taches/<id>
+"""
+
+import os
+import socket
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from models import db, Tache
+
+NB_WORKERS_DEFAUT = 2
+DELAI_ABANDON_DEFAUT = 1800  # secondes sans nouvelles d'une tâche en cours
+
+STATUTS_FINAUX = ('termine', 'erreur', 'annule')
+
+# type de tâche -> fonction(contexte, **parametres) -> résultat JSON
+TYPES_TACHES: Dict[str, Callable] = {}
+_verrou_creation = threading.Lock()
+
+
+def processus_courant() -> str:
+    """Identifiant hôte:pid du processus (relu à chaque appel : workers forkés)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def processus_actif(processus: Optional[str]) -> Optional[bool]:
+    """
+    État d'un processus hôte:pid
+
+    Returns:
+        Optional[bool]: True/False pour un processus de cette machine, None si
+        l'état ne peut pas être vérifié (autre machine, identifiant absent)
+    """
+    if not processus or os.name != 'posix':
+        return None
+    hote, _, pid = processus.rpartition(':')
+    if hote != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # processus d'un autre utilisateur, mais vivant
+    return True
+
+
+def tache(type_tache: str):
+    """Enregistre la fonction exécutant un type de tâche"""
+    def decorateur(fonction):
+        TYPES_TACHES[type_tache] = fonction
+        return fonction
+    return decorateur
+
+
+class TacheAnnulee(Exception):
+    """Levée dans le traitement quand une annulation a été demandée"""
+
+
+class ErreurTache(Exception):
+    """Échec métier du traitement, avec un résultat détaillé conservé sur la tâche"""
+
+    def __init__(self, message: str, resultat=None):
+        super().__init__(message)
+        self.resultat = resultat
+
+
+class ContexteTache:
+    """Accès du traitement à sa tâche : progression, annulation, fichiers"""
+
+    def __init__(self, gestionnaire: 'GestionnaireTaches', tache: Tache):
+        self.gestionnaire = gestionnaire
+        self.tache_id = tache.id
+        self.dossier = gestionnaire.dossier_tache(tache.id)
+        self.fichier = None
+
+    def progression(self, pourcentage: int, message: Optional[str] = None) -> None:
+        """
+        Signale l'avancement ; lève TacheAnnulee si l'annulation est demandée
+
+        L'avancement est tenu en mémoire (lu par /taches/<id>) et n'est écrit
+        en base que hors SQLite, où une seconde connexion ne bloque pas le
+        verrou d'écriture détenu par le traitement ; la même connexion relit
+        alors une annulation demandée depuis un autre processus.
+        """
+        pourcentage = max(0, min(100, int(pourcentage)))
+        self.gestionnaire.avancements[self.tache_id] = (pourcentage, message)
+        annulee = self.tache_id in self.gestionnaire.annulations
+        if db.engine.dialect.name != 'sqlite':
+            table = Tache.__table__
+            with db.engine.begin() as connexion:
+                connexion.execute(update(table).where(table.c.id == self.tache_id).values(
+                    progression=pourcentage, message=message, date_maj=datetime.utcnow()
+                ))
+                annulee = annulee or connexion.execute(
+                    select(table.c.annulation_demandee).where(table.c.id == self.tache_id)
+                ).scalar()
+        if annulee:
+            raise TacheAnnulee()
+
+    def chemin(self, nom: str) -> str:
+        """Chemin d'un fichier de travail de la tâche"""
+        return os.path.join(self.dossier, nom)
+
+    def fichier_resultat(self, nom: str, type_contenu: str) -> str:
+        """Déclare le fichier produit (téléchargeable via /taches/<id>/resultat) et retourne son chemin"""
+        self.fichier = (self.chemin(nom), nom, type_contenu)
+        return self.fichier[0]
+
+
+class GestionnaireTaches:
+    """Pool de fils exécutant les tâches persistées"""
+
+    def __init__(self, app, nb_workers: int = NB_WORKERS_DEFAUT, dossier: Optional[str] = None,
+                 synchrone: bool = False):
+        self.app = app
+        self.synchrone = synchrone
+        self.dossier = dossier or os.path.join(tempfile.gettempdir(), 'comptaebnl_taches')
+        self.pool = None if synchrone else ThreadPoolExecutor(max_workers=nb_workers, thread_name_prefix='tache')
+        self.avancements: Dict[int, tuple] = {}
+        self.annulations = set()
+
+    def dossier_tache(self, tache_id: int) -> str:
+        dossier = os.path.join(self.dossier, str(tache_id))
+        os.makedirs(dossier, exist_ok=True)
+        return dossier
+
+    # === SOUMISSION ===
+
+    def soumettre(self, type_tache: str, parametres: Optional[Dict] = None, fichiers: Optional[Dict] = None,
+                  utilisateur_id: Optional[int] = None) -> Tache:
+        """
+        Crée une tâche et la place dans la file (commit)
+
+        Args:
+            type_tache: Type enregistré via @tache
+            parametres: Paramètres JSON transmis au traitement
+            fichiers: {nom_parametre: FileStorage} recopiés dans le dossier de la tâche
+            utilisateur_id: Demandeur, optionnel
+
+        Returns:
+            Tache: Tâche créée (déjà terminée en mode synchrone)
+        """
+        if type_tache not in TYPES_TACHES:
+            raise ValueError(f'Type de tâche inconnu: {type_tache}')
+
+        tache = Tache(type_tache=type_tache, parametres=dict(parametres or {}), utilisateur_id=utilisateur_id)
+        db.session.add(tache)
+        db.session.flush()
+
+        if fichiers:
+            # Les fichiers reçus ne survivent pas à la requête : copie locale avant mise en file
+            parametres = dict(tache.parametres)
+            for nom, fichier in fichiers.items():
+                chemin = os.path.join(self.dossier_tache(tache.id), f'{nom}_{os.path.basename(fichier.filename or nom)}')
+                fichier.save(chemin)
+                parametres[nom] = chemin
+            tache.parametres = parametres
+        db.session.commit()
+
+        self._planifier(tache.id)
+        return tache
+
+    def _planifier(self, tache_id: int) -> None:
+        if self.synchrone:
+            self.executer(tache_id)
+        else:
+            self.pool.submit(self._executer_dans_contexte, tache_id)
+
+    def _executer_dans_contexte(self, tache_id: int) -> None:
+        with self.app.app_context():
+            try:
+                self.executer(tache_id)
+            finally:
+                db.session.remove()
+
+    # === EXÉCUTION ===
+
+    def executer(self, tache_id: int) -> None:
+        """Réserve la tâche (une seule exécution même si plusieurs processus la voient) puis l'exécute"""
+        maintenant = datetime.utcnow()
+        reservee = db.session.execute(
+            update(Tache).where(Tache.id == tache_id, Tache.statut == 'en_attente').values(
+                statut='en_cours', date_debut=maintenant, date_maj=maintenant, tentatives=Tache.tentatives + 1,
+                processus=processus_courant()
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if not reservee:
+            return
+
+        tache = db.session.get(Tache, tache_id)
+        db.session.refresh(tache)
+        print(f"⚙️ Tâche {tache_id} ({tache.type_tache}) démarrée")
+        contexte = ContexteTache(self, tache)
+        try:
+            resultat = TYPES_TACHES[tache.type_tache](contexte, **(tache.parametres or {}))
+            db.session.commit()
+            self._terminer(tache_id, 'termine', resultat=resultat, fichier=contexte.fichier)
+            print(f"✅ Tâche {tache_id} terminée")
+        except TacheAnnulee:
+            db.session.rollback()
+            self._terminer(tache_id, 'annule', message='Annulée pendant l\'exécution')
+            print(f"🛑 Tâche {tache_id} annulée")
+        except Exception as e:
+            db.session.rollback()
+            self._terminer(tache_id, 'erreur', erreur=str(e), resultat=getattr(e, 'resultat', None))
+            print(f"❌ Erreur tâche {tache_id}: {e}")
+        finally:
+            self.avancements.pop(tache_id, None)
+            self.annulations.discard(tache_id)
+
+    def _terminer(self, tache_id: int, statut: str, resultat=None, fichier=None, erreur=None, message=None) -> None:
+        tache = db.session.get(Tache, tache_id)
+        tache.statut = statut
+        tache.resultat = resultat
+        tache.erreur = erreur
+        if message:
+            tache.message = message
+        if statut == 'termine':
+            tache.progression = 100
+        else:
+            tache.progression = self.avancements.get(tache_id, (tache.progression, None))[0]
+        if fichier:
+            tache.fichier_resultat, tache.nom_fichier, tache.type_contenu = fichier
+        tache.date_fin = tache.date_maj = datetime.utcnow()
+        db.session.commit()
+
+    # === SUIVI ===
+
+    def etat(self, tache: Tache) -> Dict:
+        """Représentation de la tâche complétée par l'avancement en mémoire"""
+        donnees = tache.to_dict()
+        if tache.id in self.avancements:
+            donnees['progression'], message = self.avancements[tache.id]
+            donnees['message'] = message or donnees['message']
+        donnees['abandonnee'] = self.est_abandonnee(tache)
+        return donnees
+
+    def est_abandonnee(self, tache: Tache) -> bool:
+        """
+        Tâche en cours dont le processus est arrêté
+
+        Un processus de cette machine est vérifié directement. Sinon, hors
+        SQLite, la tâche est réputée abandonnée sans nouvelles depuis
+        JOBS_ABANDON_DELAI ; sous SQLite l'avancement n'est pas écrit en base
+        (date_maj reste celle du démarrage) et la tâche n'est jamais réputée
+        abandonnée sur ce seul critère.
+        """
+        if tache.statut != 'en_cours' or tache.id in self.avancements:
+            return False
+        actif = processus_actif(tache.processus)
+        if actif is not None:
+            return not actif
+        if db.engine.dialect.name == 'sqlite':
+            return False
+        delai = timedelta(seconds=self.app.config.get('JOBS_ABANDON_DELAI', DELAI_ABANDON_DEFAUT))
+        return tache.date_maj < datetime.utcnow() - delai
+
+    def annuler(self, tache: Tache) -> Tache:
+        """En attente : annulée immédiatement ; en cours : arrêt au prochain point de progression"""
+        if tache.statut == 'en_attente':
+            db.session.execute(
+                update(Tache).where(Tache.id == tache.id, Tache.statut == 'en_attente').values(
+                    statut='annule', date_fin=datetime.utcnow(), message='Annulée avant exécution'
+                ).execution_options(synchronize_session=False)
+            )
+        elif tache.statut == 'en_cours':
+            self.annulations.add(tache.id)
+            tache.annulation_demandee = True
+        db.session.commit()
+        db.session.refresh(tache)
+        return tache
+
+    def relancer(self, tache: Tache) -> Tache:
+        """Remet en file une tâche en erreur, annulée ou abandonnée (mêmes paramètres et fichiers)"""
+        if tache.statut not in ('erreur', 'annule') and not self.est_abandonnee(tache):
+            raise ValueError(f'La tâche est {tache.statut} : seules les tâches en erreur ou annulées sont relancées')
+        tache.statut = 'en_attente'
+        tache.erreur = None
+        tache.message = None
+        tache.resultat = None
+        tache.progression = 0
+        tache.annulation_demandee = False
+        tache.processus = None
+        tache.date_fin = None
+        db.session.commit()
+        self._planifier(tache.id)
+        db.session.refresh(tache)
+        return tache
+
+    def reprendre_en_attente(self) -> int:
+        """Replanifie les tâches restées en file (redémarrage du processus)"""
+        ids = [tache_id for (tache_id,) in db.session.query(Tache.id).filter(Tache.statut == 'en_attente')]
+        for tache_id in ids:
+            self._planifier(tache_id)
+        return len(ids)
+
+
+def creer_gestionnaire(app) -> GestionnaireTaches:
+    """Pool dimensionné par JOBS_MAX_WORKERS ; JOBS_SYNCHRONE exécute dans la requête (tests)"""
+    return GestionnaireTaches(
+        app,
+        nb_workers=app.config.get('JOBS_MAX_WORKERS', NB_WORKERS_DEFAUT),
+        dossier=app.config.get('JOBS_DIR'),
+        synchrone=app.config.get('JOBS_SYNCHRONE', False)
+    )
+
+
+def get_gestionnaire() -> GestionnaireTaches:
+    """Gestionnaire de l'application courante (créé au premier appel, file reprise)"""
+    with _verrou_creation:
+        if 'taches' not in current_app.extensions:
+            gestionnaire = creer_gestionnaire(current_app._get_current_object())
+            current_app.extensions['taches'] = gestionnaire
+            if not gestionnaire.synchrone:
+                gestionnaire.reprendre_en_attente()
+    return current_app.extensions['taches']
+
@@ -0,0 +1,127 @@
+"""
+Moteur d'indicateurs (KPI) pour ComptaEBNL-IA
+Définitions déclaratives par préfixes de comptes, évaluées en une seule lecture
+des totaux par compte ; chaque compte est rattaché à ses KPI via un trie de préfixes
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from services.monthly_balances import ZERO, totaux_periode
+
+SENS_DEBIT = 1    # solde = débit - crédit (charges, actif, trésorerie)
+SENS_CREDIT = -1  # solde = crédit - débit (produits, ressources, fonds propres)
+
+
+class DefinitionKPI(NamedTuple):
+    """KPI = somme signée des comptes commençant par un préfixe, hors exclusions"""
+    nom: str
+    prefixes: Tuple[str, ...]
+    sens: int = SENS_DEBIT
+    exclus: Tuple[str, ...] = ()
+
+
+class DefinitionRatio(NamedTuple):
+    """Ratio en pourcentage : somme des KPI numérateurs / somme des KPI dénominateurs"""
+    nom: str
+    numerateur: Tuple[str, ...]
+    denominateur: Tuple[str, ...]
+
+
+# Indicateurs du tableau de bord EBNL (référentiel SYCEBNL)
+KPI_EBNL = (
+    DefinitionKPI('total_dons', ('756',), SENS_CREDIT, exclus=('7561',)),
+    DefinitionKPI('total_subventions', ('74',), SENS_CREDIT),
+    DefinitionKPI('total_cotisations', ('7561',), SENS_CREDIT),
+    DefinitionKPI('total_charges', ('6',), SENS_DEBIT),
+    DefinitionKPI('tresorerie_banque', ('512',), SENS_DEBIT),
+    DefinitionKPI('tresorerie_caisse', ('53', '57'), SENS_DEBIT),
+    DefinitionKPI('total_actif', ('2',), SENS_DEBIT),
+    DefinitionKPI('fonds_associatifs', ('10',), SENS_CREDIT),
+)
+
+RATIOS_EBNL = (
+    DefinitionRatio('ratio_autonomie', ('total_dons',), ('total_dons', 'total_subventions', 'total_cotisations')),
+    DefinitionRatio('ratio_liquidite', ('tresorerie_banque', 'tresorerie_caisse'), ('total_charges',)),
+)
+
+
+class TriePrefixes:
+    """
+    Trie des préfixes de comptes
+
+    Chaque nœud porte les KPI qui commencent (+) ou cessent (exclusion) à ce
+    préfixe ; le parcours d'un numéro de compte chiffre par chiffre donne
+    l'ensemble de ses KPI en O(longueur du numéro).
+    """
+
+    def __init__(self):
+        self._racine: Dict = {}
+
+    def _noeud(self, prefixe: str) -> Dict:
+        noeud = self._racine
+        for chiffre in prefixe:
+            noeud = noeud.setdefault(chiffre, {})
+        return noeud
+
+    def ajouter(self, prefixe: str, nom: str, exclusion: bool = False) -> None:
+        self._noeud(prefixe).setdefault('#', []).append((nom, exclusion))
+
+    def correspondances(self, numero_compte: str) -> List[str]:
+        """KPI couvrant un compte (les exclusions plus longues l'emportent)"""
+        actifs: Dict[str, bool] = {}
+        noeud = self._racine
+        for chiffre in numero_compte:
+            noeud = noeud.get(chiffre)
+            if noeud is None:
+                break
+            for nom, exclusion in noeud.get('#', ()):
+                actifs[nom] = not exclusion
+        return [nom for nom, actif in actifs.items() if actif]
+
+
+def construire_trie(definitions: Iterable[DefinitionKPI]) -> TriePrefixes:
+    trie = TriePrefixes()
+    for definition in definitions:
+        for prefixe in definition.prefixes:
+            trie.ajouter(prefixe, definition.nom)
+        for prefixe in definition.exclus:
+            trie.ajouter(prefixe, definition.nom, exclusion=True)
+    return trie
+
+
+def evaluer_kpis(totaux: Dict[str, Tuple[Decimal, Decimal, int]],
+                 definitions: Iterable[DefinitionKPI] = KPI_EBNL,
+                 ratios: Iterable[DefinitionRatio] = RATIOS_EBNL) -> Dict[str, Decimal]:
+    """
+    Évalue les KPI et ratios à partir des totaux par compte
+
+    Args:
+        totaux: numero_compte -> (débit, crédit, nb_lignes), cf. totaux_periode
+        definitions: Définitions des KPI
+        ratios: Définitions des ratios (en %, 0 si dénominateur nul ou négatif)
+
+    Returns:
+        Dict[str, Decimal]: Valeur de chaque KPI et de chaque ratio
+    """
+    definitions = list(definitions)
+    sens = {definition.nom: definition.sens for definition in definitions}
+    trie = construire_trie(definitions)
+
+    valeurs: Dict[str, Decimal] = {definition.nom: ZERO for definition in definitions}
+    for numero, (debit, credit, _) in totaux.items():
+        for nom in trie.correspondances(numero):
+            valeurs[nom] += (debit - credit) * sens[nom]
+
+    for ratio in ratios:
+        denominateur = sum((valeurs[nom] for nom in ratio.denominateur), ZERO)
+        numerateur = sum((valeurs[nom] for nom in ratio.numerateur), ZERO)
+        valeurs[ratio.nom] = (numerateur / denominateur * 100).quantize(Decimal('0.01')) if denominateur > 0 else ZERO
+
+    return valeurs
+
+
+def calculer_kpis(date_debut, date_fin, definitions: Iterable[DefinitionKPI] = KPI_EBNL,
+                  ratios: Iterable[DefinitionRatio] = RATIOS_EBNL) -> Dict[str, Decimal]:
+    """KPI d'une période : une seule lecture des totaux de tous les comptes (hors écritures de clôture)"""
+    return evaluer_kpis(totaux_periode(date_debut, date_fin, hors_cloture=True), definitions, ratios)
@@ -0,0 +1,228 @@
+"""
+Import en masse d'écritures comptables pour ComptaEBNL-IA
+Validation ensembliste en une passe, numérotation par blocs et insertion par lots
+"""
+
+import time
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from models import db, JournalComptable, EcritureComptable, LigneEcriture
+from services.numerotation import allouer_numeros as reserver_numeros, formater_numero
+from services.report_cache import incrementer_version
+from services.account_registry import get_registre
+
+ZERO = Decimal('0')
+TOLERANCE = Decimal('0.01')
+TAILLE_LOT_DEFAUT = 1000
+
+REQUIRED_HEADERS = [
+    'date_ecriture', 'journal', 'libelle_ecriture', 'numero_compte',
+    'libelle_ligne', 'debit', 'credit'
+]
+
+
+def charger_referentiels() -> Tuple[Set[str], Set[str]]:
+    """Numéros de comptes (registre en mémoire) et codes journaux (une requête)"""
+    comptes = get_registre().numeros
+    journaux = {code for (code,) in db.session.query(JournalComptable.code)}
+    return comptes, journaux
+
+
+def _montant(valeur) -> Decimal:
+    valeur = (valeur or '').strip().replace(' ', '').replace(',', '.')
+    return Decimal(valeur) if valeur else ZERO
+
+
+def valider_lignes(rows: Iterable[Dict], comptes: Set[str], journaux: Set[str],
+                   date_min: Optional[date] = None, date_max: Optional[date] = None) -> Tuple[List[Dict], List[str]]:
+    """
+    Valide toutes les lignes CSV en une passe et les regroupe par écriture
+
+    Args:
+        rows: Lignes CSV (dictionnaires) dans l'ordre du fichier
+        comptes: Numéros de comptes existants
+        journaux: Codes journaux existants
+        date_min: Première date autorisée (ouverture de l'exercice)
+        date_max: Dernière date autorisée (clôture de l'exercice)
+
+    Returns:
+        Tuple[List[Dict], List[str]]: (écritures regroupées, erreurs)
+    """
+    ecritures: Dict[Tuple[str, str, str], Dict] = {}
+    erreurs = []
+    cache_dates: Dict[str, date] = {}
+
+    for ligne_num, row in enumerate(rows, start=2):
+        numero_compte = (row.get('numero_compte') or '').strip()
+        journal = (row.get('journal') or '').strip()
+        texte_date = (row.get('date_ecriture') or '').strip()
+
+        jour = cache_dates.get(texte_date)
+        if jour is None:
+            try:
+                jour = cache_dates[texte_date] = datetime.strptime(texte_date, '%Y-%m-%d').date()
+            except ValueError:
+                erreurs.append(f"Ligne {ligne_num}: Date invalide '{texte_date}'")
+                continue
+
+        if (date_min and jour < date_min) or (date_max and jour > date_max):
+            erreurs.append(f"Ligne {ligne_num}: Date {texte_date} hors de l'exercice")
+            continue
+
+        if journal not in journaux:
+            erreurs.append(f"Ligne {ligne_num}: Journal {journal} non trouvé")
+            continue
+
+        if numero_compte not in comptes:
+            erreurs.append(f"Ligne {ligne_num}: Compte {numero_compte} non trouvé")
+            continue
+
+        try:
+            debit = _montant(row.get('debit'))
+            credit = _montant(row.get('credit'))
+        except InvalidOperation:
+            erreurs.append(f"Ligne {ligne_num}: Montants invalides")
+            continue
+
+        if debit < 0 or credit < 0:
+            erreurs.append(f"Ligne {ligne_num}: Montants négatifs non autorisés")
+            continue
+
+        if debit > 0 and credit > 0:
+            erreurs.append(f"Ligne {ligne_num}: Une ligne ne peut avoir à la fois débit et crédit")
+            continue
+
+        if debit == 0 and credit == 0:
+            erreurs.append(f"Ligne {ligne_num}: Montant requis (débit ou crédit)")
+            continue
+
+        cle = (texte_date, journal, row.get('libelle_ecriture') or '')
+        ecriture = ecritures.get(cle)
+        if ecriture is None:
+            ecriture = ecritures[cle] = {
+                'cle': '_'.join(cle),
+                'date_ecriture': jour,
+                'journal': journal,
+                'libelle': row.get('libelle_ecriture') or '',
+                'piece_justificative': row.get('piece_justificative') or None,
+                'total_debit': ZERO,
+                'total_credit': ZERO,
+                'lignes': []
+            }
+        ecriture['total_debit'] += debit
+        ecriture['total_credit'] += credit
+        ecriture['lignes'].append({
+            'numero_compte': numero_compte,
+            'libelle': row.get('libelle_ligne') or ecriture['libelle'],
+            'debit': debit,
+            'credit': credit
+        })
+
+    return list(ecritures.values()), erreurs
+
+
+def controler_equilibre(ecritures: List[Dict]) -> List[str]:
+    """Erreurs des écritures en déséquilibre (créées quand même en brouillard en mode force)"""
+    erreurs = []
+    for ecriture in ecritures:
+        ecart = ecriture['total_debit'] - ecriture['total_credit']
+        if abs(ecart) > TOLERANCE:
+            erreurs.append(f"Écriture {ecriture['cle']}: Déséquilibre {ecart:.2f}")
+    return erreurs
+
+
+def allouer_numeros(ecritures: List[Dict]) -> None:
+    """
+    Attribue les numéros JOURNAL-YYYYMMDD-XXX par blocs
+
+    Un bloc consécutif est réservé par (journal, jour) dans le compteur de
+    numérotation (une mise à jour par bloc), puis distribué en mémoire.
+    """
+    effectifs: Dict[Tuple[str, date], int] = {}
+    for ecriture in ecritures:
+        cle = (ecriture['journal'], ecriture['date_ecriture'])
+        effectifs[cle] = effectifs.get(cle, 0) + 1
+
+    prochains = {
+        cle: reserver_numeros(cle[0], cle[1], quantite=nombre)
+        for cle, nombre in effectifs.items()
+    }
+
+    for ecriture in ecritures:
+        cle = (ecriture['journal'], ecriture['date_ecriture'])
+        ecriture['numero_ecriture'] = formater_numero(cle[0], cle[1], prochains[cle])
+        prochains[cle] += 1
+
+
+def inserer_par_lots(ecritures: List[Dict], taille_lot: int = TAILLE_LOT_DEFAUT, statut: str = 'brouillard',
+                     user: Optional[str] = None, progression: Optional[Callable[[Dict], None]] = None) -> Tuple[List[int], List[Dict]]:
+    """
+    Insère les écritures et leurs lignes par lots avec bulk_insert_mappings (sans commit)
+
+    Args:
+        ecritures: Écritures validées et numérotées
+        taille_lot: Nombre d'écritures par lot
+        statut: Statut des écritures créées
+        user: Utilisateur de création (traçabilité)
+        progression: Fonction appelée avec le rapport de chaque lot
+
+    Returns:
+        Tuple[List[int], List[Dict]]: (IDs créés, rapports par lot)
+    """
+    ids, rapports = [], []
+    taille_lot = max(1, taille_lot)
+    nb_lots = (len(ecritures) + taille_lot - 1) // taille_lot
+    maintenant = datetime.utcnow()
+
+    for index in range(nb_lots):
+        debut = time.perf_counter()
+        lot = ecritures[index * taille_lot:(index + 1) * taille_lot]
+
+        db.session.bulk_insert_mappings(EcritureComptable, [
+            {
+                'numero_ecriture': e['numero_ecriture'],
+                'date_ecriture': e['date_ecriture'],
+                'libelle': e['libelle'],
+                'journal': e['journal'],
+                'piece_justificative': e['piece_justificative'],
+                'montant_total': e['total_debit'],
+                'statut': statut,
+                'date_creation': maintenant,
+                'date_modification': maintenant,
+                'user_creation': user
+            }
+            for e in lot
+        ])
+
+        # Les numéros sont uniques : une requête suffit à retrouver les IDs du lot
+        ids_par_numero = dict(db.session.query(
+            EcritureComptable.numero_ecriture, EcritureComptable.id
+        ).filter(EcritureComptable.numero_ecriture.in_([e['numero_ecriture'] for e in lot])))
+
+        lignes = [
+            dict(ligne, ecriture_id=ids_par_numero[e['numero_ecriture']])
+            for e in lot
+            for ligne in e['lignes']
+        ]
+        db.session.bulk_insert_mappings(LigneEcriture, lignes)
+
+        ids.extend(ids_par_numero[e['numero_ecriture']] for e in lot)
+        rapport = {
+            'lot': index + 1,
+            'nb_lots': nb_lots,
+            'ecritures': len(lot),
+            'lignes': len(lignes),
+            'cumul_ecritures': len(ids),
+            'duree_ms': round((time.perf_counter() - debut) * 1000, 1)
+        }
+        rapports.append(rapport)
+        if progression:
+            progression(rapport)
+
+    # bulk_insert_mappings ne passe pas par les événements de flush
+    if ids:
+        incrementer_version()
+
+    return ids, rapports
@@ -0,0 +1,550 @@
+"""
+Soldes mensuels matérialisés pour ComptaEBNL-IA
+Maintient la table soldes_mensuels_comptes à la validation des écritures et
+reconstitue les totaux d'une période à partir de ces agrégats mensuels
+"""
+
+import calendar
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, extract, update, not_
+from sqlalchemy.orm import Session
+
+from models import db, EcritureComptable, LigneEcriture, ExerciceComptable, SoldeClotureExercice, SoldeMensuelCompte
+from services.account_ranges import filtre_prefixe
+from services.report_cache import ENTITE_PAR_DEFAUT, incrementer_version
+
+ZERO = Decimal('0')
+CENTIME = Decimal('0.01')
+PREFIXE_ECRITURE_CLOTURE = 'CLOT-'  # écritures de clôture définitive (solde des comptes de gestion)
+HORS_EXERCICE = 0  # exercice_id des mois sans exercice
+TAILLE_LOT_UPSERT = 500  # lignes par INSERT ... ON CONFLICT (limite de paramètres SQLite)
+
+# (date_ecriture, numero_compte, debit, credit)
+Mouvement = Tuple[date, str, Decimal, Decimal]
+
+
+def to_date(valeur) -> Optional[date]:
+    """Convertit une chaîne YYYY-MM-DD, un datetime ou une date en date"""
+    if valeur is None or valeur == '':
+        return None
+    if isinstance(valeur, datetime):
+        return valeur.date()
+    if isinstance(valeur, date):
+        return valeur
+    return datetime.strptime(valeur, '%Y-%m-%d').date()
+
+
+def to_decimal(valeur) -> Decimal:
+    """Normalise un montant SQL (Decimal, float ou None) en Decimal au centime"""
+    if valeur is None:
+        return ZERO
+    if isinstance(valeur, Decimal):
+        return valeur
+    return Decimal(str(valeur)).quantize(CENTIME)
+
+
+def periode_de(jour: date) -> str:
+    """Clé de période mensuelle YYYY-MM d'une date"""
+    return f"{jour.year:04d}-{jour.month:02d}"
+
+
+def _fin_de_mois(jour: date) -> date:
+    return date(jour.year, jour.month, calendar.monthrange(jour.year, jour.month)[1])
+
+
+def _mois_suivant(jour: date) -> date:
+    return _fin_de_mois(jour) + timedelta(days=1)
+
+
+class _ResolveurExercice:
+    """Associe une date à l'exercice qui la contient (chargé une fois par opération)"""
+
+    def __init__(self):
+        self.exercices = [
+            (exercice.date_debut, exercice.date_fin, exercice.id)
+            for exercice in ExerciceComptable.query.all()
+        ]
+
+    def __call__(self, jour: date) -> int:
+        for debut, fin, exercice_id in self.exercices:
+            if debut <= jour <= fin:
+                return exercice_id
+        return HORS_EXERCICE
+
+
+class PeriodeCloturee(ValueError):
+    """Mouvement daté dans un exercice dont les soldes de clôture sont figés"""
+
+
+def verifier_periode_ouverte(jour) -> None:
+    """
+    Refuse un mouvement daté au plus tard à la fin d'un exercice clôturé
+
+    Les soldes figés à la clôture cumulent tout le grand livre depuis
+    l'origine : un mouvement antérieur à leur date en serait absent.
+
+    Raises:
+        PeriodeCloturee: Si un exercice clôturé se termine à cette date ou après
+    """
+    jour = to_date(jour)
+    exercice = ExerciceComptable.query.filter(
+        ExerciceComptable.date_fin >= jour,
+        ExerciceComptable.id.in_(db.session.query(SoldeClotureExercice.exercice_id))
+    ).order_by(ExerciceComptable.date_fin).first()
+    if exercice:
+        raise PeriodeCloturee(
+            f"L'exercice {exercice.nom_exercice} est clôturé : rouvrez-le avant de passer "
+            f"une écriture au {jour.isoformat()}"
+        )
+
+
+# === MAINTENANCE INCRÉMENTALE ===
+
+def _upsert(lignes: List[Dict], dialecte: str) -> None:
+    """Crée les agrégats absents et ajoute les deltas aux existants (une instruction)"""
+    if dialecte == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    instruction = insert(SoldeMensuelCompte).values(lignes)
+    instruction = instruction.on_conflict_do_update(
+        index_elements=['entite_id', 'exercice_id', 'numero_compte', 'periode'],
+        set_={
+            'total_debit': SoldeMensuelCompte.total_debit + instruction.excluded.total_debit,
+            'total_credit': SoldeMensuelCompte.total_credit + instruction.excluded.total_credit,
+            'nb_lignes': SoldeMensuelCompte.nb_lignes + instruction.excluded.nb_lignes,
+            'date_maj': instruction.excluded.date_maj
+        }
+    )
+    db.session.execute(instruction)
+
+
+def _incrementer(ligne: Dict) -> None:
+    """Autres SGBD : UPDATE total = total + delta, INSERT si le mois est nouveau (la clé unique refuse un doublon)"""
+    resultat = db.session.execute(
+        update(SoldeMensuelCompte).where(
+            SoldeMensuelCompte.entite_id == ligne['entite_id'],
+            SoldeMensuelCompte.exercice_id == ligne['exercice_id'],
+            SoldeMensuelCompte.numero_compte == ligne['numero_compte'],
+            SoldeMensuelCompte.periode == ligne['periode']
+        ).values(
+            total_debit=SoldeMensuelCompte.total_debit + ligne['total_debit'],
+            total_credit=SoldeMensuelCompte.total_credit + ligne['total_credit'],
+            nb_lignes=SoldeMensuelCompte.nb_lignes + ligne['nb_lignes'],
+            date_maj=ligne['date_maj']
+        ).execution_options(synchronize_session=False)
+    )
+    if resultat.rowcount == 0:
+        db.session.add(SoldeMensuelCompte(**ligne))
+
+
+def ajouter_mouvements(mouvements: Iterable[Mouvement], signe: int = 1) -> int:
+    """
+    Reporte des mouvements validés dans les soldes mensuels, sans commit
+
+    Les deltas sont regroupés par (exercice, compte, mois) puis appliqués par
+    INSERT ... ON CONFLICT DO UPDATE SET total = total + :delta sur la clé
+    unique, ce qui reste correct si plusieurs transactions valident des
+    écritures du même mois en parallèle, y compris le premier mouvement.
+
+    Args:
+        mouvements: Itérable de (date_ecriture, numero_compte, debit, credit)
+        signe: 1 pour une validation, -1 pour une annulation
+
+    Returns:
+        int: Nombre de lignes d'agrégat touchées
+
+    Raises:
+        PeriodeCloturee: Si un mouvement est daté dans un exercice clôturé
+    """
+    resoudre_exercice = _ResolveurExercice()
+    deltas: Dict[Tuple[int, str, str], List] = {}
+    premier_jour = None
+
+    for jour, numero_compte, debit, credit in mouvements:
+        cle = (resoudre_exercice(jour), numero_compte, periode_de(jour))
+        delta = deltas.setdefault(cle, [ZERO, ZERO, 0])
+        delta[0] += to_decimal(debit)
+        delta[1] += to_decimal(credit)
+        delta[2] += 1
+        premier_jour = jour if premier_jour is None else min(premier_jour, jour)
+
+    if premier_jour is not None:
+        verifier_periode_ouverte(premier_jour)
+
+    maintenant = datetime.utcnow()
+    lignes = [
+        {
+            'entite_id': ENTITE_PAR_DEFAUT,
+            'exercice_id': exercice_id,
+            'numero_compte': numero_compte,
+            'periode': periode,
+            'total_debit': signe * debit,
+            'total_credit': signe * credit,
+            'nb_lignes': signe * nb,
+            'date_maj': maintenant
+        }
+        for (exercice_id, numero_compte, periode), (debit, credit, nb) in deltas.items()
+    ]
+    dialecte = db.session.get_bind().dialect.name
+    for debut in range(0, len(lignes), TAILLE_LOT_UPSERT):
+        lot = lignes[debut:debut + TAILLE_LOT_UPSERT]
+        if dialecte in ('postgresql', 'sqlite'):
+            _upsert(lot, dialecte)
+        else:
+            for ligne in lot:
+                _incrementer(ligne)
+
+    return len(deltas)
+
+
+def appliquer_ecritures(ecritures: Iterable[EcritureComptable], signe: int = 1) -> int:
+    """Reporte les lignes d'écritures qui viennent d'être validées (sans commit)"""
+    return ajouter_mouvements(
+        (
+            (ecriture.date_ecriture, ligne.numero_compte, ligne.debit or ZERO, ligne.credit or ZERO)
+            for ecriture in ecritures
+            for ligne in ecriture.lignes
+        ),
+        signe=signe
+    )
+
+
+def appliquer_ecriture(ecriture: EcritureComptable, signe: int = 1) -> int:
+    """Reporte les lignes d'une écriture qui vient d'être validée (sans commit)"""
+    return appliquer_ecritures([ecriture], signe=signe)
+
+
+# === RECONSTRUCTION ET CONTRÔLE ===
+
+def _bornes_exercice(exercice_id: Optional[int], session=None) -> Optional[Tuple[Optional[date], Optional[date]]]:
+    """
+    Mois entiers couverts par un exercice ((None, None) : tout le grand livre)
+
+    Les agrégats d'un mois portent sur tous les exercices qui le recoupent et
+    sur les écritures hors exercice : reconstruire ou contrôler un exercice
+    porte donc sur ses mois entiers, quel que soit l'exercice_id des lignes.
+
+    Returns:
+        Optional[Tuple]: None si l'exercice n'existe pas
+    """
+    if not exercice_id:
+        return None, None
+    exercice = (session or db.session).get(ExerciceComptable, exercice_id)
+    if exercice is None:
+        return None
+    return exercice.date_debut.replace(day=1), _fin_de_mois(exercice.date_fin)
+
+
+def _agreger_lignes(debut: Optional[date] = None, fin: Optional[date] = None,
+                    session=None) -> Dict[Tuple[int, str, str], Tuple[Decimal, Decimal, int]]:
+    """Agrège les lignes validées par (exercice, compte, mois) directement depuis le grand livre, entre deux dates"""
+    session = session or db.session
+    exercices = [
+        e for e in session.query(ExerciceComptable).all()
+        if debut is None or (e.date_debut <= fin and e.date_fin >= debut)
+    ]
+    periode = [EcritureComptable.date_ecriture.between(debut, fin)] if debut is not None else []
+
+    def requete(*filtres):
+        annee = extract('year', EcritureComptable.date_ecriture)
+        mois = extract('month', EcritureComptable.date_ecriture)
+        return session.query(
+            LigneEcriture.numero_compte,
+            annee.label('annee'),
+            mois.label('mois'),
+            func.sum(LigneEcriture.debit).label('total_debit'),
+            func.sum(LigneEcriture.credit).label('total_credit'),
+            func.count(LigneEcriture.id).label('nb_lignes')
+        ).join(
+            EcritureComptable, LigneEcriture.ecriture_id == EcritureComptable.id
+        ).filter(
+            EcritureComptable.statut == 'valide',
+            *periode,
+            *filtres
+        ).group_by(LigneEcriture.numero_compte, annee, mois).all()
+
+    lots = [
+        (exercice.id, requete(EcritureComptable.date_ecriture.between(exercice.date_debut, exercice.date_fin)))
+        for exercice in exercices
+    ]
+    hors_exercice = [
+        not_(EcritureComptable.date_ecriture.between(e.date_debut, e.date_fin))
+        for e in exercices
+    ]
+    lots.append((HORS_EXERCICE, requete(*hors_exercice)))
+
+    agregats = {}
+    for id_exercice, lignes in lots:
+        for ligne in lignes:
+            periode_ligne = f"{int(ligne.annee):04d}-{int(ligne.mois):02d}"
+            agregats[(id_exercice, ligne.numero_compte, periode_ligne)] = (
+                to_decimal(ligne.total_debit),
+                to_decimal(ligne.total_credit),
+                int(ligne.nb_lignes)
+            )
+    return agregats
+
+
+def _soldes_materialises(debut: Optional[date] = None, fin: Optional[date] = None, session=None):
+    query = (session or db.session).query(SoldeMensuelCompte)
+    if debut is not None:
+        query = query.filter(SoldeMensuelCompte.periode.between(periode_de(debut), periode_de(fin)))
+    return query
+
+
+def reconstruire_soldes_mensuels(exercice_id: Optional[int] = None, connexion=None) -> int:
+    """
+    Recalcule la table des soldes mensuels depuis les lignes d'écriture (backfill)
+
+    Args:
+        exercice_id: Limite la reconstruction aux mois de l'exercice, sinon tout le grand livre
+        connexion: Connexion d'une migration en cours (écrit dans sa transaction, sans commit)
+
+    Returns:
+        int: Nombre de lignes d'agrégat écrites
+    """
+    if connexion is not None:
+        with Session(bind=connexion) as session:
+            nb = _reconstruire(session, exercice_id)
+            session.flush()
+        incrementer_version(connexion)
+        return nb
+
+    nb = _reconstruire(db.session, exercice_id)
+    incrementer_version()
+    db.session.commit()
+    return nb
+
+
+def _reconstruire(session, exercice_id: Optional[int]) -> int:
+    bornes = _bornes_exercice(exercice_id, session)
+    if bornes is None:
+        return 0
+    _soldes_materialises(*bornes, session=session).delete(synchronize_session=False)
+
+    agregats = _agreger_lignes(*bornes, session=session)
+    session.bulk_insert_mappings(SoldeMensuelCompte, [
+        {
+            'exercice_id': id_exercice,
+            'numero_compte': numero_compte,
+            'periode': periode,
+            'total_debit': debit,
+            'total_credit': credit,
+            'nb_lignes': nb
+        }
+        for (id_exercice, numero_compte, periode), (debit, credit, nb) in agregats.items()
+    ])
+    return len(agregats)
+
+
+def verifier_coherence(exercice_id: Optional[int] = None) -> List[Dict]:
+    """
+    Compare les soldes mensuels matérialisés au grand livre
+
+    Args:
+        exercice_id: Limite le contrôle aux mois de l'exercice, sinon tout le grand livre
+
+    Returns:
+        List[Dict]: Écarts détectés (vide si la table est cohérente)
+    """
+    bornes = _bornes_exercice(exercice_id)
+    if bornes is None:
+        return []
+    attendus = _agreger_lignes(*bornes)
+
+    materialises = {
+        (s.exercice_id, s.numero_compte, s.periode): (to_decimal(s.total_debit), to_decimal(s.total_credit), s.nb_lignes)
+        for s in _soldes_materialises(*bornes).all()
+    }
+
+    vide = (ZERO, ZERO, 0)
+    ecarts = []
+    for cle in sorted(set(attendus) | set(materialises), key=lambda c: (c[2], c[1], c[0] or 0)):
+        attendu = attendus.get(cle, vide)
+        materialise = materialises.get(cle, vide)
+        if attendu != materialise:
+            ecarts.append({
+                'exercice_id': cle[0],
+                'numero_compte': cle[1],
+                'periode': cle[2],
+                'attendu': {'debit': float(attendu[0]), 'credit': float(attendu[1]), 'nb_lignes': attendu[2]},
+                'materialise': {'debit': float(materialise[0]), 'credit': float(materialise[1]), 'nb_lignes': materialise[2]}
+            })
+    return ecarts
+
+
+# === LECTURE ===
+
+def _cumuler(totaux: Dict[str, List], numero_compte: str, debit, credit, nb) -> None:
+    cumul = totaux.setdefault(numero_compte, [ZERO, ZERO, 0])
+    cumul[0] += to_decimal(debit)
+    cumul[1] += to_decimal(credit)
+    cumul[2] += int(nb or 0)
+
+
+def _lire_lignes(totaux, debut: date, fin: date, numeros, prefixe: Optional[str] = None) -> None:
+    """Complète les totaux avec les lignes brutes d'un mois partiel"""
+    query = db.session.query(
+        LigneEcriture.numero_compte,
+        func.sum(LigneEcriture.debit).label('total_debit'),
+        func.sum(LigneEcriture.credit).label('total_credit'),
+        func.count(LigneEcriture.id).label('nb_lignes')
+    ).join(
+        EcritureComptable, LigneEcriture.ecriture_id == EcritureComptable.id
+    ).filter(
+        EcritureComptable.statut == 'valide',
+        EcritureComptable.date_ecriture >= debut,
+        EcritureComptable.date_ecriture <= fin
+    )
+    if numeros is not None:
+        query = query.filter(LigneEcriture.numero_compte.in_(numeros))
+    if prefixe:
+        query = query.filter(filtre_prefixe(LigneEcriture.numero_compte, prefixe))
+    for ligne in query.group_by(LigneEcriture.numero_compte).all():
+        _cumuler(totaux, ligne.numero_compte, ligne.total_debit, ligne.total_credit, ligne.nb_lignes)
+
+
+def _retirer_cloture(totaux, debut: Optional[date], fin: Optional[date], numeros, prefixe: Optional[str] = None) -> None:
+    """Retire des totaux les lignes des écritures de clôture de la période"""
+    query = db.session.query(
+        LigneEcriture.numero_compte,
+        func.sum(LigneEcriture.debit).label('total_debit'),
+        func.sum(LigneEcriture.credit).label('total_credit'),
+        func.count(LigneEcriture.id).label('nb_lignes')
+    ).join(
+        EcritureComptable, LigneEcriture.ecriture_id == EcritureComptable.id
+    ).filter(
+        EcritureComptable.statut == 'valide',
+        EcritureComptable.numero_ecriture.like(f'{PREFIXE_ECRITURE_CLOTURE}%')
+    )
+    if debut:
+        query = query.filter(EcritureComptable.date_ecriture >= debut)
+    if fin:
+        query = query.filter(EcritureComptable.date_ecriture <= fin)
+    if numeros is not None:
+        query = query.filter(LigneEcriture.numero_compte.in_(numeros))
+    if prefixe:
+        query = query.filter(filtre_prefixe(LigneEcriture.numero_compte, prefixe))
+    for ligne in query.group_by(LigneEcriture.numero_compte).all():
+        _cumuler(totaux, ligne.numero_compte, -to_decimal(ligne.total_debit), -to_decimal(ligne.total_credit),
+                 -int(ligne.nb_lignes or 0))
+        if totaux[ligne.numero_compte] == [ZERO, ZERO, 0]:
+            del totaux[ligne.numero_compte]
+
+
+def _lire_agregats(totaux, periode_min: Optional[str], periode_max: Optional[str], numeros,
+                   prefixe: Optional[str] = None) -> None:
+    """Complète les totaux avec les agrégats des mois entiers [periode_min, periode_max]"""
+    query = db.session.query(
+        SoldeMensuelCompte.numero_compte,
+        func.sum(SoldeMensuelCompte.total_debit).label('total_debit'),
+        func.sum(SoldeMensuelCompte.total_credit).label('total_credit'),
+        func.sum(SoldeMensuelCompte.nb_lignes).label('nb_lignes')
+    )
+    if periode_min:
+        query = query.filter(SoldeMensuelCompte.periode >= periode_min)
+    if periode_max:
+        query = query.filter(SoldeMensuelCompte.periode <= periode_max)
+    if numeros is not None:
+        query = query.filter(SoldeMensuelCompte.numero_compte.in_(numeros))
+    if prefixe:
+        query = query.filter(filtre_prefixe(SoldeMensuelCompte.numero_compte, prefixe))
+    for ligne in query.group_by(SoldeMensuelCompte.numero_compte).all():
+        _cumuler(totaux, ligne.numero_compte, ligne.total_debit, ligne.total_credit, ligne.nb_lignes)
+
+
+def totaux_periode(date_debut=None, date_fin=None, numeros: Optional[Iterable[str]] = None,
+                   prefixe: Optional[str] = None, hors_cloture: bool = False) -> Dict[str, Tuple[Decimal, Decimal, int]]:
+    """
+    Totaux par compte des écritures validées sur une période quelconque
+
+    Les mois entièrement couverts sont lus dans la table des soldes mensuels ;
+    seuls les mois partiels en bordure de période sont lus ligne à ligne.
+
+    Args:
+        date_debut: Début de période (inclus), optionnel
+        date_fin: Fin de période (incluse), optionnelle
+        numeros: Restreint aux numéros de comptes exacts fournis
+        prefixe: Restreint aux comptes commençant par ce préfixe (ex: une classe)
+        hors_cloture: Exclut les écritures de clôture (comptes de gestion avant
+            leur report sur le résultat : compte de résultat, indicateurs)
+
+    Returns:
+        Dict[str, Tuple[Decimal, Decimal, int]]: numero_compte -> (débit, crédit, nb_lignes)
+    """
+    debut = to_date(date_debut)
+    fin = to_date(date_fin)
+    numeros = list(numeros) if numeros is not None else None
+    totaux: Dict[str, List] = {}
+
+    if debut and fin and debut > fin:
+        return {}
+
+    # Premier et dernier mois entièrement couverts
+    premier_mois = None
+    if debut:
+        premier_mois = debut if debut.day == 1 else _mois_suivant(debut)
+    dernier_mois = None
+    if fin:
+        dernier_mois = fin if fin == _fin_de_mois(fin) else date(fin.year, fin.month, 1) - timedelta(days=1)
+
+    if premier_mois and dernier_mois and premier_mois > dernier_mois:
+        # Période contenue dans un seul mois (ou deux mois partiels)
+        _lire_lignes(totaux, debut, fin, numeros, prefixe)
+    else:
+        _lire_agregats(
+            totaux,
+            periode_de(premier_mois) if premier_mois else None,
+            periode_de(dernier_mois) if dernier_mois else None,
+            numeros,
+            prefixe
+        )
+        if debut and premier_mois != debut:
+            _lire_lignes(totaux, debut, _fin_de_mois(debut), numeros, prefixe)
+        if fin and dernier_mois != fin:
+            _lire_lignes(totaux, date(fin.year, fin.month, 1), fin, numeros, prefixe)
+
+    if hors_cloture:
+        _retirer_cloture(totaux, debut, fin, numeros, prefixe)
+
+    return {numero: (d, c, n) for numero, (d, c, n) in totaux.items()}
+
+
+def series_mensuelles(date_debut, date_fin, numeros: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Tuple[Decimal, Decimal, int]]]:
+    """
+    Agrégats mois par mois entre deux dates, lus uniquement dans la table matérialisée
+
+    Args:
+        date_debut: Date du premier mois couvert
+        date_fin: Date du dernier mois couvert
+        numeros: Restreint aux numéros de comptes exacts fournis
+
+    Returns:
+        Dict[str, Dict[str, Tuple]]: periode -> numero_compte -> (débit, crédit, nb_lignes)
+    """
+    query = db.session.query(
+        SoldeMensuelCompte.periode,
+        SoldeMensuelCompte.numero_compte,
+        func.sum(SoldeMensuelCompte.total_debit).label('total_debit'),
+        func.sum(SoldeMensuelCompte.total_credit).label('total_credit'),
+        func.sum(SoldeMensuelCompte.nb_lignes).label('nb_lignes')
+    ).filter(
+        SoldeMensuelCompte.periode >= periode_de(to_date(date_debut)),
+        SoldeMensuelCompte.periode <= periode_de(to_date(date_fin))
+    )
+    if numeros is not None:
+        query = query.filter(SoldeMensuelCompte.numero_compte.in_(list(numeros)))
+
+    series: Dict[str, Dict[str, Tuple[Decimal, Decimal, int]]] = {}
+    for ligne in query.group_by(SoldeMensuelCompte.periode, SoldeMensuelCompte.numero_compte).all():
+        series.setdefault(ligne.periode, {})[ligne.numero_compte] = (
+            to_decimal(ligne.total_debit),
+            to_decimal(ligne.total_credit),
+            int(ligne.nb_lignes or 0)
+        )
+    return series
@@ -0,0 +1,112 @@
+"""
+Numérotation des écritures pour ComptaEBNL-IA
+Compteur par (entité, journal, jour) incrémenté atomiquement : une mise à jour
+indexée par allocation, sans COUNT et sans doublon sous charge concurrente
+"""
+
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import update, select
+
+from models import db, EcritureComptable, SequenceNumerotation
+
+ENTITE_PAR_DEFAUT = 0  # instance mono-entité
+
+
+def formater_numero(journal: str, jour: date, numero: int) -> str:
+    """Numéro d'écriture au format JOURNAL-YYYYMMDD-XXX"""
+    return f"{journal}-{jour.strftime('%Y%m%d')}-{numero:03d}"
+
+
+def _dernier_numero_existant(journal: str, jour: date) -> int:
+    """Plus grand suffixe déjà utilisé pour ce journal et ce jour (amorçage du compteur)"""
+    prefixe = formater_numero(journal, jour, 0)[:-3]
+    numeros = db.session.query(EcritureComptable.numero_ecriture).filter(
+        EcritureComptable.numero_ecriture.like(f"{prefixe}%")
+    )
+    suffixes = [numero[len(prefixe):] for (numero,) in numeros]
+    return max((int(s) for s in suffixes if s.isdigit()), default=0)
+
+
+def _incrementer(filtres, quantite: int) -> Optional[int]:
+    """UPDATE ... SET dernier_numero = dernier_numero + n RETURNING dernier_numero"""
+    return db.session.execute(
+        update(SequenceNumerotation).where(*filtres).values(
+            dernier_numero=SequenceNumerotation.dernier_numero + quantite
+        ).returning(SequenceNumerotation.dernier_numero).execution_options(synchronize_session=False)
+    ).scalar()
+
+
+def _upsert(entite_id: int, journal: str, periode: str, depart: int, quantite: int, dialecte: str) -> int:
+    """Crée le compteur ou l'incrémente si une autre transaction vient de le créer"""
+    if dialecte == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    instruction = insert(SequenceNumerotation).values(
+        entite_id=entite_id, journal=journal, periode=periode, dernier_numero=depart + quantite
+    )
+    instruction = instruction.on_conflict_do_update(
+        index_elements=['entite_id', 'journal', 'periode'],
+        set_={'dernier_numero': SequenceNumerotation.dernier_numero + quantite}
+    ).returning(SequenceNumerotation.dernier_numero)
+    return db.session.execute(instruction).scalar()
+
+
+def _verrouiller(entite_id: int, journal: str, jour: date, periode: str, quantite: int) -> int:
+    """Autres SGBD : verrou de ligne explicite (SELECT ... FOR UPDATE)"""
+    sequence = db.session.execute(
+        select(SequenceNumerotation).filter_by(
+            entite_id=entite_id, journal=journal, periode=periode
+        ).with_for_update()
+    ).scalar()
+    if sequence is None:
+        sequence = SequenceNumerotation(
+            entite_id=entite_id, journal=journal, periode=periode,
+            dernier_numero=_dernier_numero_existant(journal, jour)
+        )
+        db.session.add(sequence)
+    sequence.dernier_numero += quantite
+    db.session.flush()
+    return sequence.dernier_numero
+
+
+def allouer_numeros(journal: str, jour: date, quantite: int = 1, entite_id: Optional[int] = None) -> int:
+    """
+    Réserve un bloc de numéros consécutifs pour un journal et un jour
+
+    Le compteur est modifié dans la transaction courante : il reste verrouillé
+    jusqu'au commit (pas de doublon entre transactions concurrentes) et un
+    rollback annule la réservation.
+
+    Args:
+        journal: Code du journal
+        jour: Date des écritures
+        quantite: Taille du bloc à réserver (import en masse)
+        entite_id: Entité comptable, instance mono-entité par défaut
+
+    Returns:
+        int: Premier numéro du bloc réservé
+    """
+    entite_id = entite_id or ENTITE_PAR_DEFAUT
+    periode = jour.strftime('%Y%m%d')
+    filtres = (
+        SequenceNumerotation.entite_id == entite_id,
+        SequenceNumerotation.journal == journal,
+        SequenceNumerotation.periode == periode
+    )
+
+    dialecte = db.session.get_bind().dialect.name
+    if dialecte not in ('postgresql', 'sqlite'):
+        dernier = _verrouiller(entite_id, journal, jour, periode, quantite)
+        return dernier - quantite + 1
+
+    dernier = _incrementer(filtres, quantite)
+    if dernier is None:
+        # Premier numéro du jour : reprendre après les numéros attribués avant le compteur
+        depart = _dernier_numero_existant(journal, jour)
+        dernier = _upsert(entite_id, journal, periode, depart, quantite, dialecte)
+
+    return dernier - quantite + 1
@@ -0,0 +1,178 @@
+"""
+Soldes de clôture figés (à-nouveaux) pour ComptaEBNL-IA
+À la clôture d'un exercice, les totaux cumulés de chaque compte sont écrits une
+fois pour toutes ; les positions ultérieures partent de ce point au lieu de
+relire tout l'historique du grand livre
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, func
+
+from models import db, ExerciceComptable, SoldeClotureExercice
+from services.monthly_balances import ZERO, to_date, to_decimal, totaux_periode
+from services.report_cache import incrementer_version
+
+CLASSES_BILAN = ('1', '2', '3', '4', '5')
+COMPTE_EXCEDENT = '131'
+COMPTE_DEFICIT = '139'
+COMPTES_RESULTAT = {COMPTE_EXCEDENT: 'Résultat net : excédent', COMPTE_DEFICIT: 'Résultat net : déficit'}
+
+
+@event.listens_for(SoldeClotureExercice, 'before_update')
+def _interdire_modification(mapper, connection, cible):
+    raise ValueError(f"Les soldes de clôture de l'exercice {cible.exercice_id} sont figés")
+
+
+def compte_resultat(solde: Decimal) -> str:
+    """Compte de report du résultat selon le solde (débit - crédit) des comptes de gestion"""
+    return COMPTE_DEFICIT if solde > 0 else COMPTE_EXCEDENT
+
+
+def dernier_snapshot(au_plus_tard=None) -> Optional[Tuple[int, date]]:
+    """
+    Exercice clôturé le plus récent dont la date de fin précède une date
+
+    Args:
+        au_plus_tard: Date limite (incluse) de fin d'exercice, optionnelle
+
+    Returns:
+        Optional[Tuple[int, date]]: (exercice_id, date_fin) ou None
+    """
+    query = db.session.query(ExerciceComptable.id, ExerciceComptable.date_fin).filter(
+        ExerciceComptable.id.in_(db.session.query(SoldeClotureExercice.exercice_id).distinct())
+    )
+    limite = to_date(au_plus_tard)
+    if limite:
+        query = query.filter(ExerciceComptable.date_fin <= limite)
+    ligne = query.order_by(ExerciceComptable.date_fin.desc()).first()
+    return (ligne.id, ligne.date_fin) if ligne else None
+
+
+def lire_snapshot(exercice_id: int, numeros: Optional[Iterable[str]] = None) -> Dict[str, Tuple[Decimal, Decimal, int]]:
+    """Soldes figés d'un exercice : numero_compte -> (débit, crédit, nb_lignes)"""
+    query = db.session.query(
+        SoldeClotureExercice.numero_compte,
+        SoldeClotureExercice.total_debit,
+        SoldeClotureExercice.total_credit,
+        SoldeClotureExercice.nb_lignes
+    ).filter(
+        SoldeClotureExercice.exercice_id == exercice_id,
+        SoldeClotureExercice.entite_id.is_(None)
+    )
+    if numeros is not None:
+        query = query.filter(SoldeClotureExercice.numero_compte.in_(list(numeros)))
+    return {
+        ligne.numero_compte: (to_decimal(ligne.total_debit), to_decimal(ligne.total_credit), int(ligne.nb_lignes or 0))
+        for ligne in query.all()
+    }
+
+
+def totaux_cumules(date_fin=None, numeros: Optional[Iterable[str]] = None,
+                   hors_cloture: bool = False) -> Dict[str, Tuple[Decimal, Decimal, int]]:
+    """
+    Totaux par compte depuis l'origine jusqu'à date_fin
+
+    Lit le dernier snapshot antérieur puis seulement les mouvements postérieurs
+    à sa date ; sans snapshot, équivaut à totaux_periode(None, date_fin).
+
+    Args:
+        date_fin: Fin de période (incluse), optionnelle
+        numeros: Restreint aux numéros de comptes exacts fournis
+        hors_cloture: Exclut les écritures de clôture postérieures au snapshot
+
+    Returns:
+        Dict[str, Tuple[Decimal, Decimal, int]]: numero_compte -> (débit, crédit, nb_lignes)
+    """
+    numeros = list(numeros) if numeros is not None else None
+    snapshot = dernier_snapshot(date_fin)
+    if not snapshot:
+        return totaux_periode(None, date_fin, numeros, hors_cloture=hors_cloture)
+
+    exercice_id, fin_snapshot = snapshot
+    totaux = {numero: list(valeurs) for numero, valeurs in lire_snapshot(exercice_id, numeros).items()}
+    for numero, (debit, credit, nb) in totaux_periode(fin_snapshot + timedelta(days=1), date_fin, numeros,
+                                                      hors_cloture=hors_cloture).items():
+        cumul = totaux.setdefault(numero, [ZERO, ZERO, 0])
+        cumul[0] += debit
+        cumul[1] += credit
+        cumul[2] += nb
+    return {numero: (d, c, n) for numero, (d, c, n) in totaux.items()}
+
+
+def a_nouveaux(exercice_id: int) -> Dict[str, Tuple[Decimal, Decimal]]:
+    """
+    Soldes d'ouverture d'un exercice issus de la clôture précédente
+
+    Les comptes de bilan (classes 1 à 5) sont repris tels quels ; le solde des
+    comptes de gestion est reporté sur le compte de résultat (131 excédent,
+    139 déficit, comme l'écriture de clôture définitive). Vide si aucun
+    exercice antérieur n'a été clôturé.
+
+    Args:
+        exercice_id: ID de l'exercice à ouvrir
+
+    Returns:
+        Dict[str, Tuple[Decimal, Decimal]]: numero_compte -> (débit, crédit)
+    """
+    exercice = db.session.get(ExerciceComptable, exercice_id)
+    if not exercice or not dernier_snapshot(exercice.date_debut - timedelta(days=1)):
+        return {}
+
+    ouverture: Dict[str, Tuple[Decimal, Decimal]] = {}
+    resultat = ZERO
+    for numero, (debit, credit, _) in totaux_cumules(exercice.date_debut - timedelta(days=1)).items():
+        if numero.startswith(CLASSES_BILAN):
+            ouverture[numero] = (debit, credit)
+        else:
+            resultat += debit - credit
+
+    if resultat:
+        compte = compte_resultat(resultat)
+        debit, credit = ouverture.get(compte, (ZERO, ZERO))
+        ouverture[compte] = (debit + max(resultat, ZERO), credit + max(-resultat, ZERO))
+    return ouverture
+
+
+def creer_snapshot(exercice: ExerciceComptable) -> int:
+    """
+    Fige les totaux cumulés de chaque compte à la date de fin de l'exercice (sans commit)
+
+    Args:
+        exercice: Exercice en cours de clôture
+
+    Returns:
+        int: Nombre de comptes figés
+
+    Raises:
+        ValueError: Si l'exercice possède déjà des soldes de clôture
+    """
+    existe = db.session.query(func.count(SoldeClotureExercice.id)).filter(
+        SoldeClotureExercice.exercice_id == exercice.id
+    ).scalar()
+    if existe:
+        raise ValueError(f"Les soldes de clôture de l'exercice {exercice.nom_exercice} existent déjà")
+
+    totaux = totaux_cumules(exercice.date_fin)
+    db.session.bulk_insert_mappings(SoldeClotureExercice, [
+        {
+            'exercice_id': exercice.id,
+            'numero_compte': numero,
+            'total_debit': debit,
+            'total_credit': credit,
+            'nb_lignes': nb
+        }
+        for numero, (debit, credit, nb) in sorted(totaux.items())
+    ])
+    incrementer_version()
+    return len(totaux)
+
+
+def supprimer_snapshot(exercice_id: int) -> int:
+    """Retire les soldes figés d'un exercice rouvert (sans commit)"""
+    nb = SoldeClotureExercice.query.filter_by(exercice_id=exercice_id).delete(synchronize_session=False)
+    if nb:
+        incrementer_version()
+    return nb
@@ -0,0 +1,267 @@
+"""
+Comptage des quotas d'abonnement en écriture différée pour ComptaEBNL-IA
+Les consommations sont cumulées en mémoire par (abonnement, année, mois) puis
+écrites par lots (UPDATE ... SET x = x + :delta) au plus tous les QUOTAS_LOT
+unités ou QUOTAS_INTERVALLE secondes. La vérification d'un quota se fait sur
+la dernière valeur relue en base plus les consommations en attente ; à moins
+de QUOTAS_MARGE unités de la limite, chaque consommation est vérifiée et
+écrite en base par un UPDATE conditionnel.
+
+Garanties : dans un processus, aucun dépassement. Entre plusieurs processus,
+un processus ne voit pas les consommations en attente des autres (moins de
+QUOTAS_LOT chacun) ni ce qu'ils ont écrit depuis sa dernière relecture (au
+plus QUOTAS_INTERVALLE secondes) : le dépassement est nul tant que ces
+consommations restent sous QUOTAS_MARGE, et borné par leur excédent sinon.
+Un arrêt brutal perd au plus les consommations en attente (moins de
+QUOTAS_LOT unités par abonnement, ou QUOTAS_INTERVALLE secondes).
+"""
+
+import atexit
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from models import db, UtilisationQuota
+
+LOT_DEFAUT = 50
+INTERVALLE_DEFAUT = 10  # secondes entre deux écritures (et relectures) des compteurs
+ILLIMITE = -1
+
+# Type de ressource -> colonne de utilisation_quotas
+COLONNES = {
+    'ecritures': 'ecritures_utilisees',
+    'documents': 'documents_traites',
+    'api_calls': 'appels_api',
+    'stockage': 'stockage_utilise_mb'
+}
+
+Cle = Tuple[int, int, int]  # (abonnement_id, annee, mois)
+
+
+def periode_courante() -> Tuple[int, int]:
+    now = datetime.now()
+    return now.year, now.month
+
+
+class Utilisation:
+    """Utilisation d'un mois (valeurs en base + consommations en attente), mêmes attributs que UtilisationQuota"""
+    __slots__ = ('abonnement_id', 'annee', 'mois') + tuple(COLONNES.values())
+
+    def __init__(self, cle: Cle, compteurs: Dict[str, int]):
+        self.abonnement_id, self.annee, self.mois = cle
+        for colonne in COLONNES.values():
+            setattr(self, colonne, compteurs.get(colonne, 0))
+
+
+class CompteursQuotas:
+    """Compteurs en mémoire d'un processus et leur écriture différée"""
+
+    def __init__(self, lot: int = LOT_DEFAUT, intervalle: float = INTERVALLE_DEFAUT, marge: Optional[int] = None):
+        self.lot = max(1, lot)
+        self.intervalle = intervalle
+        self.marge = self.lot if marge is None else marge
+        self.verrou = threading.Lock()
+        self.persistes: Dict[Cle, Dict[str, int]] = {}
+        self.lus_le: Dict[Cle, float] = {}
+        self.en_attente: Dict[Cle, Dict[str, int]] = {}
+        self.dernier_flush = time.monotonic()
+
+    # === LECTURE ===
+
+    def _lire(self, cle: Cle) -> Dict[str, int]:
+        """Dernière valeur en base (zéros si la ligne du mois n'existe pas encore)"""
+        abonnement_id, annee, mois = cle
+        ligne = db.session.execute(
+            select(*(getattr(UtilisationQuota, colonne) for colonne in COLONNES.values())).where(
+                UtilisationQuota.abonnement_id == abonnement_id,
+                UtilisationQuota.annee == annee,
+                UtilisationQuota.mois == mois
+            )
+        ).first()
+        compteurs = {colonne: (ligne[i] or 0) if ligne else 0 for i, colonne in enumerate(COLONNES.values())}
+        with self.verrou:
+            self.persistes[cle] = compteurs
+            self.lus_le[cle] = time.monotonic()
+        return compteurs
+
+    def _persistes(self, cle: Cle) -> Dict[str, int]:
+        compteurs = self.persistes.get(cle)
+        if compteurs is None or time.monotonic() - self.lus_le.get(cle, 0) >= self.intervalle:
+            compteurs = self._lire(cle)
+        return compteurs
+
+    def utilisation(self, abonnement_id: int, annee: Optional[int] = None, mois: Optional[int] = None) -> Utilisation:
+        """Utilisation du mois, sans écriture"""
+        if not annee or not mois:
+            annee, mois = periode_courante()
+        cle = (abonnement_id, annee, mois)
+        persistes = self._persistes(cle)
+        with self.verrou:
+            attente = self.en_attente.get(cle, {})
+            return Utilisation(cle, {colonne: persistes[colonne] + attente.get(colonne, 0)
+                                     for colonne in COLONNES.values()})
+
+    # === CONSOMMATION ===
+
+    def consommer(self, abonnement_id: int, resource_type: str, quantite: int = 1, limite: int = ILLIMITE) -> bool:
+        """
+        Réserve une consommation si la limite le permet
+
+        Returns:
+            bool: False si la limite mensuelle serait dépassée (rien n'est compté)
+        """
+        colonne = COLONNES[resource_type]
+        cle = (abonnement_id,) + periode_courante()
+        persistes = self._persistes(cle)
+
+        with self.verrou:
+            attente = self.en_attente.setdefault(cle, {})
+            total = persistes[colonne] + attente.get(colonne, 0)
+            if limite == ILLIMITE or total + quantite <= limite - self.marge:
+                attente[colonne] = attente.get(colonne, 0) + quantite
+                return True
+
+        # Proche de la limite : consommation vérifiée et écrite en base
+        self.flush([cle], inclure_vides=True)
+        return self._consommer_en_base(cle, colonne, quantite, limite)
+
+    def rendre(self, abonnement_id: int, resource_type: str, quantite: int = 1) -> None:
+        """Annule une réservation (l'opération a échoué)"""
+        colonne = COLONNES[resource_type]
+        cle = (abonnement_id,) + periode_courante()
+        with self.verrou:
+            attente = self.en_attente.setdefault(cle, {})
+            attente[colonne] = attente.get(colonne, 0) - quantite
+
+    def _consommer_en_base(self, cle: Cle, colonne: str, quantite: int, limite: int) -> bool:
+        abonnement_id, annee, mois = cle
+        valeur = getattr(UtilisationQuota, colonne)
+        resultat = db.session.execute(
+            update(UtilisationQuota).where(
+                UtilisationQuota.abonnement_id == abonnement_id,
+                UtilisationQuota.annee == annee,
+                UtilisationQuota.mois == mois,
+                valeur + quantite <= limite
+            ).values({colonne: valeur + quantite, 'date_maj': datetime.utcnow()})
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        self._lire(cle)
+        return resultat.rowcount == 1
+
+    # === ÉCRITURE DIFFÉRÉE ===
+
+    def _ecrire(self, cle: Cle, deltas: Dict[str, int]) -> None:
+        """Crée la ligne du mois ou y ajoute les deltas (une instruction sous SQLite/PostgreSQL)"""
+        abonnement_id, annee, mois = cle
+        maintenant = datetime.utcnow()
+        deltas = {colonne: delta for colonne, delta in deltas.items() if delta}
+        dialecte = db.session.get_bind().dialect.name
+
+        if dialecte in ('postgresql', 'sqlite'):
+            if dialecte == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            instruction = insert(UtilisationQuota).values(
+                abonnement_id=abonnement_id, annee=annee, mois=mois, date_creation=maintenant, date_maj=maintenant,
+                **{colonne: deltas.get(colonne, 0) for colonne in COLONNES.values()}
+            )
+            if deltas:
+                instruction = instruction.on_conflict_do_update(
+                    index_elements=['abonnement_id', 'annee', 'mois'],
+                    set_=dict({colonne: getattr(UtilisationQuota, colonne) + delta
+                               for colonne, delta in deltas.items()}, date_maj=maintenant)
+                )
+            else:
+                instruction = instruction.on_conflict_do_nothing(index_elements=['abonnement_id', 'annee', 'mois'])
+            db.session.execute(instruction)
+            return
+
+        # Autres SGBD : mise à jour, création si la ligne n'existe pas encore
+        filtres = (UtilisationQuota.abonnement_id == abonnement_id, UtilisationQuota.annee == annee,
+                   UtilisationQuota.mois == mois)
+        resultat = db.session.execute(
+            update(UtilisationQuota).where(*filtres).values(
+                dict({colonne: getattr(UtilisationQuota, colonne) + delta for colonne, delta in deltas.items()},
+                     date_maj=maintenant)
+            ).execution_options(synchronize_session=False)
+        )
+        if resultat.rowcount == 0:
+            db.session.add(UtilisationQuota(abonnement_id=abonnement_id, annee=annee, mois=mois,
+                                            **{colonne: deltas.get(colonne, 0) for colonne in COLONNES.values()}))
+            db.session.flush()
+
+    def flush(self, cles: Optional[Iterable[Cle]] = None, inclure_vides: bool = False) -> int:
+        """
+        Écrit les consommations en attente (toutes ou celles des clés données) et relit les compteurs
+
+        Returns:
+            int: Nombre de lignes mensuelles écrites
+        """
+        with self.verrou:
+            cibles = list(self.en_attente) if cles is None else [cle for cle in cles if cle in self.en_attente
+                                                                 or inclure_vides]
+            lots = {cle: self.en_attente.pop(cle, {}) for cle in cibles}
+            if cles is None:
+                self.dernier_flush = time.monotonic()
+        lots = {cle: deltas for cle, deltas in lots.items() if inclure_vides or any(deltas.values())}
+        if not lots:
+            return 0
+
+        try:
+            for cle, deltas in lots.items():
+                self._ecrire(cle, deltas)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # Consommations remises en attente pour la prochaine écriture
+            with self.verrou:
+                for cle, deltas in lots.items():
+                    attente = self.en_attente.setdefault(cle, {})
+                    for colonne, delta in deltas.items():
+                        attente[colonne] = attente.get(colonne, 0) + delta
+            print(f"⚠️  Écriture des quotas différée : {e}")
+            return 0
+
+        for cle in lots:
+            self._lire(cle)
+        return len(lots)
+
+    def flush_si_necessaire(self) -> int:
+        """Écrit les compteurs si un abonnement a QUOTAS_LOT unités en attente ou après QUOTAS_INTERVALLE secondes"""
+        with self.verrou:
+            echeance = time.monotonic() - self.dernier_flush >= self.intervalle
+            pleins = [cle for cle, deltas in self.en_attente.items()
+                      if sum(abs(delta) for delta in deltas.values()) >= self.lot]
+        if echeance:
+            return self.flush()
+        if pleins:
+            return self.flush(pleins)
+        return 0
+
+
+def _flush_a_l_arret(app) -> None:
+    with app.app_context():
+        compteurs = app.extensions.get('compteurs_quotas')
+        if compteurs is not None:
+            compteurs.flush()
+
+
+def compteurs_quotas() -> CompteursQuotas:
+    """Compteurs de l'application courante (écrits à l'arrêt du processus)"""
+    compteurs = current_app.extensions.get('compteurs_quotas')
+    if compteurs is None:
+        config = current_app.config
+        compteurs = current_app.extensions.setdefault('compteurs_quotas', CompteursQuotas(
+            lot=config.get('QUOTAS_LOT', LOT_DEFAUT),
+            intervalle=config.get('QUOTAS_INTERVALLE', INTERVALLE_DEFAUT),
+            marge=config.get('QUOTAS_MARGE')
+        ))
+        if not current_app.testing:
+            atexit.register(_flush_a_l_arret, current_app._get_current_object())
+    return compteurs
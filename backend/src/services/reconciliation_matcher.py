@@ -0,0 +1,162 @@
+"""
+Moteur d'appariement du rapprochement bancaire pour ComptaEBNL-IA
+Indexe les lignes comptables par tranche de montant et par mot du libellé,
+puis ne note que les candidats capables d'atteindre le seuil demandé
+"""
+
+import math
+import re
+from datetime import date
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Pondération du score global (identique au calcul historique)
+POIDS_LIBELLE = 0.7
+POIDS_DATE = 0.3
+PENALITE_JOUR = 10  # points de score date perdus par jour d'écart
+SEUIL_AUTOMATIQUE = 90
+
+_PONCTUATION = re.compile(r'[^\w\s]')
+
+
+def tokeniser(libelle: str) -> FrozenSet[str]:
+    """Mots normalisés d'un libellé (minuscules, sans ponctuation)"""
+    return frozenset(_PONCTUATION.sub('', (libelle or '').lower()).split())
+
+
+def score_libelles(mots1: FrozenSet[str], mots2: FrozenSet[str]) -> float:
+    """Coefficient de Dice entre deux ensembles de mots (0-100)"""
+    if not mots1 or not mots2:
+        return 0
+    return min(100, (len(mots1 & mots2) * 2) / (len(mots1) + len(mots2)) * 100)
+
+
+def score_date(jour1: date, jour2: date) -> float:
+    """Score de proximité des dates (100 le même jour, 0 à dix jours et plus)"""
+    return max(0, 100 - abs((jour1 - jour2).days) * PENALITE_JOUR)
+
+
+class LigneCandidate:
+    """Ligne comptable bancaire prête à être appariée"""
+    __slots__ = ('ligne_id', 'ecriture_id', 'date', 'libelle', 'montant', 'piece_justificative', 'mots')
+
+    def __init__(self, ligne_id, ecriture_id, date, libelle, montant, piece_justificative=None):
+        self.ligne_id = ligne_id
+        self.ecriture_id = ecriture_id
+        self.date = date
+        self.libelle = libelle
+        self.montant = float(montant)
+        self.piece_justificative = piece_justificative
+        self.mots = tokeniser(libelle)
+
+
+class IndexRapprochement:
+    """
+    Index des lignes comptables pour l'appariement
+
+    Les montants absolus sont répartis en tranches de largeur égale à la
+    tolérance : un mouvement ne peut correspondre qu'à des lignes de sa
+    tranche ou des deux voisines. Dans chaque tranche, un index inversé
+    mot -> lignes limite les candidats à ceux qui partagent un mot.
+    """
+
+    def __init__(self, lignes: Iterable[LigneCandidate], tolerance: float = 0.01):
+        self.tolerance = max(float(tolerance), 0.005)
+        self.lignes: List[LigneCandidate] = list(lignes)
+        self._tranches: Dict[int, List[int]] = {}
+        self._mots: Dict[Tuple[int, str], List[int]] = {}
+
+        for position, ligne in enumerate(self.lignes):
+            tranche = self._tranche(ligne.montant)
+            self._tranches.setdefault(tranche, []).append(position)
+            for mot in ligne.mots:
+                self._mots.setdefault((tranche, mot), []).append(position)
+
+    def _tranche(self, montant: float) -> int:
+        return math.floor(abs(montant) / self.tolerance)
+
+    def candidats(self, montant: float, mots: FrozenSet[str], mot_requis: bool) -> Iterable[int]:
+        """Positions des lignes dont le montant est dans la tolérance (et partageant un mot si requis)"""
+        tranche = self._tranche(montant)
+        vus = set()
+        for voisine in (tranche - 1, tranche, tranche + 1):
+            if mot_requis:
+                postings = (self._mots.get((voisine, mot), ()) for mot in mots)
+                positions = (p for posting in postings for p in posting)
+            else:
+                positions = self._tranches.get(voisine, ())
+            for position in positions:
+                if position in vus:
+                    continue
+                vus.add(position)
+                if abs(abs(montant) - abs(self.lignes[position].montant)) <= self.tolerance + 1e-9:
+                    yield position
+
+
+def _bornes(seuil: float) -> Tuple[bool, Optional[int]]:
+    """
+    Élagage exact déduit du seuil : (mot commun requis, écart de jours maximal)
+
+    Un candidat sans mot commun plafonne à POIDS_DATE * 100 ; un candidat
+    daté à d jours plafonne à POIDS_LIBELLE * 100 + POIDS_DATE * score_date(d).
+    """
+    mot_requis = seuil > POIDS_DATE * 100
+    manque = seuil - POIDS_LIBELLE * 100
+    if manque <= 0:
+        return mot_requis, None
+    score_date_min = manque / POIDS_DATE
+    return mot_requis, math.floor((100 - score_date_min) / PENALITE_JOUR + 1e-9)
+
+
+def apparier(mouvements: List[Dict], index: IndexRapprochement, seuil: float = 70,
+             nb_resultats: int = 3, affectation_unique: bool = False,
+             lignes_prises: Optional[set] = None) -> List[List[Tuple[float, float, float, LigneCandidate]]]:
+    """
+    Cherche les lignes comptables correspondant à chaque mouvement bancaire
+
+    Args:
+        mouvements: Dictionnaires avec 'date', 'libelle' et 'montant'
+        index: Index des lignes comptables candidates
+        seuil: Score global minimal (0-100)
+        nb_resultats: Nombre de correspondances conservées par mouvement
+        affectation_unique: Attribue chaque ligne à un seul mouvement
+            (affectation gloutonne par score décroissant)
+        lignes_prises: IDs de lignes déjà attribuées, complété en place
+            (affectation unique sur plusieurs lots de mouvements)
+
+    Returns:
+        List[List[Tuple]]: Pour chaque mouvement, (global, libelle, date, ligne) triés par score
+    """
+    mot_requis, ecart_max = _bornes(seuil)
+    resultats: List[List[Tuple[float, float, float, LigneCandidate]]] = []
+
+    for mouvement in mouvements:
+        mots = tokeniser(mouvement['libelle'])
+        trouves = []
+        for position in index.candidats(mouvement['montant'], mots, mot_requis):
+            ligne = index.lignes[position]
+            if ecart_max is not None and abs((mouvement['date'] - ligne.date).days) > ecart_max:
+                continue
+            s_libelle = score_libelles(mots, ligne.mots)
+            s_date = score_date(mouvement['date'], ligne.date)
+            s_global = s_libelle * POIDS_LIBELLE + s_date * POIDS_DATE
+            if s_global >= seuil:
+                trouves.append((s_global, s_libelle, s_date, ligne))
+        trouves.sort(key=lambda t: (-t[0], t[3].ligne_id))
+        resultats.append(trouves)
+
+    if not affectation_unique:
+        return [trouves[:nb_resultats] for trouves in resultats]
+
+    # Affectation un-pour-un : meilleures paires d'abord, chaque côté utilisé une fois
+    paires = sorted(
+        ((trouve, numero) for numero, trouves in enumerate(resultats) for trouve in trouves),
+        key=lambda p: (-p[0][0], p[1], p[0][3].ligne_id)
+    )
+    affectes: List[List[Tuple[float, float, float, LigneCandidate]]] = [[] for _ in resultats]
+    lignes_prises = lignes_prises if lignes_prises is not None else set()
+    for trouve, numero in paires:
+        if affectes[numero] or trouve[3].ligne_id in lignes_prises:
+            continue
+        affectes[numero].append(trouve)
+        lignes_prises.add(trouve[3].ligne_id)
+    return affectes
@@ -0,0 +1,217 @@
+"""
+Cache des rapports comptables pour ComptaEBNL-IA
+Résultats indexés par (rapport, paramètres normalisés, date du jour, version
+du grand livre) : toute écriture incrémente la version et rend les anciennes
+entrées inaccessibles, sans purge explicite
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from typing import Any, Dict, Optional
+
+from flask import current_app, request, jsonify
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from models import db, EcritureComptable, LigneEcriture, VersionGrandLivre
+
+# Import optionnel du client Redis
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+TAILLE_CACHE_DEFAUT = 512
+TTL_REDIS_DEFAUT = 3600  # secondes
+ENTITE_PAR_DEFAUT = 0
+
+
+# === VERSION DU GRAND LIVRE ===
+
+def incrementer_version(connexion=None, entite_id: int = ENTITE_PAR_DEFAUT) -> None:
+    """Incrémente la version du grand livre dans la transaction courante"""
+    connexion = connexion or db.session.connection()
+    resultat = connexion.execute(
+        update(VersionGrandLivre.__table__).where(
+            VersionGrandLivre.__table__.c.entite_id == entite_id
+        ).values(version=VersionGrandLivre.__table__.c.version + 1)
+    )
+    if resultat.rowcount == 0:
+        connexion.execute(VersionGrandLivre.__table__.insert().values(entite_id=entite_id, version=1))
+
+
+def version_courante(entite_id: int = ENTITE_PAR_DEFAUT) -> int:
+    """Version actuelle du grand livre (lecture par clé primaire)"""
+    version = db.session.query(VersionGrandLivre.version).filter(
+        VersionGrandLivre.entite_id == entite_id
+    ).scalar()
+    return version or 0
+
+
+@event.listens_for(Session, 'before_flush')
+def _ecouter_modifications(session, flush_context, instances):
+    """Toute écriture ou ligne créée, modifiée ou supprimée fait avancer la version"""
+    modifies = (session.new, session.dirty, session.deleted)
+    if any(isinstance(obj, (EcritureComptable, LigneEcriture)) for groupe in modifies for obj in groupe):
+        incrementer_version(session.connection())
+
+
+# === BACKENDS ===
+
+class CacheLRU:
+    """Cache en mémoire du processus, borné en nombre d'entrées (moins récemment utilisée évincée)"""
+
+    def __init__(self, taille_max: int = TAILLE_CACHE_DEFAUT):
+        self.taille_max = taille_max
+        self._entrees: 'OrderedDict[str, Any]' = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def get(self, cle: str) -> Optional[Any]:
+        with self._verrou:
+            if cle not in self._entrees:
+                return None
+            self._entrees.move_to_end(cle)
+            return self._entrees[cle]
+
+    def set(self, cle: str, valeur: Any) -> None:
+        with self._verrou:
+            self._entrees[cle] = valeur
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._verrou:
+            self._entrees.clear()
+
+    def __len__(self) -> int:
+        return len(self._entrees)
+
+
+class CacheRedis:
+    """
+    Cache partagé entre processus via un client compatible Redis
+
+    Le client doit exposer get(cle), set(cle, valeur, ex=ttl) et
+    scan_iter/delete pour la purge ; tout objet équivalent convient en test.
+    """
+
+    def __init__(self, client, prefixe: str = 'rapports:', ttl: int = TTL_REDIS_DEFAUT):
+        self.client = client
+        self.prefixe = prefixe
+        self.ttl = ttl
+
+    def get(self, cle: str) -> Optional[Any]:
+        brut = self.client.get(self.prefixe + cle)
+        return json.loads(brut) if brut is not None else None
+
+    def set(self, cle: str, valeur: Any) -> None:
+        self.client.set(self.prefixe + cle, json.dumps(valeur, default=str), ex=self.ttl)
+
+    def clear(self) -> None:
+        for cle in list(self.client.scan_iter(f'{self.prefixe}*')):
+            self.client.delete(cle)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(f'{self.prefixe}*'))
+
+
+class CacheRapports:
+    """Cache des rapports avec compteurs de succès/échecs par rapport"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._verrou = threading.Lock()
+        self.metriques: Dict[str, Dict[str, int]] = {}
+
+    def _compter(self, rapport: str, resultat: str) -> None:
+        with self._verrou:
+            compteurs = self.metriques.setdefault(rapport, {'hits': 0, 'misses': 0})
+            compteurs[resultat] += 1
+
+    def lire(self, rapport: str, cle: str) -> Optional[Any]:
+        valeur = self.backend.get(cle)
+        self._compter(rapport, 'hits' if valeur is not None else 'misses')
+        return valeur
+
+    def ecrire(self, cle: str, valeur: Any) -> None:
+        self.backend.set(cle, valeur)
+
+    def vider(self) -> None:
+        self.backend.clear()
+
+    def statistiques(self) -> Dict:
+        hits = sum(m['hits'] for m in self.metriques.values())
+        misses = sum(m['misses'] for m in self.metriques.values())
+        return {
+            'backend': type(self.backend).__name__,
+            'entrees': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'taux_succes': round(hits / (hits + misses) * 100, 2) if hits + misses else 0,
+            'par_rapport': dict(self.metriques)
+        }
+
+
+def creer_cache(config) -> CacheRapports:
+    """Backend choisi par REPORT_CACHE_URL (redis://...) ; LRU en mémoire sinon"""
+    url = config.get('REPORT_CACHE_URL')
+    if url and REDIS_AVAILABLE:
+        backend = CacheRedis(redis.from_url(url), ttl=config.get('REPORT_CACHE_TTL', TTL_REDIS_DEFAUT))
+    else:
+        backend = CacheLRU(config.get('REPORT_CACHE_SIZE', TAILLE_CACHE_DEFAUT))
+    return CacheRapports(backend)
+
+
+def get_cache() -> CacheRapports:
+    """Cache de l'application courante (créé au premier appel)"""
+    if 'report_cache' not in current_app.extensions:
+        current_app.extensions['report_cache'] = creer_cache(current_app.config)
+    return current_app.extensions['report_cache']
+
+
+# === DÉCORATEUR ===
+
+def jour_courant() -> date:
+    """Date dont dérivent les périodes par défaut des rapports (année en cours, date_fin du jour)"""
+    return date.today()
+
+
+def cache_rapport(rapport: str):
+    """
+    Met en cache la réponse JSON (200) d'un endpoint de rapport
+
+    La clé combine le nom du rapport, les paramètres de requête triés (dont
+    entite_id), la date du jour et la version du grand livre. Les écritures ne
+    portant pas d'entité, la version lue est celle que les écritures font
+    avancer (ENTITE_PAR_DEFAUT), quelle que soit l'entité demandée ; la date du
+    jour sépare les périodes par défaut résolues d'un jour ou d'une année à
+    l'autre. L'en-tête X-Cache indique HIT/MISS.
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        def envelopper(*args, **kwargs):
+            if current_app.config.get('REPORT_CACHE_DISABLED'):
+                return vue(*args, **kwargs)
+
+            parametres = sorted((k, v) for k, v in request.args.items(multi=True))
+            cle = json.dumps([rapport, parametres, jour_courant().isoformat(), version_courante()])
+
+            cache = get_cache()
+            en_cache = cache.lire(rapport, cle)
+            if en_cache is not None:
+                response = jsonify(en_cache)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = current_app.make_response(vue(*args, **kwargs))
+            if response.status_code == 200 and response.is_json:
+                cache.ecrire(cle, response.get_json())
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return envelopper
+    return decorateur
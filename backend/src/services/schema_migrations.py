@@ -0,0 +1,246 @@
+"""
+Migrations de schéma idempotentes pour ComptaEBNL-IA
+db.create_all() crée les tables absentes mais ne modifie pas les tables
+existantes : les colonnes ajoutées aux modèles depuis sont créées ici
+(ALTER TABLE ... ADD COLUMN) avec leurs index, puis remplies. Chaque étape
+ne fait rien sur une base déjà à jour ; migrer_schema() est appelé au
+démarrage, après create_all.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+from models import (
+    db, EcritureComptable, ExerciceComptable, MouvementBancaire, PlanComptable, SoldeMensuelCompte, StatutEcriture,
+    Tache, Utilisateur
+)
+from models_elearning import InscriptionFormation
+from services.monthly_balances import reconstruire_soldes_mensuels
+
+
+def colonnes_absentes(connexion, table, noms: Optional[Iterable[str]] = None) -> List:
+    """Colonnes déclarées (toutes ou celles nommées) absentes de la table en base ([] si la table n'existe pas)"""
+    inspecteur = inspect(connexion)
+    if not inspecteur.has_table(table.name):
+        return []
+    existantes = {colonne['name'] for colonne in inspecteur.get_columns(table.name)}
+    colonnes = table.columns if noms is None else [table.columns[nom] for nom in noms]
+    return [colonne for colonne in colonnes if colonne.name not in existantes]
+
+
+def ajouter_colonnes(connexion, table, noms: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Ajoute à une table existante ses colonnes absentes et les index qui les portent
+
+    Returns:
+        List[str]: Noms des colonnes ajoutées
+    """
+    absentes = colonnes_absentes(connexion, table, noms)
+    if not absentes:
+        return []
+
+    nom_table = connexion.dialect.identifier_preparer.format_table(table)
+    for colonne in absentes:
+        definition = CreateColumn(colonne).compile(dialect=connexion.dialect)
+        connexion.exec_driver_sql(f'ALTER TABLE {nom_table} ADD COLUMN {definition}')
+
+    ajoutees = {colonne.name for colonne in absentes}
+    for index in table.indexes:
+        if ajoutees & {colonne.name for colonne in index.columns}:
+            index.create(bind=connexion, checkfirst=True)
+    return [colonne.name for colonne in absentes]
+
+
+def completer_colonne(connexion, modele, colonne: str, valeur) -> int:
+    """
+    Ajoute la colonne si elle est absente et lui donne une valeur là où elle est NULL
+
+    Returns:
+        int: Nombre de lignes complétées
+    """
+    table = modele.__table__
+    if not inspect(connexion).has_table(table.name):
+        return 0
+    ajouter_colonnes(connexion, table, [colonne])
+    resultat = connexion.execute(
+        table.update().where(table.c[colonne].is_(None)).values({colonne: valeur})
+    )
+    return resultat.rowcount
+
+
+# === MIGRATIONS ===
+
+def migrer_racines_plan_comptable(connexion) -> int:
+    """
+    Ajoute racine2/racine3 au plan comptable et les remplit depuis numero_compte
+
+    Returns:
+        int: Nombre de comptes complétés
+    """
+    if not inspect(connexion).has_table(PlanComptable.__tablename__):
+        return 0
+    ajouter_colonnes(connexion, PlanComptable.__table__, ['racine2', 'racine3'])
+    resultat = connexion.execute(text(
+        "UPDATE plan_comptable SET racine2 = substr(numero_compte, 1, 2), racine3 = substr(numero_compte, 1, 3) "
+        "WHERE racine2 IS NULL OR racine3 IS NULL"
+    ))
+    return resultat.rowcount
+
+
+def migrer_cloture_definitive(connexion) -> int:
+    """Ajoute cloture_definitif aux exercices (clôtures antérieures : provisoires)"""
+    return completer_colonne(connexion, ExerciceComptable, 'cloture_definitif', False)
+
+
+def migrer_version_droits(connexion) -> int:
+    """Ajoute version_droits aux utilisateurs (jetons à claims émis avant : version 0)"""
+    return completer_colonne(connexion, Utilisateur, 'version_droits', 0)
+
+
+def migrer_statuts_ecritures(connexion) -> int:
+    """
+    Statuts d'écriture stockés par nom ('VALIDE') convertis en valeurs ('valide')
+
+    Sous PostgreSQL, les libellés du type énuméré sont renommés ; ailleurs la
+    colonne est une chaîne mise à jour ligne à ligne. Les soldes mensuels
+    calculés avant la conversion (écritures alors ignorées) sont vidés pour être
+    reconstruits par migrer_soldes_mensuels.
+
+    Returns:
+        int: Nombre d'écritures converties
+    """
+    table = EcritureComptable.__table__
+    if not inspect(connexion).has_table(table.name):
+        return 0
+    anciens = {membre.name: membre.value for membre in StatutEcriture if membre.name != membre.value}
+    nb_ecritures = connexion.execute(text(
+        f"SELECT count(*) FROM {table.name} WHERE CAST(statut AS VARCHAR(20)) IN :noms"
+    ).bindparams(bindparam('noms', expanding=True)), {'noms': list(anciens)}).scalar()
+    if not nb_ecritures and connexion.dialect.name != 'postgresql':
+        return 0
+
+    if connexion.dialect.name == 'postgresql':
+        type_enum = table.c.statut.type.name
+        libelles = set(connexion.execute(text(
+            "SELECT e.enumlabel FROM pg_enum e JOIN pg_type t ON t.oid = e.enumtypid WHERE t.typname = :type"
+        ), {'type': type_enum}).scalars())
+        for nom, valeur in anciens.items():
+            if nom in libelles and valeur not in libelles:
+                connexion.exec_driver_sql(f"ALTER TYPE {type_enum} RENAME VALUE '{nom}' TO '{valeur}'")
+    else:
+        for nom, valeur in anciens.items():
+            connexion.execute(text(f"UPDATE {table.name} SET statut = :valeur WHERE statut = :nom"),
+                              {'nom': nom, 'valeur': valeur})
+    if nb_ecritures and inspect(connexion).has_table(SoldeMensuelCompte.__tablename__):
+        connexion.execute(SoldeMensuelCompte.__table__.delete())
+    return nb_ecritures
+
+
+def migrer_cle_soldes_mensuels(connexion) -> int:
+    """
+    Recrée la table des soldes mensuels créée avec entite_id/exercice_id nullables
+
+    Deux NULL n'entrent jamais en conflit : l'ancienne contrainte unique ne
+    pouvait pas servir de cible d'upsert. La table est un agrégat du grand
+    livre ; elle est vidée ici et reconstruite par migrer_soldes_mensuels.
+
+    Returns:
+        int: Nombre de lignes d'agrégat écartées
+    """
+    table = SoldeMensuelCompte.__table__
+    inspecteur = inspect(connexion)
+    if not inspecteur.has_table(table.name):
+        return 0
+    colonnes = {colonne['name']: colonne for colonne in inspecteur.get_columns(table.name)}
+    if not any(colonnes[nom]['nullable'] for nom in ('entite_id', 'exercice_id') if nom in colonnes):
+        return 0
+
+    nb_lignes = connexion.execute(select(func.count()).select_from(table)).scalar()
+    table.drop(bind=connexion)
+    table.create(bind=connexion)
+    return nb_lignes
+
+
+def migrer_soldes_mensuels(connexion) -> int:
+    """
+    Alimente la table des soldes mensuels quand elle est vide et que des écritures sont validées
+
+    Les rapports lisent les mois entiers dans cette table : créée vide sur une
+    base existante, elle est reconstruite depuis le grand livre.
+
+    Returns:
+        int: Nombre de lignes d'agrégat écrites
+    """
+    inspecteur = inspect(connexion)
+    if not (inspecteur.has_table(SoldeMensuelCompte.__tablename__)
+            and inspecteur.has_table(EcritureComptable.__tablename__)):
+        return 0
+    soldes = SoldeMensuelCompte.__table__
+    ecritures = EcritureComptable.__table__
+    if connexion.execute(select(soldes.c.id).limit(1)).first() is not None:
+        return 0
+    if connexion.execute(
+        select(ecritures.c.id).where(ecritures.c.statut == StatutEcriture.VALIDE).limit(1)
+    ).first() is None:
+        return 0
+
+    return reconstruire_soldes_mensuels(connexion=connexion)
+
+
+def migrer_rapprochements_uniques(connexion) -> int:
+    """Index unique des lignes rapprochées sur les mouvements bancaires existants"""
+    if inspect(connexion).has_table(MouvementBancaire.__tablename__):
+        for index in MouvementBancaire.__table__.indexes:
+            index.create(bind=connexion, checkfirst=True)
+    return 0
+
+
+def migrer_processus_taches(connexion) -> int:
+    """Ajoute aux tâches le processus qui les exécute (tâches antérieures : inconnu)"""
+    ajouter_colonnes(connexion, Tache.__table__, ['processus'])
+    return 0
+
+
+def migrer_progressions_elearning(connexion) -> int:
+    """
+    Ajoute les compteurs de leçons aux inscriptions e-learning
+
+    nb_lecons reste NULL : la progression des inscriptions existantes est
+    recalculée à leur prochaine lecture.
+    """
+    ajouter_colonnes(connexion, InscriptionFormation.__table__, ['nb_lecons'])
+    return completer_colonne(connexion, InscriptionFormation, 'lecons_terminees', 0)
+
+
+MIGRATIONS = [
+    ('racines du plan comptable', migrer_racines_plan_comptable),
+    ('clôture définitive des exercices', migrer_cloture_definitive),
+    ('version des droits des utilisateurs', migrer_version_droits),
+    ('statuts des écritures', migrer_statuts_ecritures),
+    ('clé des soldes mensuels', migrer_cle_soldes_mensuels),
+    ('soldes mensuels', migrer_soldes_mensuels),
+    ('processus des tâches', migrer_processus_taches),
+    ('rapprochements bancaires', migrer_rapprochements_uniques),
+    ('progressions e-learning', migrer_progressions_elearning),
+]
+
+
+def migrer_schema(connexion=None) -> Dict[str, int]:
+    """
+    Applique toutes les migrations (une transaction)
+
+    Returns:
+        Dict[str, int]: Lignes complétées par migration
+    """
+    if connexion is None:
+        with db.engine.begin() as connexion:
+            return migrer_schema(connexion)
+
+    resultats = {}
+    for nom, migration in MIGRATIONS:
+        resultats[nom] = migration(connexion)
+        if resultats[nom]:
+            print(f"🔧 Migration {nom} : {resultats[nom]} ligne(s) complétée(s)")
+    return resultats
@@ -0,0 +1,166 @@
+"""
+Séries temporelles comptables pour ComptaEBNL-IA
+Une seule requête GROUP BY sur une expression de troncature de date (compilée
+pour SQLite et PostgreSQL), puis complétion des périodes vides en mémoire
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import String, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from models import db, EcritureComptable, LigneEcriture
+from services.account_ranges import filtre_prefixes
+from services.monthly_balances import ZERO, to_date, to_decimal
+
+GRANULARITES = ('day', 'week', 'month', 'quarter')
+METRIQUES = ('count', 'movement', 'balance', 'cumulative')
+
+
+class tronquer_date(FunctionElement):
+    """
+    Libellé de période d'une date : 'YYYY-MM-DD' (jour, lundi de la semaine),
+    'YYYY-MM' (mois) ou 'YYYY-Qn' (trimestre)
+    """
+    type = String()
+    name = 'tronquer_date'
+    inherit_cache = False
+
+    def __init__(self, expression, granularite: str):
+        if granularite not in GRANULARITES:
+            raise ValueError(f"Granularité non supportée: {granularite}")
+        self.granularite = granularite
+        super().__init__(expression)
+
+
+@compiles(tronquer_date)
+def _tronquer_date_sqlite(element, compiler, **kw):
+    colonne = compiler.process(element.clauses, **kw)
+    if element.granularite == 'day':
+        return f"strftime('%Y-%m-%d', {colonne})"
+    if element.granularite == 'week':
+        return f"strftime('%Y-%m-%d', {colonne}, '-6 days', 'weekday 1')"
+    if element.granularite == 'month':
+        return f"strftime('%Y-%m', {colonne})"
+    return f"(strftime('%Y', {colonne}) || '-Q' || ((CAST(strftime('%m', {colonne}) AS INTEGER) + 2) / 3))"
+
+
+@compiles(tronquer_date, 'postgresql')
+def _tronquer_date_postgresql(element, compiler, **kw):
+    colonne = compiler.process(element.clauses, **kw)
+    if element.granularite == 'day':
+        return f"to_char({colonne}, 'YYYY-MM-DD')"
+    if element.granularite == 'week':
+        return f"to_char(date_trunc('week', {colonne}), 'YYYY-MM-DD')"
+    if element.granularite == 'month':
+        return f"to_char({colonne}, 'YYYY-MM')"
+    return f"to_char({colonne}, 'YYYY-\"Q\"Q')"
+
+
+def libelle_periode(jour: date, granularite: str) -> str:
+    """Même libellé que tronquer_date, calculé en Python"""
+    if granularite == 'day':
+        return jour.isoformat()
+    if granularite == 'week':
+        return (jour - timedelta(days=jour.weekday())).isoformat()
+    if granularite == 'month':
+        return f"{jour.year:04d}-{jour.month:02d}"
+    return f"{jour.year:04d}-Q{(jour.month - 1) // 3 + 1}"
+
+
+def periodes(debut: date, fin: date, granularite: str) -> List[str]:
+    """Libellés de toutes les périodes touchant [debut, fin], dans l'ordre"""
+    resultat = []
+    jour = debut
+    while jour <= fin:
+        resultat.append(libelle_periode(jour, granularite))
+        if granularite == 'day':
+            jour += timedelta(days=1)
+        elif granularite == 'week':
+            jour += timedelta(days=7 - jour.weekday())
+        else:
+            mois = jour.month + (1 if granularite == 'month' else 3 - (jour.month - 1) % 3)
+            jour = date(jour.year + (mois - 1) // 12, (mois - 1) % 12 + 1, 1)
+    return resultat
+
+
+def _filtrer(query, comptes: Optional[Iterable[str]], statut: Optional[str]):
+    if comptes:
+        query = query.filter(filtre_prefixes(LigneEcriture.numero_compte, comptes))
+    if statut:
+        query = query.filter(EcritureComptable.statut == statut)
+    return query
+
+
+def calculer_series(date_debut, date_fin, granularite: str = 'month', comptes: Optional[Iterable[str]] = None,
+                    metrique: str = 'balance', statut: Optional[str] = 'valide') -> List[Dict]:
+    """
+    Série temporelle de lignes d'écriture, toutes périodes comprises
+
+    Args:
+        date_debut: Début de période (inclus)
+        date_fin: Fin de période (incluse)
+        granularite: 'day', 'week' (lundi), 'month' ou 'quarter'
+        comptes: Préfixes de comptes (tous les comptes si vide)
+        metrique: Mesure reportée dans 'valeur' :
+            'count' (nombre d'écritures), 'movement' (débit + crédit),
+            'balance' (débit - crédit de la période),
+            'cumulative' (solde cumulé, antériorité comprise)
+        statut: Statut des écritures retenues (None : tous)
+
+    Returns:
+        List[Dict]: Un point par période {'periode', 'valeur', 'debit', 'credit', 'nb_ecritures'}
+    """
+    if metrique not in METRIQUES:
+        raise ValueError(f"Métrique non supportée: {metrique}")
+    debut, fin = to_date(date_debut), to_date(date_fin)
+    comptes = [c for c in (comptes or []) if c]
+
+    periode = tronquer_date(EcritureComptable.date_ecriture, granularite).label('periode')
+    query = db.session.query(
+        periode,
+        func.count(func.distinct(EcritureComptable.id)).label('nb_ecritures'),
+        func.sum(LigneEcriture.debit).label('total_debit'),
+        func.sum(LigneEcriture.credit).label('total_credit')
+    ).select_from(LigneEcriture).join(EcritureComptable).filter(
+        EcritureComptable.date_ecriture >= debut,
+        EcritureComptable.date_ecriture <= fin
+    )
+    agregats = {
+        ligne.periode: ligne
+        for ligne in _filtrer(query, comptes, statut).group_by(periode).all()
+    }
+
+    solde = ZERO
+    if metrique == 'cumulative':
+        anterieur = _filtrer(db.session.query(
+            func.sum(LigneEcriture.debit - LigneEcriture.credit)
+        ).select_from(LigneEcriture).join(EcritureComptable).filter(
+            EcritureComptable.date_ecriture < debut
+        ), comptes, statut).scalar()
+        solde = to_decimal(anterieur)
+
+    points = []
+    for libelle in periodes(debut, fin, granularite):
+        ligne = agregats.get(libelle)
+        debit = to_decimal(ligne.total_debit) if ligne else ZERO
+        credit = to_decimal(ligne.total_credit) if ligne else ZERO
+        nb = int(ligne.nb_ecritures) if ligne else 0
+        solde += debit - credit
+        valeur = {
+            'count': Decimal(nb),
+            'movement': debit + credit,
+            'balance': debit - credit,
+            'cumulative': solde
+        }[metrique]
+        points.append({
+            'periode': libelle,
+            'valeur': float(valeur) if metrique != 'count' else nb,
+            'debit': float(debit),
+            'credit': float(credit),
+            'nb_ecritures': nb
+        })
+    return points
@@ -0,0 +1,182 @@
+"""
+Balance comptable vectorisée pour ComptaEBNL-IA
+Construit les colonnes ouverture / mouvements / clôture en centimes entiers
+(numpy/pandas) et les sous-totaux par niveau de la hiérarchie SYCEBNL
+"""
+
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from models import db, PlanComptable
+from services.balance_engine import SoldesComptes, charger_soldes, charger_soldes_ouverture, resoudre_periode
+
+NIVEAUX_SOUS_TOTAUX = (1, 2, 3, 4)
+
+# Colonnes numériques (centimes, int64)
+COLONNES_MONTANTS = [
+    'debit_ouverture', 'credit_ouverture',
+    'debit_periode', 'credit_periode',
+    'debit_cloture', 'credit_cloture',
+    'solde_ouverture', 'mouvement_periode', 'solde_cloture',
+    'solde_debiteur', 'solde_crediteur'
+]
+
+
+def en_centimes(montant) -> int:
+    """Montant Decimal -> centimes entiers (arrondi au centime)"""
+    return int((Decimal(montant) * 100).to_integral_value())
+
+
+def en_montant(centimes) -> Decimal:
+    """Centimes entiers -> montant Decimal exact à deux décimales"""
+    return Decimal(int(centimes)).scaleb(-2)
+
+
+def _colonnes(soldes: SoldesComptes, prefixe: str) -> pd.DataFrame:
+    """Totaux d'un jeu de soldes sous forme de colonnes (numero_compte, débit, crédit)"""
+    numeros = list(soldes.totaux)
+    # Montants NUMERIC(15, 2) : exacts au centime près en float64
+    montants = np.rint(
+        np.array(list(soldes.totaux.values()), dtype=np.float64).reshape(-1, 2) * 100
+    ).astype(np.int64)
+    return pd.DataFrame(
+        {f'debit_{prefixe}': montants[:, 0], f'credit_{prefixe}': montants[:, 1]},
+        index=pd.Index(numeros, name='numero_compte', dtype=object)
+    )
+
+
+def _en_unites(df: pd.DataFrame) -> List[Dict]:
+    """Montants en centimes -> enregistrements en float (format JSON de l'API)"""
+    return (df[COLONNES_MONTANTS] / 100).to_dict('records')
+
+
+def _referentiel(numeros: List[str]) -> pd.DataFrame:
+    """Libellé, classe et niveau des comptes (une requête, colonnes seulement)"""
+    lignes = db.session.query(
+        PlanComptable.numero_compte, PlanComptable.libelle_compte,
+        PlanComptable.classe, PlanComptable.niveau
+    ).filter(PlanComptable.numero_compte.in_(numeros)).all() if numeros else []
+    return pd.DataFrame(
+        lignes, columns=['numero_compte', 'libelle_compte', 'classe', 'niveau']
+    ).set_index('numero_compte')
+
+
+def _completer(df: pd.DataFrame) -> pd.DataFrame:
+    """Colonnes de clôture, soldes et répartition débiteur/créditeur (vectorisé)"""
+    df['debit_cloture'] = df['debit_ouverture'] + df['debit_periode']
+    df['credit_cloture'] = df['credit_ouverture'] + df['credit_periode']
+    df['solde_ouverture'] = df['debit_ouverture'] - df['credit_ouverture']
+    df['mouvement_periode'] = df['debit_periode'] - df['credit_periode']
+    df['solde_cloture'] = df['debit_cloture'] - df['credit_cloture']
+    df['solde_debiteur'] = np.maximum(df['solde_cloture'].to_numpy(), 0)
+    df['solde_crediteur'] = np.maximum(-df['solde_cloture'].to_numpy(), 0)
+    return df
+
+
+class BalanceComptable:
+    """
+    Balance à colonnes ouverture / période / clôture
+
+    `lignes` est un DataFrame indexé par numéro de compte, montants en
+    centimes entiers ; les conversions en Decimal/float ne se font qu'à la sortie.
+    """
+
+    def __init__(self, lignes: pd.DataFrame):
+        self.lignes = lignes
+
+    def totaux(self) -> Dict[str, int]:
+        """Totaux généraux en centimes"""
+        return {colonne: int(self.lignes[colonne].sum()) for colonne in COLONNES_MONTANTS}
+
+    def sous_totaux(self, niveau: int) -> pd.DataFrame:
+        """Cumuls des comptes regroupés sur les `niveau` premiers chiffres"""
+        df = self.lignes
+        if df.empty:
+            return df.iloc[0:0][COLONNES_MONTANTS]
+        cles = df.index.to_series().str[:niveau]
+        cumuls = df[COLONNES_MONTANTS].groupby(cles.to_numpy()).sum()
+        cumuls.index.name = 'prefixe'
+        # Solde débiteur/créditeur recalculé sur le cumul, pas sommé compte à compte
+        cumuls['solde_debiteur'] = np.maximum(cumuls['solde_cloture'].to_numpy(), 0)
+        cumuls['solde_crediteur'] = np.maximum(-cumuls['solde_cloture'].to_numpy(), 0)
+        return cumuls
+
+    def filtrer(self, classe: Optional[int] = None, niveau: Optional[int] = None) -> 'BalanceComptable':
+        """Restreint la balance à une classe et/ou aux comptes de niveau <= niveau"""
+        masque = np.ones(len(self.lignes), dtype=bool)
+        if classe:
+            masque &= (self.lignes['classe'] == classe).to_numpy()
+        if niveau:
+            masque &= (self.lignes['niveau'] <= niveau).to_numpy()
+        return BalanceComptable(self.lignes[masque])
+
+    def lignes_dict(self) -> List[Dict]:
+        """Lignes de détail avec montants en float (format JSON de l'API)"""
+        df = self.lignes
+        return [
+            dict({'numero_compte': numero, 'libelle_compte': libelle, 'classe': classe, 'niveau': niveau}, **montants)
+            for numero, libelle, classe, niveau, montants in zip(
+                df.index, df['libelle_compte'].tolist(), df['classe'].tolist(), df['niveau'].tolist(), _en_unites(df)
+            )
+        ]
+
+    def sous_totaux_dict(self, niveaux=NIVEAUX_SOUS_TOTAUX) -> Dict[str, List[Dict]]:
+        """Sous-totaux par niveau, libellés repris du plan comptable quand le préfixe y figure"""
+        sous_totaux = {niveau: self.sous_totaux(niveau) for niveau in niveaux}
+        prefixes = sorted({p for df in sous_totaux.values() for p in df.index})
+        libelles = dict(db.session.query(
+            PlanComptable.numero_compte, PlanComptable.libelle_compte
+        ).filter(PlanComptable.numero_compte.in_(prefixes))) if prefixes else {}
+
+        return {
+            str(niveau): [
+                dict({'prefixe': prefixe, 'libelle': libelles.get(prefixe, '')}, **montants)
+                for prefixe, montants in zip(df.index, _en_unites(df))
+            ]
+            for niveau, df in sous_totaux.items()
+        }
+
+
+def construire_balance(date_debut=None, date_fin=None, exercice_id=None) -> BalanceComptable:
+    """
+    Construit la balance d'une période
+
+    Sans date de début, toute l'activité jusqu'à date_fin est comptée en
+    mouvements et l'ouverture est nulle ; avec une date de début, les lignes
+    antérieures (dans l'exercice si fourni) alimentent l'ouverture. Avec un
+    exercice, la période part de son ouverture et ses à-nouveaux sont repris.
+
+    Args:
+        date_debut: Début de la période (inclus), optionnel
+        date_fin: Fin de la période (incluse), optionnelle
+        exercice_id: ID de l'exercice encadrant le calcul, optionnel
+
+    Returns:
+        BalanceComptable: Balance avec montants en centimes
+    """
+    if not date_debut and exercice_id:
+        date_debut, _ = resoudre_periode(None, None, exercice_id)
+    if date_debut:
+        ouverture, periode = charger_soldes_ouverture(date_debut, date_fin, exercice_id)
+    else:
+        ouverture, periode = SoldesComptes(), charger_soldes(None, date_fin, exercice_id)
+
+    df = _colonnes(ouverture, 'ouverture').join(_colonnes(periode, 'periode'), how='outer')
+    df = df.fillna(0).astype(np.int64).sort_index()
+    df = _completer(df)
+
+    referentiel = _referentiel(list(df.index))
+    df = df.join(referentiel, how='left')
+    # Comptes mouvementés absents du plan : classe déduite du premier chiffre
+    manquants = df['classe'].isna().to_numpy()
+    if manquants.any():
+        df.loc[manquants, 'libelle_compte'] = ''
+        df.loc[manquants, 'classe'] = df.index[manquants].str[0].astype(int)
+        df.loc[manquants, 'niveau'] = 0
+    df['classe'] = df['classe'].astype(np.int64)
+    df['niveau'] = df['niveau'].astype(np.int64)
+
+    return BalanceComptable(df)
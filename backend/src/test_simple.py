@@ -108,7 +108,7 @@ def test_comptaebnl():
             print(f"   Montant: {ecriture.montant_total}€")
             print(f"   Équilibrée: {'✅' if ecriture.is_equilibree() else '❌'}")
             print(f"   Statut: {ecriture.statut.value}")
-            print(f"   Lignes: {ecriture.lignes.count()}")
+            print(f"   Lignes: {len(ecriture.lignes)}")
             
             # Test de validation
             try:
@@ -33,4 +33,79 @@ def test_plan_data():
         "prix": 49000,
         "fonctionnalites": ["feature1", "feature2"],
         "quota_utilisateurs": 5
-    }
\ No newline at end of file
+    }
+
+@pytest.fixture
+def app():
+    """Application Flask avec les blueprints API sur une base SQLite en mémoire"""
+    from flask import Flask
+    from models import db, init_default_data
+    from api import create_api_blueprints
+    from middleware.query_profiler import init_profilage
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        METRICS_BUDGET_STRICT=True
+    )
+    db.init_app(app)
+    create_api_blueprints(app)
+    init_profilage(app)
+
+    with app.app_context():
+        db.create_all()
+        init_default_data()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Client de test Flask"""
+    return app.test_client()
+
+
+@pytest.fixture
+def creer_ecriture(app):
+    """Fabrique d'écritures validées : creer_ecriture('2024-03-01', [('512', 100, 0), ('7561', 0, 100)])"""
+    from datetime import datetime
+    from decimal import Decimal
+    from models import db, EcritureComptable, LigneEcriture, PlanComptable
+    from services.monthly_balances import appliquer_ecriture
+
+    def _creer(date_ecriture, lignes, journal='OD', libelle='Écriture de test', statut='valide'):
+        for numero, _, _ in lignes:
+            if not PlanComptable.query.filter_by(numero_compte=numero).first():
+                db.session.add(PlanComptable(
+                    numero_compte=numero,
+                    libelle_compte=f'Compte {numero}',
+                    classe=int(numero[0]),
+                    niveau=min(len(numero) - 1, 3)
+                ))
+        ecriture = EcritureComptable(
+            date_ecriture=datetime.strptime(date_ecriture, '%Y-%m-%d').date(),
+            libelle=libelle,
+            journal=journal,
+            montant_total=Decimal(str(sum(debit for _, debit, _ in lignes))),
+            statut=statut
+        )
+        db.session.add(ecriture)
+        db.session.flush()
+        for numero, debit, credit in lignes:
+            db.session.add(LigneEcriture(
+                ecriture_id=ecriture.id,
+                numero_compte=numero,
+                libelle=libelle,
+                debit=Decimal(str(debit)),
+                credit=Decimal(str(credit))
+            ))
+        db.session.flush()
+        if statut == 'valide':
+            appliquer_ecriture(ecriture)
+        db.session.commit()
+        return ecriture
+
+    return _creer
@@ -0,0 +1,53 @@
+"""
+Tests des filtres de comptes par plage de préfixe
+"""
+
+from sqlalchemy import text
+
+from models import db, PlanComptable, LigneEcriture
+from services.account_ranges import borne_superieure, filtre_prefixe, filtre_prefixes, filtre_plan_comptable
+
+
+def test_borne_superieure():
+    assert borne_superieure('512') == '513'
+    assert borne_superieure('519') == '52'
+    assert borne_superieure('5999') == '6'
+    assert borne_superieure('99') is None
+    assert borne_superieure('OD-') == 'OD.'
+
+
+def test_filtre_equivalent_a_like(app, creer_ecriture):
+    creer_ecriture('2024-03-01', [('512', 1, 0), ('5121', 1, 0), ('5129', 1, 0), ('513', 0, 1), ('5', 0, 1), ('99', 0, 1)])
+
+    def comptes(condition):
+        return sorted({n for (n,) in db.session.query(LigneEcriture.numero_compte).filter(condition)})
+
+    assert comptes(filtre_prefixe(LigneEcriture.numero_compte, '512')) == ['512', '5121', '5129']
+    assert comptes(filtre_prefixe(LigneEcriture.numero_compte, '9')) == ['99']
+    assert comptes(filtre_prefixes(LigneEcriture.numero_compte, ['513', '99'])) == ['513', '99']
+
+
+def test_chemin_materialise(app):
+    db.session.add(PlanComptable(numero_compte='6061', libelle_compte='Fournitures', classe=6, niveau=3))
+    db.session.add(PlanComptable(numero_compte='6071', libelle_compte='Marchandises', classe=6, niveau=3))
+    db.session.execute(PlanComptable.__table__.insert().values(
+        numero_compte='6068', libelle_compte='Autres', classe=6, niveau=3
+    ))
+    db.session.commit()
+
+    compte = PlanComptable.query.filter_by(numero_compte='6068').one()
+    assert (compte.racine2, compte.racine3) == ('60', '606')
+
+    def numeros(prefixe):
+        return [c.numero_compte for c in PlanComptable.query.filter(filtre_plan_comptable(prefixe)).order_by(PlanComptable.numero_compte)]
+
+    assert numeros('606') == ['6061', '6068']
+    assert numeros('60') == ['6061', '6068', '6071']
+    assert numeros('6071') == ['6071']
+
+
+def test_plan_requete_utilise_index(app):
+    requete = db.session.query(LigneEcriture.id).filter(filtre_prefixe(LigneEcriture.numero_compte, '512'))
+    sql = str(requete.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    plan = ' '.join(str(ligne[-1]) for ligne in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+    assert plan.startswith('SEARCH') and 'numero_compte>?' in plan
@@ -0,0 +1,90 @@
+"""
+Tests du registre en mémoire du plan comptable
+"""
+
+import pytest
+
+from middleware.query_profiler import compter_requetes
+from models import db, PlanComptable
+from services.account_registry import CLE_VERSION, get_registre
+from services.report_cache import incrementer_version
+
+
+@pytest.fixture
+def plan(app):
+    """Extrait du plan : classe 7, compte 75, 756 et ses sous-comptes"""
+    classe = PlanComptable(numero_compte='7', libelle_compte='Comptes de produits', classe=7, niveau=0)
+    db.session.add(classe)
+    db.session.flush()
+    principal = PlanComptable(numero_compte='75', libelle_compte='Autres produits', classe=7, niveau=1,
+                              parent_id=classe.id)
+    db.session.add(principal)
+    db.session.flush()
+    dons = PlanComptable(numero_compte='756', libelle_compte='Dons et legs', classe=7, niveau=2,
+                         parent_id=principal.id)
+    db.session.add(dons)
+    db.session.flush()
+    db.session.add_all([
+        PlanComptable(numero_compte='7561', libelle_compte='Dons manuels reçus', classe=7, niveau=3, parent_id=dons.id),
+        PlanComptable(numero_compte='7562', libelle_compte='Legs et donations', classe=7, niveau=3, parent_id=dons.id),
+        PlanComptable(numero_compte='5211', libelle_compte='Banques locales', classe=5, niveau=3),
+    ])
+    db.session.commit()
+
+
+def test_index_et_navigation(app, plan):
+    registre = get_registre()
+
+    with compter_requetes(budget=0):
+        assert registre.par_prefixe('756') == ['756', '7561', '7562']
+        assert registre.par_prefixe('75') == ['75', '756', '7561', '7562']
+        assert registre.par_prefixe('9') == []
+        assert '7561' in registre and '7569' not in registre
+
+        assert registre.rechercher_libelle('recus') == ['7561']
+        assert registre.rechercher_libelle('DON') == ['756', '7561', '7562']  # début de mot : dons, donations
+        assert registre.rechercher_libelle('dons leg') == ['756']
+        assert registre.rechercher_libelle('dons et legs', exact=True) == ['756']
+
+        assert registre.par_classe == {7: 5, 5: 1}
+        assert registre.par_niveau == {0: 1, 1: 1, 2: 1, 3: 3}
+        assert registre.parent('7561')['numero_compte'] == '756'
+        assert [enfant['numero_compte'] for enfant in registre.enfants_de('756')] == ['7561', '7562']
+
+
+def test_rechargement_apres_modification(app, plan):
+    assert get_registre().libelle('7561') == 'Dons manuels reçus'
+
+    compte = PlanComptable.query.filter_by(numero_compte='7561').first()
+    compte.libelle_compte = 'Dons manuels'
+    db.session.add(PlanComptable(numero_compte='7563', libelle_compte='Mécénat', classe=7, niveau=3))
+    db.session.commit()
+
+    registre = get_registre()
+    assert registre.libelle('7561') == 'Dons manuels'
+    assert registre.rechercher_libelle('mecenat') == ['7563']
+
+    # Modification par un autre processus : seule la version en base avance
+    db.session.execute(PlanComptable.__table__.insert().values(
+        numero_compte='7564', libelle_compte='Quêtes', classe=7, niveau=3, actif=True, racine2='75', racine3='756'
+    ))
+    incrementer_version(entite_id=CLE_VERSION)
+    db.session.commit()
+    assert '7564' not in get_registre()  # dans le délai REGISTRE_COMPTES_TTL
+
+    app.config['REGISTRE_COMPTES_TTL'] = 0
+    assert '7564' in get_registre()
+
+
+def test_endpoints_sans_requete(app, client, plan):
+    client.get('/api/v1/plan-comptable/stats')
+
+    with compter_requetes(budget=0):
+        stats = client.get('/api/v1/plan-comptable/stats').get_json()['data']
+        compte = client.get('/api/v1/plan-comptable/compte/756').get_json()['data']
+        recherche = client.get('/api/v1/plan-comptable/search?q=legs').get_json()['data']
+
+    assert stats['total_comptes'] == 6
+    assert {'numero': '756', 'description': 'Dons et legs', 'presente': True} in stats['comptes_specifiques_ebnl']
+    assert compte['parent']['numero_compte'] == '75' and len(compte['enfants']) == 2
+    assert [c['numero_compte'] for c in recherche] == ['756', '7562']
@@ -0,0 +1,127 @@
+"""
+Tests du cache des contextes d'authentification (token_required, permission_required)
+"""
+
+import datetime
+
+import jwt
+import pytest
+
+from api.utilisateurs import JWT_ALGORITHM, JWT_SECRET
+from middleware.query_profiler import compter_requetes
+from models import db, Utilisateur
+from services.auth_context import (
+    CacheContextesAuth, ContexteAuth, bit_permission, claims_auth, masque_role
+)
+
+
+@pytest.fixture
+def utilisateurs(app):
+    """Un administrateur et un consultant (identifiants)"""
+    admin = Utilisateur(nom_utilisateur='admin', email='admin@ebnl.org', mot_de_passe_hash='x',
+                        role='administrateur', actif=True)
+    consultant = Utilisateur(nom_utilisateur='consultant', email='consultant@ebnl.org', mot_de_passe_hash='x',
+                             role='consultant', actif=True)
+    db.session.add_all([admin, consultant])
+    db.session.commit()
+    return admin.id, consultant.id
+
+
+def entetes(user_id, claims=False, emis_le=None):
+    utilisateur = db.session.get(Utilisateur, user_id)
+    maintenant = emis_le or datetime.datetime.now(datetime.timezone.utc)
+    payload = {
+        'user_id': utilisateur.id,
+        'nom_utilisateur': utilisateur.nom_utilisateur,
+        'iat': maintenant,
+        'exp': maintenant + datetime.timedelta(hours=1)
+    }
+    if claims:
+        payload['auth'] = claims_auth(utilisateur)
+    jeton = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    # Chaque requête HTTP part d'une session vide (pas de carte d'identité partagée avec le test)
+    db.session.expunge_all()
+    return {'Authorization': f'Bearer {jeton}'}
+
+
+def modifier(user_id, **valeurs):
+    utilisateur = db.session.get(Utilisateur, user_id)
+    for attribut, valeur in valeurs.items():
+        setattr(utilisateur, attribut, valeur)
+    db.session.commit()
+
+
+def test_aucune_requete_une_fois_en_cache(app, client, utilisateurs):
+    admin, consultant = utilisateurs
+    jeton = entetes(consultant)
+    assert client.get('/api/v1/roles', headers=jeton).status_code == 200
+
+    with compter_requetes(budget=0):
+        assert client.get('/api/v1/roles', headers=jeton).status_code == 200
+        # Permission refusée sans relire l'utilisateur
+        assert client.get('/api/v1/utilisateurs', headers=jeton).status_code == 403
+
+    assert client.get('/api/v1/roles').status_code == 401
+    assert client.get('/api/v1/roles', headers={'Authorization': 'Bearer abc'}).status_code == 401
+    # Profil complet : chargé à la demande
+    assert client.get('/api/v1/auth/me', headers=entetes(consultant)).get_json()['data']['email'] == 'consultant@ebnl.org'
+
+
+def test_invalidation_apres_modification(app, client, utilisateurs):
+    admin, consultant = utilisateurs
+    assert client.get('/api/v1/stats', headers=entetes(consultant)).status_code == 403
+
+    modifier(consultant, role='administrateur')
+    assert client.get('/api/v1/stats', headers=entetes(consultant)).status_code == 200
+
+    modifier(consultant, actif=False)
+    assert client.get('/api/v1/roles', headers=entetes(consultant)).status_code == 401
+
+    # Entrée expirée : relue en base
+    app.config['AUTH_CACHE_TTL'] = 0
+    jeton_admin = entetes(admin)
+    with compter_requetes() as collecteur:
+        client.get('/api/v1/roles', headers=jeton_admin)
+    assert collecteur.nb_requetes == 1
+
+
+def test_claims_du_jeton(app, client, utilisateurs):
+    admin, consultant = utilisateurs
+    app.config['AUTH_CLAIMS_JWT'] = True
+    emis_le = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5)
+    ancien_jeton = entetes(consultant, claims=True, emis_le=emis_le)
+
+    # Version des droits relue (clé primaire), rôle et permissions pris dans le jeton
+    with compter_requetes() as collecteur:
+        assert client.get('/api/v1/roles', headers=ancien_jeton).status_code == 200
+    assert collecteur.nb_requetes == 1
+    with compter_requetes(budget=0):
+        assert client.get('/api/v1/roles', headers=ancien_jeton).status_code == 200
+
+    # Désactivation par un autre processus : rien n'est invalidé ici, la version en base suffit
+    app.config['AUTH_CACHE_TTL'] = 0
+    modifier(consultant, actif=False)
+    assert db.session.get(Utilisateur, consultant).version_droits == 1
+    app.extensions['contextes_auth'] = CacheContextesAuth()
+    db.session.expunge_all()
+    assert client.get('/api/v1/roles', headers=ancien_jeton).status_code == 401
+
+    # Connexion sans changement de droits : la version ne bouge pas
+    modifier(admin, derniere_connexion=datetime.datetime.utcnow())
+    assert client.get('/api/v1/roles', headers=entetes(admin, claims=True)).status_code == 200
+    assert db.session.get(Utilisateur, admin).version_droits == 0
+
+
+def test_masques_et_lru():
+    assert masque_role('administrateur') & bit_permission('permission.declaree.apres')
+    assert masque_role('comptable') & bit_permission('ecriture.validate')
+    assert not masque_role('consultant') & bit_permission('ecriture.create')
+    assert masque_role('inconnu') == 0
+
+    cache = CacheContextesAuth(taille=2)
+    for user_id in (1, 2):
+        cache.put(ContexteAuth(user_id, f'u{user_id}', 'consultant', True))
+    assert cache.get(1, ttl=60) is not None  # 1 devient le plus récent
+    cache.put(ContexteAuth(3, 'u3', 'consultant', True))
+    assert cache.get(2, ttl=60) is None and len(cache) == 2
+    assert cache.get(1, ttl=0) is None
@@ -0,0 +1,60 @@
+"""
+Tests du moteur de soldes SYCEBNL (agrégation unique + remontée par préfixe)
+"""
+
+from decimal import Decimal
+
+from services.balance_engine import SoldesComptes, charger_soldes, charger_soldes_ouverture
+
+
+def test_remontee_prefixes():
+    """Les totaux d'un compte remontent sur tous ses préfixes"""
+    soldes = SoldesComptes({
+        '5211': (Decimal('100'), Decimal('0')),
+        '5212': (Decimal('50'), Decimal('20')),
+        '571': (Decimal('10'), Decimal('0'))
+    })
+
+    assert soldes.solde_decimal('5') == Decimal('140')
+    assert soldes.solde_decimal('52') == Decimal('130')
+    assert soldes.solde('5212') == {'debit': 50.0, 'credit': 20.0, 'solde': 30.0}
+    assert soldes.solde('6') == {'debit': 0.0, 'credit': 0.0, 'solde': 0.0}
+
+
+def test_charger_soldes_une_requete(app, creer_ecriture):
+    """Seules les écritures validées de la période sont agrégées"""
+    creer_ecriture('2024-01-10', [('5211', 100, 0), ('7561', 0, 100)])
+    creer_ecriture('2024-02-10', [('6061', 40, 0), ('5211', 0, 40)])
+    creer_ecriture('2024-02-11', [('6061', 999, 0), ('5211', 0, 999)], statut='brouillard')
+    creer_ecriture('2025-01-05', [('5211', 7, 0), ('7561', 0, 7)])
+
+    soldes = charger_soldes(date_debut='2024-01-01', date_fin='2024-12-31')
+
+    assert soldes.solde_decimal('52') == Decimal('60')
+    assert soldes.solde_decimal('6') == Decimal('40')
+    assert soldes.solde_decimal('7') == Decimal('-100')
+
+
+def test_charger_soldes_ouverture(app, creer_ecriture):
+    """Ouverture et mouvements de la période sont séparés en une seule agrégation"""
+    creer_ecriture('2023-12-20', [('5211', 500, 0), ('101', 0, 500)])
+    creer_ecriture('2024-03-01', [('5211', 100, 0), ('7561', 0, 100)])
+
+    ouverture, mouvements = charger_soldes_ouverture('2024-01-01', date_fin='2024-12-31')
+
+    assert ouverture.solde_decimal('52') == Decimal('500')
+    assert mouvements.solde_decimal('52') == Decimal('100')
+    assert ouverture.combiner(mouvements).solde_decimal('5') == Decimal('600')
+
+
+def test_bilan_equilibre(client, creer_ecriture):
+    """Le bilan est calculé à partir des soldes cumulés par préfixe"""
+    creer_ecriture('2024-01-10', [('5211', 300, 0), ('101', 0, 300)])
+
+    response = client.get('/api/v1/bilan?date_fin=2024-12-31')
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert data['actif']['ACTIF_CIRCULANT']['comptes']['52']['solde'] == 300.0
+    assert data['passif']['RESSOURCES_DURABLES']['comptes']['10']['solde'] == 300.0
+    assert data['equilibre']['equilibre'] is True
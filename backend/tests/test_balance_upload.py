@@ -0,0 +1,73 @@
+"""
+Tests de l'import des balances (lecture en colonnes et lecture en flux)
+"""
+
+import io
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from services.balance_upload import FormatBalanceInvalide, iterer_lots_csv, preparer_lignes
+
+CONTENU = (
+    "Numéro Compte;Libellé compte;Solde débiteur;Solde créditeur;Mouvement débit\n"
+    "5211;Banque;1 234,50;;2000\n"
+    ";;;;\n"
+    "7561;Dons;;980;\n"
+    "ABC;Compte texte;10;;\n"
+    "6061;;abc;-5;\n"
+    "5211;Banque bis;1;;\n"
+    "4011;Fournisseurs;10;20;\n"
+)
+
+
+def _colonnes(contenu):
+    return preparer_lignes(pd.read_csv(io.StringIO(contenu), sep=';', dtype=str, keep_default_na=False), 7)
+
+
+def _flux(contenu, taille_lot=1000):
+    lignes, erreurs = [], []
+    for lot, erreurs_lot in iterer_lots_csv(io.StringIO(contenu), 7, ';', taille_lot):
+        lignes.extend(lot)
+        erreurs.extend(erreurs_lot)
+    return lignes, erreurs
+
+
+def test_conversion_en_colonnes():
+    lignes, _ = _colonnes(CONTENU)
+    assert [ligne['numero_compte'] for ligne in lignes] == ['5211', '7561']
+    banque = lignes[0]
+    assert banque['balance_id'] == 7 and banque['ligne_fichier'] == 2
+    assert banque['solde_debiteur'] == 1234.5 and banque['solde_crediteur'] == 0
+    assert banque['mouvement_debit'] == 2000 and banque['mouvement_credit'] == 0
+
+
+def test_toutes_les_erreurs_signalees():
+    _, erreurs = _colonnes(CONTENU)
+    assert erreurs == [
+        "Ligne 5: Numéro de compte invalide 'ABC'",
+        "Ligne 6: Libellé du compte manquant",
+        "Ligne 6: Montants négatifs non autorisés",
+        "Ligne 6: Montant solde_debiteur invalide 'abc'",
+        "Ligne 7: Compte déjà présent plus haut dans le fichier",
+        "Ligne 8: Une ligne ne peut avoir à la fois un solde débiteur et un solde créditeur",
+    ]
+
+
+def test_lecture_en_flux_identique():
+    lignes_colonnes, erreurs_colonnes = _colonnes(CONTENU)
+    lignes_flux, erreurs_flux = _flux(CONTENU, taille_lot=1)
+
+    assert erreurs_flux == erreurs_colonnes
+    assert [ligne['solde_debiteur'] for ligne in lignes_flux] == [Decimal('1234.50'), Decimal('0.00')]
+    assert [{cle: float(valeur) if isinstance(valeur, Decimal) else valeur for cle, valeur in ligne.items()}
+            for ligne in lignes_flux] == lignes_colonnes
+
+
+def test_colonnes_requises():
+    contenu = "numero_compte,libelle_compte\n5211,Banque\n"
+    with pytest.raises(FormatBalanceInvalide, match='solde_debiteur'):
+        preparer_lignes(pd.read_csv(io.StringIO(contenu), dtype=str), 1)
+    with pytest.raises(FormatBalanceInvalide):
+        next(iterer_lots_csv(io.StringIO(contenu), 1))
@@ -0,0 +1,117 @@
+"""
+Tests de l'import des relevés bancaires (CSV, OFX, CAMT.053) et du rapprochement sur mouvements enregistrés
+"""
+
+import io
+
+from models import MouvementBancaire
+from services.bank_statements import lire_ofx, lire_camt053, empreinte_mouvement
+
+CSV = (
+    "Date;Libelle;Montant;Reference\n"
+    "2024-03-05;Don Dupont mars;150,00;DON001\n"
+    "2024-03-07;Frais tenue compte;-2,50;\n"
+    "2024-03-07;Frais tenue compte;-2,50;\n"
+)
+
+OFX = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240305120000<TRNAMT>150.00<FITID>A1<NAME>DON DUPONT</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240306<TRNAMT>-80.00<FITID>A2<NAME>PRLV EDF<MEMO>Facture</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+CAMT = """<?xml version="1.0"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02"><BkToCstmrStmt><Stmt>
+<Ntry><Amt Ccy="XOF">80.00</Amt><CdtDbtInd>DBIT</CdtDbtInd><BookgDt><Dt>2024-03-06</Dt></BookgDt>
+<AcctSvcrRef>REF-1</AcctSvcrRef><NtryDtls><TxDtls><RmtInf><Ustrd>Facture EDF</Ustrd></RmtInf></TxDtls></NtryDtls></Ntry>
+</Stmt></BkToCstmrStmt></Document>
+"""
+
+
+def _importer(client, contenu, nom):
+    return client.post('/api/v1/rapprochement/import-releve', data={
+        'file': (io.BytesIO(contenu.encode('utf-8')), nom), 'compte': '5121'
+    }, content_type='multipart/form-data')
+
+
+def test_lecteurs_ofx_et_camt():
+    """Les lecteurs OFX et CAMT.053 produisent des mouvements signés"""
+    ofx = list(lire_ofx(io.BytesIO(OFX.encode('latin-1'))))
+    assert [(m['date'].isoformat(), str(m['montant']), m['id_banque']) for m in ofx] == [
+        ('2024-03-05', '150.00', 'A1'), ('2024-03-06', '-80.00', 'A2')
+    ]
+    assert ofx[1]['libelle'] == 'PRLV EDF Facture'
+
+    camt = list(lire_camt053(io.BytesIO(CAMT.encode('utf-8'))))
+    assert [(str(m['montant']), m['libelle'], m['id_banque']) for m in camt] == [('-80.00', 'Facture EDF', 'REF-1')]
+
+
+def test_empreinte_stable():
+    """L'empreinte dépend du contenu et du rang d'occurrence, pas du processus"""
+    from datetime import date
+    mouvement = {'date': date(2024, 3, 7), 'libelle': 'Frais  tenue compte', 'montant': -2.5}
+    assert empreinte_mouvement('5121', mouvement) == empreinte_mouvement('5121', dict(mouvement, libelle='frais tenue compte'))
+    assert empreinte_mouvement('5121', mouvement, 1) != empreinte_mouvement('5121', mouvement, 2)
+
+
+def test_import_dedoublonne(app, client):
+    """Deux frais identiques sont conservés, un second import du même fichier n'ajoute rien"""
+    premier = _importer(client, CSV, 'releve.csv').get_json()['data']
+    assert (premier['format'], premier['lus'], premier['importes']) == ('csv', 3, 3)
+
+    second = _importer(client, CSV, 'releve.csv').get_json()['data']
+    assert (second['importes'], second['doublons']) == (0, 3)
+
+    assert _importer(client, OFX, 'releve.ofx').get_json()['data']['importes'] == 2
+    assert _importer(client, CAMT, 'releve.xml').get_json()['data']['format'] == 'camt053'
+    assert MouvementBancaire.query.count() == 6
+
+
+def test_rapprochement_sur_mouvements_enregistres(app, client, creer_ecriture):
+    """Sans mouvements dans la requête, les mouvements importés sont rapprochés par lots"""
+    creer_ecriture('2024-03-05', [('5121', 150, 0), ('7561', 0, 150)], journal='BQ', libelle='Don Dupont mars')
+    _importer(client, CSV, 'releve.csv')
+
+    response = client.post('/api/v1/rapprochement/correspondances', json={
+        'date_debut': '2024-03-01', 'date_fin': '2024-03-31', 'taille_lot': 1
+    })
+    correspondances = response.get_json()['data']['correspondances']
+
+    assert len(correspondances) == 3
+    assert correspondances[0]['statut'] == 'automatique'
+    assert correspondances[0]['mouvement_bancaire']['reference'] == 'DON001'
+
+
+def test_validation_d_une_correspondance(app, client, creer_ecriture):
+    """Le rapprochement accepté retire le mouvement et la ligne des candidats suivants"""
+    creer_ecriture('2024-03-05', [('5121', 150, 0), ('7561', 0, 150)], journal='BQ', libelle='Don Dupont mars')
+    _importer(client, CSV, 'releve.csv')
+    periode = {'date_debut': '2024-03-01', 'date_fin': '2024-03-31'}
+
+    correspondance = client.post('/api/v1/rapprochement/correspondances', json=periode).get_json()['data']['correspondances'][0]
+    mouvement_id = correspondance['mouvement_bancaire']['id']
+    ligne_id = correspondance['correspondances_trouvees'][0]['ligne_id']
+    frais = MouvementBancaire.query.filter(MouvementBancaire.id != mouvement_id).first()
+
+    # Montant différent : refusé
+    response = client.post(f'/api/v1/rapprochement/mouvements/{frais.id}/rapprocher', json={'ligne_id': ligne_id})
+    assert response.status_code == 400
+
+    response = client.post(f'/api/v1/rapprochement/mouvements/{mouvement_id}/rapprocher',
+                           json={'ligne_id': ligne_id, 'score': correspondance['correspondances_trouvees'][0]['scores']['global']})
+    assert response.status_code == 200
+    assert response.get_json()['data']['statut'] == 'rapproche'
+    assert response.get_json()['data']['ligne_ecriture_id'] == ligne_id
+
+    # La ligne n'est plus proposée, le mouvement n'est plus relu
+    correspondances = client.post('/api/v1/rapprochement/correspondances', json=periode).get_json()['data']['correspondances']
+    assert len(correspondances) == 2
+    assert all(not c['correspondances_trouvees'] for c in correspondances)
+    non_rapprochees = client.get('/api/v1/rapprochement/ecritures-non-rapprochees',
+                                 query_string={**periode, 'compte': '5121'}).get_json()['data']
+    assert non_rapprochees['total'] == 0
+
+    response = client.delete(f'/api/v1/rapprochement/mouvements/{mouvement_id}/rapprocher')
+    assert response.get_json()['data']['statut'] == 'non_rapproche'
+    assert len(client.post('/api/v1/rapprochement/correspondances', json=periode).get_json()['data']['correspondances']) == 3
@@ -0,0 +1,33 @@
+"""
+Tests de la pagination par curseur de /ecritures
+"""
+
+
+def test_pagination_par_curseur(app, client, creer_ecriture):
+    """Les pages successives couvrent toutes les écritures sans doublon"""
+    for jour in (1, 1, 2, 3, 3, 3, 4):
+        creer_ecriture(f'2024-03-0{jour}', [('5211', 10, 0), ('7561', 0, 10)])
+
+    vus, curseur = [], None
+    while True:
+        url = '/api/v1/ecritures?limit=3' + (f'&cursor={curseur}' if curseur else '')
+        corps = client.get(url).get_json()
+        vus.extend(e['id'] for e in corps['data'])
+        curseur = corps['pagination']['next_cursor']
+        if not curseur:
+            break
+
+    assert len(vus) == 7 and len(set(vus)) == 7
+    premiere = client.get('/api/v1/ecritures?limit=3').get_json()['pagination']
+    assert premiere['total'] == 7 and premiere['has_more']
+    assert client.get('/api/v1/ecritures?cursor=%%%').status_code == 400
+
+
+def test_filtre_compte_sans_doublon(app, client, creer_ecriture):
+    """Une écriture mouvementant deux fois le compte filtré n'apparaît qu'une fois"""
+    creer_ecriture('2024-03-01', [('6061', 10, 0), ('6061', 5, 0), ('5211', 0, 15)])
+
+    corps = client.get('/api/v1/ecritures?compte=6061').get_json()
+    assert corps['pagination']['total'] == 1
+    assert len(corps['data']) == 1
+    assert len(corps['data'][0]['lignes']) == 3
@@ -0,0 +1,87 @@
+"""
+Tests de la progression e-learning gardée sur les inscriptions
+"""
+
+import pytest
+
+from flask import Flask
+
+from middleware.query_profiler import compter_requetes
+
+
+@pytest.fixture
+def elearning():
+    """Base e-learning en mémoire : une formation de 2 modules (3 + 2 leçons) et deux inscriptions"""
+    from extensions import db
+    from models_elearning import (
+        CategorieFormation, Formation, InscriptionFormation, Lecon, ModuleFormation,
+        NiveauDifficulte, ProgressionLecon, TypeContenu
+    )
+
+    app_elearning = Flask(__name__)
+    app_elearning.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///:memory:', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app_elearning)
+
+    with app_elearning.app_context():
+        db.create_all()
+        categorie = CategorieFormation(nom='Comptabilité')
+        formation = Formation(titre='SYCEBNL', categorie=categorie, niveau=NiveauDifficulte.DEBUTANT, publie=True)
+        for numero_module, nb_lecons in enumerate((3, 2), start=1):
+            module = ModuleFormation(formation=formation, titre=f'Module {numero_module}', ordre=numero_module)
+            for ordre in range(1, nb_lecons + 1):
+                Lecon(module=module, titre=f'Leçon {numero_module}.{ordre}', type_contenu=TypeContenu.TEXTE, ordre=ordre)
+        inscriptions = [InscriptionFormation(formation=formation, utilisateur_id=user_id) for user_id in (1, 2)]
+        db.session.add_all([categorie, formation] + inscriptions)
+        db.session.flush()
+
+        lecons = [lecon for module in formation.modules for lecon in module.lecons]
+        for lecon in lecons[:2]:
+            db.session.add(ProgressionLecon(inscription=inscriptions[0], lecon=lecon, utilisateur_id=1,
+                                            commence=True, termine=True))
+        db.session.add(ProgressionLecon(inscription=inscriptions[0], lecon=lecons[2], utilisateur_id=1, commence=True))
+        db.session.commit()
+        yield db, formation, inscriptions, lecons
+        db.session.remove()
+        db.drop_all()
+
+
+def test_recalcul_en_une_requete(elearning):
+    from models_elearning import InscriptionFormation
+    from services.elearning_progression import progressions_a_jour
+
+    db, formation, inscriptions, lecons = elearning
+    # Inscriptions chargées comme par l'endpoint (une requête pour toutes)
+    inscriptions = InscriptionFormation.query.order_by(InscriptionFormation.id).all()
+    with compter_requetes() as collecteur:
+        assert progressions_a_jour(inscriptions) == inscriptions
+    assert collecteur.nb_requetes == 1
+    assert [(i.lecons_terminees, i.nb_lecons, i.pourcentage_completion) for i in inscriptions] == [
+        (2, 5, 40.0), (0, 5, 0.0)
+    ]
+
+    # Progressions connues : rien à recalculer
+    with compter_requetes(budget=0):
+        assert progressions_a_jour(inscriptions) == []
+
+
+def test_increment_et_invalidation(elearning):
+    from models_elearning import Lecon, ProgressionLecon, TypeContenu
+    from services.elearning_progression import enregistrer_lecon_terminee, progressions_a_jour
+
+    db, formation, inscriptions, lecons = elearning
+    inscription = inscriptions[0]
+    progressions_a_jour([inscription])
+    db.session.commit()
+
+    progression = ProgressionLecon.query.filter_by(inscription_id=inscription.id, lecon_id=lecons[2].id).one()
+    progression.termine = True
+    enregistrer_lecon_terminee(inscription)
+    db.session.commit()
+    assert (inscription.lecons_terminees, inscription.pourcentage_completion) == (3, 60.0)
+
+    # Leçon ajoutée à la formation : nombre de leçons à recalculer pour toutes les inscriptions
+    db.session.add(Lecon(module=formation.modules[1], titre='Leçon 2.3', type_contenu=TypeContenu.TEXTE, ordre=3))
+    db.session.commit()
+    assert [i.nb_lecons for i in inscriptions] == [None, None]
+    progressions_a_jour(inscriptions)
+    assert (inscription.lecons_terminees, inscription.nb_lecons, inscription.pourcentage_completion) == (3, 6, 50.0)
@@ -0,0 +1,156 @@
+"""
+Tests de la clôture d'exercice incrémentale et reprenable
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models import db, EcritureComptable, ExerciceComptable, PlanComptable, SoldeClotureExercice
+from services import exercice_closing
+from services.exercice_closing import executer_cloture, preparer_cloture
+from services.monthly_balances import totaux_periode
+
+
+@pytest.fixture
+def exercice(app, creer_ecriture):
+    exercice = ExerciceComptable(nom_exercice='2023', date_debut=date(2023, 1, 1), date_fin=date(2023, 12, 31))
+    db.session.add(exercice)
+    db.session.commit()
+    creer_ecriture('2023-02-10', [('5211', 500, 0), ('7561', 0, 500)])
+    creer_ecriture('2023-06-15', [('6061', 120, 0), ('5211', 0, 120)])
+    creer_ecriture('2023-09-01', [('6061', 10, 0), ('5211', 0, 10)], statut='brouillard')
+    return exercice
+
+
+def test_cloture_par_etapes(app, client, exercice):
+    app.config['CLOTURE_SYNCHRONE'] = True
+    response = client.post(f'/api/v1/exercices/{exercice.id}/cloturer', json={'definitif': True})
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['resultat_net'] == 380
+    assert data['cloture']['etapes_terminees'] == exercice_closing.NOMS_ETAPES
+    assert any('brouillard' in v['message'] for v in data['verifications'])
+
+    # Écriture de clôture : comptes de gestion soldés sur 131
+    ecriture = EcritureComptable.query.filter_by(numero_ecriture=f'CLOT-{exercice.id:06d}').one()
+    assert {l.numero_compte for l in ecriture.lignes} == {'6061', '7561', '131'}
+    totaux = totaux_periode('2023-01-01', '2023-12-31')
+    assert totaux['7561'][0] == totaux['7561'][1] and totaux['131'][1] == 380
+    # Compte de résultat : comptes de gestion avant l'écriture de clôture
+    avant_cloture = totaux_periode('2023-01-01', '2023-12-31', hors_cloture=True)
+    assert avant_cloture['7561'][1] - avant_cloture['7561'][0] == 500 and '131' not in avant_cloture
+    compte_resultat = client.get(f'/api/v1/compte-resultat?exercice_id={exercice.id}&date_debut=2023-01-01'
+                                 f'&date_fin=2023-12-31').get_json()['data']
+    assert compte_resultat['resultat']['resultat_net'] == 380
+
+    suivi = client.get(f'/api/v1/exercices/{exercice.id}/cloture').get_json()['data']
+    assert suivi['statut'] == 'termine' and suivi['progression'] == 100
+    assert db.session.get(ExerciceComptable, exercice.id).cloture_definitif
+
+
+@pytest.mark.parametrize('nb_comptes, compte_131_existant', [(0, True), (140, False)])
+def test_cloture_definitive_compte_resultat(app, client, exercice, nb_comptes, compte_131_existant):
+    """Compte 131 cherché par numéro : réutilisé s'il existe (cas SYCEBNL courant), créé sinon"""
+    app.config['CLOTURE_SYNCHRONE'] = True
+    # Au-delà de 131 comptes, la clé primaire 131 désigne un autre compte que le numéro 131
+    comptes = [PlanComptable(numero_compte=f'4{rang:04d}', libelle_compte=f'Tiers {rang}', classe=4, niveau=3)
+               for rang in range(nb_comptes)]
+    if compte_131_existant:
+        comptes.append(PlanComptable(numero_compte='131', libelle_compte='Résultat net : excédent', classe=1, niveau=2))
+    db.session.add_all(comptes)
+    db.session.commit()
+
+    response = client.post(f'/api/v1/exercices/{exercice.id}/cloturer', json={'definitif': True})
+    assert response.status_code == 200
+    assert response.get_json()['data']['cloture']['statut'] == 'termine'
+    assert PlanComptable.query.filter_by(numero_compte='131').count() == 1
+    ecriture = EcritureComptable.query.filter_by(numero_ecriture=f'CLOT-{exercice.id:06d}').one()
+    assert '131' in {l.numero_compte for l in ecriture.lignes}
+
+
+def test_lancement_asynchrone(app, client, exercice, monkeypatch):
+    lances = []
+    monkeypatch.setattr('api.exercices.lancer_cloture', lances.append)
+
+    response = client.post(f'/api/v1/exercices/{exercice.id}/cloturer', json={})
+    assert response.status_code == 202
+    assert response.get_json()['data']['suivi'] == f'/api/v1/exercices/{exercice.id}/cloture'
+    assert lances == [response.get_json()['data']['cloture']['id']]
+
+    statut = client.get(f'/api/v1/exercices/{exercice.id}/cloture').get_json()['data']
+    assert statut['statut'] == 'en_attente'
+
+
+def test_reprise_apres_interruption(app, exercice, monkeypatch):
+    appels = []
+    original = exercice_closing.totaux_periode
+
+    def totaux_instrumentes(debut, fin, *args, **kwargs):
+        appels.append(str(debut)[:7])
+        return original(debut, fin, *args, **kwargs)
+
+    def panne(cloture, exercice):
+        raise RuntimeError('processus interrompu')
+
+    monkeypatch.setattr(exercice_closing, 'totaux_periode', totaux_instrumentes)
+    etapes = list(exercice_closing.ETAPES)
+    etapes[3] = ('soldes_cloture', panne)
+    monkeypatch.setattr(exercice_closing, 'ETAPES', etapes)
+
+    cloture, _ = preparer_cloture(exercice)
+    cloture = executer_cloture(cloture.id)
+    assert cloture.statut == 'erreur' and cloture.etape == 'soldes_cloture'
+    assert cloture.etapes_terminees == ['verification', 'resultat', 'ecritures_cloture']
+    assert SoldeClotureExercice.query.count() == 0
+
+    # Reprise : seules les étapes restantes sont rejouées
+    monkeypatch.undo()
+    appels.clear()
+    cloture, a_lancer = preparer_cloture(exercice)
+    assert a_lancer
+    cloture = executer_cloture(cloture.id)
+    assert cloture.statut == 'termine'
+    assert SoldeClotureExercice.query.filter_by(exercice_id=exercice.id).count() == 3
+    assert appels == []
+
+
+def test_reprise_verification_au_mois(app, exercice):
+    """Un point de reprise mensuel évite de relire les mois déjà vérifiés"""
+    cloture, _ = preparer_cloture(exercice)
+    cloture.etat = {'verification': {'reprise': '2023-12-01', 'debit': '620', 'credit': '620'}}
+    db.session.commit()
+
+    cloture = executer_cloture(cloture.id)
+    assert cloture.statut == 'termine'
+    assert cloture.etat['verification']['debit'] == '620'
+
+
+def test_cloture_bloquee_puis_forcee(app, client, exercice, creer_ecriture):
+    app.config['CLOTURE_SYNCHRONE'] = True
+    creer_ecriture('2023-03-01', [('5211', 50, 0), ('7561', 0, 40)])
+
+    response = client.post(f'/api/v1/exercices/{exercice.id}/cloturer', json={})
+    assert response.status_code == 400
+    assert response.get_json()['verifications'][0]['type'] == 'erreur'
+
+    response = client.post(f'/api/v1/exercices/{exercice.id}/cloturer', json={'forcer': True})
+    assert response.status_code == 200
+
+
+def test_traitement_abandonne_repris(app, client, exercice, monkeypatch):
+    lances = []
+    monkeypatch.setattr('api.exercices.lancer_cloture', lances.append)
+    cloture, _ = preparer_cloture(exercice)
+    cloture.statut = 'en_cours'
+    db.session.commit()
+
+    # Traitement actif : pas de second lancement
+    assert client.post(f'/api/v1/exercices/{exercice.id}/cloturer', json={}).status_code == 202
+    assert lances == []
+
+    cloture.date_maj = datetime.utcnow() - timedelta(minutes=10)
+    db.session.commit()
+    assert client.get(f'/api/v1/exercices/{exercice.id}/cloture').get_json()['data']['interrompue']
+    client.post(f'/api/v1/exercices/{exercice.id}/cloturer', json={})
+    assert lances == [cloture.id]
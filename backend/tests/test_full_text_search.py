@@ -0,0 +1,125 @@
+"""
+Tests de la recherche plein texte (écritures et plan comptable)
+"""
+
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from models import db, EcritureComptable, LigneEcriture
+from services.full_text_search import TABLE_INDEX, IndexBM25, installer_index, rechercher_ecritures, surligner
+
+
+@pytest.fixture
+def ecritures(creer_ecriture):
+    """Le mot « électricité » dans le libellé d'une écriture, dans une ligne d'une autre, absent des suivantes"""
+    annee = date.today().year
+    facture = creer_ecriture(f'{annee}-02-10', [('605', 120, 0), ('401', 0, 120)],
+                             journal='ACH', libelle='Facture Électricité EDF février')
+    facture.piece_justificative = 'FAC-EDF-0042'
+    reglement = creer_ecriture(f'{annee}-03-02', [('401', 120, 0), ('5211', 0, 120)],
+                               journal='BQ', libelle='Règlement fournisseurs mars')
+    reglement.lignes[0].libelle = "Solde facture d'électricité"
+    for mois in range(3, 7):
+        creer_ecriture(f'{annee}-{mois:02d}-05', [('5211', 500, 0), ('756', 0, 500)], journal='BQ',
+                       libelle='Don de la mairie')
+    db.session.commit()
+    return facture, reglement
+
+
+@pytest.mark.parametrize('moteur', [None, 'python'])
+def test_recherche_ecritures(app, client, ecritures, moteur):
+    facture, reglement = ecritures
+    if moteur:
+        app.config['RECHERCHE_MOTEUR'] = moteur
+
+    reponse = client.get('/api/v1/ecritures/recherche?q=electricite').get_json()
+    assert reponse['moteur'] == (moteur or 'fts5')
+    # Libellé de l'écriture (poids 3) avant libellé de ligne (poids 1)
+    assert [e['id'] for e in reponse['data']] == [facture.id, reglement.id]
+    assert reponse['data'][0]['extrait'] == 'Facture <mark>Électricité</mark> EDF février'
+    assert reponse['data'][1]['extrait'] == "Solde facture d&#x27;<mark>électricité</mark> Règlement fournisseurs mars"
+    assert reponse['data'][0]['score'] > reponse['data'][1]['score'] > 0
+
+    # Début de mot, tous les mots requis, pièce justificative, filtres
+    assert [e['id'] for e in client.get('/api/v1/ecritures/recherche?q=ÉLEC edf').get_json()['data']] == [facture.id]
+    assert [e['id'] for e in client.get('/api/v1/ecritures/recherche?q=fac-edf').get_json()['data']] == [facture.id]
+    assert client.get('/api/v1/ecritures/recherche?q=electricite&journal=BQ').get_json()['data'][0]['id'] == reglement.id
+    page = client.get('/api/v1/ecritures/recherche?q=electricite&limit=1').get_json()
+    assert page['pagination'] == {'limit': 1, 'offset': 0, 'next_offset': 1, 'has_more': True}
+    assert client.get('/api/v1/ecritures/recherche?q=').status_code == 400
+
+
+def test_index_suit_les_modifications(app, ecritures, creer_ecriture):
+    facture, reglement = ecritures
+    assert [r['id'] for r in rechercher_ecritures('electricite')['resultats']] == [facture.id, reglement.id]
+
+    facture.libelle = 'Facture gaz février'
+    db.session.delete(reglement)
+    # Insertion par lots hors unité de travail : notée par les déclencheurs comme les autres
+    db.session.execute(EcritureComptable.__table__.insert().values(
+        id=1000, numero_ecriture='OD-IMPORT-1', date_ecriture=date.today(), libelle='Électricité locaux',
+        journal='OD', montant_total=10, statut='brouillard'
+    ))
+    db.session.execute(LigneEcriture.__table__.insert(), [
+        {'ecriture_id': 1000, 'numero_compte': '605', 'libelle': 'Compteur', 'debit': 10, 'credit': 0},
+        {'ecriture_id': 1000, 'numero_compte': '401', 'libelle': 'Compteur', 'debit': 0, 'credit': 10},
+    ])
+    db.session.commit()
+
+    # Réglement supprimé ; la facture ne garde le mot que dans ses lignes
+    resultat = rechercher_ecritures('electricite')
+    assert [r['id'] for r in resultat['resultats']] == [1000, facture.id]
+    assert [r['id'] for r in rechercher_ecritures('gaz')['resultats']] == [facture.id]
+    assert [r['id'] for r in rechercher_ecritures('compteur', statut='brouillard')['resultats']] == [1000]
+
+
+def test_installation_sur_base_existante(app, client, ecritures):
+    """Index installé après coup (create_all sur une base existante) : les écritures déjà présentes y entrent"""
+    facture, reglement = ecritures
+    connexion = db.session.connection()
+    connexion.exec_driver_sql(f'DROP TABLE {TABLE_INDEX}')
+    connexion.exec_driver_sql('DELETE FROM recherche_a_indexer')
+
+    assert installer_index(connexion) == 'fts5'
+    db.session.commit()
+    reponse = client.get('/api/v1/ecritures/recherche?q=electricite').get_json()
+    assert [e['id'] for e in reponse['data']] == [facture.id, reglement.id]
+
+    # Réinstallation sur un index existant : rien n'est remis en file
+    assert installer_index(db.session.connection()) == 'fts5'
+    assert db.session.execute(text('SELECT count(*) FROM recherche_a_indexer')).scalar() == 0
+
+
+def test_recherche_plan_comptable(app, client):
+    from models import PlanComptable
+    db.session.add_all([
+        PlanComptable(numero_compte='6051', libelle_compte='Fournitures non stockables - électricité', classe=6, niveau=3),
+        PlanComptable(numero_compte='6052', libelle_compte='Électricité', classe=6, niveau=3),
+        PlanComptable(numero_compte='6053', libelle_compte='Eau', classe=6, niveau=3),
+    ])
+    db.session.commit()
+
+    comptes = client.get('/api/v1/plan-comptable/search?q=electricite').get_json()['data']
+    # Libellé court (« Électricité ») plus pertinent que le libellé long, malgré l'ordre des numéros
+    assert [c['numero_compte'] for c in comptes] == ['6052', '6051']
+    assert comptes[0]['extrait'] == '<mark>Électricité</mark>'
+    assert [c['numero_compte'] for c in
+            client.get('/api/v1/plan-comptable?search=ELEC').get_json()['data']] == ['6052', '6051']
+
+
+def test_index_bm25_et_surlignage():
+    index = IndexBM25([
+        (1, {'libelle': 'cotisation annuelle', 'detail': ''}),
+        (2, {'libelle': 'don', 'detail': 'cotisation cotisation membres'}),
+        (3, {'libelle': 'loyer', 'detail': 'bureau'}),
+    ], poids={'libelle': 3.0, 'detail': 1.0})
+
+    assert [cle for cle, _ in index.rechercher('cotis')] == [1, 2]
+    assert index.rechercher('cotisation loyer') == []
+    assert index.rechercher('   ') == []
+    assert surligner('Reçu <b>dons</b> et legs', ['don', 'leg']) == \
+        'Reçu &lt;b&gt;<mark>dons</mark>&lt;/b&gt; et <mark>legs</mark>'
+    assert surligner(' '.join(f'mot{i}' for i in range(30)) + ' cible', ['cible'], 6) == \
+        '…mot25 mot26 mot27 mot28 mot29 <mark>cible</mark>'
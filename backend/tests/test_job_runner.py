@@ -0,0 +1,187 @@
+"""
+Tests du pool de tâches en arrière-plan (/taches)
+"""
+
+import csv
+import io
+import socket
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models import db, Tache, EcritureComptable, ExerciceComptable, PlanComptable
+from services.job_runner import ErreurTache, get_gestionnaire, processus_courant, tache
+
+ENTETE = "date_ecriture,journal,libelle_ecriture,numero_compte,libelle_ligne,debit,credit\n"
+ECHECS = {'restants': 0}
+
+
+@tache('test_calcul')
+def tache_calcul(contexte, valeur, pause=0):
+    for etape in range(1, 4):
+        time.sleep(pause)
+        contexte.progression(etape * 25, f'Étape {etape}')
+    if ECHECS['restants']:
+        ECHECS['restants'] -= 1
+        raise ErreurTache('Échec provisoire', {'valeur': valeur})
+    return {'double': valeur * 2}
+
+
+@tache('test_annulation')
+def tache_annulation(contexte):
+    contexte.gestionnaire.annulations.add(contexte.tache_id)  # annulation reçue pendant l'exécution
+    contexte.progression(50)
+    return {'atteint': True}
+
+
+@pytest.fixture
+def synchrone(app, tmp_path):
+    app.config.update(JOBS_SYNCHRONE=True, JOBS_DIR=str(tmp_path))
+
+
+def _preparer_import():
+    exercice = ExerciceComptable(nom_exercice='2024', date_debut=date(2024, 1, 1), date_fin=date(2024, 12, 31))
+    db.session.add(exercice)
+    for numero in ('5211', '7561'):
+        db.session.add(PlanComptable(numero_compte=numero, libelle_compte=f'Compte {numero}',
+                                     classe=int(numero[0]), niveau=3))
+    db.session.commit()
+    return exercice.id
+
+
+def _importer(client, exercice_id, contenu):
+    return client.post('/api/v1/import/ecritures', data={
+        'exercice_id': str(exercice_id), 'asynchrone': 'true',
+        'file': (io.BytesIO(contenu.encode('utf-8')), 'ecritures.csv')
+    }, content_type='multipart/form-data')
+
+
+def test_import_asynchrone(app, client, synchrone):
+    exercice_id = _preparer_import()
+    response = _importer(client, exercice_id, ENTETE + (
+        "2024-02-01,OD,Don,5211,Don reçu,50,0\n"
+        "2024-02-01,OD,Don,7561,Don reçu,0,50\n"
+    ))
+    assert response.status_code == 200
+    donnees = response.get_json()['data']
+    assert donnees['suivi'] == f"/api/v1/taches/{donnees['tache']['id']}"
+
+    etat = client.get(donnees['suivi']).get_json()['data']
+    assert etat['statut'] == 'termine' and etat['progression'] == 100
+    assert etat['resultat']['ecritures_creees'] == 1
+    assert EcritureComptable.query.count() == 1
+
+
+def test_import_asynchrone_en_erreur(app, client, synchrone):
+    exercice_id = _preparer_import()
+    response = _importer(client, exercice_id, ENTETE + "2024-02-01,OD,Don,9999,Inconnu,50,0\n")
+    assert response.status_code == 400
+
+    etat = response.get_json()['data']['tache']
+    assert etat['statut'] == 'erreur' and etat['resultat']['erreurs']
+    assert EcritureComptable.query.count() == 0
+
+
+def test_export_asynchrone_telechargeable(app, client, synchrone, creer_ecriture):
+    creer_ecriture('2024-03-01', [('5211', 80, 0), ('7562', 0, 80)])
+
+    response = client.get('/api/v1/export/ecritures?asynchrone=1&date_debut=2024-01-01&date_fin=2024-12-31')
+    etat = response.get_json()['data']['tache']
+    assert etat['statut'] == 'termine' and etat['resultat']['lignes'] == 2
+
+    fichier = client.get(f"/api/v1/taches/{etat['id']}/resultat")
+    assert fichier.status_code == 200
+    assert 'attachment' in fichier.headers['Content-Disposition']
+    lignes = list(csv.reader(io.StringIO(fichier.get_data(as_text=True))))
+    assert len(lignes) == 3 and {ligne[5] for ligne in lignes[1:]} == {'5211', '7562'}
+
+
+def test_erreur_puis_relance(app, client, synchrone):
+    ECHECS['restants'] = 1
+    tache_echec = get_gestionnaire().soumettre('test_calcul', {'valeur': 21})
+    assert tache_echec.statut == 'erreur' and tache_echec.resultat == {'valeur': 21}
+    assert client.get(f'/api/v1/taches/{tache_echec.id}/resultat').status_code == 409
+
+    response = client.post(f'/api/v1/taches/{tache_echec.id}/relancer')
+    assert response.status_code == 200
+    etat = response.get_json()['data']['tache']
+    assert etat['statut'] == 'termine' and etat['tentatives'] == 2
+    assert client.get(f'/api/v1/taches/{tache_echec.id}/resultat').get_json()['data'] == {'double': 42}
+
+    # Une tâche terminée ne se relance pas
+    assert client.post(f'/api/v1/taches/{tache_echec.id}/relancer').status_code == 400
+
+
+def test_tache_en_cours_relancee_seulement_si_processus_arrete(app, client, synchrone):
+    """Sous SQLite date_maj reste celle du démarrage : seul un processus arrêté permet la relance"""
+    termine = subprocess.Popen([sys.executable, '-c', 'pass'])
+    termine.wait()
+    ancienne = datetime.utcnow() - timedelta(days=1)
+    taches = {}
+    for nom, processus in (('actif', processus_courant()), ('inconnu', None),
+                           ('arrete', f'{socket.gethostname()}:{termine.pid}')):
+        taches[nom] = Tache(type_tache='test_calcul', parametres={'valeur': 2}, statut='en_cours',
+                            processus=processus, date_debut=ancienne, date_maj=ancienne)
+    db.session.add_all(taches.values())
+    db.session.commit()
+
+    for nom in ('actif', 'inconnu'):
+        assert client.get(f'/api/v1/taches/{taches[nom].id}').get_json()['data']['abandonnee'] is False
+        assert client.post(f'/api/v1/taches/{taches[nom].id}/relancer').status_code == 400
+
+    response = client.post(f'/api/v1/taches/{taches["arrete"].id}/relancer')
+    assert response.status_code == 200
+    assert response.get_json()['data']['tache']['statut'] == 'termine'
+
+
+def test_annulation(app, client, synchrone):
+    en_attente = Tache(type_tache='test_calcul', parametres={'valeur': 1})
+    db.session.add(en_attente)
+    db.session.commit()
+    response = client.post(f'/api/v1/taches/{en_attente.id}/annuler')
+    assert response.get_json()['data']['statut'] == 'annule'
+    assert client.post(f'/api/v1/taches/{en_attente.id}/annuler').status_code == 400
+
+    # Tâche annulée en cours d'exécution : arrêt au point de progression, travail annulé
+    annulee = get_gestionnaire().soumettre('test_annulation')
+    assert annulee.statut == 'annule' and annulee.progression == 50
+
+
+def test_pool_concurrent(tmp_path):
+    """Pool de fils réel sur une base fichier, borné par JOBS_MAX_WORKERS"""
+    from flask import Flask
+    from api import create_api_blueprints
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'taches.db'}",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        JOBS_MAX_WORKERS=2,
+        JOBS_DIR=str(tmp_path)
+    )
+    db.init_app(app)
+    create_api_blueprints(app)
+
+    with app.app_context():
+        db.create_all()
+        gestionnaire = get_gestionnaire()
+        ids = [gestionnaire.soumettre('test_calcul', {'valeur': n, 'pause': 0.05}).id for n in range(4)]
+
+        client = app.test_client()
+        for _ in range(100):
+            db.session.expire_all()
+            statuts = {t.statut for t in Tache.query.filter(Tache.id.in_(ids))}
+            if statuts == {'termine'}:
+                break
+            time.sleep(0.05)
+
+        assert statuts == {'termine'}
+        assert [client.get(f'/api/v1/taches/{i}/resultat').get_json()['data']['double'] for i in ids] == [0, 2, 4, 6]
+        assert gestionnaire.pool._max_workers == 2
+        gestionnaire.pool.shutdown(wait=True)
+        db.session.remove()
+        db.drop_all()
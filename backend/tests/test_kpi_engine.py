@@ -0,0 +1,51 @@
+"""
+Tests du moteur de KPI (définitions par préfixes, trie, ratios)
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+from services.kpi_engine import DefinitionKPI, TriePrefixes, evaluer_kpis
+
+
+def test_trie_exclusion_plus_longue():
+    trie = TriePrefixes()
+    trie.ajouter('756', 'dons')
+    trie.ajouter('7561', 'dons', exclusion=True)
+    trie.ajouter('7561', 'cotisations')
+    trie.ajouter('7', 'produits')
+
+    assert sorted(trie.correspondances('75611')) == ['cotisations', 'produits']
+    assert sorted(trie.correspondances('7562')) == ['dons', 'produits']
+    assert trie.correspondances('6061') == []
+
+
+def test_cumul_par_prefixe_et_sens():
+    totaux = {
+        '6061': (Decimal('40'), Decimal('0'), 1),
+        '6063': (Decimal('10'), Decimal('0'), 1),
+        '7562': (Decimal('0'), Decimal('30'), 1),
+        '7561': (Decimal('0'), Decimal('20'), 1),
+    }
+    kpis = evaluer_kpis(totaux)
+    assert kpis['total_charges'] == Decimal('50')
+    assert kpis['total_dons'] == Decimal('30')
+    assert kpis['total_cotisations'] == Decimal('20')
+    assert kpis['ratio_autonomie'] == Decimal('60.00')
+
+    personnalise = evaluer_kpis(totaux, [DefinitionKPI('produits', ('7',), -1)], [])
+    assert personnalise == {'produits': Decimal('50')}
+
+
+def test_endpoint_dashboard_kpi(app, client, creer_ecriture):
+    annee = datetime.now().year
+    creer_ecriture(f'{annee}-02-01', [('5121', 500, 0), ('7562', 0, 500)])
+    creer_ecriture(f'{annee}-02-03', [('6061', 250, 0), ('5121', 0, 250)])
+
+    kpis = client.get('/api/v1/dashboard/kpi').get_json()['data']['kpis']
+    assert kpis['total_charges'] == 250.0
+    assert kpis['total_dons'] == 500.0
+    assert kpis['tresorerie_banque'] == 250.0
+    assert kpis['ratio_autonomie'] == 100.0
+    assert kpis['ratio_liquidite'] == 100.0
+    assert kpis['nb_ecritures'] == 2
@@ -0,0 +1,103 @@
+"""
+Tests de l'import en masse et de l'export en flux des écritures (/import/ecritures, /export/ecritures)
+"""
+
+import io
+from datetime import date
+
+from models import db, ExerciceComptable, EcritureComptable, LigneEcriture, PlanComptable
+
+ENTETE = "date_ecriture,journal,libelle_ecriture,numero_compte,libelle_ligne,debit,credit\n"
+
+
+def _preparer(app):
+    exercice = ExerciceComptable(nom_exercice='2024', date_debut=date(2024, 1, 1), date_fin=date(2024, 12, 31))
+    db.session.add(exercice)
+    for numero in ('5211', '7561', '6061'):
+        db.session.add(PlanComptable(numero_compte=numero, libelle_compte=f'Compte {numero}',
+                                     classe=int(numero[0]), niveau=3))
+    db.session.commit()
+    return exercice.id
+
+
+def _envoyer(client, contenu, **form):
+    donnees = {'file': (io.BytesIO(contenu.encode('utf-8')), 'ecritures.csv')}
+    donnees.update({cle: str(valeur) for cle, valeur in form.items()})
+    return client.post('/api/v1/import/ecritures', data=donnees, content_type='multipart/form-data')
+
+
+def test_import_par_lots(app, client, creer_ecriture):
+    """Les écritures sont numérotées à la suite de l'existant et insérées par lots"""
+    exercice_id = _preparer(app)
+    creer_ecriture('2024-03-01', [('5211', 10, 0), ('7561', 0, 10)], journal='BQ')
+
+    contenu = ENTETE + "".join(
+        f"2024-03-01,BQ,Don {i},5211,Encaissement,{i},\n2024-03-01,BQ,Don {i},7561,Don,,{i}\n"
+        for i in range(1, 6)
+    )
+    response = _envoyer(client, contenu, exercice_id=exercice_id, taille_lot=2)
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert data['ecritures_creees'] == 5
+    assert data['lignes_creees'] == 10
+    assert [lot['ecritures'] for lot in data['lots']] == [2, 2, 1]
+
+    numeros = sorted(e.numero_ecriture for e in EcritureComptable.query.filter(EcritureComptable.id.in_(data['ecritures_ids'])))
+    assert numeros == [f'BQ-20240301-{n:03d}' for n in range(2, 7)]
+    assert LigneEcriture.query.count() == 12
+
+
+def test_import_rejete_les_erreurs(app, client):
+    """Comptes inconnus, dates hors exercice et déséquilibres sont signalés sans rien insérer"""
+    exercice_id = _preparer(app)
+    contenu = ENTETE + (
+        "2024-03-01,BQ,A,9999,Ligne,10,\n"
+        "2023-12-31,BQ,B,5211,Ligne,10,\n"
+        "2024-03-02,BQ,C,5211,Ligne,10,\n"
+        "2024-03-02,BQ,C,7561,Ligne,,9\n"
+    )
+    response = _envoyer(client, contenu, exercice_id=exercice_id)
+    erreurs = response.get_json()['erreurs']
+
+    assert response.status_code == 400
+    assert len(erreurs) == 3
+    assert 'Compte 9999' in erreurs[0] and 'hors de l' in erreurs[1] and 'Déséquilibre' in erreurs[2]
+    assert EcritureComptable.query.count() == 0
+
+
+def test_import_force_garde_les_desequilibrees_en_brouillard(app, client):
+    """En mode force, une écriture déséquilibrée est créée en brouillard et signalée"""
+    exercice_id = _preparer(app)
+    contenu = ENTETE + (
+        "2024-03-01,BQ,A,5211,Ligne,10,\n"
+        "2024-03-01,BQ,A,7561,Ligne,,10\n"
+        "2024-03-02,BQ,C,5211,Ligne,10,\n"
+        "2024-03-02,BQ,C,7561,Ligne,,9\n"
+    )
+    assert _envoyer(client, contenu, exercice_id=exercice_id).status_code == 400
+
+    data = _envoyer(client, contenu, exercice_id=exercice_id, mode='force').get_json()['data']
+    assert data['ecritures_creees'] == 2
+    assert len(data['erreurs']) == 1 and 'Déséquilibre 1.00' in data['erreurs'][0]
+    ecritures = EcritureComptable.query.filter(EcritureComptable.id.in_(data['ecritures_ids'])).all()
+    assert {e.statut.value for e in ecritures} == {'brouillard'}
+
+
+def test_export_en_flux(app, client, creer_ecriture, monkeypatch):
+    """L'export est émis par blocs et contient une ligne par ligne d'écriture validée"""
+    import api.import_export as import_export
+    monkeypatch.setattr(import_export, 'EXPORT_BATCH_SIZE', 2)
+    creer_ecriture('2024-03-01', [('5211', 10, 0), ('7561', 0, 10)], journal='BQ')
+    creer_ecriture('2024-03-02', [('6061', 4, 0), ('5211', 0, 4)], journal='BQ')
+    creer_ecriture('2024-03-03', [('6061', 1, 0), ('5211', 0, 1)], statut='brouillard')
+
+    response = client.get('/api/v1/export/ecritures?format=csv')
+    assert response.is_streamed
+    lignes = response.get_data(as_text=True).strip().splitlines()
+    assert lignes[0].startswith('numero_ecriture,')
+    assert len(lignes) == 5
+    assert lignes[1].split(',')[5:7] == ['5211', 'Compte 5211']
+
+    fec = client.get('/api/v1/export/ecritures?format=fec&date_debut=2024-03-02').get_data(as_text=True)
+    assert fec.strip().splitlines()[1].split('|')[:5] == ['BQ', 'Journal de Banque', 'BQ-20240302-001', '20240302', '6061']
@@ -0,0 +1,108 @@
+"""
+Tests des soldes mensuels matérialisés (maintenance incrémentale, reconstruction, lecture)
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from models import db, EcritureComptable, ExerciceComptable, SoldeMensuelCompte
+from services.monthly_balances import (
+    reconstruire_soldes_mensuels, verifier_coherence, totaux_periode, series_mensuelles
+)
+
+
+def test_validation_alimente_les_soldes(app, client, creer_ecriture):
+    """La validation d'une écriture met à jour le mois et le compte concernés"""
+    creer_ecriture('2024-03-05', [('5211', 100, 0), ('7561', 0, 100)])
+    brouillard = creer_ecriture('2024-03-20', [('5211', 30, 0), ('7561', 0, 30)], statut='brouillard')
+
+    assert SoldeMensuelCompte.query.filter_by(numero_compte='5211', periode='2024-03').one().total_debit == Decimal('100')
+
+    response = client.post(f'/api/v1/ecritures/{brouillard.id}/valider')
+    assert response.status_code == 200
+
+    solde = SoldeMensuelCompte.query.filter_by(numero_compte='5211', periode='2024-03').one()
+    assert solde.total_debit == Decimal('130')
+    assert solde.nb_lignes == 2
+    assert verifier_coherence() == []
+
+
+def test_reconstruction_et_controle(app, creer_ecriture):
+    """Le contrôle détecte un écart et la reconstruction le corrige"""
+    db.session.add(ExerciceComptable(nom_exercice='2024', date_debut=date(2024, 1, 1), date_fin=date(2024, 12, 31)))
+    db.session.commit()
+    creer_ecriture('2024-01-15', [('6061', 40, 0), ('5211', 0, 40)])
+    creer_ecriture('2023-12-31', [('6061', 5, 0), ('5211', 0, 5)])
+
+    SoldeMensuelCompte.query.filter_by(numero_compte='6061', periode='2024-01').one().total_debit = Decimal('1')
+    db.session.commit()
+
+    ecarts = verifier_coherence()
+    assert [(e['numero_compte'], e['periode']) for e in ecarts] == [('6061', '2024-01')]
+
+    assert reconstruire_soldes_mensuels() == 4
+    assert verifier_coherence() == []
+    assert SoldeMensuelCompte.query.filter_by(periode='2023-12', numero_compte='6061').one().exercice_id == 0
+
+
+def test_reconstruction_d_un_exercice_cree_apres_coup(app, creer_ecriture):
+    """Lignes validées avant la création de l'exercice (exercice_id NULL) : remplacées, pas doublées"""
+    creer_ecriture('2024-03-10', [('6061', 40, 0), ('5211', 0, 40)])
+    creer_ecriture('2023-12-20', [('6061', 5, 0), ('5211', 0, 5)])
+    exercice = ExerciceComptable(nom_exercice='2024', date_debut=date(2024, 1, 1), date_fin=date(2024, 12, 31))
+    db.session.add(exercice)
+    db.session.commit()
+
+    assert reconstruire_soldes_mensuels(exercice.id) == 2
+    assert verifier_coherence() == []
+    solde = SoldeMensuelCompte.query.filter_by(numero_compte='6061', periode='2024-03').one()
+    assert (solde.exercice_id, solde.total_debit) == (exercice.id, Decimal('40'))
+    # Mois hors de l'exercice : inchangés
+    assert SoldeMensuelCompte.query.filter_by(numero_compte='6061', periode='2023-12').one().exercice_id == 0
+    assert totaux_periode('2024-01-01', '2024-12-31')['6061'][0] == Decimal('40')
+
+
+def test_totaux_periode_mois_partiels(app, creer_ecriture):
+    """Les mois entiers viennent de la table, les bordures des lignes brutes"""
+    creer_ecriture('2024-01-10', [('5211', 100, 0), ('7561', 0, 100)])
+    creer_ecriture('2024-02-10', [('5211', 20, 0), ('7561', 0, 20)])
+    creer_ecriture('2024-03-25', [('5211', 3, 0), ('7561', 0, 3)])
+
+    assert totaux_periode('2024-01-01', '2024-02-29')['5211'][0] == Decimal('120')
+    assert totaux_periode('2024-01-15', '2024-03-24')['5211'][0] == Decimal('20')
+    assert totaux_periode('2024-01-10', '2024-01-10')['7561'][1] == Decimal('100')
+    assert totaux_periode(None, '2024-03-31', numeros=['7561']) == {'7561': (Decimal('0'), Decimal('123'), 3)}
+
+    series = series_mensuelles('2024-01-01', '2024-03-31', numeros=['5211'])
+    assert sorted(series) == ['2024-01', '2024-02', '2024-03']
+    assert series['2024-02']['5211'][0] == Decimal('20')
+
+
+def test_double_validation_sans_double_report(app, client, creer_ecriture):
+    """Valider deux fois la même écriture ne reporte ses lignes qu'une fois"""
+    brouillard = creer_ecriture('2024-03-20', [('5211', 100, 0), ('7561', 0, 100)], statut='brouillard')
+
+    assert client.post(f'/api/v1/ecritures/{brouillard.id}/valider').status_code == 200
+    assert client.post(f'/api/v1/ecritures/{brouillard.id}/valider').status_code == 400
+    db.session.get(EcritureComptable, brouillard.id).valider()
+
+    solde = SoldeMensuelCompte.query.filter_by(numero_compte='5211', periode='2024-03').one()
+    assert (solde.total_debit, solde.nb_lignes) == (Decimal('100'), 1)
+    assert verifier_coherence() == []
+
+
+def test_cle_unique_des_soldes(app, creer_ecriture):
+    """Mois hors exercice : une seule ligne (exercice 0), la clé unique refuse un doublon"""
+    creer_ecriture('2022-05-02', [('5211', 10, 0), ('7561', 0, 10)])
+    creer_ecriture('2022-05-20', [('5211', 5, 0), ('7561', 0, 5)])
+
+    solde = SoldeMensuelCompte.query.filter_by(numero_compte='5211', periode='2022-05').one()
+    assert (solde.entite_id, solde.exercice_id, solde.total_debit, solde.nb_lignes) == (0, 0, Decimal('15'), 2)
+
+    db.session.add(SoldeMensuelCompte(numero_compte='5211', periode='2022-05'))
+    with pytest.raises(IntegrityError):
+        db.session.flush()
+    db.session.rollback()
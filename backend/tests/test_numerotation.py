@@ -0,0 +1,44 @@
+"""
+Tests du compteur de numérotation des écritures
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from models import db, EcritureComptable, SequenceNumerotation
+from services.numerotation import allouer_numeros
+
+
+def _ecriture(jour, journal='OD', **kwargs):
+    return EcritureComptable(date_ecriture=jour, libelle='Test', journal=journal,
+                             montant_total=Decimal('0'), **kwargs)
+
+
+def test_numeros_consecutifs_par_journal_et_jour(app):
+    """Chaque (journal, jour) a sa propre séquence"""
+    jour = date(2024, 5, 2)
+    numeros = [_ecriture(jour).numero_ecriture for _ in range(3)]
+    assert numeros == ['OD-20240502-001', 'OD-20240502-002', 'OD-20240502-003']
+    assert _ecriture(jour, journal='BQ').numero_ecriture == 'BQ-20240502-001'
+    assert _ecriture(date(2024, 5, 3)).numero_ecriture == 'OD-20240503-001'
+    assert SequenceNumerotation.query.count() == 3
+
+
+def test_reprise_apres_numeros_existants_et_blocs(app):
+    """Le compteur démarre après les numéros déjà attribués et réserve des blocs"""
+    jour = date(2024, 5, 2)
+    db.session.add(_ecriture(jour, numero_ecriture='OD-20240502-007'))
+    db.session.commit()
+
+    assert allouer_numeros('OD', jour, quantite=10) == 8
+    assert _ecriture(jour).numero_ecriture == 'OD-20240502-018'
+
+
+def test_rollback_annule_la_reservation(app):
+    """Une réservation non validée par commit est libérée"""
+    jour = date(2024, 5, 2)
+    allouer_numeros('OD', jour)
+    db.session.commit()
+    allouer_numeros('OD', jour, quantite=5)
+    db.session.rollback()
+    assert allouer_numeros('OD', jour) == 2
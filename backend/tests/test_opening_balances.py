@@ -0,0 +1,121 @@
+"""
+Tests des soldes de clôture figés et des à-nouveaux
+"""
+
+import io
+from datetime import date
+
+import pytest
+
+from models import db, EcritureComptable, ExerciceComptable, SoldeClotureExercice
+from services.balance_engine import charger_soldes
+from services.monthly_balances import PeriodeCloturee
+from services.opening_balances import a_nouveaux, totaux_cumules
+from services.trial_balance import construire_balance
+
+
+@pytest.fixture(autouse=True)
+def cloture_synchrone(app):
+    app.config['CLOTURE_SYNCHRONE'] = True
+
+
+@pytest.fixture
+def exercices(app):
+    """Exercices 2023 et 2024"""
+    precedent = ExerciceComptable(nom_exercice='2023', date_debut=date(2023, 1, 1), date_fin=date(2023, 12, 31))
+    courant = ExerciceComptable(nom_exercice='2024', date_debut=date(2024, 1, 1), date_fin=date(2024, 12, 31))
+    db.session.add_all([precedent, courant])
+    db.session.commit()
+    return precedent, courant
+
+
+@pytest.fixture
+def historique(creer_ecriture):
+    creer_ecriture('2023-02-10', [('5211', 500, 0), ('7561', 0, 500)])
+    creer_ecriture('2023-06-15', [('6061', 120, 0), ('5211', 0, 120)])
+    creer_ecriture('2024-03-05', [('5211', 80, 0), ('7562', 0, 80)])
+
+
+def test_cloture_fige_les_soldes(app, client, exercices, historique):
+    precedent, _ = exercices
+    response = client.post(f'/api/v1/exercices/{precedent.id}/cloturer', json={})
+    assert response.status_code == 200
+    assert response.get_json()['data']['comptes_figes'] == 3
+
+    figes = {s.numero_compte: s for s in SoldeClotureExercice.query.filter_by(exercice_id=precedent.id)}
+    assert float(figes['5211'].total_debit) == 500 and float(figes['5211'].total_credit) == 120
+
+    # Immuable : une modification ORM est refusée
+    figes['5211'].total_debit = 0
+    with pytest.raises(ValueError):
+        db.session.flush()
+    db.session.rollback()
+
+
+def test_positions_partent_du_snapshot(app, client, exercices, historique, creer_ecriture):
+    precedent, courant = exercices
+    attendu = charger_soldes(date_fin='2024-12-31').solde('5211')
+    client.post(f'/api/v1/exercices/{precedent.id}/cloturer', json={})
+
+    # L'historique vient du snapshot ; une écriture tardive dans l'exercice clos est refusée
+    with pytest.raises(PeriodeCloturee):
+        creer_ecriture('2023-07-01', [('5211', 1000, 0), ('7561', 0, 1000)])
+    db.session.rollback()
+    assert charger_soldes(date_fin='2024-12-31').solde('5211') == attendu
+    assert totaux_cumules('2024-12-31')['5211'][:2] == (500 + 80, 120)
+
+
+def test_validation_refusee_dans_un_exercice_clos(app, client, exercices, historique, creer_ecriture):
+    """Une écriture datée dans un exercice clôturé n'est validée qu'après réouverture"""
+    precedent, _ = exercices
+    tardive = creer_ecriture('2023-06-30', [('5211', 50, 0), ('7561', 0, 50)], statut='brouillard')
+    client.post(f'/api/v1/exercices/{precedent.id}/cloturer', json={})
+
+    response = client.post(f'/api/v1/ecritures/{tardive.id}/valider')
+    assert response.status_code == 400
+    assert db.session.get(EcritureComptable, tardive.id).est_validee is False
+    assert totaux_cumules('2024-06-30')['5211'][0] == 500 + 80
+
+    contenu = "date_ecriture,journal,libelle_ecriture,numero_compte,libelle_ligne,debit,credit\n"
+    response = client.post('/api/v1/import/ecritures', content_type='multipart/form-data', data={
+        'file': (io.BytesIO(contenu.encode('utf-8')), 'ecritures.csv'), 'exercice_id': str(precedent.id)
+    })
+    assert response.status_code == 400
+
+    assert client.post(f'/api/v1/exercices/{precedent.id}/rouvrir').status_code == 200
+    assert client.post(f'/api/v1/ecritures/{tardive.id}/valider').status_code == 200
+    client.post(f'/api/v1/exercices/{precedent.id}/cloturer', json={})
+    assert totaux_cumules('2024-06-30')['5211'][0] == 500 + 50 + 80
+
+
+def test_a_nouveaux_exercice_suivant(app, client, exercices, historique):
+    precedent, courant = exercices
+    assert a_nouveaux(courant.id) == {}
+    client.post(f'/api/v1/exercices/{precedent.id}/cloturer', json={})
+
+    ouverture = a_nouveaux(courant.id)
+    assert ouverture['5211'] == (500, 120)
+    assert '7561' not in ouverture and ouverture['131'] == (0, 380)  # excédent 2023, comme la clôture définitive
+
+    balance = construire_balance(exercice_id=courant.id)
+    banque = balance.lignes.loc['5211']
+    assert banque['solde_ouverture'] == 38000 and banque['solde_cloture'] == 46000
+    totaux = balance.totaux()
+    assert totaux['debit_cloture'] == totaux['credit_cloture']
+
+    bilan = client.get(f'/api/v1/bilan?exercice_id={courant.id}&date_fin=2024-12-31').get_json()
+    assert bilan['success']
+    assert charger_soldes(exercice_id=courant.id).solde('5211')['solde'] == 460
+
+
+def test_reouverture_supprime_le_snapshot(app, client, exercices, historique):
+    precedent, courant = exercices
+    client.post(f'/api/v1/exercices/{precedent.id}/cloturer', json={})
+    client.post(f'/api/v1/exercices/{courant.id}/cloturer', json={})
+
+    # L'exercice suivant, clos, inclut 2023 : il doit être rouvert d'abord
+    assert client.post(f'/api/v1/exercices/{precedent.id}/rouvrir').status_code == 400
+
+    assert client.post(f'/api/v1/exercices/{courant.id}/rouvrir').status_code == 200
+    assert client.post(f'/api/v1/exercices/{precedent.id}/rouvrir').status_code == 200
+    assert SoldeClotureExercice.query.count() == 0
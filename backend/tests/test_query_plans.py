@@ -0,0 +1,119 @@
+"""
+Non-régression des plans d'exécution des rapports
+
+Chaque endpoint de rapport est appelé sur un grand livre volumineux ; les
+SELECT émis sont rejoués avec EXPLAIN QUERY PLAN et le test échoue si une
+grande table est parcourue intégralement (SCAN) au lieu d'une recherche indexée.
+"""
+
+import random
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event, text
+
+from models import db, PlanComptable, EcritureComptable, LigneEcriture
+from services.monthly_balances import reconstruire_soldes_mensuels
+
+GRANDES_TABLES = ('lignes_ecriture', 'ecritures_comptables', 'soldes_mensuels_comptes', 'mouvements_bancaires')
+NB_ECRITURES = 4000
+
+ENDPOINTS = [
+    '/api/v1/balance?date_debut=2024-02-10&date_fin=2024-11-20',
+    '/api/v1/bilan?date_fin=2024-12-31',
+    '/api/v1/compte-resultat?date_debut=2024-01-01&date_fin=2024-12-31',
+    '/api/v1/synthese?date_debut=2024-01-01&date_fin=2024-12-31',
+    '/api/v1/dashboard/kpi',
+    '/api/v1/grand-livre/5121?date_debut=2024-03-01&date_fin=2024-03-31',
+    '/api/v1/ecritures?compte=6061&limit=20',
+    '/api/v1/ecritures?statut=valide&date_debut=2024-03-01&date_fin=2024-03-31&limit=20',
+    '/api/v1/analyses/series?comptes=6&date_debut=2024-01-01&date_fin=2024-12-31',
+    '/api/v1/analyses/activite-mensuelle?annee=2024',
+]
+
+
+@pytest.fixture
+def grand_livre(app):
+    """Grand livre de NB_ECRITURES écritures sur deux ans, statistiques à jour"""
+    comptes = ['101', '2183', '5121', '531', '571', '6061', '6063', '741', '7561', '7562']
+    db.session.execute(PlanComptable.__table__.insert(), [
+        {'numero_compte': n, 'libelle_compte': f'Compte {n}', 'classe': int(n[0]), 'niveau': 3}
+        for n in comptes
+    ])
+    aleatoire = random.Random(7)
+    db.session.execute(EcritureComptable.__table__.insert(), [
+        {
+            'id': i,
+            'numero_ecriture': f'OD-{i:06d}',
+            'date_ecriture': date(2024, 1, 1) + timedelta(days=aleatoire.randint(0, 700)),
+            'libelle': 'Écriture',
+            'journal': 'OD',
+            'montant_total': 10,
+            'statut': 'valide' if i % 5 else 'brouillard'
+        }
+        for i in range(1, NB_ECRITURES + 1)
+    ])
+    db.session.execute(LigneEcriture.__table__.insert(), [
+        {'ecriture_id': i, 'numero_compte': aleatoire.choice(comptes), 'libelle': 'Ligne',
+         'debit': 10 if sens == 0 else 0, 'credit': 0 if sens == 0 else 10}
+        for i in range(1, NB_ECRITURES + 1) for sens in (0, 1)
+    ])
+    db.session.commit()
+    reconstruire_soldes_mensuels()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+@contextmanager
+def capturer_selects():
+    """Collecte (sql, paramètres) des SELECT exécutés dans le bloc"""
+    requetes = []
+
+    def capturer(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            requetes.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capturer)
+    try:
+        yield requetes
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capturer)
+
+
+def parcours_complets(requetes):
+    """Requêtes dont le plan parcourt intégralement une grande table"""
+    connexion = db.session.connection()
+    fautives = []
+    for sql, parametres in requetes:
+        plan = [ligne[-1] for ligne in connexion.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', parametres)]
+        scans = [etape for etape in plan if any(etape.startswith(f'SCAN {table}') for table in GRANDES_TABLES)]
+        if scans:
+            fautives.append((sql.split('FROM')[0][:80], scans))
+    return fautives
+
+
+@pytest.mark.parametrize('url', ENDPOINTS)
+def test_aucun_parcours_complet(app, client, grand_livre, url):
+    with capturer_selects() as requetes:
+        response = client.get(url)
+    assert response.status_code == 200
+
+    assert requetes, "Aucune requête capturée"
+    assert parcours_complets(requetes) == []
+
+
+def test_index_composites_utilises(app, grand_livre):
+    """Les agrégats par compte sur une période passent par les index composites"""
+    requete = db.session.query(LigneEcriture.numero_compte).join(EcritureComptable).filter(
+        EcritureComptable.statut == 'valide',
+        EcritureComptable.date_ecriture >= date(2024, 3, 1),
+        EcritureComptable.date_ecriture <= date(2024, 3, 31)
+    ).group_by(LigneEcriture.numero_compte)
+    with capturer_selects() as requetes:
+        requete.all()
+    plan = ' | '.join(
+        ligne[-1] for ligne in db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {requetes[0][0]}', requetes[0][1])
+    )
+    assert 'ix_ecritures_statut_date' in plan
+    assert 'ix_lignes_ecriture_compte' in plan
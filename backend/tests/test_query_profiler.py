@@ -0,0 +1,76 @@
+"""
+Tests du profilage SQL par requête (Server-Timing, /api/metrics, budgets de requêtes)
+"""
+
+import datetime
+from datetime import date
+
+import jwt
+import pytest
+
+from api.utilisateurs import JWT_ALGORITHM, JWT_SECRET
+from middleware.query_profiler import BudgetRequetesDepasse, compter_requetes
+from models import db, PlanComptable, Utilisateur
+
+
+@pytest.fixture
+def grand_livre(creer_ecriture):
+    """Un an d'écritures sur une vingtaine de comptes"""
+    annee = date.today().year
+    for mois in range(1, 13):
+        creer_ecriture(f'{annee}-{mois:02d}-05', [('5211', 100 + mois, 0), (f'756{mois % 3}', 0, 100 + mois)])
+        creer_ecriture(f'{annee}-{mois:02d}-09', [(f'60{mois % 9}1', 20, 0), ('5211', 0, 20)])
+
+
+def entetes(role):
+    utilisateur = Utilisateur(nom_utilisateur=role, email=f'{role}@ebnl.org', mot_de_passe_hash='x', role=role)
+    db.session.add(utilisateur)
+    db.session.commit()
+    maintenant = datetime.datetime.now(datetime.timezone.utc)
+    jeton = jwt.encode({'user_id': utilisateur.id, 'iat': maintenant, 'exp': maintenant + datetime.timedelta(hours=1)},
+                       JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return {'Authorization': f'Bearer {jeton}'}
+
+
+def test_server_timing_et_metrics(app, client, grand_livre):
+    response = client.get('/api/v1/ecritures')
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('sql;dur=') and 'app;dur=' in timing
+
+    client.get('/api/v1/ecritures?page=2')
+    admin, comptable = entetes('administrateur'), entetes('comptable')
+    assert client.get('/api/metrics').status_code == 401
+    assert client.get('/api/metrics', headers=comptable).status_code == 403
+    assert client.delete('/api/metrics', headers=comptable).status_code == 403
+    metrics = client.get('/api/metrics', headers=admin).get_json()['data']['endpoints']
+    ecritures = next(e for e in metrics if e['endpoint'] == 'comptabilite.get_ecritures')
+    assert ecritures['appels'] == 2 and ecritures['requetes_max'] >= 1
+    assert ecritures['requetes_lentes'][0]['sql'].startswith('SELECT')
+
+    assert client.delete('/api/metrics', headers=admin).status_code == 200
+    assert client.get('/api/metrics', headers=admin).get_json()['data']['endpoints'] == []
+
+
+def test_budget_strict_fait_echouer(app, client):
+    app.config['METRICS_BUDGETS'] = {'plan_comptable.get_plan_comptable': 0}
+    with pytest.raises(BudgetRequetesDepasse, match='plan_comptable.get_plan_comptable'):
+        client.get('/api/v1/plan-comptable')
+
+    with pytest.raises(BudgetRequetesDepasse):
+        with compter_requetes(budget=1):
+            PlanComptable.query.count()
+            PlanComptable.query.first()
+
+
+@pytest.mark.parametrize('url, budget', [
+    ('/api/v1/balance', 6),
+    ('/api/v1/ecritures', 4),
+    ('/api/v1/analyses/comptes-top?limite=20', 1),
+    ('/api/v1/tableau-bord', 6),
+])
+def test_budgets_endpoints(app, client, grand_livre, url, budget):
+    """Le nombre de requêtes ne dépend pas du nombre de comptes ou de lignes renvoyés"""
+    client.get(url)  # chargements uniques (registre du plan comptable) hors budget
+    with compter_requetes(budget=budget) as collecteur:
+        assert client.get(url).status_code == 200
+    assert collecteur.nb_requetes > 0
@@ -0,0 +1,101 @@
+"""
+Tests des quotas d'abonnement en écriture différée et du cache des abonnements
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Blueprint, jsonify, request
+
+from middleware.query_profiler import compter_requetes
+from middleware.subscription_middleware import QuotaManager, quota_required, subscription_required
+from models import (
+    db, Abonnement, PlanAbonnement, StatutAbonnement, TypePlan, Utilisateur, UtilisationQuota
+)
+from services.quota_accounting import CompteursQuotas, compteurs_quotas
+
+
+@pytest.fixture
+def abonnement(app):
+    """Abonnement gratuit actif (20 écritures par mois) et un endpoint consommant une écriture"""
+    app.config.update(QUOTAS_LOT=5, QUOTAS_MARGE=5, QUOTAS_INTERVALLE=3600)
+
+    quota_bp = Blueprint('quota_test', __name__)
+
+    @quota_bp.route('/quota/ecritures', methods=['POST'])
+    @subscription_required
+    @quota_required('ecritures', 1)
+    def creer_ecriture():
+        if request.args.get('echec'):
+            return jsonify({'success': False, 'error': 'Écriture invalide'}), 400
+        return jsonify({'success': True}), 201
+
+    app.register_blueprint(quota_bp)
+
+    utilisateur = Utilisateur(nom_utilisateur='tresorier', email='tresorier@ebnl.org', mot_de_passe_hash='x')
+    plan = PlanAbonnement(nom='Gratuit', type_plan=TypePlan.GRATUIT, prix_mensuel=0, max_ecritures_mois=20)
+    db.session.add_all([utilisateur, plan])
+    db.session.flush()
+    abonnement = Abonnement(utilisateur_id=utilisateur.id, plan_id=plan.id, statut=StatutAbonnement.ACTIF,
+                            date_debut=datetime.utcnow(), date_fin=datetime.utcnow() + timedelta(days=30),
+                            montant=0)
+    db.session.add(abonnement)
+    db.session.commit()
+    return abonnement.id, {'X-User-ID': str(utilisateur.id)}
+
+
+def ecritures_en_base(abonnement_id):
+    ligne = UtilisationQuota.query.filter_by(abonnement_id=abonnement_id).first()
+    return ligne.ecritures_utilisees if ligne else None
+
+
+def test_ecriture_par_lots_sans_requete(app, client, abonnement):
+    abonnement_id, entetes = abonnement
+    assert client.post('/quota/ecritures', headers=entetes).status_code == 201
+
+    # Abonnement et compteur en mémoire : aucune requête jusqu'au lot suivant
+    db.session.expunge_all()
+    with compter_requetes(budget=0):
+        for _ in range(3):
+            assert client.post('/quota/ecritures', headers=entetes).status_code == 201
+        # Échec de l'endpoint : la réservation est rendue
+        assert client.post('/quota/ecritures?echec=1', headers=entetes).status_code == 400
+    assert ecritures_en_base(abonnement_id) is None
+    assert QuotaManager.get_current_usage(abonnement_id).ecritures_utilisees == 4
+
+    # Cinquième écriture : le lot est écrit en une instruction
+    assert client.post('/quota/ecritures', headers=entetes).status_code == 201
+    assert ecritures_en_base(abonnement_id) == 5
+
+    # Abonnement résilié : cache invalidé au commit
+    db.session.get(Abonnement, abonnement_id).statut = StatutAbonnement.ANNULE
+    db.session.commit()
+    assert client.post('/quota/ecritures', headers=entetes).status_code == 402
+
+
+def test_limite_jamais_depassee(app, client, abonnement):
+    abonnement_id, entetes = abonnement
+    statuts = [client.post('/quota/ecritures', headers=entetes).status_code for _ in range(25)]
+    assert statuts == [201] * 20 + [429] * 5
+
+    compteurs_quotas().flush()
+    assert ecritures_en_base(abonnement_id) == 20
+    refus = client.post('/quota/ecritures', headers=entetes).get_json()
+    assert refus['quota_details']['current_usage'] == 20
+
+
+def test_plusieurs_processus(app, abonnement):
+    """Deux processus (deux jeux de compteurs) consomment en alternance : la marge couvre ce qu'ils ne voient pas"""
+    abonnement_id, _ = abonnement
+    processus = [CompteursQuotas(lot=5, intervalle=3600, marge=10) for _ in range(2)]
+    admises = 0
+    for i in range(30):
+        compteurs = processus[i % 2]
+        admises += compteurs.consommer(abonnement_id, 'ecritures', 1, limite=20)
+        compteurs.flush_si_necessaire()
+    for compteurs in processus:
+        compteurs.flush()
+
+    assert admises == 20
+    assert ecritures_en_base(abonnement_id) == 20
+    assert processus[0].utilisation(abonnement_id).ecritures_utilisees == 20
@@ -0,0 +1,86 @@
+"""
+Tests du moteur d'appariement du rapprochement bancaire
+"""
+
+import random
+from datetime import date, timedelta
+
+from services.reconciliation_matcher import (
+    IndexRapprochement, LigneCandidate, apparier, tokeniser, score_libelles, score_date
+)
+
+MOTS = ['don', 'virement', 'cotisation', 'subvention', 'loyer', 'edf', 'dupont', 'martin', 'mairie', 'facture']
+
+
+def _force_brute(mouvements, lignes, tolerance, seuil):
+    resultats = []
+    for mouvement in mouvements:
+        trouves = []
+        for ligne in lignes:
+            if abs(abs(mouvement['montant']) - abs(ligne.montant)) <= tolerance:
+                s_libelle = score_libelles(tokeniser(mouvement['libelle']), ligne.mots)
+                s_global = s_libelle * 0.7 + score_date(mouvement['date'], ligne.date) * 0.3
+                if s_global >= seuil:
+                    trouves.append((round(s_global, 6), ligne.ligne_id))
+        resultats.append(sorted(trouves, key=lambda t: (-t[0], t[1]))[:3])
+    return resultats
+
+
+def test_index_equivalent_a_la_force_brute():
+    """L'élagage par tranches, mots et dates ne perd aucune correspondance"""
+    alea = random.Random(42)
+    debut = date(2024, 1, 1)
+
+    def libelle():
+        return ' '.join(alea.sample(MOTS, alea.randint(1, 3)))
+
+    lignes = [
+        LigneCandidate(i, i, debut + timedelta(days=alea.randint(0, 30)), libelle(),
+                       alea.choice([-1, 1]) * alea.randint(1, 40) * 5)
+        for i in range(400)
+    ]
+    mouvements = [
+        {'date': debut + timedelta(days=alea.randint(0, 30)), 'libelle': libelle(), 'montant': alea.randint(1, 40) * 5}
+        for _ in range(150)
+    ]
+    index = IndexRapprochement(lignes, tolerance=5)
+
+    for seuil in (20, 70, 85):
+        obtenus = [
+            [(round(t[0], 6), t[3].ligne_id) for t in trouves]
+            for trouves in apparier(mouvements, index, seuil=seuil)
+        ]
+        assert obtenus == _force_brute(mouvements, lignes, 5, seuil)
+
+
+def test_affectation_unique():
+    """En affectation unique, une ligne n'est attribuée qu'au meilleur mouvement"""
+    jour = date(2024, 3, 1)
+    index = IndexRapprochement([LigneCandidate(1, 10, jour, 'Don Dupont', 100)])
+    mouvements = [
+        {'date': jour + timedelta(days=2), 'libelle': 'Don Dupont', 'montant': 100},
+        {'date': jour, 'libelle': 'Don Dupont', 'montant': 100}
+    ]
+
+    assert [len(t) for t in apparier(mouvements, index)] == [1, 1]
+    assert [len(t) for t in apparier(mouvements, index, affectation_unique=True)] == [0, 1]
+
+
+def test_endpoint_correspondances(app, client, creer_ecriture):
+    """L'API retourne les correspondances notées et le statut automatique"""
+    creer_ecriture('2024-03-05', [('5121', 150, 0), ('7561', 0, 150)], journal='BQ', libelle='Don Dupont mars')
+    creer_ecriture('2024-03-06', [('6061', 80, 0), ('5121', 0, 80)], journal='BQ', libelle='Facture EDF')
+
+    response = client.post('/api/v1/rapprochement/correspondances', json={
+        'date_debut': '2024-03-01',
+        'date_fin': '2024-03-31',
+        'mouvements_bancaires': [
+            {'date': '2024-03-05', 'libelle': 'DON DUPONT MARS', 'montant': 150},
+            {'date': '2024-03-07', 'libelle': 'Prlv facture EDF', 'montant': -80}
+        ]
+    })
+    correspondances = response.get_json()['data']['correspondances']
+
+    assert correspondances[0]['statut'] == 'automatique'
+    assert correspondances[0]['correspondances_trouvees'][0]['scores']['global'] == 100
+    assert correspondances[1]['correspondances_trouvees'][0]['ecriture']['montant'] == -80
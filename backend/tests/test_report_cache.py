@@ -0,0 +1,118 @@
+"""
+Tests du cache des rapports indexé par la version du grand livre
+"""
+
+from datetime import date
+
+from services import report_cache
+from services.report_cache import CacheLRU, CacheRedis, version_courante
+
+
+def test_hit_puis_invalidation_par_ecriture(app, client, creer_ecriture):
+    """Une seconde lecture est servie par le cache ; une nouvelle écriture l'invalide"""
+    creer_ecriture('2024-03-01', [('5211', 100, 0), ('7561', 0, 100)])
+    url = '/api/v1/balance?date_debut=2024-01-01&date_fin=2024-12-31'
+
+    premiere = client.get(url)
+    seconde = client.get(url)
+    assert premiere.headers['X-Cache'] == 'MISS'
+    assert seconde.headers['X-Cache'] == 'HIT'
+    assert seconde.get_json() == premiere.get_json()
+
+    version = version_courante()
+    creer_ecriture('2024-03-02', [('5211', 50, 0), ('7561', 0, 50)])
+    assert version_courante() > version
+
+    apres = client.get(url)
+    assert apres.headers['X-Cache'] == 'MISS'
+    assert apres.get_json() != premiere.get_json()
+
+    stats = client.get('/api/v1/rapports/cache/stats').get_json()['data']
+    assert stats['par_rapport']['balance'] == {'hits': 1, 'misses': 2}
+
+
+def test_parametres_normalises_et_purge(app, client, creer_ecriture):
+    """L'ordre des paramètres n'influe pas sur la clé ; la purge vide le cache"""
+    creer_ecriture('2024-03-01', [('5211', 100, 0), ('7561', 0, 100)])
+
+    client.get('/api/v1/balance?date_debut=2024-01-01&date_fin=2024-12-31')
+    inverse = client.get('/api/v1/balance?date_fin=2024-12-31&date_debut=2024-01-01')
+    assert inverse.headers['X-Cache'] == 'HIT'
+
+    assert client.delete('/api/v1/rapports/cache').status_code == 200
+    assert client.get('/api/v1/balance?date_debut=2024-01-01&date_fin=2024-12-31').headers['X-Cache'] == 'MISS'
+
+
+def test_validation_brouillard_invalide(app, client, creer_ecriture):
+    """La validation d'un brouillard fait avancer la version"""
+    ecriture = creer_ecriture('2024-03-01', [('5211', 100, 0), ('7561', 0, 100)], statut='brouillard')
+    client.get('/api/v1/bilan')
+    version = version_courante()
+
+    assert client.post(f'/api/v1/ecritures/{ecriture.id}/valider').status_code == 200
+    assert version_courante() > version
+    assert client.get('/api/v1/bilan').headers['X-Cache'] == 'MISS'
+
+
+def test_entite_invalidee_par_ecriture(app, client, creer_ecriture):
+    """Une entité autre que celle par défaut suit la même version du grand livre"""
+    creer_ecriture('2024-03-01', [('5211', 100, 0), ('7561', 0, 100)])
+    url = '/api/v1/balance?date_debut=2024-01-01&date_fin=2024-12-31&entite_id=7'
+
+    premiere = client.get(url)
+    assert client.get(url).headers['X-Cache'] == 'HIT'
+    creer_ecriture('2024-03-02', [('5211', 50, 0), ('7561', 0, 50)])
+
+    apres = client.get(url)
+    assert apres.headers['X-Cache'] == 'MISS'
+    assert apres.get_json() != premiere.get_json()
+
+
+def test_periode_par_defaut_change_d_annee(app, client, creer_ecriture, monkeypatch):
+    """Sans paramètres, la période par défaut (année en cours) dépend du jour : la clé aussi"""
+    creer_ecriture('2024-03-01', [('5211', 100, 0), ('7561', 0, 100)])
+
+    monkeypatch.setattr(report_cache, 'jour_courant', lambda: date(2024, 12, 31))
+    assert client.get('/api/v1/dashboard/kpi').headers['X-Cache'] == 'MISS'
+    assert client.get('/api/v1/dashboard/kpi').headers['X-Cache'] == 'HIT'
+
+    monkeypatch.setattr(report_cache, 'jour_courant', lambda: date(2025, 1, 1))
+    assert client.get('/api/v1/dashboard/kpi').headers['X-Cache'] == 'MISS'
+
+
+def test_lru_evince_la_plus_ancienne():
+    cache = CacheLRU(taille_max=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+class _ClientMemoire:
+    """Client minimal compatible Redis (get/set/scan_iter/delete)"""
+
+    def __init__(self):
+        self.donnees = {}
+
+    def get(self, cle):
+        return self.donnees.get(cle)
+
+    def set(self, cle, valeur, ex=None):
+        self.donnees[cle] = valeur
+
+    def scan_iter(self, motif):
+        return [c for c in self.donnees if c.startswith(motif.rstrip('*'))]
+
+    def delete(self, cle):
+        self.donnees.pop(cle, None)
+
+
+def test_backend_redis_serialise_en_json():
+    cache = CacheRedis(_ClientMemoire(), prefixe='t:')
+    cache.set('cle', {'success': True, 'data': [1, 2]})
+    assert cache.get('cle') == {'success': True, 'data': [1, 2]}
+    assert len(cache) == 1
+    cache.clear()
+    assert cache.get('cle') is None
@@ -0,0 +1,230 @@
+"""
+Tests des migrations de schéma sur une base créée par une version antérieure
+"""
+
+from flask import Flask
+from sqlalchemy import create_engine, inspect, text
+
+from services.schema_migrations import migrer_schema
+
+PLAN_COMPTABLE_INITIAL = """
+CREATE TABLE plan_comptable (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    numero_compte VARCHAR(20) NOT NULL UNIQUE,
+    libelle_compte VARCHAR(255) NOT NULL,
+    classe INTEGER NOT NULL,
+    niveau INTEGER NOT NULL,
+    parent_id INTEGER REFERENCES plan_comptable (id),
+    actif BOOLEAN NOT NULL,
+    observations TEXT,
+    date_creation DATETIME,
+    date_modification DATETIME
+)
+"""
+
+
+# Tables du grand livre telles que créées avant les index composites
+GRAND_LIVRE_INITIAL = [
+    PLAN_COMPTABLE_INITIAL,
+    "CREATE UNIQUE INDEX ix_plan_comptable_numero_compte ON plan_comptable (numero_compte)",
+    """
+    CREATE TABLE ecritures_comptables (
+        id INTEGER NOT NULL PRIMARY KEY,
+        numero_ecriture VARCHAR(20) UNIQUE,
+        date_ecriture DATE NOT NULL,
+        libelle VARCHAR(255) NOT NULL,
+        journal VARCHAR(10) NOT NULL,
+        piece_justificative VARCHAR(50),
+        montant_total NUMERIC(15, 2) NOT NULL,
+        statut VARCHAR(10) NOT NULL,
+        date_creation DATETIME,
+        date_modification DATETIME,
+        date_validation DATETIME,
+        user_creation VARCHAR(50),
+        user_validation VARCHAR(50),
+        ia_generated BOOLEAN,
+        ia_confidence FLOAT,
+        document_source VARCHAR(255)
+    )
+    """,
+    "CREATE INDEX ix_ecritures_comptables_statut ON ecritures_comptables (statut)",
+    "CREATE INDEX ix_ecritures_comptables_date_ecriture ON ecritures_comptables (date_ecriture)",
+    """
+    CREATE TABLE lignes_ecriture (
+        id INTEGER NOT NULL PRIMARY KEY,
+        ecriture_id INTEGER NOT NULL REFERENCES ecritures_comptables (id),
+        numero_compte VARCHAR(20) NOT NULL REFERENCES plan_comptable (numero_compte),
+        libelle VARCHAR(255) NOT NULL,
+        debit NUMERIC(15, 2) NOT NULL,
+        credit NUMERIC(15, 2) NOT NULL,
+        quantite NUMERIC(12, 3),
+        prix_unitaire NUMERIC(12, 2),
+        date_echeance DATE,
+        reference_externe VARCHAR(50)
+    )
+    """,
+    "CREATE INDEX ix_lignes_ecriture_ecriture_id ON lignes_ecriture (ecriture_id)",
+    "CREATE INDEX ix_lignes_ecriture_numero_compte ON lignes_ecriture (numero_compte)",
+]
+
+
+def base_initiale():
+    moteur = create_engine('sqlite://')
+    with moteur.begin() as connexion:
+        connexion.exec_driver_sql(PLAN_COMPTABLE_INITIAL)
+        for numero in ('5', '512', '52110'):
+            connexion.execute(text(
+                "INSERT INTO plan_comptable (numero_compte, libelle_compte, classe, niveau, actif) "
+                "VALUES (:numero, 'Compte', 5, 1, 1)"
+            ), {'numero': numero})
+    return moteur
+
+
+def test_racines_ajoutees_et_remplies():
+    moteur = base_initiale()
+    with moteur.begin() as connexion:
+        assert migrer_schema(connexion)['racines du plan comptable'] == 3
+
+    inspecteur = inspect(moteur)
+    assert {'racine2', 'racine3'} <= {colonne['name'] for colonne in inspecteur.get_columns('plan_comptable')}
+    assert {'ix_plan_comptable_racine2', 'ix_plan_comptable_racine3'} <= {
+        index['name'] for index in inspecteur.get_indexes('plan_comptable')
+    }
+    with moteur.connect() as connexion:
+        assert connexion.execute(text(
+            "SELECT numero_compte, racine2, racine3 FROM plan_comptable ORDER BY numero_compte"
+        )).all() == [('5', '5', '5'), ('512', '51', '512'), ('52110', '52', '521')]
+
+    # Base à jour : rien à faire
+    with moteur.begin() as connexion:
+        assert migrer_schema(connexion)['racines du plan comptable'] == 0
+
+
+def test_base_sans_tables():
+    moteur = create_engine('sqlite://')
+    with moteur.begin() as connexion:
+        assert not any(migrer_schema(connexion).values())
+
+
+def test_cloture_definitive_ajoutee():
+    moteur = create_engine('sqlite://')
+    with moteur.begin() as connexion:
+        connexion.exec_driver_sql(
+            "CREATE TABLE exercices_comptables (id INTEGER PRIMARY KEY, nom_exercice VARCHAR(50), statut VARCHAR(20))"
+        )
+        connexion.exec_driver_sql("INSERT INTO exercices_comptables VALUES (1, '2023', 'cloture')")
+        assert migrer_schema(connexion)['clôture définitive des exercices'] == 1
+        assert connexion.exec_driver_sql("SELECT cloture_definitif FROM exercices_comptables").scalar() == 0
+
+
+def test_migration_grand_livre_sur_base_initiale(tmp_path):
+    from models import db, PlanComptable
+    from migrate_index_grand_livre import TABLES_GRAND_LIVRE, mettre_a_jour_grand_livre
+
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'initiale.db'}",
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    with app.app_context():
+        with db.engine.begin() as connexion:
+            for instruction in GRAND_LIVRE_INITIAL:
+                connexion.exec_driver_sql(instruction)
+            connexion.exec_driver_sql(
+                "INSERT INTO plan_comptable (numero_compte, libelle_compte, classe, niveau, actif) "
+                "VALUES ('5121', 'Banque', 5, 2, 1)"
+            )
+
+        # Simulation : table des soldes mensuels et index listés, rien n'est créé
+        tables, manquants = mettre_a_jour_grand_livre(simulation=True)
+        assert [table.name for table in tables] == ['soldes_mensuels_comptes']
+        assert 'ix_plan_comptable_racine3' in {index.name for index in manquants}
+        assert not inspect(db.engine).has_table('soldes_mensuels_comptes')
+
+        mettre_a_jour_grand_livre()
+        inspecteur = inspect(db.engine)
+        for modele in TABLES_GRAND_LIVRE:
+            existants = {index['name'] for index in inspecteur.get_indexes(modele.__tablename__)}
+            assert {index.name for index in modele.__table__.indexes} <= existants
+        assert PlanComptable.query.filter_by(racine3='512').one().numero_compte == '5121'
+
+        # Base à jour
+        assert mettre_a_jour_grand_livre() == ([], [])
+        db.session.remove()
+
+
+def test_statuts_ecritures_par_valeur():
+    moteur = create_engine('sqlite://')
+    with moteur.begin() as connexion:
+        connexion.exec_driver_sql(GRAND_LIVRE_INITIAL[2])
+        for statut in ('VALIDE', 'VALIDE', 'BROUILLARD', 'valide'):
+            connexion.exec_driver_sql(
+                "INSERT INTO ecritures_comptables (date_ecriture, libelle, journal, montant_total, statut) "
+                f"VALUES ('2023-05-01', 'Don', 'OD', 10, '{statut}')"
+            )
+        assert migrer_schema(connexion)['statuts des écritures'] == 3
+        assert connexion.exec_driver_sql(
+            "SELECT statut, count(*) FROM ecritures_comptables GROUP BY statut ORDER BY statut"
+        ).all() == [('brouillard', 1), ('valide', 3)]
+        assert migrer_schema(connexion)['statuts des écritures'] == 0
+
+
+def test_progressions_elearning_a_recalculer():
+    moteur = create_engine('sqlite://')
+    with moteur.begin() as connexion:
+        connexion.exec_driver_sql(
+            "CREATE TABLE inscriptions_formation (id INTEGER PRIMARY KEY, utilisateur_id INTEGER, "
+            "formation_id INTEGER, pourcentage_completion FLOAT)"
+        )
+        connexion.exec_driver_sql("INSERT INTO inscriptions_formation VALUES (1, 1, 1, 40.0)")
+        assert migrer_schema(connexion)['progressions e-learning'] == 1
+        assert connexion.exec_driver_sql(
+            "SELECT lecons_terminees, nb_lecons FROM inscriptions_formation"
+        ).one() == (0, None)
+        assert migrer_schema(connexion)['progressions e-learning'] == 0
+
+
+def test_soldes_mensuels_reconstruits(app, creer_ecriture):
+    from models import db, SoldeMensuelCompte
+    from services.monthly_balances import totaux_periode, verifier_coherence
+
+    creer_ecriture('2024-01-10', [('5211', 100, 0), ('7561', 0, 100)])
+    creer_ecriture('2024-02-10', [('5211', 20, 0), ('7561', 0, 20)])
+    # Table créée vide par create_all sur une base existante
+    SoldeMensuelCompte.query.delete()
+    db.session.commit()
+    assert totaux_periode('2024-01-01', '2024-02-29') == {}
+
+    assert migrer_schema()['soldes mensuels'] == 4
+    db.session.expire_all()
+    assert verifier_coherence() == []
+    assert totaux_periode('2024-01-01', '2024-02-29')['5211'][0] == 120
+    assert migrer_schema()['soldes mensuels'] == 0
+
+
+def test_cle_des_soldes_mensuels_non_nulle(app, creer_ecriture):
+    from models import db
+    from services.monthly_balances import verifier_coherence
+
+    creer_ecriture('2022-05-02', [('5211', 10, 0), ('7561', 0, 10)])
+    # Table d'une version antérieure : clé nullable, doublons que la contrainte n'empêchait pas
+    with db.engine.begin() as connexion:
+        connexion.exec_driver_sql("DROP TABLE soldes_mensuels_comptes")
+        connexion.exec_driver_sql(
+            "CREATE TABLE soldes_mensuels_comptes (id INTEGER PRIMARY KEY, entite_id INTEGER, exercice_id INTEGER, "
+            "numero_compte VARCHAR(20) NOT NULL, periode VARCHAR(7) NOT NULL, total_debit NUMERIC(15, 2) NOT NULL, "
+            "total_credit NUMERIC(15, 2) NOT NULL, nb_lignes INTEGER NOT NULL, date_maj DATETIME, "
+            "UNIQUE (entite_id, exercice_id, numero_compte, periode))"
+        )
+        for _ in range(2):
+            connexion.exec_driver_sql(
+                "INSERT INTO soldes_mensuels_comptes (numero_compte, periode, total_debit, total_credit, nb_lignes) "
+                "VALUES ('5211', '2022-05', 10, 0, 1)"
+            )
+
+    resultats = migrer_schema()
+    assert (resultats['clé des soldes mensuels'], resultats['soldes mensuels']) == (2, 2)
+    colonnes = {colonne['name']: colonne for colonne in inspect(db.engine).get_columns('soldes_mensuels_comptes')}
+    assert not colonnes['entite_id']['nullable'] and not colonnes['exercice_id']['nullable']
+    db.session.expire_all()
+    assert verifier_coherence() == []
+    assert migrer_schema()['clé des soldes mensuels'] == 0
@@ -0,0 +1,52 @@
+"""
+Tests des séries temporelles (/analyses/series)
+"""
+
+from datetime import date
+
+from services.time_series import calculer_series, periodes
+
+
+def test_periodes_completes():
+    assert periodes(date(2024, 1, 31), date(2024, 3, 1), 'month') == ['2024-01', '2024-02', '2024-03']
+    assert periodes(date(2024, 2, 15), date(2024, 7, 1), 'quarter') == ['2024-Q1', '2024-Q2', '2024-Q3']
+    # 2024-03-06 est un mercredi : semaines commençant le lundi
+    assert periodes(date(2024, 3, 6), date(2024, 3, 18), 'week') == ['2024-03-04', '2024-03-11', '2024-03-18']
+
+
+def test_regroupement_et_trous(app, creer_ecriture):
+    creer_ecriture('2024-01-15', [('6061', 100, 0), ('5121', 0, 100)])
+    creer_ecriture('2024-01-20', [('6063', 50, 0), ('5121', 0, 50)])
+    creer_ecriture('2024-03-02', [('6061', 30, 0), ('5121', 0, 30)])
+
+    points = calculer_series('2024-01-01', '2024-04-30', 'month', comptes=['6'], metrique='balance')
+    assert [p['periode'] for p in points] == ['2024-01', '2024-02', '2024-03', '2024-04']
+    assert [p['valeur'] for p in points] == [150.0, 0.0, 30.0, 0.0]
+    assert [p['nb_ecritures'] for p in points] == [2, 0, 1, 0]
+
+    semaines = calculer_series('2024-03-01', '2024-03-10', 'week', comptes=['6'], metrique='count')
+    assert [(p['periode'], p['valeur']) for p in semaines] == [('2024-02-26', 1), ('2024-03-04', 0)]
+
+
+def test_solde_cumule_avec_anteriorite(app, creer_ecriture):
+    creer_ecriture('2023-12-20', [('5121', 200, 0), ('7562', 0, 200)])
+    creer_ecriture('2024-02-10', [('6061', 50, 0), ('5121', 0, 50)])
+
+    points = calculer_series('2024-01-01', '2024-03-31', 'quarter', comptes=['512'], metrique='cumulative')
+    assert points == [{'periode': '2024-Q1', 'valeur': 150.0, 'debit': 0.0, 'credit': 50.0, 'nb_ecritures': 1}]
+
+
+def test_endpoint_series_et_activite(app, client, creer_ecriture):
+    creer_ecriture('2024-05-03', [('6061', 10, 0), ('5121', 0, 10)])
+    creer_ecriture('2024-05-04', [('6061', 5, 0), ('5121', 0, 5)], statut='brouillard')
+
+    data = client.get('/api/v1/analyses/series?comptes=6&granularite=day'
+                      '&date_debut=2024-05-01&date_fin=2024-05-05&metrique=movement').get_json()['data']
+    assert [p['valeur'] for p in data['points']] == [0.0, 0.0, 10.0, 0.0, 0.0]
+    assert client.get('/api/v1/analyses/series?granularite=year').status_code == 400
+
+    activite = client.get('/api/v1/analyses/activite-mensuelle?annee=2024').get_json()['data']
+    mai = activite['activite_mensuelle'][4]
+    assert mai['mois'] == '2024-05' and mai['nb_ecritures'] == 2
+    assert mai['total_mouvements'] == 30.0
+    assert activite['synthese_annuelle']['total_ecritures'] == 2
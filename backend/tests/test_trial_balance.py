@@ -0,0 +1,63 @@
+"""
+Tests de la balance vectorisée (/balance et /export/balance)
+"""
+
+import csv
+import io
+
+from services.trial_balance import construire_balance, en_centimes, en_montant
+
+
+def test_colonnes_ouverture_periode_cloture(app, creer_ecriture):
+    """Les lignes antérieures à la période alimentent l'ouverture, au centime près"""
+    creer_ecriture('2024-01-10', [('5211', 100.10, 0), ('7561', 0, 100.10)])
+    creer_ecriture('2024-03-05', [('6061', 0.20, 0), ('5211', 0, 0.20)])
+
+    balance = construire_balance('2024-02-01', '2024-12-31')
+    banque = balance.lignes.loc['5211']
+    assert banque['debit_ouverture'] == 10010 and banque['credit_periode'] == 20
+    assert banque['solde_cloture'] == 9990
+    assert banque['solde_debiteur'] == 9990 and banque['solde_crediteur'] == 0
+
+    produits = balance.lignes.loc['7561']
+    assert produits['solde_crediteur'] == 10010
+
+    totaux = balance.totaux()
+    assert totaux['debit_cloture'] == totaux['credit_cloture'] == 10030
+    assert en_montant(totaux['debit_cloture']) == en_montant(en_centimes('100.30'))
+
+
+def test_sous_totaux_par_niveau(app, creer_ecriture):
+    creer_ecriture('2024-03-01', [('6061', 40, 0), ('6063', 10, 0), ('5211', 0, 50)])
+
+    balance = construire_balance(None, '2024-12-31')
+    classe6 = balance.sous_totaux(1).loc['6']
+    assert classe6['debit_cloture'] == 5000
+    assert list(balance.sous_totaux(3).index) == ['521', '606']
+    assert balance.sous_totaux(4).loc['6063']['solde_debiteur'] == 1000
+
+
+def test_endpoint_balance(app, client, creer_ecriture):
+    creer_ecriture('2024-03-01', [('5211', 100, 0), ('7561', 0, 100)])
+
+    data = client.get('/api/v1/balance?date_debut=2024-01-01&date_fin=2024-12-31').get_json()['data']
+    ligne = next(l for l in data['lignes'] if l['numero_compte'] == '7561')
+    assert ligne['credit'] == 100.0 and ligne['sens_solde'] == 'créditeur'
+    assert data['totaux']['equilibre'] is True
+    assert [s['prefixe'] for s in data['sous_totaux']['1']] == ['5', '7']
+
+    filtre = client.get('/api/v1/balance?classe=7').get_json()['data']
+    assert [l['numero_compte'] for l in filtre['lignes']] == ['7561']
+
+
+def test_export_balance_csv(app, client, creer_ecriture):
+    creer_ecriture('2024-01-10', [('5211', 80, 0), ('7561', 0, 80)])
+    creer_ecriture('2024-03-01', [('5211', 20.05, 0), ('7561', 0, 20.05)])
+
+    response = client.get('/api/v1/export/balance?date_debut=2024-02-01&date_fin=2024-12-31')
+    assert response.status_code == 200
+    lignes = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    banque = next(l for l in lignes if l['numero_compte'] == '5211')
+    assert banque['debit_precedent'] == '80.00'
+    assert banque['debit_periode'] == '20.05'
+    assert banque['solde_final'] == '100.05'